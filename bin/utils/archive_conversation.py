@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Архивация conversation (после миграций 0019/0020): строки завершенных сессий без активности дольше
+--older-than-days переносятся в conversation_archive (сжатые помесячные секции, минимум индексов),
+так что горячие секции conversation и их индексы содержат только идущие и недавние сессии.
+
+За один запуск:
+  1. создает помесячные секции conversation на --months-ahead месяцев вперед;
+  2. переносит строки сессий пачками по --batch-size сессий (одна транзакция на пачку,
+     run_state.archived_at отмечает перенесенные сессии);
+  3. удаляет опустевшие секции conversation за месяцы старше границы архивации.
+Запускать по расписанию (раз в сутки); повторный запуск продолжает с места остановки.
+Читать строки вместе с архивом - через представление conversation_all.
+
+Использование:
+    python bin/utils/archive_conversation.py [--older-than-days N] [--include-inactive] [--batch-size N] [--dry-run]
+"""
+import os
+import re
+import sys
+import time
+import argparse
+from datetime import date, timedelta
+import psycopg2
+
+# Загружаем переменные окружения (опционально)
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    # dotenv не установлен, используем переменные окружения напрямую
+    pass
+
+DATABASE_URL = os.environ.get('DATABASE_URL')
+
+if not DATABASE_URL:
+    print("❌ Ошибка: DATABASE_URL не установлен!")
+    print("Установите DATABASE_URL в файле .env или в переменных окружения")
+    sys.exit(1)
+
+HOT_PARTITION = re.compile(r"^conversation_y(\d{4})m(\d{2})$")
+
+# Сессии для архивации: последняя строка conversation (run_state.updated_at) старше границы;
+# уже перенесенные сессии - только если после переноса появились новые строки
+CANDIDATES = """
+    FROM run_state rs
+    JOIN run r ON r.run_id = rs.run_id
+    WHERE COALESCE(rs.updated_at, r.date_inserted) < %(cutoff)s
+      AND (rs.archived_at IS NULL OR rs.updated_at > rs.archived_at)
+      AND (r.is_ended OR %(include_inactive)s)
+"""
+
+# Все строки таких сессий старше границы: условие по date_inserted отсекает свежие секции
+MOVE_QUERY = """
+    WITH moved AS (
+        DELETE FROM conversation
+        WHERE run_id = ANY(%(run_ids)s) AND date_inserted < %(cutoff)s
+        RETURNING *
+    )
+    INSERT INTO conversation_archive SELECT * FROM moved
+"""
+
+
+def create_hot_partitions(conn, cursor, months_ahead):
+    """Секции conversation на months_ahead месяцев вперед (новые строки не должны попадать в секцию по умолчанию)"""
+    until = date.today() + timedelta(days=31 * months_ahead)
+    try:
+        cursor.execute("SELECT conversation_create_partitions('conversation', 'conversation', current_date, %s)", (until,))
+        created = cursor.fetchone()[0]
+        conn.commit()
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"⚠️  Не удалось создать секции conversation до {until}: {e}")
+        return
+    if created:
+        print(f"Создано секций conversation: {created} (до {until})")
+
+
+def archive_runs(conn, cursor, cutoff, include_inactive, batch_size, pause, dry_run):
+    """Перенос строк сессий в conversation_archive, возвращает (сессий, строк)"""
+    params = {"cutoff": cutoff, "include_inactive": include_inactive, "limit": batch_size}
+    if dry_run:
+        cursor.execute(f"SELECT count(*) {CANDIDATES}", params)
+        print(f"Сессий для архивации: {cursor.fetchone()[0]}")
+        return 0, 0
+
+    runs = 0
+    rows = 0
+    while True:
+        cursor.execute(f"SELECT rs.run_id {CANDIDATES} ORDER BY rs.run_id LIMIT %(limit)s", params)
+        run_ids = [row[0] for row in cursor.fetchall()]
+        if not run_ids:
+            break
+
+        cursor.execute("""
+            SELECT min(date_inserted)::date, max(date_inserted)::date FROM conversation
+            WHERE run_id = ANY(%(run_ids)s) AND date_inserted < %(cutoff)s
+        """, {"run_ids": run_ids, "cutoff": cutoff})
+        first_day, last_day = cursor.fetchone()
+        if first_day is not None:
+            cursor.execute("SELECT conversation_create_partitions('conversation_archive', 'conversation_archive', %s, %s, true)",
+                           (first_day, last_day))
+            cursor.execute(MOVE_QUERY, {"run_ids": run_ids, "cutoff": cutoff})
+            rows += cursor.rowcount
+        cursor.execute("UPDATE run_state SET archived_at = now() WHERE run_id = ANY(%s)", (run_ids,))
+        conn.commit()
+
+        runs += len(run_ids)
+        print(f"... {runs} сессий, {rows} строк")
+        if pause:
+            time.sleep(pause)
+    return runs, rows
+
+
+def drop_empty_partitions(conn, cursor, cutoff, dry_run):
+    """Отсоединяет и удаляет пустые секции conversation за месяцы целиком раньше границы архивации"""
+    cursor.execute("""
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'conversation'::regclass
+        ORDER BY c.relname
+    """)
+    dropped = []
+    for (name,) in cursor.fetchall():
+        match = HOT_PARTITION.match(name)
+        if not match:
+            continue
+        year, month = int(match.group(1)), int(match.group(2))
+        month_end = date(year + month // 12, month % 12 + 1, 1)
+        if month_end > cutoff.date():
+            continue
+        cursor.execute(f'SELECT EXISTS (SELECT 1 FROM "{name}")')
+        if cursor.fetchone()[0]:
+            continue
+        if dry_run:
+            dropped.append(name)
+            continue
+        try:
+            # DETACH берет эксклюзивную блокировку conversation: не ждем дольше lock_timeout
+            cursor.execute("SET LOCAL lock_timeout = '5s'")
+            cursor.execute(f'ALTER TABLE conversation DETACH PARTITION "{name}"')
+            cursor.execute(f'DROP TABLE "{name}"')
+            conn.commit()
+            dropped.append(name)
+        except psycopg2.Error as e:
+            conn.rollback()
+            print(f"⚠️  Секция {name} не удалена (будет удалена при следующем запуске): {e}")
+    if dropped:
+        print(f"{'Пустые секции для удаления' if dry_run else 'Удалены пустые секции'}: {', '.join(dropped)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Перенос строк conversation завершенных сессий в conversation_archive')
+    parser.add_argument('--older-than-days', type=int, default=90,
+                        help='Сессии без активности дольше N дней (по умолчанию 90)')
+    parser.add_argument('--include-inactive', action='store_true',
+                        help='Архивировать и незавершенные сессии без активности (брошенные)')
+    parser.add_argument('--batch-size', type=int, default=500, help='Сессий на транзакцию (по умолчанию 500)')
+    parser.add_argument('--months-ahead', type=int, default=2, help='Создавать секции на N месяцев вперед (по умолчанию 2)')
+    parser.add_argument('--pause', type=float, default=0.0, help='Пауза между пачками в секундах (по умолчанию 0)')
+    parser.add_argument('--dry-run', action='store_true', help='Только показать, что будет перенесено и удалено')
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(DATABASE_URL)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT relkind FROM pg_class WHERE oid = 'conversation'::regclass")
+            if cursor.fetchone()[0] != 'p':
+                print("❌ conversation не секционирована: примените миграции 0019 и 0020")
+                sys.exit(1)
+            cursor.execute("SELECT now() - %s", (timedelta(days=args.older_than_days),))
+            cutoff = cursor.fetchone()[0]
+            conn.commit()
+            print(f"Граница архивации: {cutoff:%Y-%m-%d %H:%M} ({args.older_than_days} дней)")
+
+            started = time.perf_counter()
+            if not args.dry_run:
+                create_hot_partitions(conn, cursor, args.months_ahead)
+            runs, rows = archive_runs(conn, cursor, cutoff, args.include_inactive,
+                                      args.batch_size, args.pause, args.dry_run)
+            drop_empty_partitions(conn, cursor, cutoff, args.dry_run)
+    finally:
+        conn.close()
+
+    if not args.dry_run:
+        print(f"\n✅ Перенесено: {rows} строк из {runs} сессий за {time.perf_counter() - started:.1f} с")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Заполнение conversation.json_b (jsonb копия conversation.json) пачками - шаг между миграциями 0017 и 0018
+Каждая пачка - отдельная короткая транзакция по диапазону conversation_id, так что скрипт можно
+запускать на работающей БД, останавливать и запускать снова (заполняются только строки с json_b IS NULL).
+Новые строки заполняет триггер миграции 0017.
+
+Использование:
+    python bin/utils/backfill_jsonb.py [--batch-size N] [--pause SEC] [--dry-run]
+"""
+import os
+import sys
+import time
+import argparse
+import psycopg2
+
+# Загружаем переменные окружения (опционально)
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    # dotenv не установлен, используем переменные окружения напрямую
+    pass
+
+DATABASE_URL = os.environ.get('DATABASE_URL')
+
+if not DATABASE_URL:
+    print("❌ Ошибка: DATABASE_URL не установлен!")
+    print("Установите DATABASE_URL в файле .env или в переменных окружения")
+    sys.exit(1)
+
+
+def backfill(batch_size, pause, dry_run):
+    conn = psycopg2.connect(DATABASE_URL)
+    filled = 0
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT column_name FROM information_schema.columns
+                WHERE table_name = 'conversation' AND column_name = 'json_b'
+            """)
+            if not cursor.fetchone():
+                print("❌ Колонки conversation.json_b нет: примените миграцию 0017 (или 0018 уже применена)")
+                return False
+
+            cursor.execute("SELECT min(conversation_id), max(conversation_id) FROM conversation")
+            first_id, last_id = cursor.fetchone()
+            if first_id is None:
+                print("conversation пуста")
+                return True
+
+            cursor.execute("SELECT count(*) FROM conversation WHERE json IS NOT NULL AND json_b IS NULL")
+            remaining = cursor.fetchone()[0]
+            print(f"Строк без json_b: {remaining}, conversation_id {first_id}..{last_id}, пачка {batch_size}")
+            if dry_run:
+                return True
+            conn.commit()
+
+            started = time.perf_counter()
+            for start_id in range(first_id, last_id + 1, batch_size):
+                cursor.execute("""
+                    UPDATE conversation
+                    SET json_b = text_to_jsonb(json)
+                    WHERE conversation_id >= %s AND conversation_id < %s
+                      AND json IS NOT NULL AND json_b IS NULL
+                """, (start_id, start_id + batch_size))
+                filled += cursor.rowcount
+                conn.commit()
+                if cursor.rowcount:
+                    print(f"... {filled}/{remaining} строк (conversation_id < {start_id + batch_size})")
+                if pause:
+                    time.sleep(pause)
+
+            cursor.execute("SELECT count(*) FROM conversation WHERE json IS NOT NULL AND json_b IS NULL")
+            left = cursor.fetchone()[0]
+            cursor.execute("SELECT count(*) FROM conversation WHERE jsonb_typeof(json_b) = 'string'")
+            invalid = cursor.fetchone()[0]
+    finally:
+        conn.close()
+
+    print(f"\nЗаполнено: {filled} за {time.perf_counter() - started:.1f} с")
+    if invalid:
+        print(f"⚠️  {invalid} строк с некорректным JSON сохранены как jsonb строка")
+    if left:
+        print(f"❌ Осталось {left} строк без json_b, запустите скрипт снова")
+        return False
+    print("✅ Можно применять миграцию 0018_jsonb_conversation_swap")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Пакетное заполнение conversation.json_b перед миграцией 0018')
+    parser.add_argument('--batch-size', type=int, default=5000, help='conversation_id на транзакцию (по умолчанию 5000)')
+    parser.add_argument('--pause', type=float, default=0.0, help='Пауза между пачками в секундах (по умолчанию 0)')
+    parser.add_argument('--dry-run', action='store_true', help='Только показать, сколько строк нужно заполнить')
+    args = parser.parse_args()
+    sys.exit(0 if backfill(args.batch_size, args.pause, args.dry_run) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк чтения conversation.json: text + json.loads против jsonb (миграции 0017/0018)
+Создает схему jsonb_bench с двумя одинаковыми таблицами (json text и json jsonb), заполняет их
+строками элементов (dialog с историей, quiz, message, строки с цепочкой повторения) и сравнивает:
+  - чтение истории сессии с разбором JSON в Python;
+  - выборку одного ключа (тип элемента): разбор в Python против json->'element_data'->>'type' в БД;
+  - поиск строк с цепочкой повторения: LIKE '%"revision"%' против json ? 'revision' (частичный индекс).
+Схема удаляется после замера.
+
+Использование:
+    python bin/utils/bench_jsonb.py [--runs N] [--rows-per-run N] [--repeat N] [--keep]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import psycopg2
+import psycopg2.extras
+
+# Загружаем переменные окружения (опционально)
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    # dotenv не установлен, используем переменные окружения напрямую
+    pass
+
+DATABASE_URL = os.environ.get('DATABASE_URL')
+
+if not DATABASE_URL:
+    print("❌ Ошибка: DATABASE_URL не установлен!")
+    print("Установите DATABASE_URL в файле .env или в переменных окружения")
+    sys.exit(1)
+
+SCHEMA = "jsonb_bench"
+DIALOG_MESSAGES = 20
+
+
+def element_json(k):
+    """JSON строки conversation: каждая 10-я - dialog с историей, каждая 50-я - цепочка повторения"""
+    if k % 50 == 0:
+        return {"revision": {"revision_element": {"type": "revision", "prefix": "Ex"},
+                             "data": [{f"Ex_{i}": {"element_data": {"type": "quiz", "text": "?" * 200}}}
+                                      for i in range(5)]}}
+    if k % 10 == 0:
+        return {"element_data": {"type": "dialog", "text": "Начнем", "prompt": "p" * 1000,
+                                 "conversation": [{"role": "user" if i % 2 else "assistant", "content": "c" * 300}
+                                                  for i in range(DIALOG_MESSAGES)]}}
+    if k % 2 == 0:
+        return {"element_data": {"type": "quiz", "text": "Вопрос " * 20,
+                                 "answers": [{"text": f"Ответ {i}", "correct": i == 0} for i in range(4)]}}
+    return {"element_data": {"type": "message", "text": "Текст " * 50}}
+
+
+def seed(cursor, runs, rows_per_run):
+    cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    cursor.execute(f"CREATE SCHEMA {SCHEMA}")
+    for table, json_type in (("conv_text", "TEXT"), ("conv_jsonb", "JSONB")):
+        cursor.execute(f"""
+            CREATE TABLE {SCHEMA}.{table} (
+                conversation_id INT4 PRIMARY KEY,
+                run_id INT4 NOT NULL,
+                role TEXT NOT NULL,
+                json {json_type}
+            )
+        """)
+        cursor.execute(f"CREATE INDEX ON {SCHEMA}.{table} (run_id, conversation_id)")
+    cursor.execute(f"""CREATE INDEX ON {SCHEMA}.conv_jsonb (run_id, conversation_id)
+                       WHERE role = 'bot' AND json ? 'revision'""")
+
+    payloads = [json.dumps(element_json(k), ensure_ascii=False) for k in range(rows_per_run)]
+    rows = [(r * rows_per_run + k, r, 'bot' if k % 2 == 0 else 'user', payloads[k])
+            for r in range(runs) for k in range(rows_per_run)]
+    for table, cast in (("conv_text", ""), ("conv_jsonb", "::jsonb")):
+        psycopg2.extras.execute_values(
+            cursor, f"INSERT INTO {SCHEMA}.{table} VALUES %s", rows,
+            template=f"(%s, %s, %s, %s{cast})", page_size=1000
+        )
+        cursor.execute(f"ANALYZE {SCHEMA}.{table}")
+
+
+def timed(repeat, fn):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def decode(value):
+    # text приходит строкой, jsonb psycopg2 декодирует сам
+    return json.loads(value) if isinstance(value, str) else value
+
+
+def bench(cursor, runs, repeat):
+    run_id = runs // 2
+
+    def history(table):
+        def fn():
+            cursor.execute(f"SELECT json FROM {SCHEMA}.{table} WHERE run_id = %s ORDER BY conversation_id", (run_id,))
+            return [decode(row[0]) for row in cursor.fetchall()]
+        return fn
+
+    def types_in_python(table):
+        def fn():
+            cursor.execute(f"SELECT json FROM {SCHEMA}.{table} WHERE run_id = %s", (run_id,))
+            return [(decode(row[0]).get("element_data") or {}).get("type") for row in cursor.fetchall()]
+        return fn
+
+    def types_in_db():
+        cursor.execute(f"SELECT json->'element_data'->>'type' FROM {SCHEMA}.conv_jsonb WHERE run_id = %s", (run_id,))
+        return [row[0] for row in cursor.fetchall()]
+
+    def revision_like():
+        cursor.execute(f"""SELECT conversation_id FROM {SCHEMA}.conv_text
+                           WHERE run_id = %s AND role = 'bot' AND json LIKE '%%"revision"%%'
+                           ORDER BY conversation_id DESC LIMIT 1""", (run_id,))
+        return cursor.fetchone()
+
+    def revision_key():
+        cursor.execute(f"""SELECT conversation_id FROM {SCHEMA}.conv_jsonb
+                           WHERE run_id = %s AND role = 'bot' AND json ? 'revision'
+                           ORDER BY conversation_id DESC LIMIT 1""", (run_id,))
+        return cursor.fetchone()
+
+    if history("conv_text")() != history("conv_jsonb")() or revision_like() != revision_key():
+        print("❌ Результаты text и jsonb различаются")
+        sys.exit(1)
+
+    results = [
+        ("История сессии + разбор JSON", timed(repeat, history("conv_text")), timed(repeat, history("conv_jsonb"))),
+        ("Тип элемента (jsonb: ->> в БД)", timed(repeat, types_in_python("conv_text")), timed(repeat, types_in_db)),
+        ("Строка с цепочкой повторения", timed(repeat, revision_like), timed(repeat, revision_key)),
+    ]
+    print(f"{'Чтение':<34} {'text, мс':>9} {'jsonb, мс':>10} {'Ускорение':>10}")
+    for name, text_ms, jsonb_ms in results:
+        print(f"{name:<34} {text_ms:>9.2f} {jsonb_ms:>10.2f} {text_ms / jsonb_ms:>9.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк чтения conversation.json: text против jsonb')
+    parser.add_argument('--runs', type=int, default=500, help='Сессий (по умолчанию 500)')
+    parser.add_argument('--rows-per-run', type=int, default=100, help='Строк на сессию (по умолчанию 100)')
+    parser.add_argument('--repeat', type=int, default=30, help='Повторов каждого замера (по умолчанию 30)')
+    parser.add_argument('--keep', action='store_true', help=f'Не удалять схему {SCHEMA} после замера')
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(DATABASE_URL)
+    try:
+        with conn.cursor() as cursor:
+            print(f"Заполнение {SCHEMA}: {args.runs} сессий x {args.rows_per_run} строк...")
+            seed(cursor, args.runs, args.rows_per_run)
+            conn.commit()
+            bench(cursor, args.runs, args.repeat)
+            if not args.keep:
+                cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+                conn.commit()
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк накладных расходов вызова LLM в chat.py: клиент на каждый вызов против общего пула соединений
+Локальный stub-сервер (127.0.0.1, HTTP/1.1 keep-alive) отвечает на /chat/completions и /responses
+фиксированным ответом через --latency мс - как модель, но без сети. Сравниваются:
+  before - как было: requests.post (Completions API) / новый OpenAI клиент (Responses API) на каждый ход,
+           блокирующий вызов внутри event loop;
+  after  - chat.get_reply_impl: общий httpx.AsyncClient (keep-alive), AsyncOpenAI поверх него.
+Для каждого режима: среднее время хода при последовательных вызовах (накладные = время - latency)
+и общее время --concurrency одновременных ходов (блокирующий вызов выполняет их по очереди).
+Stub без TLS: в проде к разнице добавляется TLS handshake до прокси на каждом новом соединении.
+С --serve только запускает stub на --port (для load_test_mvp.py без реальной модели: openai.proxy
+в config.yaml = http://127.0.0.1:PORT/v1).
+
+Использование:
+    python bin/utils/bench_llm_client.py [--api completions|responses|both] [--turns N]
+                                         [--concurrency N] [--latency MS]
+    python bin/utils/bench_llm_client.py --serve [--port N] [--latency MS]
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import threading
+import statistics
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from openai import OpenAI
+
+# chat.py в корне проекта, config.yaml там же
+project_root = Path(__file__).resolve().parent.parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+os.environ.setdefault('CONFIG_FILE', str(project_root / 'config.yaml'))
+os.environ.setdefault('OPENAI_API_KEY', 'stub')
+
+import chat  # noqa: E402
+
+COMPLETION = {
+    "id": "chatcmpl-stub", "object": "chat.completion", "created": 0, "model": "stub",
+    "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "ok"}}],
+    "usage": {"prompt_tokens": 10, "completion_tokens": 1, "total_tokens": 11},
+}
+RESPONSE = {
+    "id": "resp-stub", "object": "response", "created_at": 0, "model": "stub", "status": "completed",
+    "output": [{
+        "type": "message", "id": "msg-stub", "role": "assistant", "status": "completed",
+        "content": [{"type": "output_text", "text": "ok", "annotations": []}],
+    }],
+    "parallel_tool_calls": False, "tool_choice": "auto", "tools": [],
+    "usage": {"input_tokens": 10, "output_tokens": 1, "total_tokens": 11,
+              "input_tokens_details": {"cached_tokens": 0}, "output_tokens_details": {"reasoning_tokens": 0}},
+}
+CONVERSATION = [
+    {"role": "system", "content": "You are a helpful tutor."},
+    {"role": "user", "content": "Explain the difference between a list and a tuple in Python."},
+]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    latency = 0.0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.latency)
+        body = json.dumps(RESPONSE if self.path.endswith("/responses") else COMPLETION).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub(latency, port=0):
+    StubHandler.latency = latency
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/v1"
+
+
+async def turn_before(api, base_url):
+    """Ход как до общего клиента: новое соединение на каждый вызов, блокирует event loop"""
+    if api == "responses":
+        client = OpenAI(api_key=chat.API_KEY, base_url=base_url)
+        response = client.responses.create(model="stub", instructions=CONVERSATION[0]["content"],
+                                           input=CONVERSATION[1:], temperature=0.0)
+        return response.output_text
+    response = requests.post(base_url + "/chat/completions",
+                             headers={"Authorization": f"Bearer {chat.API_KEY}", "Content-Type": "application/json"},
+                             json={"model": "stub", "temperature": 0.0, "messages": CONVERSATION})
+    return response.json()["choices"][0]["message"]["content"]
+
+
+async def turn_after(api, base_url):
+    return await chat.get_reply_impl(CONVERSATION, {"model": "stub"})
+
+
+async def measure(turn, api, base_url, turns, concurrency):
+    """(времена последовательных ходов, общее время concurrency одновременных ходов)"""
+    await turn(api, base_url)  # прогрев (импорт SDK, первое соединение)
+    times = []
+    for _ in range(turns):
+        start = time.perf_counter()
+        await turn(api, base_url)
+        times.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    await asyncio.gather(*[turn(api, base_url) for _ in range(concurrency)])
+    return times, time.perf_counter() - start
+
+
+async def run(args):
+    server, base_url = start_stub(args.latency / 1000)
+    chat.CONFIG["proxy"] = base_url
+    chat.CONFIG["log"] = False
+    apis = ["completions", "responses"] if args.api == "both" else [args.api]
+    print(f"Stub {base_url}, latency {args.latency} мс, {args.turns} последовательных ходов, "
+          f"{args.concurrency} одновременных, HTTP/2: {'да' if chat.HTTP2 else 'нет (h2 не установлен)'}")
+    try:
+        for api in apis:
+            chat.CONFIG["api"] = api
+            print(f"\n{api}:")
+            for label, turn in (("before", turn_before), ("after", turn_after)):
+                times, concurrent = await measure(turn, api, base_url, args.turns, args.concurrency)
+                mean = statistics.mean(times)
+                print(f"  {label:<7} ход {mean * 1000:7.2f} мс (накладные {(mean - args.latency / 1000) * 1000:6.2f} мс, "
+                      f"p95 {sorted(times)[min(len(times) - 1, int(len(times) * 0.95))] * 1000:7.2f} мс), "
+                      f"{args.concurrency} одновременных за {concurrent * 1000:8.1f} мс")
+    finally:
+        await chat.aclose()
+        server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Накладные расходы вызова LLM: клиент на вызов против общего пула')
+    parser.add_argument('--api', choices=['completions', 'responses', 'both'], default='both',
+                        help='Режим API chat.py (по умолчанию both)')
+    parser.add_argument('--turns', type=int, default=200, help='Последовательных ходов (по умолчанию 200)')
+    parser.add_argument('--concurrency', type=int, default=20, help='Одновременных ходов (по умолчанию 20)')
+    parser.add_argument('--latency', type=float, default=50.0, help='Задержка ответа stub в мс (по умолчанию 50)')
+    parser.add_argument('--serve', action='store_true', help='Только запустить stub-сервер (до Ctrl+C)')
+    parser.add_argument('--port', type=int, default=8100, help='Порт stub-сервера для --serve (по умолчанию 8100)')
+    args = parser.parse_args()
+    if args.serve:
+        server, base_url = start_stub(args.latency / 1000, args.port)
+        print(f"Stub {base_url}, latency {args.latency} мс (Ctrl+C - остановка)")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            server.shutdown()
+        return
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
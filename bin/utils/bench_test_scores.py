@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк подсчета баллов test/revision (CourseRepository.get_user_responses_for_elements / get_test_scores)
+Сравнивает прежнюю схему (запрос ORDER BY ... LIMIT 1 на каждый элемент) с одним запросом DISTINCT ON (element_id)
+для тестов из 10/50/200 элементов: количество запросов к БД и время.
+
+Создает схему score_bench с копией conversation (LIKE ... INCLUDING ALL, те же индексы), заполняет
+тестовыми данными и удаляет после замера. Запускать на локальной/тестовой БД с примененными миграциями.
+
+Использование:
+    python bin/utils/bench_test_scores.py [--sizes 10,50,200] [--repeat N] [--runs N] [--keep]
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+import psycopg2
+
+# Загружаем переменные окружения (опционально)
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    # dotenv не установлен, используем переменные окружения напрямую
+    pass
+
+DATABASE_URL = os.environ.get('DATABASE_URL')
+
+if not DATABASE_URL:
+    print("❌ Ошибка: DATABASE_URL не установлен!")
+    print("Установите DATABASE_URL в файле .env или в переменных окружения")
+    sys.exit(1)
+
+SCHEMA = "score_bench"
+COURSE_ID = "bench_course"
+ATTEMPTS = 3  # ответов пользователя на элемент (повторные попытки, revision)
+
+# Условия выборки ответа - как в CourseRepository
+RESPONSE_FILTER = """
+    chat_id = %(chat_id)s AND course_id = %(course_id)s AND run_id = %(run_id)s AND role = 'user'
+    AND ((score IS NOT NULL AND maxscore IS NOT NULL)
+         OR (json IS NOT NULL AND json <> '{}' AND json <> 'null'))
+"""
+
+PER_ELEMENT_QUERY = f"""
+    SELECT * FROM conversation
+    WHERE {RESPONSE_FILTER} AND element_id = %(element_id)s
+    ORDER BY score IS NOT NULL DESC, date_inserted DESC LIMIT 1
+"""
+
+BATCH_QUERY = f"""
+    SELECT DISTINCT ON (element_id) * FROM conversation
+    WHERE {RESPONSE_FILTER} AND element_id IN %(element_ids)s
+    ORDER BY element_id, score IS NOT NULL DESC, date_inserted DESC
+"""
+
+
+def element_ids(size):
+    return [f"Test{size}_{i}" for i in range(size)]
+
+
+def seed(cursor, sizes, runs):
+    """Схема score_bench: копия conversation и ответы на тесты каждого размера в каждой сессии"""
+    cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    cursor.execute(f"CREATE SCHEMA {SCHEMA}")
+    cursor.execute(f"CREATE TABLE {SCHEMA}.conversation (LIKE public.conversation INCLUDING ALL)")
+    for size in sizes:
+        # На каждый элемент: bot строка и ATTEMPTS ответов user; у последней попытки score NULL (ответ в JSON)
+        cursor.execute(f"""
+            INSERT INTO {SCHEMA}.conversation (chat_id, username, course_id, element_id, element_type,
+                                               run_id, json, role, report, score, maxscore, date_inserted)
+            SELECT 100000 + r, 'user' || r, %(course_id)s, 'Test' || %(size)s || '_' || e, 'quiz', r,
+                   CASE WHEN a = 0 THEN '{{"element_data": {{"type": "quiz"}}}}'::jsonb
+                        ELSE '{{"user_answer": {{"score": 1, "max_score": 1}}}}'::jsonb END,
+                   CASE WHEN a = 0 THEN 'bot' ELSE 'user' END,
+                   'report',
+                   CASE WHEN a BETWEEN 1 AND %(attempts)s - 1 THEN (e %% 3 > 0)::int END,
+                   CASE WHEN a BETWEEN 1 AND %(attempts)s - 1 THEN 1 END,
+                   now() - interval '1 hour' + interval '1 second' * (e * 10 + a)
+            FROM generate_series(1, %(runs)s) r, generate_series(0, %(size)s - 1) e,
+                 generate_series(0, %(attempts)s) a
+        """, {"course_id": COURSE_ID, "size": size, "runs": runs, "attempts": ATTEMPTS})
+    cursor.execute(f"ANALYZE {SCHEMA}.conversation")
+
+
+def timed(cursor, repeat, fn):
+    """Медиана времени fn() в мс и количество запросов за один вызов"""
+    timings = []
+    queries = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        queries = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), queries
+
+
+def bench(cursor, sizes, repeat, runs):
+    cursor.execute(f"SET search_path TO {SCHEMA}")
+    params = {"chat_id": 100000 + runs // 2, "course_id": COURSE_ID, "run_id": runs // 2}
+    print(f"{'Элементов':>10} {'Запросов':>9} {'N+1, мс':>9} {'Запросов':>9} {'DISTINCT ON, мс':>16} {'Ускорение':>10}")
+    for size in sizes:
+        ids = element_ids(size)
+
+        def per_element():
+            rows = []
+            for element_id in ids:
+                cursor.execute(PER_ELEMENT_QUERY, {**params, "element_id": element_id})
+                row = cursor.fetchone()
+                if row:
+                    rows.append(row)
+            per_element.rows = rows
+            return len(ids)
+
+        def batch():
+            cursor.execute(BATCH_QUERY, {**params, "element_ids": tuple(ids)})
+            batch.rows = cursor.fetchall()
+            return 1
+
+        old_ms, old_queries = timed(cursor, repeat, per_element)
+        new_ms, new_queries = timed(cursor, repeat, batch)
+        if sorted(per_element.rows) != sorted(batch.rows):
+            print(f"❌ {size}: результаты запросов различаются")
+            sys.exit(1)
+        print(f"{size:>10} {old_queries:>9} {old_ms:>9.2f} {new_queries:>9} {new_ms:>16.2f} {old_ms / new_ms:>9.1f}x")
+    cursor.execute("SET search_path TO DEFAULT")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк подсчета баллов test/revision: запрос на элемент vs DISTINCT ON')
+    parser.add_argument('--sizes', default='10,50,200', help='Размеры тестов через запятую (по умолчанию 10,50,200)')
+    parser.add_argument('--repeat', type=int, default=20, help='Повторов каждого замера (по умолчанию 20)')
+    parser.add_argument('--runs', type=int, default=200, help='Сессий с ответами (по умолчанию 200)')
+    parser.add_argument('--keep', action='store_true', help=f'Не удалять схему {SCHEMA} после замера')
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    conn = psycopg2.connect(DATABASE_URL)
+    try:
+        with conn.cursor() as cursor:
+            print(f"Заполнение {SCHEMA}: {args.runs} сессий, тесты {args.sizes}, {ATTEMPTS} ответа на элемент...")
+            seed(cursor, sizes, args.runs)
+            conn.commit()
+            bench(cursor, sizes, args.repeat, args.runs)
+            if not args.keep:
+                cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+                conn.commit()
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Проверка планов горячих запросов CourseRepository (EXPLAIN)
+Создает схему plan_check с копиями таблиц run, conversation, run_state, run_score, dialog_message
+(LIKE ... INCLUDING ALL, то есть с теми же индексами, что в БД; conversation - с помесячными секциями,
+если она секционирована в БД, миграции 0019/0020), заполняет их тестовыми данными за --months месяцев
+и проверяет, что ни один запрос не использует Seq Scan. Схема удаляется после проверки.
+
+Запросы не копируются вручную: методы CourseRepository вызываются на тестовых данных (в транзакции,
+которая откатывается), SQL, который они выполняют, перехватывается и проверяется через EXPLAIN
+с теми же параметрами. Для conversation выводится число просмотренных секций.
+
+Запускать на локальной/тестовой БД с примененными миграциями.
+
+Использование:
+    python bin/utils/check_query_plans.py [--runs N] [--rows-per-run N] [--months N] [--keep]
+"""
+import os
+import sys
+import json
+import argparse
+from pathlib import Path
+import psycopg2
+
+# Загружаем переменные окружения (опционально)
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    # dotenv не установлен, используем переменные окружения напрямую
+    pass
+
+DATABASE_URL = os.environ.get('DATABASE_URL')
+
+if not DATABASE_URL:
+    print("❌ Ошибка: DATABASE_URL не установлен!")
+    print("Установите DATABASE_URL в файле .env или в переменных окружения")
+    sys.exit(1)
+
+# CourseRepository из webapp/backend (настройки бэкенда, не нужные для проверки, - заглушки)
+backend_root = Path(__file__).resolve().parent.parent.parent / "webapp" / "backend"
+if str(backend_root) not in sys.path:
+    sys.path.insert(0, str(backend_root))
+os.environ.setdefault('SECRET_KEY', 'plan_check')
+os.environ.setdefault('OPENAI_API_KEY', 'plan_check')
+
+from sqlalchemy import create_engine, event  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+from app.repositories.course_repository import CourseRepository  # noqa: E402
+
+SCHEMA = "plan_check"
+BOT_NAME = "plan_check_bot"
+TABLES = ("run", "conversation", "run_state", "run_score", "dialog_message")
+CHATS = 2000
+COURSES = 3
+
+# Параметры запросов: пользователь, его сессия и элементы из тестовых данных
+RUN_ID = 7
+CHAT_ID = 100000 + RUN_ID % CHATS
+COURSE_ID = f"course_{RUN_ID % COURSES}"
+ELEMENT_ID = "Ex1_3"
+ELEMENTS = [(element_id, "quiz", {}) for element_id in ("Ex1_1", "Ex1_3", "Ex1_5", "Ex1_7", "Ex1_9")]
+PREFIX = "Ex1"
+CONVERSATION_ID = RUN_ID * 1000 + 14  # bot строка dialog элемента (есть dialog_message)
+
+# (название, вызов репозитория) - проверяется каждый запрос, который выполняет вызов
+CHECKS = [
+    ("get_dialog_conversation", lambda repo: repo.get_dialog_conversation(CHAT_ID, COURSE_ID, RUN_ID, ELEMENT_ID)),
+    ("update_conversation_report",
+     lambda repo: repo.update_conversation_report(CHAT_ID, COURSE_ID, RUN_ID, ELEMENT_ID, "report")),
+    ("get_user_responses_for_elements",
+     lambda repo: repo.get_user_responses_for_elements(CHAT_ID, COURSE_ID, RUN_ID, ELEMENTS)),
+    # Ex1_0 без ответов и строки run_score: выполняется и запрос к conversation для элементов без run_score
+    ("get_test_scores", lambda repo: repo.get_test_scores(CHAT_ID, COURSE_ID, RUN_ID, ELEMENTS + [("Ex1_0", "quiz", {})])),
+    ("get_revision_mistakes", lambda repo: repo.get_revision_mistakes(RUN_ID, PREFIX)),
+    ("get_revision_elements", lambda repo: repo.get_revision_elements(RUN_ID, PREFIX)),
+    ("get_total_score", lambda repo: repo.get_total_score(RUN_ID, PREFIX)),
+    ("get_element_type_count", lambda repo: repo.get_element_type_count("quiz", RUN_ID)),
+    ("get_last_element_of", lambda repo: repo.get_last_element_of(CHAT_ID, ELEMENT_ID)),
+    ("get_current_element (run_state)", lambda repo: repo.get_current_element(CHAT_ID)),
+    ("get_current_element_ids (run_state)", lambda repo: repo.get_current_element_ids(CHAT_ID)),
+    ("get_last_bot_conversation (run_state)", lambda repo: repo.get_last_bot_conversation(RUN_ID)),
+    ("get_run_id", lambda repo: repo.get_run_id(CHAT_ID, COURSE_ID)),
+    ("set_course_ended", lambda repo: repo.set_course_ended(CHAT_ID, COURSE_ID)),
+    ("get_username_by_chat_id", lambda repo: repo.get_username_by_chat_id(CHAT_ID)),
+    ("get_active_run_id", lambda repo: repo.get_active_run_id(CHAT_ID, COURSE_ID)),
+    ("is_course_ended", lambda repo: repo.is_course_ended(CHAT_ID, COURSE_ID)),
+    ("get_run_state", lambda repo: repo.get_run_state(RUN_ID)),
+    ("get_dialog_messages", lambda repo: repo.get_dialog_messages(CONVERSATION_ID)),
+]
+
+
+def is_partitioned(cursor, table):
+    cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s))",
+                   (f"public.{table}",))
+    return cursor.fetchone()[0]
+
+
+def seed(cursor, runs, rows_per_run, months):
+    """Схема plan_check: копии таблиц с индексами и тестовые данные"""
+    cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    cursor.execute(f"CREATE SCHEMA {SCHEMA}")
+    for table in TABLES:
+        if table == "conversation" and is_partitioned(cursor, table):
+            # Секции за период данных, как у conversation_create_partitions(), и секция по умолчанию
+            cursor.execute(f"CREATE TABLE {SCHEMA}.{table} (LIKE public.{table} INCLUDING ALL) "
+                           f"PARTITION BY RANGE (date_inserted)")
+            cursor.execute("""
+                SELECT m::date, (m + interval '1 month')::date
+                FROM generate_series(date_trunc('month', now() - interval '1 month' * %s),
+                                     date_trunc('month', now()), interval '1 month') m
+            """, (months,))
+            for month_start, month_end in cursor.fetchall():
+                cursor.execute(f"""
+                    CREATE TABLE {SCHEMA}.conversation_y{month_start:%Y}m{month_start:%m}
+                    PARTITION OF {SCHEMA}.conversation FOR VALUES FROM (%s) TO (%s)
+                """, (month_start, month_end))
+            cursor.execute(f"CREATE TABLE {SCHEMA}.conversation_default PARTITION OF {SCHEMA}.conversation DEFAULT")
+        else:
+            cursor.execute(f"CREATE TABLE {SCHEMA}.{table} (LIKE public.{table} INCLUDING ALL)")
+
+    # Сессии равномерно за months месяцев; каждая 5-я - другого бота; у пользователя несколько сессий в разных курсах
+    cursor.execute(f"""
+        INSERT INTO {SCHEMA}.run (run_id, chat_id, username, botname, course_id, date_inserted, is_ended)
+        SELECT g, 100000 + g %% {CHATS}, 'user' || g,
+               CASE WHEN g %% 5 = 0 THEN 'other_bot' ELSE %(botname)s END,
+               'course_' || (g %% {COURSES}),
+               now() - interval '1 month' * %(months)s * (%(runs)s - g) / %(runs)s, false
+        FROM generate_series(1, %(runs)s) g
+    """, {"botname": BOT_NAME, "runs": runs, "months": months})
+
+    # Элементы Ex{модуль}_{номер}; bot и user строки чередуются, у user строк есть score; строки сессии
+    # идут через секунду от ее начала
+    cursor.execute(f"""
+        INSERT INTO {SCHEMA}.conversation (conversation_id, chat_id, username, course_id, element_id, element_type,
+                                           run_id, json, role, report, score, maxscore, date_inserted)
+        SELECT r.run_id * 1000 + k, r.chat_id, r.username, r.course_id,
+               'Ex' || (k / 20) || '_' || (k %% 10),
+               CASE WHEN k %% 4 < 2 THEN 'quiz' WHEN k %% 10 = 4 THEN 'dialog' ELSE 'message' END,
+               r.run_id, '{{"element_data": {{"type": "quiz", "text": "..."}}}}'::jsonb,
+               CASE WHEN k %% 2 = 0 THEN 'bot' ELSE 'user' END,
+               'report',
+               CASE WHEN k %% 2 = 1 THEN (k %% 3 = 0)::int END,
+               CASE WHEN k %% 2 = 1 THEN 1 END,
+               r.date_inserted + interval '1 second' * k
+        FROM {SCHEMA}.run r, generate_series(0, %(rows)s - 1) k
+    """, {"rows": rows_per_run})
+
+    cursor.execute(f"""
+        INSERT INTO {SCHEMA}.run_state (run_id, chat_id, course_id, botname, is_ended,
+                                        conversation_id, element_id, element_type, bot_conversation_id, updated_at)
+        SELECT r.run_id, r.chat_id, r.course_id, r.botname, false,
+               c.conversation_id, c.element_id, c.element_type, c.conversation_id, c.date_inserted
+        FROM {SCHEMA}.run r
+        LEFT JOIN LATERAL (
+            SELECT * FROM {SCHEMA}.conversation
+            WHERE run_id = r.run_id
+            ORDER BY date_inserted DESC, conversation_id DESC LIMIT 1
+        ) c ON true
+    """)
+
+    # run_score - как его заполняет триггер 0015: последний ответ с баллом на элемент
+    cursor.execute(f"""
+        INSERT INTO {SCHEMA}.run_score (run_id, element_id, last_score, last_maxscore, best_score)
+        SELECT DISTINCT ON (run_id, element_id) run_id, element_id, score, maxscore, score
+        FROM {SCHEMA}.conversation
+        WHERE role = 'user' AND score IS NOT NULL AND maxscore IS NOT NULL
+        ORDER BY run_id, element_id, date_inserted DESC, conversation_id DESC
+    """)
+
+    # По 6 сообщений у bot строк dialog элементов
+    cursor.execute(f"""
+        INSERT INTO {SCHEMA}.dialog_message (conversation_id, seq, run_id, element_id, role, content, token_count)
+        SELECT c.conversation_id, s, c.run_id, c.element_id,
+               CASE WHEN s %% 2 = 0 THEN 'assistant' ELSE 'user' END, 'message', 1
+        FROM {SCHEMA}.conversation c, generate_series(0, 5) s
+        WHERE c.element_type = 'dialog' AND c.role = 'bot'
+    """)
+    for table in TABLES:
+        cursor.execute(f"ANALYZE {SCHEMA}.{table}")
+
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def explain(cursor, statement, parameters):
+    cursor.execute("EXPLAIN (FORMAT JSON) " + statement, parameters)
+    plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return list(plan_nodes(plan[0]["Plan"]))
+
+
+def check_plans(engine):
+    """EXPLAIN каждого запроса каждого вызова из CHECKS; возвращает (названия с Seq Scan, число проверок)"""
+    failed = []
+    with engine.connect() as connection:
+        transaction = connection.begin()  # записи вызовов (set_course_ended и т.д.) откатываются
+        connection.exec_driver_sql(f"SET LOCAL search_path TO {SCHEMA}")
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append((statement, parameters))
+        event.listen(connection, "before_cursor_execute", before_cursor_execute)
+
+        # EXPLAIN через курсор драйвера: мимо перехвата, в той же транзакции
+        cursor = connection.connection.driver_connection.cursor()
+        try:
+            for name, call in CHECKS:
+                statements.clear()
+                # Новая сессия на вызов: без identity map прошлых вызовов (db.get и т.п. идут в БД);
+                # commit репозитория освобождает savepoint, внешняя транзакция откатывается в конце
+                with Session(bind=connection, join_transaction_mode="create_savepoint") as session:
+                    repo = CourseRepository(session)
+                    repo.bot_name = BOT_NAME
+                    call(repo)
+                queries = [(statement, parameters) for statement, parameters in statements
+                           if not statement.lstrip().upper().startswith(("SAVEPOINT", "RELEASE", "ROLLBACK"))]
+                if not queries:
+                    failed.append(name)
+                    print(f"❌ {name}: вызов не выполнил ни одного запроса (данные или метод изменились)")
+                    continue
+
+                seq_scans, indexes, partitions = [], set(), set()
+                for statement, parameters in queries:
+                    nodes = explain(cursor, statement, parameters)
+                    seq_scans += [node.get("Relation Name") for node in nodes if node["Node Type"] == "Seq Scan"]
+                    indexes |= {node["Index Name"] for node in nodes if node.get("Index Name")}
+                    partitions |= {node["Relation Name"] for node in nodes
+                                   if node.get("Relation Name", "").startswith("conversation_")}
+                scanned = f" (секций conversation: {len(partitions)})" if partitions else ""
+                if seq_scans:
+                    failed.append(name)
+                    print(f"❌ {name}: Seq Scan on {', '.join(seq_scans)}{scanned}")
+                else:
+                    print(f"✅ {name}: {len(queries)} запр., {', '.join(sorted(indexes))}{scanned}")
+        finally:
+            cursor.close()
+            event.remove(connection, "before_cursor_execute", before_cursor_execute)
+            transaction.rollback()
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='EXPLAIN-проверка горячих запросов: без Seq Scan на тестовых данных')
+    parser.add_argument('--runs', type=int, default=5000, help='Количество сессий (по умолчанию 5000)')
+    parser.add_argument('--rows-per-run', type=int, default=40, help='Строк conversation на сессию (по умолчанию 40)')
+    parser.add_argument('--months', type=int, default=6, help='Период данных в месяцах (по умолчанию 6)')
+    parser.add_argument('--keep', action='store_true', help=f'Не удалять схему {SCHEMA} после проверки')
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(DATABASE_URL)
+    engine = create_engine(DATABASE_URL)
+    try:
+        with conn.cursor() as cursor:
+            print(f"Заполнение {SCHEMA}: {args.runs} сессий x {args.rows_per_run} строк conversation "
+                  f"за {args.months} мес. (conversation {'секционирована' if is_partitioned(cursor, 'conversation') else 'без секций'})...")
+            seed(cursor, args.runs, args.rows_per_run, args.months)
+            conn.commit()
+        failed = check_plans(engine)
+    finally:
+        conn.rollback()  # после ошибки заполнения
+        if not args.keep:
+            with conn.cursor() as cursor:
+                cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+            conn.commit()
+        conn.close()
+        engine.dispose()
+
+    if failed:
+        print(f"\nSeq Scan в {len(failed)} проверках из {len(CHECKS)}")
+        sys.exit(1)
+    print(f"\nВсе запросы {len(CHECKS)} вызовов репозитория используют индексы")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Компиляция курсов в snapshot-файлы (marshal) для быстрой загрузки
+Бот (course.py) и web backend (mvp.py) берут snapshot вместо YAML, если он собран из текущей версии файла
+
+Использование:
+    python bin/utils/compile_courses.py compile [--bot-folder FOLDER]
+    python bin/utils/compile_courses.py clean [--bot-folder FOLDER]
+    python bin/utils/compile_courses.py bench [--repeat N]
+"""
+import os
+import sys
+import glob
+import time
+import argparse
+
+import yaml
+
+# Корень проекта (course_cache.py лежит там)
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, PROJECT_ROOT)
+
+from course_cache import write_snapshot, load_snapshot, snapshot_path, file_signature, _load_yaml
+
+COURSES_FILE = "courses.yml"
+EXT_ID = "ext_courses"
+
+
+def get_course_files(bot_folder):
+    """Список YAML файлов: courses.yml, ext-файл курсов и все курсы из него (кроме курсов из БД)"""
+    folder = os.path.join(PROJECT_ROOT, "scripts", bot_folder)
+    courses_path = os.path.join(folder, COURSES_FILE)
+    courses = _load_yaml(courses_path) or {}
+    files = [courses_path]
+
+    ext_path = (courses.get(EXT_ID) or {}).get("path")
+    if ext_path and ext_path != "db":
+        files.append(os.path.join(folder, ext_path))
+        courses.update(_load_yaml(os.path.join(folder, ext_path)) or {})
+
+    for course_id, course_info in courses.items():
+        if course_id == EXT_ID or not isinstance(course_info, dict):
+            continue
+        path = course_info.get("path")
+        if not path or path == "db":
+            # Курсы из БД не читаются из YAML: бот запрашивает элементы по одному, snapshot им не нужен
+            continue
+        if path.startswith("scripts/"):
+            path = os.path.join(PROJECT_ROOT, path)
+        elif not os.path.isabs(path):
+            path = os.path.join(folder, path)
+        if path not in files:
+            files.append(path)
+    return files
+
+
+def compile_courses(bot_folder):
+    compiled = failed = 0
+    for path in get_course_files(bot_folder):
+        rel_path = os.path.relpath(path, PROJECT_ROOT)
+        if not os.path.exists(path):
+            print(f"⚠️  {rel_path}: файл не найден")
+            failed += 1
+            continue
+        try:
+            size = write_snapshot(path)
+        except (yaml.YAMLError, ValueError) as e:
+            print(f"❌ {rel_path}: {e}")
+            failed += 1
+            continue
+        print(f"✅ {rel_path} -> {os.path.basename(snapshot_path(path))} ({size} байт)")
+        compiled += 1
+    print(f"\nСкомпилировано: {compiled}, ошибок: {failed}")
+    return failed == 0
+
+
+def clean_snapshots(bot_folder):
+    for path in get_course_files(bot_folder):
+        if os.path.exists(snapshot_path(path)):
+            os.remove(snapshot_path(path))
+            print(f"🗑  {os.path.relpath(snapshot_path(path), PROJECT_ROOT)}")
+    return True
+
+
+def benchmark(repeat):
+    """Сравнение времени загрузки scripts/*.yml и *.yaml: yaml.safe_load против snapshot"""
+    scripts = os.path.join(PROJECT_ROOT, "scripts")
+    paths = sorted(glob.glob(os.path.join(scripts, "**", "*.yml"), recursive=True)
+                   + glob.glob(os.path.join(scripts, "**", "*.yaml"), recursive=True))
+    print(f"{'файл':<45} {'YAML, мс':>10} {'snapshot, мс':>13} {'ускорение':>10}")
+    total_yaml = total_snapshot = 0.0
+    for path in paths:
+        had_snapshot = os.path.exists(snapshot_path(path))
+        try:
+            write_snapshot(path)
+        except (yaml.YAMLError, ValueError) as e:
+            print(f"{os.path.relpath(path, PROJECT_ROOT):<45} пропущен: {e}")
+            continue
+        signature = file_signature(path)
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            _load_yaml(path)
+        yaml_ms = (time.perf_counter() - start) * 1000 / repeat
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            load_snapshot(path, signature)
+        snapshot_ms = (time.perf_counter() - start) * 1000 / repeat
+
+        if not had_snapshot:
+            os.remove(snapshot_path(path))
+        total_yaml += yaml_ms
+        total_snapshot += snapshot_ms
+        speedup = yaml_ms / snapshot_ms if snapshot_ms else 0
+        print(f"{os.path.relpath(path, PROJECT_ROOT):<45} {yaml_ms:>10.2f} {snapshot_ms:>13.3f} {speedup:>9.0f}x")
+    if total_snapshot:
+        print(f"{'ИТОГО':<45} {total_yaml:>10.2f} {total_snapshot:>13.3f} {total_yaml / total_snapshot:>9.0f}x")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Компиляция курсов в snapshot-файлы')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    for name, help_text in (('compile', 'Собрать snapshot для всех курсов из courses.yml'),
+                            ('clean', 'Удалить snapshot-файлы курсов из courses.yml')):
+        subparser = subparsers.add_parser(name, help=help_text)
+        subparser.add_argument('--bot-folder', default=os.environ.get('BOT_FOLDER', ''),
+                               help='Папка бота внутри scripts/ (по умолчанию BOT_FOLDER)')
+
+    bench_parser = subparsers.add_parser('bench', help='Сравнить время загрузки YAML и snapshot для scripts/*.yml')
+    bench_parser.add_argument('--repeat', type=int, default=5, help='Количество повторов (по умолчанию 5)')
+
+    args = parser.parse_args()
+    if args.command == 'compile':
+        ok = compile_courses(args.bot_folder)
+    elif args.command == 'clean':
+        ok = clean_snapshots(args.bot_folder)
+    else:
+        ok = benchmark(args.repeat)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
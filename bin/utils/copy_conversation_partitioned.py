@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Копирование conversation в conversation_partitioned пачками - шаг между миграциями 0019 и 0020
+Каждая пачка - отдельная короткая транзакция по диапазону conversation_id; строки пачки блокируются
+FOR SHARE, чтобы параллельное изменение строки (триггер синхронизации 0019) не перемешалось с копированием.
+Уже скопированные строки пропускаются (ON CONFLICT DO NOTHING), так что скрипт можно запускать на
+работающей БД, останавливать и запускать снова. Новые и измененные строки копирует триггер миграции 0019.
+
+Использование:
+    python bin/utils/copy_conversation_partitioned.py [--batch-size N] [--pause SEC] [--dry-run]
+"""
+import os
+import sys
+import time
+import argparse
+import psycopg2
+
+# Загружаем переменные окружения (опционально)
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    # dotenv не установлен, используем переменные окружения напрямую
+    pass
+
+DATABASE_URL = os.environ.get('DATABASE_URL')
+
+if not DATABASE_URL:
+    print("❌ Ошибка: DATABASE_URL не установлен!")
+    print("Установите DATABASE_URL в файле .env или в переменных окружения")
+    sys.exit(1)
+
+COPY_BATCH = """
+    WITH batch AS (
+        SELECT * FROM conversation
+        WHERE conversation_id >= %s AND conversation_id < %s
+        FOR SHARE
+    )
+    INSERT INTO conversation_partitioned SELECT * FROM batch
+    ON CONFLICT DO NOTHING
+"""
+
+
+def count_rows(cursor):
+    """Количество строк обеих таблиц в одном снимке (как проверка миграции 0020)"""
+    cursor.execute("SELECT (SELECT count(*) FROM conversation), (SELECT count(*) FROM conversation_partitioned)")
+    return cursor.fetchone()
+
+
+def copy(batch_size, pause, dry_run):
+    conn = psycopg2.connect(DATABASE_URL)
+    copied = 0
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT to_regclass('conversation_partitioned')")
+            if cursor.fetchone()[0] is None:
+                print("❌ Таблицы conversation_partitioned нет: примените миграцию 0019 (или 0020 уже применена)")
+                return False
+
+            cursor.execute("SELECT min(conversation_id), max(conversation_id) FROM conversation")
+            first_id, last_id = cursor.fetchone()
+            if first_id is None:
+                print("conversation пуста")
+                return True
+
+            old_count, new_count = count_rows(cursor)
+            print(f"Строк: conversation {old_count}, conversation_partitioned {new_count}, "
+                  f"conversation_id {first_id}..{last_id}, пачка {batch_size}")
+            if dry_run:
+                return True
+
+            # Ключ секционирования не может быть NULL (строки, вставленные до триггера 0019)
+            cursor.execute("""
+                UPDATE conversation c
+                SET date_inserted = COALESCE((SELECT r.date_inserted FROM run r WHERE r.run_id = c.run_id), '2000-01-01')
+                WHERE c.date_inserted IS NULL
+            """)
+            conn.commit()
+
+            started = time.perf_counter()
+            for start_id in range(first_id, last_id + 1, batch_size):
+                cursor.execute(COPY_BATCH, (start_id, start_id + batch_size))
+                copied += cursor.rowcount
+                conn.commit()
+                if cursor.rowcount:
+                    print(f"... {copied} строк (conversation_id < {start_id + batch_size})")
+                if pause:
+                    time.sleep(pause)
+
+            old_count, new_count = count_rows(cursor)
+            cursor.execute("SELECT count(*) FROM conversation_default")
+            default_count = cursor.fetchone()[0]
+    finally:
+        conn.close()
+
+    print(f"\nСкопировано: {copied} за {time.perf_counter() - started:.1f} с")
+    if default_count:
+        print(f"⚠️  {default_count} строк в секции по умолчанию conversation_default (даты вне помесячных секций)")
+    if old_count != new_count:
+        print(f"❌ conversation {old_count} строк, conversation_partitioned {new_count}, запустите скрипт снова")
+        return False
+    print("✅ Можно применять миграцию 0020_conversation_partitioning_swap")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Пакетное копирование conversation в conversation_partitioned перед миграцией 0020')
+    parser.add_argument('--batch-size', type=int, default=5000, help='conversation_id на транзакцию (по умолчанию 5000)')
+    parser.add_argument('--pause', type=float, default=0.0, help='Пауза между пачками в секундах (по умолчанию 0)')
+    parser.add_argument('--dry-run', action='store_true', help='Только показать количество строк')
+    args = parser.parse_args()
+    sys.exit(0 if copy(args.batch_size, args.pause, args.dry_run) else 1)
+
+
+if __name__ == '__main__':
+    main()
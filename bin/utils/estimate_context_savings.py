@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Оценка экономии токенов от бюджета истории диалога (max_context_tokens, context_window.py) на данных dialog_message
+Каждый диалог проигрывается по ходам: на каждом сообщении пользователя считается, сколько токенов ушло бы
+модели без бюджета и с бюджетом (system prompt + сводка + последние --keep-turns ходов). Сводка модели
+заменяется текстом длиной --summary-tokens, запросы на сводки считаются отдельно (они тоже стоят токенов).
+
+Использование:
+    python bin/utils/estimate_context_savings.py [--max-context-tokens N] [--keep-turns N]
+                                                 [--summary-tokens N] [--limit N]
+"""
+import os
+import sys
+import asyncio
+import logging
+import argparse
+from pathlib import Path
+import psycopg2
+
+# context_window.py в корне проекта
+project_root = Path(__file__).resolve().parent.parent.parent
+if str(project_root) not in sys.path:
+    sys.path.insert(0, str(project_root))
+
+from context_window import ContextWindow  # noqa: E402
+
+# Загружаем переменные окружения (опционально)
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    # dotenv не установлен, используем переменные окружения напрямую
+    pass
+
+DATABASE_URL = os.environ.get('DATABASE_URL')
+
+if not DATABASE_URL:
+    print("❌ Ошибка: DATABASE_URL не установлен!")
+    print("Установите DATABASE_URL в файле .env или в переменных окружения")
+    sys.exit(1)
+
+
+class MemoryCache(dict):
+    """Кэш сводок в памяти (интерфейс chat.ReplyCache)"""
+    def get(self, key):
+        return super().get(key)
+
+    def set(self, key, value, ttl=None):
+        self[key] = value
+
+
+def load_dialogs(limit):
+    """{conversation_id: [сообщения по seq]} последних limit диалогов"""
+    conn = psycopg2.connect(DATABASE_URL)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT dm.conversation_id, dm.role, dm.content
+                FROM dialog_message dm
+                WHERE dm.conversation_id IN (
+                    SELECT DISTINCT conversation_id FROM dialog_message ORDER BY conversation_id DESC LIMIT %s
+                )
+                ORDER BY dm.conversation_id, dm.seq
+            """, (limit,))
+            dialogs = {}
+            for conversation_id, role, content in cursor.fetchall():
+                dialogs.setdefault(conversation_id, []).append({"role": role, "content": content or ""})
+            return dialogs
+    finally:
+        conn.close()
+
+
+async def replay(dialogs, args):
+    async def summarize(previous_summary, messages):
+        return "s" * (4 * args.summary_tokens)
+
+    window = ContextWindow(summarize, MemoryCache(), max_tokens=args.max_context_tokens, keep_turns=args.keep_turns)
+    for messages in dialogs.values():
+        for i, message in enumerate(messages):
+            if message["role"] == "user":
+                await window.fit(messages[:i + 1])
+    return window.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Оценка экономии токенов от max_context_tokens на истории dialog_message')
+    parser.add_argument('--max-context-tokens', type=int, default=8000, help='Бюджет токенов (по умолчанию 8000)')
+    parser.add_argument('--keep-turns', type=int, default=4, help='Последних ходов без сводки (по умолчанию 4)')
+    parser.add_argument('--summary-tokens', type=int, default=300, help='Размер сводки в токенах (по умолчанию 300)')
+    parser.add_argument('--limit', type=int, default=1000, help='Последних диалогов (по умолчанию 1000)')
+    args = parser.parse_args()
+
+    dialogs = load_dialogs(args.limit)
+    if not dialogs:
+        print("dialog_message пуста")
+        return
+
+    logging.disable(logging.INFO) # без строки лога на каждый ход
+    stats = asyncio.run(replay(dialogs, args))
+
+    print(f"Диалогов: {len(dialogs)}, запросов к модели: {stats['requests']}, с бюджетом: {stats['windowed']}")
+    print(f"Токенов без бюджета:  {stats['tokens_in']}")
+    print(f"Токенов с бюджетом:   {stats['tokens_sent']} (сводок: {stats['summaries']}, на них {stats['summary_tokens']} токенов)")
+    if stats['tokens_in']:
+        print(f"Экономия: {stats['net_tokens_saved']} токенов ({stats['net_tokens_saved'] * 100 / stats['tokens_in']:.1f}%) с учетом сводок")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Разворачивание строк conversation, сохраненных относительно версии курса (course_version),
+обратно в полный JSON элемента. Нужно перед откатом миграции 0011
+
+Использование:
+    python bin/utils/expand_conversation_json.py [--batch-size N] [--dry-run]
+"""
+import os
+import sys
+import json
+import argparse
+import psycopg2
+
+# Корень проекта (course_cache.py лежит там)
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, PROJECT_ROOT)
+
+from course_cache import unpack_element_json
+
+# Загружаем переменные окружения (опционально)
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    # dotenv не установлен, используем переменные окружения напрямую
+    pass
+
+DATABASE_URL = os.environ.get('DATABASE_URL')
+
+if not DATABASE_URL:
+    print("❌ Ошибка: DATABASE_URL не установлен!")
+    print("Установите DATABASE_URL в файле .env или в переменных окружения")
+    sys.exit(1)
+
+
+def expand(batch_size, dry_run):
+    conn = psycopg2.connect(DATABASE_URL)
+    versions = {}  # course_version -> элементы курса
+    expanded = missing = 0
+    last_id = 0
+    try:
+        while True:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT conversation_id, element_id, course_version, json
+                    FROM conversation
+                    WHERE course_version IS NOT NULL AND conversation_id > %s
+                    ORDER BY conversation_id
+                    LIMIT %s
+                """, (last_id, batch_size))
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+
+                updates = []
+                for conversation_id, element_id, course_version, json_str in rows:
+                    last_id = conversation_id
+                    if course_version not in versions:
+                        cursor.execute("SELECT elements FROM course_version WHERE course_version = %s", (course_version,))
+                        row = cursor.fetchone()
+                        versions[course_version] = json.loads(row[0]) if row else None
+                    elements = versions[course_version]
+                    if elements is None or element_id not in elements:
+                        print(f"⚠️  conversation_id={conversation_id}: версия {course_version} или элемент {element_id} не найдены")
+                        missing += 1
+                        continue
+                    json_data = unpack_element_json(elements[element_id], (json.loads(json_str) if isinstance(json_str, str) else json_str) if json_str else {})
+                    updates.append((json.dumps(json_data, ensure_ascii=False), conversation_id))
+
+                if not dry_run and updates:
+                    cursor.executemany(
+                        "UPDATE conversation SET json = %s, course_version = NULL WHERE conversation_id = %s",
+                        updates
+                    )
+                    conn.commit()
+                expanded += len(updates)
+                print(f"... {expanded} строк")
+    finally:
+        conn.close()
+
+    action = "Будет развернуто" if dry_run else "Развернуто"
+    print(f"\n{action}: {expanded}, пропущено: {missing}")
+    return missing == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Разворачивание conversation.json относительно course_version в полный JSON')
+    parser.add_argument('--batch-size', type=int, default=1000, help='Строк за транзакцию (по умолчанию 1000)')
+    parser.add_argument('--dry-run', action='store_true', help='Только показать, что будет сделано')
+    args = parser.parse_args()
+    sys.exit(0 if expand(args.batch_size, args.dry_run) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест MVP API: пропускная способность быстрых запросов при одновременных долгих запросах к LLM
+Быстрые клиенты (--clients) в цикле запрашивают GET /courses/{course}/current, долгие (--slow-clients)
+отправляют сообщения в dialog элемент (--dialog-element) - запрос к LLM длится секунды.
+
+Запускать против одного процесса uvicorn (1 worker) дважды - с MVP_DB_MODE=sync и MVP_DB_MODE=async -
+и сравнивать запросов/с и задержки быстрых запросов. В режиме sync быстрые запросы выполняются
+в threadpool (40 потоков), в режиме async - в event loop на asyncpg (AsyncCourseRepository). Обработчик диалога в обоих режимах
+ждет ответ LLM в event loop без потока и соединения с БД: сотни долгих клиентов не должны замедлять быстрые.
+Без реальной модели: bin/utils/bench_llm_client.py --serve и openai.proxy в config.yaml на него.
+
+Использование:
+    python bin/utils/load_test_mvp.py --course test_course [--base-url URL] [--clients N] [--duration SEC]
+                                      [--slow-clients N --dialog-element ID] [--label sync]
+"""
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+import httpx
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+
+    def summary(self, duration):
+        if not self.latencies:
+            return f"0 запросов, ошибок {self.errors}"
+        ordered = sorted(self.latencies)
+        p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+        return (f"{len(ordered)} запросов, {len(ordered) / duration:.1f} запр/с, "
+                f"p50 {statistics.median(ordered) * 1000:.0f} мс, p95 {p95 * 1000:.0f} мс, "
+                f"max {ordered[-1] * 1000:.0f} мс, ошибок {self.errors}")
+
+
+async def timed_request(client, stats, method, url, **kwargs):
+    start = time.perf_counter()
+    try:
+        response = await client.request(method, url, **kwargs)
+        if response.status_code >= 400:
+            stats.errors += 1
+            return
+    except httpx.HTTPError:
+        stats.errors += 1
+        return
+    stats.latencies.append(time.perf_counter() - start)
+
+
+async def quick_client(base_url, course, deadline, stats):
+    """Клиент с собственным chat_id (cookie): старт курса, затем GET /current до конца теста"""
+    async with httpx.AsyncClient(base_url=base_url, timeout=60.0) as client:
+        await client.post(f"/courses/{course}/start")
+        while time.perf_counter() < deadline:
+            await timed_request(client, stats, "GET", f"/courses/{course}/current")
+
+
+async def slow_client(base_url, course, dialog_element, deadline, stats):
+    """Клиент диалога: старт курса с dialog элемента, затем сообщения в диалог до конца теста"""
+    async with httpx.AsyncClient(base_url=base_url, timeout=120.0) as client:
+        await client.post(f"/courses/{course}/start", params={"element_id": dialog_element})
+        while time.perf_counter() < deadline:
+            await timed_request(client, stats, "POST", f"/courses/{course}/dialog/message",
+                                json={"element_id": dialog_element, "message": "Расскажи подробнее"})
+
+
+async def run(args):
+    base_url = args.base_url.rstrip("/") + "/api/mvp"
+    quick = Stats()
+    slow = Stats()
+    deadline = time.perf_counter() + args.duration
+    tasks = [quick_client(base_url, args.course, deadline, quick) for _ in range(args.clients)]
+    if args.slow_clients:
+        tasks += [slow_client(base_url, args.course, args.dialog_element, deadline, slow)
+                  for _ in range(args.slow_clients)]
+    started = time.perf_counter()
+    await asyncio.gather(*tasks)
+    duration = time.perf_counter() - started
+
+    label = f" [{args.label}]" if args.label else ""
+    print(f"Результат{label}: {args.clients} быстрых и {args.slow_clients} долгих клиентов, {duration:.0f} с")
+    print(f"  GET /current:          {quick.summary(duration)}")
+    if args.slow_clients:
+        print(f"  POST /dialog/message:  {slow.summary(duration)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный тест MVP API: быстрые запросы при долгих запросах к LLM')
+    parser.add_argument('--base-url', default='http://localhost:8000', help='Адрес backend (по умолчанию http://localhost:8000)')
+    parser.add_argument('--course', required=True, help='ID курса (course_id в URL MVP)')
+    parser.add_argument('--clients', type=int, default=100, help='Быстрых клиентов (по умолчанию 100)')
+    parser.add_argument('--slow-clients', type=int, default=0, help='Клиентов dialog (по умолчанию 0)')
+    parser.add_argument('--dialog-element', help='ID dialog элемента курса для долгих клиентов')
+    parser.add_argument('--duration', type=int, default=30, help='Длительность в секундах (по умолчанию 30)')
+    parser.add_argument('--label', default='', help='Метка результата (например, sync или async)')
+    args = parser.parse_args()
+    if args.slow_clients and not args.dialog_element:
+        print("❌ Для --slow-clients нужен --dialog-element")
+        sys.exit(1)
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
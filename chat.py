@@ -1,8 +1,16 @@
 import os
+import json
+import time
+import asyncio
+import hashlib
 import logging
-import requests
+import threading
+import weakref
+from collections import OrderedDict
+import httpx
 import yaml
-from openai import OpenAI
+from openai import AsyncOpenAI
+from context_window import ContextWindow
 
 # Load environment variables from .env file
 try:
@@ -20,6 +28,226 @@ API_KEY = os.getenv('OPENAI_API_KEY', CONFIG.get("api_key"))
 ELEVENLABS_API_KEY = os.getenv('ELEVENLABS_API_KEY')
 CURRENT_ENV = os.getenv('CURRENT_ENVIRONMENT', '')
 
+# HTTP client settings (openai section of config.yaml)
+POOL_SIZE = CONFIG.get("pool_size", 200)  # in-flight requests (HTTP/1.1: one connection each)
+TIMEOUT = CONFIG.get("timeout", 600)  # seconds, a whole generation (OpenAI SDK default)
+CONNECT_TIMEOUT = CONFIG.get("connect_timeout", 10)
+KEEPALIVE_EXPIRY = CONFIG.get("keepalive_expiry", 60)
+
+try:
+    import h2  # noqa: F401 - HTTP/2 support of httpx
+    HTTP2 = CONFIG.get("http2", True)
+except ImportError:
+    HTTP2 = False
+
+class ReplyCache:
+    """
+    Opt-in cache of model replies (dialog elements with cache: true in the course YAML).
+    The key is a hash of the whole request: model, temperature/reasoning, instructions and all messages,
+    so only identical turns hit, e.g. the first reply of an auto_start dialog at temperature 0.
+    Entries live ttl seconds in a size-bounded LRU in memory and, if directory is set,
+    in files shared by processes (bot and web backend) and kept across restarts.
+    Expired files are removed when read; every PRUNE_EVERY writes the directory is pruned
+    in a background thread: expired files go, then the oldest ones above dir_size files.
+    """
+    PRUNE_EVERY = 100
+
+    def __init__(self, size=1000, ttl=86400, directory=None, dir_size=10000):
+        self.size = size
+        self.ttl = ttl
+        self.directory = directory
+        self.dir_size = dir_size
+        self._writes = 0
+        self._pruning = False
+        self._lock = threading.Lock()
+        self._entries = OrderedDict() # key -> (expires_at, reply), LRU
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    @staticmethod
+    def key(is_responses, request_params):
+        data = json.dumps([is_responses, request_params], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def get(self, key):
+        """ Cached reply or None. """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+        entry = self._read(key, now) if self.directory else None
+        with self._lock:
+            if entry:
+                self.disk_hits += 1
+                self._put(key, entry)
+                return entry[1]
+            self._entries.pop(key, None)
+            self.misses += 1
+        return None
+
+    def set(self, key, reply, ttl=None):
+        entry = (time.time() + (ttl or self.ttl), reply)
+        with self._lock:
+            self._put(key, entry)
+            self.stores += 1
+        if self.directory:
+            self._write(key, entry)
+
+    def _put(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def _read(self, key, now):
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if data.get("expires_at", 0) <= now:
+            self._remove(self._path(key))
+            return None
+        return (data["expires_at"], data["reply"])
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass # already removed by another process
+
+    def _write(self, key, entry):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as file:
+                json.dump({"expires_at": entry[0], "reply": entry[1]}, file, ensure_ascii=False)
+            os.replace(tmp_path, path) # readers never see a partial file
+        except OSError as e:
+            logging.warning(f"AI cache: can't write {path}: {e}")
+            return
+        with self._lock:
+            self._writes += 1
+            if self._writes % self.PRUNE_EVERY or self._pruning:
+                return
+            self._pruning = True
+        threading.Thread(target=self.prune, daemon=True).start()
+
+    def prune(self):
+        """ Removes expired files and the oldest files above dir_size from the directory. """
+        now = time.time()
+        try:
+            files = []
+            for subdir in os.listdir(self.directory):
+                subdir_path = os.path.join(self.directory, subdir)
+                if len(subdir) != 2 or not os.path.isdir(subdir_path): # not a key[:2] directory (e.g. summaries/)
+                    continue
+                for name in os.listdir(subdir_path):
+                    if name.endswith(".json"):
+                        path = os.path.join(subdir_path, name)
+                        try:
+                            files.append((os.stat(path).st_mtime, path))
+                        except OSError:
+                            pass
+            removed = 0
+            live = []
+            for mtime, path in files:
+                try:
+                    with open(path, "r", encoding="utf-8") as file:
+                        expired = json.load(file).get("expires_at", 0) <= now
+                except (OSError, ValueError):
+                    expired = True
+                if expired:
+                    self._remove(path)
+                    removed += 1
+                else:
+                    live.append((mtime, path))
+            live.sort()
+            for mtime, path in live[:max(len(live) - self.dir_size, 0)]:
+                self._remove(path)
+                removed += 1
+            if removed:
+                logging.info(f"AI cache: pruned {removed} files from {self.directory}, {min(len(live), self.dir_size)} left")
+        except OSError as e:
+            logging.warning(f"AI cache: can't prune {self.directory}: {e}")
+        finally:
+            with self._lock:
+                self._pruning = False
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "hit_rate": round((self.hits + self.disk_hits) / total, 3) if total else None,
+            }
+
+# Reply cache settings (openai section of config.yaml); used only for elements with cache: true
+reply_cache = ReplyCache(
+    size=CONFIG.get("cache_size", 1000),
+    ttl=CONFIG.get("cache_ttl", 86400),
+    directory=CONFIG.get("cache_dir"),
+    dir_size=CONFIG.get("cache_dir_size", 10000),
+)
+
+# Token budget of the conversation sent to the model (max_context_tokens of a dialog element or of config.yaml):
+# the prompt and the last context_keep_turns turns as is, older turns as a cached rolling summary
+SUMMARY_PROMPT = (
+    "Summarize the conversation below for the assistant who continues it. Keep what the learner said about "
+    "themselves, their answers and mistakes, what has been explained and agreed, and open questions. "
+    "At most 200 words, in the language of the conversation."
+)
+
+async def summarize_conversation(previous_summary, messages):
+    """
+    Summary for ContextWindow: previous_summary extended with messages (model summary_model or the default one)
+    """
+    text = "\n\n".join(f"### {m.get('role')}:\n{m.get('content', '')}" for m in messages)
+    if previous_summary:
+        text = f"Summary so far:\n{previous_summary}\n\nContinuation of the conversation:\n{text}"
+    conversation = [{"role": "system", "content": SUMMARY_PROMPT}, {"role": "user", "content": text}]
+    return await get_reply_impl(conversation, {"model": CONFIG.get("summary_model")})
+
+context_window = ContextWindow(
+    summarize_conversation,
+    ReplyCache(size=CONFIG.get("cache_size", 1000), ttl=CONFIG.get("cache_ttl", 86400),
+               directory=os.path.join(CONFIG["cache_dir"], "summaries") if CONFIG.get("cache_dir") else None,
+               dir_size=CONFIG.get("cache_dir_size", 10000)),
+    max_tokens=CONFIG.get("max_context_tokens"),
+    keep_turns=CONFIG.get("context_keep_turns", 4),
+)
+
+def get_cached_reply(params, is_responses, request_params):
+    """
+    (cache key, cached reply) for a request of an element with cache enabled; (None, None) otherwise
+    """
+    if not params.get("cache"):
+        return None, None
+    key = reply_cache.key(is_responses, request_params)
+    reply = reply_cache.get(key)
+    if CONFIG.get("log"):
+        stats = reply_cache.stats()
+        logging.info(f"AI cache: {'hit' if reply is not None else 'miss'} (hit rate {stats['hit_rate']}, {stats['entries']} entries)")
+    return key, reply
+
+# One pooled client per event loop (httpx connections belong to the loop they were opened in):
+# loop -> (httpx.AsyncClient, AsyncOpenAI on top of it)
+_clients = weakref.WeakKeyDictionary()
+
 def set_param(request_params, params, name, default_value = None):
     """
     Helper function to set parameters from different sources
@@ -40,16 +268,97 @@ async def get_reply(conversation, new_prompt, params):
     params is a dictionary containing model, temperature, etc.
     """
     conversation.append({"role": "user", "content": new_prompt})
-    reply = await get_reply_impl(conversation, params)
+    messages = await context_window.fit(conversation, params.get("max_context_tokens"))
+    reply = await get_reply_impl(messages, params)
     conversation.append({"role": "assistant", "content": reply})
     return reply, conversation
 
-async def get_reply_impl(conversation, params):
+async def get_reply_stream(conversation, new_prompt, params):
+    """
+    Streaming variant of get_reply: yields pieces of the reply as they arrive.
+    The assistant message is appended to conversation when the stream is complete.
+    """
+    conversation.append({"role": "user", "content": new_prompt})
+    messages = await context_window.fit(conversation, params.get("max_context_tokens"))
+    parts = []
+    async for delta in get_reply_stream_impl(messages, params):
+        parts.append(delta)
+        yield delta
+    conversation.append({"role": "assistant", "content": "".join(parts)})
+
+class StopMarkerFilter:
+    """
+    Removes the {STOP} marker from a streamed reply, also when it is split between chunks:
+    a tail that may be the beginning of the marker is held back until the next chunk.
+    """
+    MARKER = "{STOP}"
+
+    def __init__(self):
+        self.stopped = False
+        self.pending = ""
+
+    def feed(self, chunk):
+        """Returns the text that can be shown now"""
+        text = self.pending + chunk
+        if self.MARKER in text:
+            text = text.replace(self.MARKER, "")
+            self.stopped = True
+        keep = 0
+        for n in range(min(len(self.MARKER) - 1, len(text)), 0, -1):
+            if text.endswith(self.MARKER[:n]):
+                keep = n
+                break
+        self.pending = text[len(text) - keep:]
+        return text[:len(text) - keep]
+
+    def flush(self):
+        """The held back tail when the stream is complete (it was not the marker)"""
+        text, self.pending = self.pending, ""
+        return text
+
+def get_base_url():
     if CURRENT_ENV == 'heroku':
-        base_url = "https://api.openai.com/v1"
-    else:
-        base_url = CONFIG.get("proxy") or "https://api.proxyapi.ru/openai/v1"
+        return "https://api.openai.com/v1"
+    return CONFIG.get("proxy") or "https://api.proxyapi.ru/openai/v1"
 
+def get_clients():
+    """
+    Shared HTTP client of the running event loop (keep-alive, HTTP/2 if h2 is installed),
+    created on first use. Both API modes reuse its connections instead of a new TCP/TLS handshake per turn.
+    """
+    loop = asyncio.get_running_loop()
+    clients = _clients.get(loop)
+    if clients is None:
+        timeout = httpx.Timeout(TIMEOUT, connect=CONNECT_TIMEOUT)
+        http_client = httpx.AsyncClient(
+            http2=HTTP2,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE,
+                                keepalive_expiry=KEEPALIVE_EXPIRY),
+        )
+        openai_client = AsyncOpenAI(api_key=API_KEY, base_url=get_base_url(), http_client=http_client, timeout=timeout)
+        clients = (http_client, openai_client)
+        _clients[loop] = clients
+    return clients
+
+async def aclose():
+    """
+    Close the client of the running event loop. Call on shutdown of the bot or the web backend.
+    """
+    clients = _clients.pop(asyncio.get_running_loop(), None)
+    if clients is not None:
+        await clients[0].aclose()
+
+def completions_headers():
+    return {
+        "Authorization": f"Bearer {API_KEY}",
+        "Content-Type": "application/json"
+    }
+
+def build_request(conversation, params):
+    """
+    Request parameters for the configured API: (is_responses, request_params)
+    """
     is_responses = CONFIG.get("api") == "responses"
  
     request_params = {}
@@ -68,7 +377,6 @@ async def get_reply_impl(conversation, params):
         set_param(request_params, params, "temperature", 0.0)
 
     if is_responses:
-        client = OpenAI(api_key=API_KEY, base_url=base_url)
         # Responses API: convert system messages to instructions; keep the rest as input messages
         input_messages = []
         system_messages = []
@@ -86,18 +394,25 @@ async def get_reply_impl(conversation, params):
             request_params["instructions"] = "\n\n".join(m for m in system_messages if m)
 
         request_params["input"] = input_messages if input_messages else conversation
+    else:
+        request_params["messages"] = conversation
+
+    return is_responses, request_params
+
+async def get_reply_impl(conversation, params):
+    http_client, openai_client = get_clients()
+    is_responses, request_params = build_request(conversation, params)
+
+    cache_key, reply = get_cached_reply(params, is_responses, request_params)
+    if reply is not None:
+        return reply
 
     # Call API
     if is_responses:
-        response = client.responses.create(**request_params)
+        response = await openai_client.responses.create(**request_params)
         # If we’re here, it’s complete
     else: # Completions API
-        headers = {
-            "Authorization": f"Bearer {API_KEY}",
-            "Content-Type": "application/json"
-        }
-        request_params["messages"] = conversation
-        response = requests.post(base_url+"/chat/completions", headers=headers, json=request_params)
+        response = await http_client.post(get_base_url()+"/chat/completions", headers=completions_headers(), json=request_params)
         if response.status_code != 200:
             raise Exception(f"Error: {response.status_code} - {response.text}")
 
@@ -123,8 +438,60 @@ async def get_reply_impl(conversation, params):
         #  reply = completion.choices[0].message.content # AI coder replaced this for some reason:
         reply = response.json()["choices"][0]["message"]["content"]
 
+    if cache_key:
+        reply_cache.set(cache_key, reply, params.get("cache_ttl"))
     return reply
 
+async def get_reply_stream_impl(conversation, params):
+    """
+    Streamed request: yields text deltas of the Responses stream or of the Completions SSE stream
+    """
+    http_client, openai_client = get_clients()
+    is_responses, request_params = build_request(conversation, params)
+
+    cache_key, reply = get_cached_reply(params, is_responses, request_params)
+    if reply is not None:
+        yield reply
+        return
+
+    if CONFIG.get("log"):
+        logging.info(f"AI: conversation length = {len(conversation)} (stream)")
+
+    parts = []
+    if is_responses:
+        stream = await openai_client.responses.create(**request_params, stream=True)
+        async for event in stream:
+            if event.type == "response.output_text.delta":
+                parts.append(event.delta)
+                yield event.delta
+            elif event.type == "response.completed":
+                if CONFIG.get("log"):
+                    log_response(event.response)
+            elif event.type in ("response.failed", "error"):
+                raise Exception(f"Error: {event}")
+    else: # Completions API
+        request_params["stream"] = True
+        async with http_client.stream("POST", get_base_url()+"/chat/completions",
+                                      headers=completions_headers(), json=request_params) as response:
+            if response.status_code != 200:
+                await response.aread()
+                raise Exception(f"Error: {response.status_code} - {response.text}")
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices")
+                if choices:
+                    delta = choices[0].get("delta", {}).get("content")
+                    if delta:
+                        parts.append(delta)
+                        yield delta
+
+    if cache_key:
+        reply_cache.set(cache_key, "".join(parts), params.get("cache_ttl"))
+
 def log_response(response):
     """
     Log token usage information from the Responses API response
@@ -0,0 +1,133 @@
+import json
+import hashlib
+import logging
+import threading
+
+MESSAGE_OVERHEAD = 4 # tokens for the role and separators of a message
+SUMMARY_HEADER = "Summary of the earlier part of the conversation:\n"
+
+def estimate_tokens(text):
+    """ Token count without the model's tokenizer (~4 characters per token). """
+    return (len(text or "") + 3) // 4
+
+def message_tokens(message):
+    return estimate_tokens(str(message.get("content") or "")) + MESSAGE_OVERHEAD
+
+class ContextWindow:
+    """
+    Fits a conversation into a token budget before it is sent to the model (the stored conversation is not changed).
+    The leading system messages (the prompt) and the last keep_turns turns are sent as is, older turns are
+    replaced with a summary made by summarize(previous_summary, messages) - a coroutine calling the model.
+    The summarized part grows in steps of keep_turns turns, so one summary serves keep_turns turns in a row;
+    if that is not enough to fit, everything before the last keep_turns turns is summarized.
+    Summaries are kept in cache (get(key)/set(key, value, ttl), e.g. chat.ReplyCache) under a hash chain
+    of the summarized messages and rolled forward: the next summary extends the latest cached one
+    with the newly summarized turns only. If the result is still over budget, the oldest kept turns
+    are dropped (the last message is always sent).
+    """
+    def __init__(self, summarize, cache, max_tokens=None, keep_turns=4, summary_ttl=None):
+        self.summarize = summarize
+        self.cache = cache
+        self.max_tokens = max_tokens
+        self.keep_turns = keep_turns
+        self.summary_ttl = summary_ttl
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.windowed = 0
+        self.tokens_in = 0 # the whole conversations
+        self.tokens_sent = 0
+        self.summaries = 0 # summaries made by the model (not from cache)
+        self.summary_tokens = 0 # sent to the model to make them
+
+    async def fit(self, conversation, max_tokens=None):
+        """ Messages to send: conversation itself if it fits into max_tokens (or there's no budget). """
+        max_tokens = max_tokens or self.max_tokens
+        total = sum(message_tokens(m) for m in conversation)
+        if not max_tokens or total <= max_tokens:
+            self._count(total, total)
+            return conversation
+
+        n_system = 0
+        while n_system < len(conversation) and conversation[n_system].get("role") == "system":
+            n_system += 1
+        system, history = conversation[:n_system], conversation[n_system:]
+
+        step = 2 * self.keep_turns # user + assistant messages
+        kept = max(len(history) - step, 0) # the messages before the last keep_turns turns
+        boundary = kept - kept % step
+        messages, sent, dropped = await self._assemble(system, history, boundary, max_tokens)
+        if dropped and boundary < kept:
+            # The step-aligned summary is not enough: summarize everything before the kept turns
+            # instead of dropping turns nobody summarized
+            boundary = kept
+            messages, sent, dropped = await self._assemble(system, history, boundary, max_tokens)
+
+        self._count(total, sent, windowed=True)
+        logging.info(f"context_window: {total} -> {sent} tokens ({len(conversation)} -> {len(messages)} messages, "
+                     f"{boundary} summarized, {dropped} dropped; saved {self.stats()['tokens_saved']} in total)")
+        return messages
+
+    async def _assemble(self, system, history, boundary, max_tokens):
+        """ (messages, tokens, dropped): system + summary of history[:boundary] + history[boundary:] within max_tokens. """
+        summary = await self._summary(system, history[:boundary]) if boundary else None
+        head = system + ([{"role": "system", "content": SUMMARY_HEADER + summary}] if summary else [])
+        tail = history[boundary:]
+
+        head_tokens = sum(message_tokens(m) for m in head)
+        tail_tokens = [message_tokens(m) for m in tail]
+        dropped = 0
+        while len(tail) - dropped > 1 and head_tokens + sum(tail_tokens[dropped:]) > max_tokens:
+            dropped += 1
+        return head + tail[dropped:], head_tokens + sum(tail_tokens[dropped:]), dropped
+
+    async def _summary(self, system, messages):
+        """ Summary of messages (the beginning of the history after the system messages), cached and rolled forward. """
+        # chain[i] - hash of system + messages[:i]
+        chain = [hashlib.sha256(json.dumps(system, sort_keys=True, ensure_ascii=False).encode()).hexdigest()]
+        for message in messages:
+            data = chain[-1] + json.dumps(message, sort_keys=True, ensure_ascii=False)
+            chain.append(hashlib.sha256(data.encode()).hexdigest())
+
+        summary = self.cache.get("summary:" + chain[-1])
+        if summary is not None:
+            return summary
+
+        # The latest cached summary of a shorter part (the boundaries move in steps of 2 * keep_turns messages)
+        step = 2 * self.keep_turns
+        start = (len(messages) - 1) // step * step
+        previous = None
+        while start > 0:
+            previous = self.cache.get("summary:" + chain[start])
+            if previous is not None:
+                break
+            start -= step
+        start = max(start, 0)
+
+        new_messages = messages[start:]
+        summary = await self.summarize(previous, new_messages)
+        self.cache.set("summary:" + chain[-1], summary, self.summary_ttl)
+        with self._lock:
+            self.summaries += 1
+            self.summary_tokens += estimate_tokens(previous) + sum(message_tokens(m) for m in new_messages)
+        return summary
+
+    def _count(self, total, sent, windowed=False):
+        with self._lock:
+            self.requests += 1
+            self.windowed += windowed
+            self.tokens_in += total
+            self.tokens_sent += sent
+
+    def stats(self):
+        with self._lock:
+            saved = self.tokens_in - self.tokens_sent
+            return {
+                "requests": self.requests,
+                "windowed": self.windowed,
+                "tokens_in": self.tokens_in,
+                "tokens_sent": self.tokens_sent,
+                "tokens_saved": saved,
+                "summaries": self.summaries,
+                "summary_tokens": self.summary_tokens,
+                "net_tokens_saved": saved - self.summary_tokens,
+            }
@@ -2,6 +2,8 @@ import yaml
 import db
 from elements import element_registry
 from elements.element import _get_stack_part
+from course_cache import course_cache, CourseRegistry
+import copy
 import logging
 import os
 
@@ -21,9 +23,15 @@ def load_courses():
       (ext_courses: path: db). All such courses have path: db and no settings (if needed, add them to course table).
     Can also add courses from another file from the same folder (ext_courses: path: file.yml).
     Note: even DEFAULT_ID course can be overriden this way.
+    The result is cached in courses_registry (shared, don't modify it).
     """
+    return courses_registry.get()
+
+def _load_courses():
+    """ Loader for courses_registry: returns (courses, files courses were read from). """
     BOT_FOLDER = os.environ.get('BOT_FOLDER', '')
     folder = f"scripts/{BOT_FOLDER}"
+    paths = [folder + COURSES_FILE]
     with open(folder + COURSES_FILE, 'r') as file:
         try:
             courses = yaml.safe_load(file)
@@ -32,14 +40,36 @@ def load_courses():
                 if ext_file == "db":
                     ext = db.get_courses()
                 else: # can throw io and missing path exceptions (uncaught)
+                    paths.append(folder + ext_file)
                     with open(folder + ext_file, 'r') as ext_file:
                         ext = yaml.safe_load(ext_file)
                 del courses[EXT_ID]
                 courses.update(ext) # Overrides if the same key existed in courses
-            return courses
+            return courses, paths
         except yaml.YAMLError as e:
             logging.error(f"Error reading {folder + COURSES_FILE}: {e}")
-            return None
+            return None, paths
+
+# courses.yml is reread when it (or the ext file) changes; courses from db - every COURSES_TTL seconds
+# or right after invalidate_courses()
+courses_registry = CourseRegistry(_load_courses, ttl=int(os.environ.get('COURSES_TTL', 60)))
+
+def invalidate_courses():
+    """ Call after courses were added or changed in db to make them visible without waiting for the TTL. """
+    courses_registry.invalidate()
+
+def start_course_watch(dsn=None):
+    """
+    Call once on worker start. Edits in scripts/ are picked up within COURSE_WATCH_INTERVAL seconds,
+    and with dsn (DATABASE_URL) db course changes made by any process invalidate courses right away,
+    so the COURSES_TTL reload is not needed any more.
+    """
+    import course_watch
+    started = course_watch.start(dsn)
+    if started["db"]:
+        course_watch.add_listener(lambda course_code: invalidate_courses())
+        courses_registry.ttl = None
+    return started
 
 class Course:
     def __init__(self, command):
@@ -95,16 +125,34 @@ class Course:
 
     def start_run(self):
         run_id = db.create_run(self.course_id, self.username, self.chat_id, 
-                              self.params.get('utms'), self.params.get('utmc'))
+                              self.params.get('utms'), self.params.get('utmc'),
+                              course_version=self.pin_course_version())
         self.run_id = run_id
         return run_id
 
+    def pin_course_version(self):
+        """
+        Version of the course the run is pinned to (None for db courses): conversation rows of the run store
+        only the differences from its elements. The version is saved to db once per process.
+        """
+        if self.course_path == "db":
+            return None
+        compiled = self.get_compiled_course()
+        version = course_cache.register_version(compiled)
+        if not compiled.stored:
+            db.save_course_version(version, self.course_id, compiled.to_json())
+            compiled.stored = True
+        return version
+
     def get_course_data(self):
         # This slow implementation for db is not needed as this method is called for non-db only
         # if self.course_path == "db":
         #     return db.get_course_as_json(self.course_id)        
-        with open(self.course_path, 'r') as file:
-            return yaml.safe_load(file)
+        return self.get_compiled_course().elements
+
+    def get_compiled_course(self):
+        """ Cached parsed course with its navigation index (non-db courses only). Read-only. """
+        return course_cache.get_course(self.course_path)
 
     def get_element(self, element_id = None):
         if element_id:
@@ -142,25 +190,17 @@ class Course:
         #print (f"{element_id} {element_type}, {course_id}, {run_id}\n {element_data}")
 
 
-        if "revision" in element_data:
-            if len(element_data["revision"]['data'])>0:
-                revision_element = element_data["revision"]['revision_element']
-                revision_elements = element_data["revision"]['data']
-                next_element_data = revision_elements.pop(0)
-
-                next_element_id, element_data = next(iter(next_element_data.items()))
-
-                data = {
-                    'revision':{
-                        'revision_element': revision_element,
-                        'data': revision_elements
-                    },
-                    "element_data": element_data["element_data"]
-                }
-
-                e = Course._get_element_from_data(element_id, course_id, data)
+        # Revision chain (revision_queue): its elements are shown under the id of the revision element,
+        # so after the chain the course goes on after the revision element
+        chain_element_id, revision_element_id = db.next_revision_element(run_id, element_id)
+        while chain_element_id:
+            chain_element = Course._get_element_from_course(course_id, chain_element_id)
+            if chain_element and chain_element.id == chain_element_id: # skip elements removed from the course
+                e = Course._get_element_from_data(revision_element_id, course_id,
+                                                  {"element_data": chain_element.data["element_data"]})
                 e.set_run_id (run_id)
                 return e
+            chain_element_id, revision_element_id = db.next_revision_element(run_id, revision_element_id)
 
         e = Course._get_next_element_from_course(course_id, element_id)
         if e:
@@ -200,15 +240,16 @@ class Course:
             e = Course._get_element_from_data(element_id, course_id, json)
             return e
         else:
-            course_data = course.get_course_data()
+            compiled = course.get_compiled_course()
             if element_id:
-                if element_id in course_data:
-                    e = Course._get_element_from_data(element_id, course_id, {"element_data":course_data[element_id]})
+                if element_id in compiled.index:
+                    e = Course._get_element_from_compiled(compiled, element_id, course_id)
                     # e.set_run_id(self.run_id)
                     # e.set_user(self.chat_id, self.username)
                     return e
-            for element_key, element_data in course_data.items():
-                return Course._get_element_from_data(element_key, course_id, {"element_data":element_data})
+            first_id = compiled.index.first_id()
+            if first_id:
+                return Course._get_element_from_compiled(compiled, first_id, course_id)
 
     @classmethod
     def _get_next_element_from_course(cls, course_id, element_id):
@@ -218,22 +259,16 @@ class Course:
             e = Course._get_element_from_data(next_element_id, course_id, json)
             return e
         else:
-            next_element = False
-            course_data = course.get_course_data()
-
-            for key, element_data in course_data.items():
-                if next_element:
-                    e = Course._get_element_from_data(key, course_id, {"element_data":element_data})
-                    return e
-                if key==element_id:
-                    next_element = True
+            compiled = course.get_compiled_course()
+            next_element_id = compiled.index.next_id(element_id)
+            if next_element_id:
+                return Course._get_element_from_compiled(compiled, next_element_id, course_id)
             return None
 
     @classmethod
     def _get_module_id_from_course(cls, course_id, chat_id, shift):
         """ shift is either 1 (next module) or 0 (beginning of current module) or -1 (previous module).
             Note: shift==0 assumes that the first element of the module is {module}_0
-            Note: shift==-1 is not supported for db courses yet.
             "Module" here is the first element of the module.
             If such module is not found, current element_id is returned.
         """
@@ -250,39 +285,17 @@ class Course:
         
         course = Course(course_id)
         if course.course_path == "db":
-            element_id = db.get_other_module_course_element_id(course_id, element_id, module, shift)
-            #TODO: think if this is dangerous because of None element_id
+            # Module boundaries of db courses are kept in course_module table
+            module_element_id = db.get_other_module_course_element_id(course_id, element_id, module, shift)
         else:
-            prev_module = None
-            current = False # if the key belongs to the current module (where the user is now)
-            course_keys = list(course.get_course_data().keys())
-            if shift < 0:
-                course_keys = list(reversed(course_keys))
-                if element_id == course_keys[0]: #it's last element: the course is over. Simulating next module:
-                    prev_module = module + "END"
-                    course_keys.insert(0, prev_module + "_0")
-            last_i = len(course_keys) - 1
-            for i, key in enumerate(course_keys):
-                mod = key[:key.find("_")]
-                if module == mod: # e.g. Ex7
-                    current = True
-                if shift == 1: # searching next module
-                    if current and (module != mod or i == last_i): # current == True if the previous element belongs to the current module
-                        logging.info(f"Going forward from {element_id} to {key} (element #{i})")
-                        element_id = key # e.g. Ex8_0
-                        break
-                else: # searching previous module
-                    if current and module != mod: # current == True if the next element (prev in the keys list) belongs to the current module
-                        if prev_module is None: # e.g. key == Ex6_2
-                            prev_module = mod
-                        elif prev_module != mod: # e.g. Ex5_3
-                            logging.info(f"Going back from {element_id} to {course_keys[i-1]} (element #{i-1})")
-                            element_id = course_keys[i-1] # e.g. Ex6_0
-                            break
-                        elif i == last_i: # e.g. Ex0_0
-                            logging.info(f"Going back from {element_id} to {key} (last element)")
-                            element_id = key # e.g. Ex0_0
-                            break
+            modules = course.get_compiled_course().modules
+            if shift == 1:
+                module_element_id = modules.next_module_id(element_id)
+            else:
+                module_element_id = modules.prev_module_id(element_id)
+        if module_element_id:
+            logging.info(f"Going {'forward' if shift == 1 else 'back'} from {element_id} to {module_element_id}")
+            element_id = module_element_id
         return element_id
 
     @classmethod
@@ -316,6 +329,12 @@ class Course:
         element.set_conversation_id(conversation_id)
         return element
 
+    @classmethod
+    def _get_element_from_compiled(cls, compiled, element_id, course_id):
+        # Elements modify their data (e.g. Dialog stores its conversation there), so they get a copy of the cached one
+        element_data = copy.deepcopy(compiled.elements[element_id])
+        return Course._get_element_from_data(element_id, course_id, {"element_data":element_data})
+
     @classmethod
     def _get_element_from_data(cls, element_key, course_id, element_data):
         if not element_key:
@@ -0,0 +1,477 @@
+import os
+import json
+import time
+import marshal
+import hashlib
+import logging
+import threading
+import weakref
+from collections import deque, OrderedDict
+import yaml
+
+class CourseIndex:
+    """
+    Navigation over the element order of a course, built once per course version:
+    order is the list of element ids, positions maps element_id -> index in order,
+    next_ids maps element_id -> id of the element that follows it (the last one has no entry).
+    All lookups are dictionary/list accesses, independent of the course length.
+    """
+    def __init__(self, element_ids):
+        self.order = list(element_ids)
+        self.positions = {element_id: i for i, element_id in enumerate(self.order)}
+        self.next_ids = dict(zip(self.order, self.order[1:]))
+
+    def first_id(self):
+        return self.order[0] if self.order else None
+
+    def next_id(self, element_id):
+        """ None if element_id is the last one or is not in the course. """
+        return self.next_ids.get(element_id)
+
+    def prev_id(self, element_id):
+        i = self.positions.get(element_id)
+        return self.order[i - 1] if i else None
+
+    def __contains__(self, element_id):
+        return element_id in self.positions
+
+def module_of(element_id):
+    """ Module of an element: the part of the id before the first "_" (Ex8_2 -> Ex8; Ex8-1 -> Ex8- if there's no "_"). """
+    return element_id[:element_id.find("_")]
+
+class ModuleTable:
+    """
+    Module boundaries of a course, built once per course version:
+    modules maps module -> {"first", "last", "next", "prev", "restart"} (element ids or None):
+        first - the first element of the module, last - its last element;
+        next - where "next module" jumps: the first element after the module's first block;
+        prev - where "previous module" jumps: the start of the block of the previous module
+               (modules can be interleaved, e.g. Graph_Quiz_Intro_* elements between GraphQuiz* ones,
+               such elements are passed over as part of the previous module);
+        restart - the first element of the module's last block ("previous module" on the last element of the course).
+    The same table is stored for db courses in the course_module table (migration 0009).
+    """
+    def __init__(self, modules):
+        self.modules = modules
+
+    @classmethod
+    def from_element_ids(cls, element_ids):
+        runs = [] # [module, first_id, last_id] for each contiguous block of elements of one module
+        for element_id in element_ids:
+            module = module_of(element_id)
+            if runs and runs[-1][0] == module:
+                runs[-1][2] = element_id
+            else:
+                runs.append([module, element_id, element_id])
+        modules = {}
+        for i, (module, first_id, last_id) in enumerate(runs):
+            if module not in modules:
+                next_id = runs[i + 1][1] if i + 1 < len(runs) else None
+                modules[module] = {"first": first_id, "next": next_id}
+            prev_id = None
+            if i > 0:
+                prev_module = runs[i - 1][0]
+                j = i - 1
+                while j > 0 and runs[j - 1][0] in (module, prev_module):
+                    j -= 1
+                if j > 0 or runs[0][0] != module: # the course starts with this module: there's no previous one
+                    prev_id = runs[j][1]
+            modules[module].update({"last": last_id, "prev": prev_id, "restart": first_id if i > 0 else None})
+        return cls(modules)
+
+    def next_module_id(self, element_id):
+        """ First element of the next module; the last element of the course if this is the last module. None if not found. """
+        entry = self.modules.get(module_of(element_id))
+        if not entry:
+            return None
+        return entry["next"] or entry["last"]
+
+    def prev_module_id(self, element_id):
+        """
+        First element of the previous module. On the last element of the course - the first element of the current module
+        (the course is over, so the current module counts as the previous one). None if there's no such module.
+        """
+        entry = self.modules.get(module_of(element_id))
+        if not entry:
+            return None
+        if entry["next"] is None and element_id == entry["last"]:
+            return entry["restart"]
+        return entry["prev"]
+
+# Element types that get a score and are summed up by test and revision elements
+SCORED_ELEMENT_TYPES = ("quiz", "input", "multi_choice")
+
+class ScoredElements:
+    """
+    Scored elements whose ids start with a prefix (the ones a test/revision element evaluates):
+    entries is the list of (element_id, element_type, element_data) in course order,
+    by_id maps element_id -> the same tuple.
+    """
+    def __init__(self, entries):
+        self.entries = entries
+        self.by_id = {entry[0]: entry for entry in entries}
+
+class CompiledCourse:
+    """
+    A course script parsed once and kept in memory.
+    elements is the ordered dict element_id -> element_data exactly as it is in the YAML.
+    Callers must treat it as read-only: it is shared between requests.
+    version is the content hash of the course; runs are pinned to it and conversation rows
+    store only the differences from its elements (course_version table, migration 0011).
+    """
+    def __init__(self, path, signature, elements):
+        self.path = path
+        self.signature = signature
+        self.elements = elements
+        self._version = None
+        self._json_elements = None
+        self.stored = False # the version was saved to the course_version table by this process
+        self.index = CourseIndex(elements.keys())
+        self.modules = ModuleTable.from_element_ids(self.index.order)
+        self._scored = [
+            (element_id, element_data.get("type", "message"), element_data)
+            for element_id, element_data in elements.items()
+            if isinstance(element_data, dict) and element_data.get("type", "message") in SCORED_ELEMENT_TYPES
+        ]
+        self._scored_by_prefix = {}
+        # Prefixes used by the course's test/revision elements are known upfront
+        # (an empty or non-string prefix: in the YAML must not break the whole course)
+        for element_data in elements.values():
+            if isinstance(element_data, dict) and element_data.get("type") in ("test", "revision"):
+                self.scored_elements(element_data.get("prefix"))
+
+    def scored_elements(self, prefix):
+        """ ScoredElements for the prefix, computed once per course version. """
+        prefix = str(prefix) if prefix else ""
+        scored = self._scored_by_prefix.get(prefix)
+        if scored is None:
+            scored = ScoredElements([entry for entry in self._scored if entry[0].startswith(prefix)])
+            self._scored_by_prefix[prefix] = scored
+        return scored
+
+    def to_json(self):
+        """ The elements as they are stored in the course_version table. """
+        return json.dumps(self.elements, ensure_ascii=False, default=str)
+
+    def _compute_version(self):
+        text = self.to_json()
+        # The element definitions conversation rows are packed against: the elements after a JSON round trip,
+        # exactly as they come back from the course_version table (and as conversation.json is read)
+        self._json_elements = json.loads(text)
+        self._version = hashlib.sha256(text.encode("utf-8")).hexdigest()[:32] # 128 bits
+
+    @property
+    def version(self):
+        """ Content hash of the course: equal content gives the same version in every process. """
+        if self._version is None:
+            self._compute_version()
+        return self._version
+
+    @property
+    def json_elements(self):
+        if self._json_elements is None:
+            self._compute_version()
+        return self._json_elements
+
+    @classmethod
+    def from_version(cls, version, text):
+        """ A course version loaded from the course_version table. """
+        compiled = cls(None, None, json.loads(text))
+        compiled._version = version
+        compiled._json_elements = compiled.elements
+        compiled.stored = True
+        return compiled
+
+def pack_element_json(definition, json_data):
+    """
+    conversation.json of an element reduced to per-user state: element_data keeps only the keys that differ
+    from definition (the element in the course version), removed_keys lists the definition keys it doesn't have.
+    Other keys (e.g. the revision chain) are kept as they are.
+    """
+    element_data = json_data["element_data"]
+    packed = dict(json_data)
+    packed["element_data"] = {key: value for key, value in element_data.items()
+                              if key not in definition or definition[key] != value}
+    removed_keys = [key for key in definition if key not in element_data]
+    if removed_keys:
+        packed["removed_keys"] = removed_keys
+    return packed
+
+def unpack_element_json(definition, packed):
+    """ Inverse of pack_element_json. """
+    json_data = dict(packed)
+    removed_keys = json_data.pop("removed_keys", ())
+    element_data = {key: value for key, value in definition.items() if key not in removed_keys}
+    element_data.update(json_data.get("element_data") or {})
+    json_data["element_data"] = element_data
+    return json_data
+
+class CoursesIndex:
+    """ courses.yml parsed once per file version, with a token -> course_id index for invite links. """
+    def __init__(self, courses):
+        self.courses = courses
+        self.by_token = {}
+        for course_id, course_info in courses.items():
+            if isinstance(course_info, dict) and course_info.get("token"):
+                # The first course with the token wins, as it did with the linear search
+                self.by_token.setdefault(course_info["token"], course_id)
+
+    def resolve_token(self, token):
+        """ course_id for the token or None. """
+        return self.by_token.get(token)
+
+def file_signature(path):
+    """
+    (mtime, size, inode) of the file. The inode changes when an editor saves by rename,
+    size catches writes within the same mtime tick.
+    Raises OSError (e.g. FileNotFoundError) if the file is not accessible.
+    """
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+def _load_yaml(path):
+    with open(path, 'r', encoding='utf-8') as file:
+        return yaml.safe_load(file)
+
+# Precompiled snapshots (bin/utils/compile_courses.py): the parsed YAML stored with marshal next to
+# the source file. A snapshot is used only if it was built from the current version of the file
+# (same mtime and size); otherwise the YAML is parsed as usual.
+SNAPSHOT_SUFFIX = ".snapshot"
+SNAPSHOT_FORMAT = 1
+
+def snapshot_path(path):
+    return path + SNAPSHOT_SUFFIX
+
+def write_snapshot(path):
+    """
+    Compiles the YAML file at path into its snapshot; returns the snapshot size in bytes.
+    Raises ValueError if the document has values marshal can't store (e.g. dates).
+    """
+    st = os.stat(path)
+    data = _load_yaml(path)
+    blob = marshal.dumps({
+        "format": SNAPSHOT_FORMAT,
+        "source": (st.st_mtime_ns, st.st_size),
+        "data": data,
+    })
+    tmp_path = snapshot_path(path) + ".tmp"
+    with open(tmp_path, 'wb') as file:
+        file.write(blob)
+    os.replace(tmp_path, snapshot_path(path)) # readers never see a half-written snapshot
+    return len(blob)
+
+def load_snapshot(path, signature=None):
+    """ Data from the snapshot of path if it matches the source file, otherwise None. """
+    if signature is None:
+        signature = file_signature(path)
+    try:
+        with open(snapshot_path(path), 'rb') as file:
+            payload = marshal.load(file)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, EOFError, TypeError) as e:
+        logging.warning(f"course_cache: broken snapshot for {path}: {e}")
+        return None
+    if not isinstance(payload, dict) or payload.get("format") != SNAPSHOT_FORMAT:
+        return None
+    if payload.get("source") != signature[:2]: # YAML was edited after compilation
+        return None
+    return payload.get("data")
+
+def _load_source(path, signature):
+    data = load_snapshot(path, signature)
+    if data is not None:
+        return data
+    return _load_yaml(path)
+
+class CourseCache:
+    """
+    Process-wide cache of YAML files (course scripts and courses.yml).
+    Every lookup stats the file and reparses it only if its signature has changed,
+    so edits in scripts/ are picked up on the next request without restarts.
+    While a watcher (course_watch.FileWatcher) is running, watched is True: lookups trust
+    cached entries without a stat and the watcher invalidates changed files instead.
+    """
+    # Course versions loaded from db (old versions pinned by runs) kept in memory
+    MAX_LOADED_VERSIONS = 16
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {} # abs path -> (signature, value)
+        self._versions = weakref.WeakValueDictionary() # version -> CompiledCourse still in use
+        self._loaded_versions = OrderedDict() # version -> CompiledCourse loaded from db, LRU
+        self.watched = False
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, path, compile_fn):
+        path = os.path.abspath(path)
+        if self.watched:
+            with self._lock:
+                entry = self._entries.get(path)
+                if entry:
+                    self.hits += 1
+                    return entry[1]
+        signature = file_signature(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry and entry[0] == signature:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        # Parsing is done outside of the lock: two threads may parse the same file once, that's fine
+        value = compile_fn(path, signature, _load_source(path, signature))
+        with self._lock:
+            self._entries[path] = (signature, value)
+        logging.info(f"course_cache: loaded {path}")
+        return value
+
+    def get_course(self, path):
+        """ CompiledCourse for the course script at path. """
+        return self._get(path, lambda path, signature, data: CompiledCourse(path, signature, data or {}))
+
+    def get_courses_index(self, path):
+        """ CoursesIndex for a courses.yml file. """
+        return self._get(path, lambda path, signature, data: CoursesIndex(data or {}))
+
+    def is_cached(self, path):
+        """ True if the next lookup of path is served from the cache (no parsing). """
+        path = os.path.abspath(path)
+        with self._lock:
+            entry = self._entries.get(path)
+        if entry is None:
+            return False
+        if self.watched:
+            return True
+        try:
+            return entry[0] == file_signature(path)
+        except OSError:
+            return False
+
+    def invalidate(self, path=None):
+        """ Drops one file (or everything if path is None); it will be reparsed on the next lookup. """
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(os.path.abspath(path), None)
+
+    def register_version(self, compiled):
+        """ Makes compiled findable by its version (while it is in use); returns the version. """
+        version = compiled.version
+        with self._lock:
+            self._versions[version] = compiled
+        return version
+
+    def get_version(self, version, loader=None):
+        """
+        CompiledCourse of a course version: the one in memory or, if loader is given,
+        built from loader(version) (the JSON from the course_version table). None if not found.
+        """
+        with self._lock:
+            compiled = self._versions.get(version)
+            if compiled is not None:
+                if version in self._loaded_versions:
+                    self._loaded_versions.move_to_end(version)
+                return compiled
+        text = loader(version) if loader else None
+        if text is None:
+            return None
+        compiled = CompiledCourse.from_version(version, text)
+        with self._lock:
+            self._versions[version] = compiled
+            self._loaded_versions[version] = compiled
+            while len(self._loaded_versions) > self.MAX_LOADED_VERSIONS:
+                self._loaded_versions.popitem(last=False)
+        logging.info(f"course_cache: loaded course version {version}")
+        return compiled
+
+    def signatures(self):
+        """ {abs path: signature} of the cached files (for the watcher). """
+        with self._lock:
+            return {path: entry[0] for path, entry in self._entries.items()}
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "versions": len(self._versions),
+                "watched": self.watched,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else None,
+            }
+
+class CourseRegistry:
+    """
+    Keeps the result of a courses loader (course_id -> path and settings) in memory.
+    loader() returns (courses, paths): paths are the files the result was built from.
+    The result is reloaded when one of these files changes, when ttl seconds have passed
+    (covers sources that can't be watched, e.g. courses from db) or after invalidate().
+    ttl=None disables expiry (when db changes come through course_watch.CourseChangeListener).
+    """
+    def __init__(self, loader, ttl=60):
+        self._loader = loader
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._courses = None
+        self._signatures = None # path -> signature of the files used by the last load
+        self._loaded_at = 0
+        self._reload_times = deque() # monotonic times of reloads within the last minute
+        self.reloads = 0
+
+    def _is_fresh(self):
+        if self._courses is None:
+            return False
+        if self.ttl is not None and time.monotonic() - self._loaded_at > self.ttl:
+            return False
+        try:
+            return all(file_signature(path) == signature for path, signature in self._signatures.items())
+        except OSError:
+            return False
+
+    def get(self):
+        """ Courses dict (shared, read-only); None if the loader failed. """
+        with self._lock:
+            if self._is_fresh():
+                return self._courses
+        courses, paths = self._loader()
+        signatures = {}
+        for path in paths:
+            try:
+                signatures[path] = file_signature(path)
+            except OSError:
+                signatures[path] = None
+        now = time.monotonic()
+        with self._lock:
+            if courses is not None: # keep retrying on the next lookup while the loader fails
+                self._courses = courses
+                self._signatures = signatures
+                self._loaded_at = now
+            self.reloads += 1
+            self._reload_times.append(now)
+            while now - self._reload_times[0] > 60:
+                self._reload_times.popleft()
+            per_minute = len(self._reload_times)
+        logging.info(f"course_registry: reloaded {len(courses or {})} courses ({per_minute} reloads in the last minute)")
+        return courses
+
+    def invalidate(self):
+        """ Forces a reload on the next lookup, e.g. after courses were added to db. """
+        with self._lock:
+            self._courses = None
+
+    def stats(self):
+        with self._lock:
+            now = time.monotonic()
+            while self._reload_times and now - self._reload_times[0] > 60:
+                self._reload_times.popleft()
+            return {
+                "courses": len(self._courses) if self._courses is not None else None,
+                "reloads": self.reloads,
+                "reloads_last_minute": len(self._reload_times),
+                "age": round(now - self._loaded_at, 1) if self._courses is not None else None,
+            }
+
+course_cache = CourseCache()
@@ -0,0 +1,158 @@
+import os
+import select
+import logging
+import threading
+
+from course_cache import course_cache, file_signature
+
+try:
+    import psycopg2
+    import psycopg2.extensions
+except ImportError: # the listener is optional, file watching works without it
+    psycopg2 = None
+
+# Channel notified by the triggers of migration 0010 on every change of course/course_element, payload is the course_code
+CHANNEL = "course_changed"
+
+_listeners = []
+_listeners_lock = threading.Lock()
+
+def add_listener(callback):
+    """
+    callback(course_code) is called (from a watcher thread) when a db course has changed
+    in any process: backend, course editor or bot. Keep it fast, e.g. drop a cache entry.
+    """
+    with _listeners_lock:
+        _listeners.append(callback)
+
+def notify_listeners(course_code):
+    with _listeners_lock:
+        listeners = list(_listeners)
+    for callback in listeners:
+        try:
+            callback(course_code)
+        except Exception as e:
+            logging.error(f"course_watch: listener failed for {course_code}: {e}")
+
+class FileWatcher(threading.Thread):
+    """
+    Polls the files cached in cache every interval seconds and drops the changed ones,
+    so an edit in scripts/ is visible to this process within interval seconds.
+    While it runs, cache lookups don't stat files (cache.watched is True).
+    Only the changed course is reparsed; nothing is reloaded periodically.
+    """
+    def __init__(self, cache, interval=1.0):
+        super().__init__(name="course-file-watcher", daemon=True)
+        self.cache = cache
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def check(self):
+        """ One scan; returns the list of invalidated paths. """
+        changed = []
+        for path, signature in self.cache.signatures().items():
+            try:
+                current = file_signature(path)
+            except OSError:
+                current = None
+            if current != signature:
+                self.cache.invalidate(path)
+                changed.append(path)
+        for path in changed:
+            logging.info(f"course_watch: {path} changed, dropped from cache")
+        return changed
+
+    def run(self):
+        self.cache.watched = True
+        try:
+            while not self._stop_event.wait(self.interval):
+                try:
+                    self.check()
+                except Exception as e:
+                    logging.error(f"course_watch: file scan failed: {e}")
+        finally:
+            self.cache.watched = False
+
+    def stop(self):
+        self._stop_event.set()
+
+class CourseChangeListener(threading.Thread):
+    """
+    LISTEN on CHANNEL and calls notify_listeners(course_code) for every notification.
+    Reconnects after errors; after a reconnect listeners get None ("anything may have changed"),
+    as notifications sent while disconnected are lost.
+    """
+    def __init__(self, dsn, timeout=5.0, retry_delay=5.0):
+        super().__init__(name="course-change-listener", daemon=True)
+        self.dsn = dsn
+        self.timeout = timeout
+        self.retry_delay = retry_delay
+        self._stop_event = threading.Event()
+
+    def _listen(self, connection):
+        connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with connection.cursor() as cursor:
+            cursor.execute(f"LISTEN {CHANNEL};")
+        logging.info(f"course_watch: listening on {CHANNEL}")
+        while not self._stop_event.is_set():
+            if select.select([connection], [], [], self.timeout) == ([], [], []):
+                continue
+            connection.poll()
+            course_codes = set()
+            while connection.notifies:
+                course_codes.add(connection.notifies.pop(0).payload)
+            for course_code in course_codes:
+                logging.info(f"course_watch: course {course_code} changed in db")
+                notify_listeners(course_code)
+
+    def run(self):
+        reconnect = False
+        while not self._stop_event.is_set():
+            connection = None
+            try:
+                connection = psycopg2.connect(self.dsn)
+                if reconnect:
+                    notify_listeners(None)
+                reconnect = True
+                self._listen(connection)
+            except Exception as e:
+                logging.error(f"course_watch: listener error: {e}, reconnecting in {self.retry_delay}s")
+                self._stop_event.wait(self.retry_delay)
+            finally:
+                if connection is not None:
+                    connection.close()
+
+    def stop(self):
+        self._stop_event.set()
+
+_started = {}
+_start_lock = threading.Lock()
+
+def start(dsn=None, interval=None):
+    """
+    Starts the invalidation bus of this process once: the file watcher for course_cache
+    and, if dsn is given and psycopg2 is installed, the db listener.
+    interval defaults to COURSE_WATCH_INTERVAL (seconds, 1 by default; 0 disables the file watcher).
+    Returns {"files": FileWatcher or None, "db": CourseChangeListener or None}.
+    """
+    if interval is None:
+        interval = float(os.environ.get('COURSE_WATCH_INTERVAL', 1))
+    if dsn:
+        dsn = dsn.replace("postgresql+psycopg2://", "postgresql://") # SQLAlchemy URL
+    with _start_lock:
+        if not _started:
+            _started["files"] = FileWatcher(course_cache, interval) if interval > 0 else None
+            if dsn and psycopg2 is None:
+                logging.warning("course_watch: psycopg2 is not installed, db course changes are not watched")
+            _started["db"] = CourseChangeListener(dsn) if dsn and psycopg2 is not None else None
+            for thread in _started.values():
+                if thread:
+                    thread.start()
+        return dict(_started)
+
+def stop():
+    with _start_lock:
+        for thread in _started.values():
+            if thread:
+                thread.stop()
+        _started.clear()
@@ -5,9 +5,13 @@ import re
 import logging
 import asyncio
 import io
+import time
 
 from utils import get_direct_download_link
 
+# Min interval between progressive updates of a streamed reply (Telegram limits message edits)
+STREAM_UPDATE_INTERVAL = 1.0
+
 class Dialog(Element):
     def __init__(self, id: int, course_id: str, data: str) -> None:
         super().__init__(id, course_id, data)
@@ -18,7 +22,12 @@ class Dialog(Element):
         self.params = { 
             "model": element_data.get("model"),
             "temperature": element_data.get("temperature"),
-            "reasoning": element_data.get("reasoning")
+            "reasoning": element_data.get("reasoning"),
+            # Opt-in reply cache for identical turns (see chat.ReplyCache)
+            "cache": element_data.get("cache", False),
+            "cache_ttl": element_data.get("cache_ttl"),
+            # Token budget of the conversation sent to the model (see context_window.ContextWindow)
+            "max_context_tokens": element_data.get("max_context_tokens")
         }
         
         # Language for voice message transcription (ISO-639-1 code, e.g., "el" for Greek)
@@ -105,8 +114,12 @@ class Dialog(Element):
         self.save_report(role = "bot", report = self.bot_reply)
 
 
-    async def chat_reply(self, message_text, ban_text=None):
-        """Process chat reply (for web, without bot parameter)"""
+    async def chat_reply(self, message_text, ban_text=None, on_partial=None):
+        """
+        Process chat reply (for web, without bot parameter).
+        on_partial: optional async callback getting the reply so far while it is streamed
+        (e.g. to edit the sent Telegram message); without it the whole reply is awaited.
+        """
         if ban_text is not None:
             self.BANNED = True
             self.text = ban_text
@@ -120,7 +133,10 @@ class Dialog(Element):
             conversation.append({"role": "system", "content": prompt})
     
         # Call chat API directly (no typing indicator for web)
-        reply, conversation = await chat.get_reply(conversation, message_text, self.params)
+        if on_partial is None:
+            reply, conversation = await chat.get_reply(conversation, message_text, self.params)
+        else:
+            reply = await self.stream_reply(conversation, message_text, on_partial)
         self.set_conversation(conversation)
 
         if "{STOP}" in reply:
@@ -136,6 +152,24 @@ class Dialog(Element):
         if reply.strip() != "": # can be if {STOP} was in AI's answer
             self.save_reply(reply)
         
+    async def stream_reply(self, conversation, message_text, on_partial):
+        """
+        Streams the reply (without the {STOP} marker) to on_partial at most every STREAM_UPDATE_INTERVAL seconds.
+        Returns the whole reply; conversation is updated as by chat.get_reply.
+        """
+        stop_filter = chat.StopMarkerFilter()
+        parts = []
+        shown = ""
+        last_update = 0.0
+        async for delta in chat.get_reply_stream(conversation, message_text, self.params):
+            parts.append(delta)
+            shown += stop_filter.feed(delta)
+            now = time.monotonic()
+            if shown.strip() and now - last_update >= STREAM_UPDATE_INTERVAL:
+                await on_partial(shown)
+                last_update = now
+        return "".join(parts)
+
     # replace_vars needs previous conversations in db, so it must be called just before sending this element
     def replace_vars_in_prompt(self):
         prompt = re.sub(r'<!--.*?-->', '', self.prompt, flags=re.DOTALL)
@@ -19,7 +19,9 @@ class Revision(Element):
         if len(revision_mistakes)>0:
             revision_elements = db.get_revision_elements(self.run_id, self.prefix)
 
-            self.data['revision'] = {"revision_element": self.data['element_data'], 'data': revision_mistakes + revision_elements}
+            # The chain is kept in revision_queue (element ids only), Course.get_next_element goes through it
+            element_ids = [next(iter(item)) for item in revision_mistakes + revision_elements]
+            db.start_revision_queue(self.run_id, self.id, element_ids)
             message = self.text
         else:
             message = self.no_mistakes
@@ -0,0 +1,24 @@
+-- ============================================================================
+-- Rollback: 0009_course_module
+-- ============================================================================
+-- Description: Rollback for course_module table and its triggers
+-- ============================================================================
+
+BEGIN;
+
+-- Drop triggers
+DROP TRIGGER IF EXISTS course_element_module_insert ON course_element;
+DROP TRIGGER IF EXISTS course_element_module_update ON course_element;
+DROP TRIGGER IF EXISTS course_element_module_delete ON course_element;
+
+-- Drop functions
+DROP FUNCTION IF EXISTS course_element_refresh_course_module();
+DROP FUNCTION IF EXISTS refresh_course_module(INT4, INT4);
+
+-- Drop table
+DROP TABLE IF EXISTS course_module;
+
+-- Remove from migration history
+DELETE FROM schema_migrations WHERE version = '0009';
+
+COMMIT;
@@ -0,0 +1,22 @@
+-- ============================================================================
+-- Rollback: 0010_course_changed_notify
+-- ============================================================================
+-- Description: Rollback for course_changed notification triggers
+-- ============================================================================
+
+BEGIN;
+
+-- Drop triggers
+DROP TRIGGER IF EXISTS course_notify ON course;
+DROP TRIGGER IF EXISTS course_element_notify_insert ON course_element;
+DROP TRIGGER IF EXISTS course_element_notify_update ON course_element;
+DROP TRIGGER IF EXISTS course_element_notify_delete ON course_element;
+
+-- Drop functions
+DROP FUNCTION IF EXISTS course_notify_changed();
+DROP FUNCTION IF EXISTS course_element_notify_changed();
+
+-- Remove from migration history
+DELETE FROM schema_migrations WHERE version = '0010';
+
+COMMIT;
@@ -0,0 +1,29 @@
+-- ============================================================================
+-- Rollback: 0011_course_version
+-- ============================================================================
+-- Description: Rollback for course_version table and columns
+-- WARNING: conversation rows written with course_version keep only per-user state;
+--          expand them before the rollback, otherwise their element data is lost:
+--          python bin/utils/expand_conversation_json.py
+-- ============================================================================
+
+BEGIN;
+
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM conversation WHERE course_version IS NOT NULL) THEN
+        RAISE EXCEPTION 'conversation has rows packed against course_version, expand them first';
+    END IF;
+END $$;
+
+-- Drop columns
+ALTER TABLE conversation DROP COLUMN IF EXISTS course_version;
+ALTER TABLE run DROP COLUMN IF EXISTS course_version;
+
+-- Drop table
+DROP TABLE IF EXISTS course_version;
+
+-- Remove from migration history
+DELETE FROM schema_migrations WHERE version = '0011';
+
+COMMIT;
@@ -0,0 +1,24 @@
+-- ============================================================================
+-- Rollback: 0012_run_state
+-- ============================================================================
+-- Description: Rollback for run_state table and its triggers
+-- ============================================================================
+
+BEGIN;
+
+-- Drop triggers
+DROP TRIGGER IF EXISTS run_state_run_insert ON run;
+DROP TRIGGER IF EXISTS run_state_run_update ON run;
+DROP TRIGGER IF EXISTS run_state_conversation_insert ON conversation;
+
+-- Drop functions
+DROP FUNCTION IF EXISTS run_state_on_run();
+DROP FUNCTION IF EXISTS run_state_on_conversation();
+
+-- Drop table
+DROP TABLE IF EXISTS run_state;
+
+-- Remove from migration history
+DELETE FROM schema_migrations WHERE version = '0012';
+
+COMMIT;
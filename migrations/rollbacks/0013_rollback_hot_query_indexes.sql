@@ -0,0 +1,14 @@
+-- ============================================================================
+-- Rollback: 0013_hot_query_indexes
+-- ============================================================================
+-- Description: Rollback for hot query indexes
+-- DROP INDEX CONCURRENTLY can't run inside a transaction block: apply without BEGIN/COMMIT
+-- ============================================================================
+
+DROP INDEX CONCURRENTLY IF EXISTS idx_conversation_run_element_role_date;
+DROP INDEX CONCURRENTLY IF EXISTS idx_conversation_run_role_date;
+DROP INDEX CONCURRENTLY IF EXISTS idx_conversation_chat_element_date;
+DROP INDEX CONCURRENTLY IF EXISTS idx_run_chat_bot_course_date;
+
+-- Remove from migration history
+DELETE FROM schema_migrations WHERE version = '0013';
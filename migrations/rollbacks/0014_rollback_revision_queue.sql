@@ -0,0 +1,15 @@
+-- ============================================================================
+-- Rollback: 0014_revision_queue
+-- ============================================================================
+-- Description: Rollback for revision_queue table
+-- ============================================================================
+
+BEGIN;
+
+-- Drop table
+DROP TABLE IF EXISTS revision_queue;
+
+-- Remove from migration history
+DELETE FROM schema_migrations WHERE version = '0014';
+
+COMMIT;
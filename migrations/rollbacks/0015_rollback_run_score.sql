@@ -0,0 +1,21 @@
+-- ============================================================================
+-- Rollback: 0015_run_score
+-- ============================================================================
+-- Description: Rollback for run_score table and its trigger
+-- ============================================================================
+
+BEGIN;
+
+-- Drop trigger
+DROP TRIGGER IF EXISTS run_score_conversation_insert ON conversation;
+
+-- Drop function
+DROP FUNCTION IF EXISTS run_score_on_conversation();
+
+-- Drop table
+DROP TABLE IF EXISTS run_score;
+
+-- Remove from migration history
+DELETE FROM schema_migrations WHERE version = '0015';
+
+COMMIT;
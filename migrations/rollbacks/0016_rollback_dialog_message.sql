@@ -0,0 +1,28 @@
+-- ============================================================================
+-- Rollback: 0016_dialog_message
+-- ============================================================================
+-- Description: Rollback for dialog_message table. Histories are copied back
+--              into element_data.conversation of the dialog rows first.
+-- ============================================================================
+
+BEGIN;
+
+-- Copy histories back into conversation.json (full and course_version-packed rows
+-- both keep element_data as an object)
+UPDATE conversation c
+SET json = jsonb_set(c.json::jsonb, '{element_data,conversation}', m.messages)::text
+FROM (
+    SELECT conversation_id,
+           jsonb_agg(jsonb_build_object('role', role, 'content', content) ORDER BY seq) AS messages
+    FROM dialog_message
+    GROUP BY conversation_id
+) m
+WHERE c.conversation_id = m.conversation_id;
+
+-- Drop table
+DROP TABLE IF EXISTS dialog_message;
+
+-- Remove from migration history
+DELETE FROM schema_migrations WHERE version = '0016';
+
+COMMIT;
@@ -0,0 +1,25 @@
+-- ============================================================================
+-- Rollback: 0017_jsonb_payloads
+-- ============================================================================
+-- Description: Rollback for the first step of the jsonb conversion
+-- (roll back 0018_jsonb_conversation_swap first if it was applied)
+-- ============================================================================
+
+BEGIN;
+
+-- Drop shadow column and its trigger
+DROP TRIGGER IF EXISTS conversation_sync_json_b ON conversation;
+DROP FUNCTION IF EXISTS conversation_sync_json_b();
+ALTER TABLE conversation DROP COLUMN IF EXISTS json_b;
+
+-- course_element.json back to text
+DROP INDEX IF EXISTS idx_course_element_json;
+ALTER TABLE course_element ALTER COLUMN json TYPE TEXT USING json::text;
+
+-- Drop helper
+DROP FUNCTION IF EXISTS text_to_jsonb(TEXT);
+
+-- Remove from migration history
+DELETE FROM schema_migrations WHERE version = '0017';
+
+COMMIT;
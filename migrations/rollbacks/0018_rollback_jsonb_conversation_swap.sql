@@ -0,0 +1,50 @@
+-- ============================================================================
+-- Rollback: 0018_jsonb_conversation_swap
+-- ============================================================================
+-- Description: Rollback for the conversation.json swap: json back to text
+-- (rewrites the table under an ACCESS EXCLUSIVE lock) and the 0012 version of
+-- run_state_on_conversation. Afterwards 0017 is applied again: json_b is empty
+-- until the next backfill.
+-- DROP INDEX CONCURRENTLY can't run inside a transaction block: it goes first, without BEGIN
+-- ============================================================================
+
+DROP INDEX CONCURRENTLY IF EXISTS idx_conversation_revision_rows;
+
+BEGIN;
+
+ALTER TABLE conversation ALTER COLUMN json TYPE TEXT USING json::text;
+ALTER TABLE conversation ADD COLUMN IF NOT EXISTS json_b JSONB NULL;
+
+CREATE OR REPLACE FUNCTION conversation_sync_json_b()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.json_b := text_to_jsonb(NEW.json);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS conversation_sync_json_b ON conversation;
+CREATE TRIGGER conversation_sync_json_b
+    BEFORE INSERT OR UPDATE OF json ON conversation
+    FOR EACH ROW EXECUTE FUNCTION conversation_sync_json_b();
+
+CREATE OR REPLACE FUNCTION run_state_on_conversation()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE run_state
+    SET conversation_id = NEW.conversation_id,
+        element_id = NEW.element_id,
+        element_type = NEW.element_type,
+        updated_at = NEW.date_inserted,
+        bot_conversation_id = CASE WHEN NEW.role = 'bot' THEN NEW.conversation_id ELSE bot_conversation_id END,
+        revision_conversation_id = CASE WHEN NEW.role = 'bot' AND NEW.json LIKE '%"revision"%'
+                                        THEN NEW.conversation_id ELSE revision_conversation_id END
+    WHERE run_id = NEW.run_id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Remove from migration history
+DELETE FROM schema_migrations WHERE version = '0018';
+
+COMMIT;
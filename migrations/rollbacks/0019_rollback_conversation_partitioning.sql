@@ -0,0 +1,24 @@
+-- ============================================================================
+-- Rollback: 0019_conversation_partitioning
+-- ============================================================================
+-- Description: Rollback for the first partitioning step: drops the sync trigger,
+--              conversation_partitioned, conversation_archive (with all their
+--              partitions) and run_state.archived_at. conversation is not changed.
+--              Apply 0020's rollback first if the tables were swapped.
+-- ============================================================================
+
+BEGIN;
+
+DROP TRIGGER IF EXISTS conversation_sync_partitioned ON conversation;
+DROP FUNCTION IF EXISTS conversation_sync_partitioned();
+
+DROP TABLE IF EXISTS conversation_partitioned;
+DROP TABLE IF EXISTS conversation_archive;
+DROP FUNCTION IF EXISTS conversation_create_partitions(TEXT, TEXT, DATE, DATE, BOOLEAN);
+
+ALTER TABLE run_state DROP COLUMN IF EXISTS archived_at;
+
+-- Remove from migration history
+DELETE FROM schema_migrations WHERE version = '0019';
+
+COMMIT;
@@ -0,0 +1,101 @@
+-- ============================================================================
+-- Rollback: 0020_conversation_partitioning_swap
+-- ============================================================================
+-- Description: Rollback for the partitioning swap: conversation_unpartitioned
+--              becomes conversation again, the partitioned table goes back to
+--              conversation_partitioned with the sync trigger of 0019.
+--              Rows inserted after the swap and archived rows are copied into the
+--              old table first; of later updates only json and report are copied
+--              back (the only columns the backend updates).
+--              Requires conversation_unpartitioned (not dropped after the swap).
+-- ============================================================================
+
+BEGIN;
+
+LOCK TABLE conversation, conversation_unpartitioned, conversation_archive IN ACCESS EXCLUSIVE MODE;
+
+-- Archived rows back into the hot table (state of 0019: both tables hold all rows)
+INSERT INTO conversation SELECT * FROM conversation_archive;
+TRUNCATE conversation_archive;
+UPDATE run_state SET archived_at = NULL WHERE archived_at IS NOT NULL;
+
+INSERT INTO conversation_unpartitioned
+SELECT * FROM conversation c
+WHERE NOT EXISTS (SELECT 1 FROM conversation_unpartitioned o WHERE o.conversation_id = c.conversation_id);
+
+UPDATE conversation_unpartitioned o
+SET json = c.json, report = c.report
+FROM conversation c
+WHERE o.conversation_id = c.conversation_id
+  AND (o.json IS DISTINCT FROM c.json OR o.report IS DISTINCT FROM c.report);
+
+DROP VIEW IF EXISTS conversation_all;
+DROP TRIGGER IF EXISTS run_state_conversation_insert ON conversation;
+DROP TRIGGER IF EXISTS run_score_conversation_insert ON conversation;
+
+ALTER INDEX conversation_pkey RENAME TO conversation_partitioned_pkey;
+ALTER INDEX idx_conversation_run_element_role_date RENAME TO idx_conversation_partitioned_run_element_role_date;
+ALTER INDEX idx_conversation_run_role_date RENAME TO idx_conversation_partitioned_run_role_date;
+ALTER INDEX idx_conversation_chat_element_date RENAME TO idx_conversation_partitioned_chat_element_date;
+ALTER INDEX idx_conversation_element RENAME TO idx_conversation_partitioned_element;
+ALTER INDEX idx_conversation_account RENAME TO idx_conversation_partitioned_account;
+ALTER INDEX idx_conversation_date RENAME TO idx_conversation_partitioned_date;
+ALTER INDEX idx_conversation_revision_rows RENAME TO idx_conversation_partitioned_revision_rows;
+
+ALTER TABLE conversation RENAME TO conversation_partitioned;
+ALTER TABLE conversation_unpartitioned RENAME TO conversation;
+
+DO $$
+DECLARE
+    index_name TEXT;
+BEGIN
+    FOR index_name IN
+        SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE i.indrelid = 'conversation'::regclass AND c.relname LIKE '%\_unpartitioned'
+    LOOP
+        EXECUTE format('ALTER INDEX %I RENAME TO %I', index_name,
+                       left(index_name, length(index_name) - length('_unpartitioned')));
+    END LOOP;
+    EXECUTE format('ALTER SEQUENCE %s OWNED BY conversation.conversation_id',
+                   pg_get_serial_sequence('conversation_partitioned', 'conversation_id'));
+END $$;
+
+CREATE TRIGGER run_state_conversation_insert
+    AFTER INSERT ON conversation
+    FOR EACH ROW EXECUTE FUNCTION run_state_on_conversation();
+
+CREATE TRIGGER run_score_conversation_insert
+    AFTER INSERT ON conversation
+    FOR EACH ROW
+    WHEN (NEW.run_id IS NOT NULL AND NEW.element_id IS NOT NULL
+          AND NEW.score IS NOT NULL AND NEW.maxscore IS NOT NULL
+          AND NEW.element_type IS DISTINCT FROM 'test')
+    EXECUTE FUNCTION run_score_on_conversation();
+
+-- Same as in 0019
+CREATE OR REPLACE FUNCTION conversation_sync_partitioned()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP <> 'INSERT' THEN
+        DELETE FROM conversation_partitioned WHERE conversation_id = OLD.conversation_id;
+    END IF;
+    IF TG_OP = 'DELETE' THEN
+        RETURN OLD;
+    END IF;
+    NEW.date_inserted := COALESCE(NEW.date_inserted, now());
+    INSERT INTO conversation_partitioned SELECT (NEW).*;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER conversation_sync_partitioned
+    BEFORE INSERT OR UPDATE OR DELETE ON conversation
+    FOR EACH ROW EXECUTE FUNCTION conversation_sync_partitioned();
+
+ALTER TABLE dialog_message ADD CONSTRAINT dialog_message_conversation_fkey FOREIGN KEY (conversation_id)
+    REFERENCES conversation(conversation_id) ON DELETE CASCADE;
+
+-- Remove from migration history
+DELETE FROM schema_migrations WHERE version = '0020';
+
+COMMIT;
@@ -0,0 +1,203 @@
+-- ============================================================================
+-- Migration: 0009_course_module
+-- ============================================================================
+-- Description: Adds course_module table with module boundaries of db courses
+--              (first/last element, where next/previous module navigation jumps).
+--              The table is rebuilt by triggers on course_element, so it stays in sync
+--              with any writer (backend, course editor).
+-- Author: System
+-- Date: 2026-10-16
+-- Related: course_cache.ModuleTable (the same table for YAML courses)
+-- Breaking: No (new table, triggers and functions only)
+-- ============================================================================
+--
+-- This migration performs:
+-- Phase 1: Create course_module table
+-- Phase 2: Create refresh_course_module() function
+-- Phase 3: Create triggers on course_element
+-- Phase 4: Fill course_module for existing courses
+-- ============================================================================
+
+BEGIN;
+
+-- ============================================================================
+-- PHASE 1: Create course_module table
+-- ============================================================================
+
+-- Module is the part of element_id before the first "_" (Ex8_2 -> Ex8)
+-- next_element_id: first element after the module's first block (NULL for the last module)
+-- prev_element_id: first element of the previous module (NULL for the first module)
+-- restart_element_id: first element of the module's last block
+--   ("previous module" on the last element of the course)
+CREATE TABLE IF NOT EXISTS course_module (
+    course_id INT4 NOT NULL,
+    account_id INT4 NOT NULL DEFAULT 1,
+    module TEXT NOT NULL,
+    module_order INT4 NOT NULL,
+    first_element_id TEXT NOT NULL,
+    last_element_id TEXT NOT NULL,
+    next_element_id TEXT NULL,
+    prev_element_id TEXT NULL,
+    restart_element_id TEXT NULL,
+    CONSTRAINT course_module_pkey PRIMARY KEY (course_id, account_id, module),
+    CONSTRAINT course_module_course_fkey FOREIGN KEY (course_id) REFERENCES course(course_id) ON DELETE CASCADE
+);
+
+COMMENT ON TABLE course_module IS 'Module boundaries of db courses for next/previous module navigation (rebuilt by triggers on course_element)';
+
+-- ============================================================================
+-- PHASE 2: Create refresh_course_module() function
+-- ============================================================================
+
+-- Rebuilds course_module rows of one course from course_element (in course_element_id order).
+-- Must produce the same table as course_cache.ModuleTable.from_element_ids().
+CREATE OR REPLACE FUNCTION refresh_course_module(p_course_id INT4, p_account_id INT4)
+RETURNS VOID AS $$
+BEGIN
+    DELETE FROM course_module
+    WHERE course_id = p_course_id AND account_id = p_account_id;
+
+    INSERT INTO course_module (
+        course_id, account_id, module, module_order,
+        first_element_id, last_element_id, next_element_id, prev_element_id, restart_element_id
+    )
+    WITH elements AS (
+        SELECT course_element_id, element_id,
+               CASE WHEN strpos(element_id, '_') > 0 THEN left(element_id, strpos(element_id, '_') - 1)
+                    ELSE left(element_id, -1)
+               END AS module
+        FROM course_element
+        WHERE course_id = p_course_id
+          AND account_id = p_account_id
+          AND element_id IS NOT NULL
+          AND element_id <> ''
+    ),
+    marked AS (
+        SELECT elements.*,
+               CASE WHEN module IS DISTINCT FROM lag(module) OVER (ORDER BY course_element_id) THEN 1 ELSE 0 END AS is_start
+        FROM elements
+    ),
+    numbered AS (
+        SELECT marked.*, sum(is_start) OVER (ORDER BY course_element_id) AS run_no
+        FROM marked
+    ),
+    -- Contiguous blocks of elements of one module
+    runs AS (
+        SELECT run_no, module,
+               (array_agg(element_id ORDER BY course_element_id))[1] AS first_id,
+               (array_agg(element_id ORDER BY course_element_id DESC))[1] AS last_id
+        FROM numbered
+        GROUP BY run_no, module
+    ),
+    bounds AS (
+        SELECT module, min(run_no) AS first_run, max(run_no) AS last_run
+        FROM runs
+        GROUP BY module
+    )
+    SELECT p_course_id, p_account_id, b.module, b.first_run::INT4,
+           fr.first_id,
+           lr.last_id,
+           nr.first_id,
+           -- Going back from the last block of the module: blocks of the previous module
+           -- and of the module itself are passed over up to the first block of another module
+           (SELECT CASE WHEN pr.run_no = 1 AND pr.module = b.module THEN NULL ELSE pr.first_id END
+            FROM runs pr
+            WHERE b.last_run > 1
+              AND pr.run_no = COALESCE((
+                  SELECT max(k.run_no) FROM runs k
+                  WHERE k.run_no < b.last_run - 1
+                    AND k.module <> b.module
+                    AND k.module <> (SELECT p.module FROM runs p WHERE p.run_no = b.last_run - 1)
+              ), 0) + 1),
+           CASE WHEN b.last_run > 1 THEN lr.first_id END
+    FROM bounds b
+    JOIN runs fr ON fr.run_no = b.first_run
+    JOIN runs lr ON lr.run_no = b.last_run
+    LEFT JOIN runs nr ON nr.run_no = b.first_run + 1;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================================================
+-- PHASE 3: Create triggers on course_element
+-- ============================================================================
+
+-- Statement-level: one rebuild per changed course per statement
+CREATE OR REPLACE FUNCTION course_element_refresh_course_module()
+RETURNS TRIGGER AS $$
+DECLARE
+    changed RECORD;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        FOR changed IN SELECT DISTINCT course_id, account_id FROM new_rows LOOP
+            PERFORM refresh_course_module(changed.course_id, changed.account_id);
+        END LOOP;
+    ELSIF TG_OP = 'DELETE' THEN
+        FOR changed IN SELECT DISTINCT course_id, account_id FROM old_rows LOOP
+            PERFORM refresh_course_module(changed.course_id, changed.account_id);
+        END LOOP;
+    ELSE
+        FOR changed IN
+            SELECT course_id, account_id FROM new_rows
+            UNION
+            SELECT course_id, account_id FROM old_rows
+        LOOP
+            PERFORM refresh_course_module(changed.course_id, changed.account_id);
+        END LOOP;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS course_element_module_insert ON course_element;
+CREATE TRIGGER course_element_module_insert
+    AFTER INSERT ON course_element
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION course_element_refresh_course_module();
+
+DROP TRIGGER IF EXISTS course_element_module_update ON course_element;
+CREATE TRIGGER course_element_module_update
+    AFTER UPDATE ON course_element
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION course_element_refresh_course_module();
+
+DROP TRIGGER IF EXISTS course_element_module_delete ON course_element;
+CREATE TRIGGER course_element_module_delete
+    AFTER DELETE ON course_element
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION course_element_refresh_course_module();
+
+-- ============================================================================
+-- PHASE 4: Fill course_module for existing courses
+-- ============================================================================
+
+SELECT refresh_course_module(c.course_id, c.account_id)
+FROM (SELECT DISTINCT course_id, account_id FROM course_element) c;
+
+-- ============================================================================
+-- Validation
+-- ============================================================================
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.tables
+        WHERE table_name = 'course_module'
+    ) THEN
+        RAISE EXCEPTION 'Table course_module was not created';
+    END IF;
+END $$;
+
+-- ============================================================================
+-- Record migration
+-- ============================================================================
+
+INSERT INTO schema_migrations (version, description, applied_by)
+VALUES ('0009', 'Add course_module table with module boundaries of db courses', current_user)
+ON CONFLICT (version) DO NOTHING;
+
+COMMIT;
+
+-- ============================================================================
+-- Rollback
+-- ============================================================================
+-- See migrations/rollbacks/0009_rollback_course_module.sql
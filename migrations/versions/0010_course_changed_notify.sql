@@ -0,0 +1,110 @@
+-- ============================================================================
+-- Migration: 0010_course_changed_notify
+-- ============================================================================
+-- Description: Sends NOTIFY course_changed (payload: course_code) on every change
+--              of course and course_element, so bot and backend processes drop
+--              cached data of the changed course (course_watch.CourseChangeListener).
+--              Triggers cover any writer: CourseRepository.add_replace_course,
+--              insert_course_element, delete_course and the course editor.
+-- Author: System
+-- Date: 2026-10-16
+-- Related: course_watch.py, 0009_course_module
+-- Breaking: No (triggers and functions only)
+-- ============================================================================
+--
+-- This migration performs:
+-- Phase 1: Create notify functions
+-- Phase 2: Create triggers on course and course_element
+-- ============================================================================
+
+BEGIN;
+
+-- ============================================================================
+-- PHASE 1: Create notify functions
+-- ============================================================================
+
+-- Notifications are delivered on commit; identical notifications of one transaction
+-- are sent once, so add_replace_course (course update + element delete/insert) gives one message
+CREATE OR REPLACE FUNCTION course_notify_changed()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('course_changed', OLD.course_code);
+    ELSE
+        PERFORM pg_notify('course_changed', NEW.course_code);
+        IF TG_OP = 'UPDATE' AND OLD.course_code IS DISTINCT FROM NEW.course_code THEN
+            PERFORM pg_notify('course_changed', OLD.course_code);
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Statement-level: one notification per changed course per statement
+CREATE OR REPLACE FUNCTION course_element_notify_changed()
+RETURNS TRIGGER AS $$
+DECLARE
+    changed RECORD;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        FOR changed IN SELECT DISTINCT course_code FROM new_rows WHERE course_code IS NOT NULL LOOP
+            PERFORM pg_notify('course_changed', changed.course_code);
+        END LOOP;
+    ELSIF TG_OP = 'DELETE' THEN
+        FOR changed IN SELECT DISTINCT course_code FROM old_rows WHERE course_code IS NOT NULL LOOP
+            PERFORM pg_notify('course_changed', changed.course_code);
+        END LOOP;
+    ELSE
+        FOR changed IN
+            SELECT course_code FROM new_rows WHERE course_code IS NOT NULL
+            UNION
+            SELECT course_code FROM old_rows WHERE course_code IS NOT NULL
+        LOOP
+            PERFORM pg_notify('course_changed', changed.course_code);
+        END LOOP;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================================================
+-- PHASE 2: Create triggers on course and course_element
+-- ============================================================================
+
+DROP TRIGGER IF EXISTS course_notify ON course;
+CREATE TRIGGER course_notify
+    AFTER INSERT OR UPDATE OR DELETE ON course
+    FOR EACH ROW EXECUTE FUNCTION course_notify_changed();
+
+DROP TRIGGER IF EXISTS course_element_notify_insert ON course_element;
+CREATE TRIGGER course_element_notify_insert
+    AFTER INSERT ON course_element
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION course_element_notify_changed();
+
+DROP TRIGGER IF EXISTS course_element_notify_update ON course_element;
+CREATE TRIGGER course_element_notify_update
+    AFTER UPDATE ON course_element
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION course_element_notify_changed();
+
+DROP TRIGGER IF EXISTS course_element_notify_delete ON course_element;
+CREATE TRIGGER course_element_notify_delete
+    AFTER DELETE ON course_element
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION course_element_notify_changed();
+
+-- ============================================================================
+-- Record migration
+-- ============================================================================
+
+INSERT INTO schema_migrations (version, description, applied_by)
+VALUES ('0010', 'Add course_changed notifications on course and course_element changes', current_user)
+ON CONFLICT (version) DO NOTHING;
+
+COMMIT;
+
+-- ============================================================================
+-- Rollback
+-- ============================================================================
+-- See migrations/rollbacks/0010_rollback_course_changed_notify.sql
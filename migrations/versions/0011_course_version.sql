@@ -0,0 +1,75 @@
+-- ============================================================================
+-- Migration: 0011_course_version
+-- ============================================================================
+-- Description: Adds course_version table (course elements stored once per content
+--              hash) and course_version columns of run and conversation.
+--              A run is pinned to the course version it started on; conversation
+--              rows with course_version keep only per-user state in json
+--              (element_data keys that differ from the element of that version).
+-- Author: System
+-- Date: 2026-10-16
+-- Related: course_cache.CompiledCourse.version, pack_element_json/unpack_element_json
+-- Breaking: No (rows without course_version keep the full element JSON and are read as before)
+-- ============================================================================
+--
+-- This migration performs:
+-- Phase 1: Create course_version table
+-- Phase 2: Add course_version to run and conversation
+-- ============================================================================
+
+BEGIN;
+
+-- ============================================================================
+-- PHASE 1: Create course_version table
+-- ============================================================================
+
+CREATE TABLE IF NOT EXISTS course_version (
+    course_version TEXT NOT NULL,
+    course_code TEXT NOT NULL,
+    elements TEXT NOT NULL,
+    date_created TIMESTAMPTZ NOT NULL DEFAULT now(),
+    CONSTRAINT course_version_pkey PRIMARY KEY (course_version)
+);
+
+CREATE INDEX IF NOT EXISTS idx_course_version_course_code ON course_version(course_code);
+
+COMMENT ON TABLE course_version IS 'Course elements (JSON) stored once per content hash; referenced by run and conversation';
+
+-- ============================================================================
+-- PHASE 2: Add course_version to run and conversation
+-- ============================================================================
+
+ALTER TABLE run ADD COLUMN IF NOT EXISTS course_version TEXT NULL;
+ALTER TABLE conversation ADD COLUMN IF NOT EXISTS course_version TEXT NULL;
+
+COMMENT ON COLUMN run.course_version IS 'Course version the run started on';
+COMMENT ON COLUMN conversation.course_version IS 'If set, json keeps only the differences from the element of this course version';
+
+-- ============================================================================
+-- Validation
+-- ============================================================================
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'conversation' AND column_name = 'course_version'
+    ) THEN
+        RAISE EXCEPTION 'Column conversation.course_version was not created';
+    END IF;
+END $$;
+
+-- ============================================================================
+-- Record migration
+-- ============================================================================
+
+INSERT INTO schema_migrations (version, description, applied_by)
+VALUES ('0011', 'Add course_version table, run and conversation course_version', current_user)
+ON CONFLICT (version) DO NOTHING;
+
+COMMIT;
+
+-- ============================================================================
+-- Rollback
+-- ============================================================================
+-- See migrations/rollbacks/0011_rollback_course_version.sql
@@ -0,0 +1,174 @@
+-- ============================================================================
+-- Migration: 0012_run_state
+-- ============================================================================
+-- Description: Adds run_state table: one row per run with the user's position
+--              (last conversation row, last bot row, active revision row),
+--              course version and ended flag. Rows are maintained by triggers on
+--              run and conversation in the same transaction as the insert, so the
+--              current element is found by one indexed read instead of
+--              ORDER BY date_inserted DESC scans over conversation.
+-- Author: System
+-- Date: 2026-10-16
+-- Related: CourseRepository.get_run_state, get_active_run_id, get_current_element
+-- Breaking: No (new table and triggers only)
+-- ============================================================================
+--
+-- This migration performs:
+-- Phase 1: Create run_state table
+-- Phase 2: Create triggers on run and conversation
+-- Phase 3: Fill run_state for existing runs
+-- ============================================================================
+
+BEGIN;
+
+-- ============================================================================
+-- PHASE 1: Create run_state table
+-- ============================================================================
+
+-- conversation_id: last conversation row of the run (any role)
+-- bot_conversation_id: last row with role = 'bot'
+-- revision_conversation_id: last bot row with a revision chain in json
+CREATE TABLE IF NOT EXISTS run_state (
+    run_id INT4 NOT NULL,
+    chat_id INT8 NOT NULL,
+    course_id TEXT NOT NULL,
+    botname TEXT NOT NULL,
+    course_version TEXT NULL,
+    is_ended BOOLEAN NOT NULL DEFAULT FALSE,
+    conversation_id INT4 NULL,
+    element_id TEXT NULL,
+    element_type TEXT NULL,
+    bot_conversation_id INT4 NULL,
+    revision_conversation_id INT4 NULL,
+    updated_at TIMESTAMPTZ NULL,
+    CONSTRAINT run_state_pkey PRIMARY KEY (run_id),
+    CONSTRAINT run_state_run_fkey FOREIGN KEY (run_id) REFERENCES run(run_id) ON DELETE CASCADE
+);
+
+-- Latest run of a user in a course (get_active_run_id, is_course_ended)
+CREATE INDEX IF NOT EXISTS idx_run_state_chat_course ON run_state(chat_id, course_id, botname, run_id DESC);
+-- Latest position of a user (get_current_element, get_current_element_ids)
+CREATE INDEX IF NOT EXISTS idx_run_state_chat_updated ON run_state(chat_id, botname, updated_at DESC)
+    WHERE conversation_id IS NOT NULL;
+
+COMMENT ON TABLE run_state IS 'Current position of each run (maintained by triggers on run and conversation)';
+
+-- ============================================================================
+-- PHASE 2: Create triggers on run and conversation
+-- ============================================================================
+
+CREATE OR REPLACE FUNCTION run_state_on_run()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO run_state (run_id, chat_id, course_id, botname, course_version, is_ended)
+        VALUES (NEW.run_id, NEW.chat_id, NEW.course_id, NEW.botname, NEW.course_version, COALESCE(NEW.is_ended, FALSE))
+        ON CONFLICT (run_id) DO NOTHING;
+    ELSE
+        UPDATE run_state
+        SET is_ended = COALESCE(NEW.is_ended, FALSE),
+            course_version = NEW.course_version
+        WHERE run_id = NEW.run_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS run_state_run_insert ON run;
+CREATE TRIGGER run_state_run_insert
+    AFTER INSERT ON run
+    FOR EACH ROW EXECUTE FUNCTION run_state_on_run();
+
+DROP TRIGGER IF EXISTS run_state_run_update ON run;
+CREATE TRIGGER run_state_run_update
+    AFTER UPDATE OF is_ended, course_version ON run
+    FOR EACH ROW EXECUTE FUNCTION run_state_on_run();
+
+CREATE OR REPLACE FUNCTION run_state_on_conversation()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE run_state
+    SET conversation_id = NEW.conversation_id,
+        element_id = NEW.element_id,
+        element_type = NEW.element_type,
+        updated_at = NEW.date_inserted,
+        bot_conversation_id = CASE WHEN NEW.role = 'bot' THEN NEW.conversation_id ELSE bot_conversation_id END,
+        revision_conversation_id = CASE WHEN NEW.role = 'bot' AND NEW.json LIKE '%"revision"%'
+                                        THEN NEW.conversation_id ELSE revision_conversation_id END
+    WHERE run_id = NEW.run_id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS run_state_conversation_insert ON conversation;
+CREATE TRIGGER run_state_conversation_insert
+    AFTER INSERT ON conversation
+    FOR EACH ROW EXECUTE FUNCTION run_state_on_conversation();
+
+-- ============================================================================
+-- PHASE 3: Fill run_state for existing runs
+-- ============================================================================
+
+INSERT INTO run_state (run_id, chat_id, course_id, botname, course_version, is_ended)
+SELECT run_id, chat_id, course_id, botname, course_version, COALESCE(is_ended, FALSE)
+FROM run
+ON CONFLICT (run_id) DO NOTHING;
+
+UPDATE run_state s
+SET conversation_id = c.conversation_id,
+    element_id = c.element_id,
+    element_type = c.element_type,
+    updated_at = c.date_inserted
+FROM (
+    SELECT DISTINCT ON (run_id) run_id, conversation_id, element_id, element_type, date_inserted
+    FROM conversation
+    WHERE run_id IS NOT NULL
+    ORDER BY run_id, date_inserted DESC, conversation_id DESC
+) c
+WHERE s.run_id = c.run_id;
+
+UPDATE run_state s
+SET bot_conversation_id = c.conversation_id
+FROM (
+    SELECT DISTINCT ON (run_id) run_id, conversation_id
+    FROM conversation
+    WHERE run_id IS NOT NULL AND role = 'bot'
+    ORDER BY run_id, date_inserted DESC, conversation_id DESC
+) c
+WHERE s.run_id = c.run_id;
+
+UPDATE run_state s
+SET revision_conversation_id = c.conversation_id
+FROM (
+    SELECT DISTINCT ON (run_id) run_id, conversation_id
+    FROM conversation
+    WHERE run_id IS NOT NULL AND role = 'bot' AND json LIKE '%"revision"%'
+    ORDER BY run_id, date_inserted DESC, conversation_id DESC
+) c
+WHERE s.run_id = c.run_id;
+
+-- ============================================================================
+-- Validation
+-- ============================================================================
+
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM run r LEFT JOIN run_state s ON s.run_id = r.run_id WHERE s.run_id IS NULL) THEN
+        RAISE EXCEPTION 'run_state is missing rows for existing runs';
+    END IF;
+END $$;
+
+-- ============================================================================
+-- Record migration
+-- ============================================================================
+
+INSERT INTO schema_migrations (version, description, applied_by)
+VALUES ('0012', 'Add run_state table maintained by triggers on run and conversation', current_user)
+ON CONFLICT (version) DO NOTHING;
+
+COMMIT;
+
+-- ============================================================================
+-- Rollback
+-- ============================================================================
+-- See migrations/rollbacks/0012_rollback_run_state.sql
@@ -0,0 +1,64 @@
+-- ============================================================================
+-- Migration: 0013_hot_query_indexes
+-- ============================================================================
+-- Description: Composite indexes for the hot queries of CourseRepository and mvp.py
+--              (conversation by run/element/role ordered by date_inserted,
+--              element_id LIKE 'prefix%' within a run, last element of a chat,
+--              latest run of a user in a course).
+-- Author: System
+-- Date: 2026-10-16
+-- Related: bin/utils/check_query_plans.py (EXPLAIN check of these queries)
+-- Breaking: No (indexes only)
+-- ============================================================================
+--
+-- Indexes are built CONCURRENTLY (no write lock on conversation/run), which can't run
+-- inside a transaction block: the file has no BEGIN/COMMIT and must not be run with psql -1
+-- (tools/migrate.sh runs it with psql -f, which is fine).
+-- If a build fails, the index is left INVALID: drop it (see the rollback) and rerun.
+--
+-- This migration performs:
+-- Phase 1: conversation indexes
+-- Phase 2: run indexes
+-- ============================================================================
+
+-- ============================================================================
+-- PHASE 1: conversation indexes
+-- ============================================================================
+
+-- run_id + element_id equality or element_id LIKE 'prefix%' (text_pattern_ops supports both),
+-- then role and the newest row first:
+--   get_dialog_conversation, update_conversation_report, get_user_responses_for_elements,
+--   get_test_scores, get_conversation_text_for_var (run_id, element_id, role ORDER BY date_inserted DESC)
+--   get_revision_mistakes, get_revision_elements, get_total_score (run_id, element_id LIKE 'prefix%')
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_conversation_run_element_role_date
+    ON conversation USING btree (run_id, element_id text_pattern_ops, role, date_inserted DESC);
+
+-- run_id + role, newest first: last bot/user row of a run (queries not yet moved to run_state)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_conversation_run_role_date
+    ON conversation USING btree (run_id, role, date_inserted DESC);
+
+-- get_last_element_of: (chat_id, element_id) ORDER BY date_inserted DESC
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_conversation_chat_element_date
+    ON conversation USING btree (chat_id, element_id, date_inserted DESC);
+
+-- ============================================================================
+-- PHASE 2: run indexes
+-- ============================================================================
+
+-- get_run_id: (chat_id, botname, course_id) ORDER BY date_inserted DESC;
+-- set_course_ended, get_username_by_chat_id: (chat_id, botname[, course_id])
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_run_chat_bot_course_date
+    ON run USING btree (chat_id, botname, course_id, date_inserted DESC);
+
+-- ============================================================================
+-- Record migration
+-- ============================================================================
+
+INSERT INTO schema_migrations (version, description, applied_by)
+VALUES ('0013', 'Add composite indexes for hot conversation and run queries', current_user)
+ON CONFLICT (version) DO NOTHING;
+
+-- ============================================================================
+-- Rollback
+-- ============================================================================
+-- See migrations/rollbacks/0013_rollback_hot_query_indexes.sql
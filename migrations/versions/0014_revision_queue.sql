@@ -0,0 +1,55 @@
+-- ============================================================================
+-- Migration: 0014_revision_queue
+-- ============================================================================
+-- Description: Adds revision_queue table: elements of a revision (repetition of
+--              mistakes) as rows instead of a JSON chain with copies of element
+--              data inside a conversation row. Element data is taken from the course.
+-- Author: System
+-- Date: 2026-10-16
+-- Related: CourseRepository.start_revision_queue / next_revision_element,
+--          elements/revision.py, Course.get_next_element, mvp start_revision/next_element
+-- Breaking: No (new table; revision chains started before the migration are not continued)
+-- ============================================================================
+--
+-- This migration performs:
+-- Phase 1: Create revision_queue table
+-- ============================================================================
+
+BEGIN;
+
+-- ============================================================================
+-- PHASE 1: Create revision_queue table
+-- ============================================================================
+
+-- status: pending (not shown yet) -> shown (shown, the revision goes on) -> done
+-- position grows within a run; a new revision marks unfinished items of the previous one as done
+CREATE TABLE IF NOT EXISTS revision_queue (
+    run_id INT4 NOT NULL,
+    position INT4 NOT NULL,
+    element_id TEXT NOT NULL,
+    revision_element_id TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    date_inserted TIMESTAMPTZ NOT NULL DEFAULT now(),
+    CONSTRAINT revision_queue_pkey PRIMARY KEY (run_id, position),
+    CONSTRAINT revision_queue_run_fkey FOREIGN KEY (run_id) REFERENCES run(run_id) ON DELETE CASCADE,
+    CONSTRAINT revision_queue_status_check CHECK (status IN ('pending', 'shown', 'done'))
+);
+
+CREATE INDEX IF NOT EXISTS idx_revision_queue_run_status ON revision_queue(run_id, status, position);
+
+COMMENT ON TABLE revision_queue IS 'Elements of revision chains (repetition of mistakes) per run';
+
+-- ============================================================================
+-- Record migration
+-- ============================================================================
+
+INSERT INTO schema_migrations (version, description, applied_by)
+VALUES ('0014', 'Add revision_queue table', current_user)
+ON CONFLICT (version) DO NOTHING;
+
+COMMIT;
+
+-- ============================================================================
+-- Rollback
+-- ============================================================================
+-- See migrations/rollbacks/0014_rollback_revision_queue.sql
@@ -0,0 +1,109 @@
+-- ============================================================================
+-- Migration: 0015_run_score
+-- ============================================================================
+-- Description: Adds run_score table: per run and scored element the last and
+--              best score and the number of attempts. Rows are maintained by a
+--              trigger on conversation in the same transaction as the answer, so
+--              test results and cohort totals read a few precomputed rows instead
+--              of aggregating the conversation log with LIKE 'prefix%'.
+-- Author: System
+-- Date: 2026-10-16
+-- Related: CourseRepository.get_total_score, get_test_scores, get_run_score_totals
+-- Breaking: No (new table and trigger only)
+-- ============================================================================
+--
+-- This migration performs:
+-- Phase 1: Create run_score table
+-- Phase 2: Create trigger on conversation
+-- Phase 3: Fill run_score from existing answers
+-- ============================================================================
+
+BEGIN;
+
+-- ============================================================================
+-- PHASE 1: Create run_score table
+-- ============================================================================
+
+-- A scored answer is a conversation row with score and maxscore (the bot stores them
+-- on bot rows, the web app on user rows). Rows of test elements hold totals and are skipped.
+CREATE TABLE IF NOT EXISTS run_score (
+    run_id INT4 NOT NULL,
+    element_id TEXT NOT NULL,
+    last_score FLOAT8 NOT NULL,
+    last_maxscore FLOAT8 NOT NULL,
+    best_score FLOAT8 NOT NULL,
+    attempts INT4 NOT NULL DEFAULT 1,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    CONSTRAINT run_score_pkey PRIMARY KEY (run_id, element_id),
+    CONSTRAINT run_score_run_fkey FOREIGN KEY (run_id) REFERENCES run(run_id) ON DELETE CASCADE
+);
+
+COMMENT ON TABLE run_score IS 'Last/best score per run and element (maintained by a trigger on conversation)';
+
+-- ============================================================================
+-- PHASE 2: Create trigger on conversation
+-- ============================================================================
+
+CREATE OR REPLACE FUNCTION run_score_on_conversation()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO run_score (run_id, element_id, last_score, last_maxscore, best_score, attempts, updated_at)
+    VALUES (NEW.run_id, NEW.element_id, NEW.score, NEW.maxscore, NEW.score, 1, COALESCE(NEW.date_inserted, now()))
+    ON CONFLICT (run_id, element_id) DO UPDATE
+    SET last_score = EXCLUDED.last_score,
+        last_maxscore = EXCLUDED.last_maxscore,
+        best_score = GREATEST(run_score.best_score, EXCLUDED.best_score),
+        attempts = run_score.attempts + 1,
+        updated_at = EXCLUDED.updated_at;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS run_score_conversation_insert ON conversation;
+CREATE TRIGGER run_score_conversation_insert
+    AFTER INSERT ON conversation
+    FOR EACH ROW
+    WHEN (NEW.run_id IS NOT NULL AND NEW.element_id IS NOT NULL
+          AND NEW.score IS NOT NULL AND NEW.maxscore IS NOT NULL
+          AND NEW.element_type IS DISTINCT FROM 'test')
+    EXECUTE FUNCTION run_score_on_conversation();
+
+-- ============================================================================
+-- PHASE 3: Fill run_score from existing answers
+-- ============================================================================
+
+INSERT INTO run_score (run_id, element_id, last_score, last_maxscore, best_score, attempts, updated_at)
+SELECT l.run_id, l.element_id, l.score, l.maxscore, a.best_score, a.attempts, l.date_inserted
+FROM (
+    SELECT DISTINCT ON (run_id, element_id) run_id, element_id, score, maxscore, date_inserted
+    FROM conversation
+    WHERE run_id IS NOT NULL AND element_id IS NOT NULL
+      AND score IS NOT NULL AND maxscore IS NOT NULL
+      AND element_type IS DISTINCT FROM 'test'
+    ORDER BY run_id, element_id, date_inserted DESC, conversation_id DESC
+) l
+JOIN (
+    SELECT run_id, element_id, max(score) AS best_score, count(*) AS attempts
+    FROM conversation
+    WHERE run_id IS NOT NULL AND element_id IS NOT NULL
+      AND score IS NOT NULL AND maxscore IS NOT NULL
+      AND element_type IS DISTINCT FROM 'test'
+    GROUP BY run_id, element_id
+) a ON a.run_id = l.run_id AND a.element_id = l.element_id
+JOIN run r ON r.run_id = l.run_id
+ON CONFLICT (run_id, element_id) DO NOTHING;
+
+-- ============================================================================
+-- Record migration
+-- ============================================================================
+
+INSERT INTO schema_migrations (version, description, applied_by)
+VALUES ('0015', 'Add run_score table maintained by a trigger on conversation', current_user)
+ON CONFLICT (version) DO NOTHING;
+
+COMMIT;
+
+-- ============================================================================
+-- Rollback
+-- ============================================================================
+-- See migrations/rollbacks/0015_rollback_run_score.sql
@@ -0,0 +1,62 @@
+-- ============================================================================
+-- Migration: 0016_dialog_message
+-- ============================================================================
+-- Description: Adds dialog_message table: messages of a dialog element as
+--              append-only rows (one per message) instead of the history array
+--              inside the json of the dialog's bot conversation row, which was
+--              read, extended and rewritten on every message.
+-- Author: System
+-- Date: 2026-10-16
+-- Related: CourseRepository.get_dialog_messages / append_dialog_messages,
+--          mvp send_dialog_message
+-- Breaking: No (new table; dialogs started before the migration are read from
+--           conversation.json and copied here on their next message)
+-- ============================================================================
+--
+-- This migration performs:
+-- Phase 1: Create dialog_message table
+-- ============================================================================
+
+BEGIN;
+
+-- ============================================================================
+-- PHASE 1: Create dialog_message table
+-- ============================================================================
+
+-- conversation_id: bot row of the dialog element (a dialog shown again gets a new row and a new history)
+-- seq: position in the history from 0, the system prompt is the first message
+-- token_count: estimated size of content in tokens
+CREATE TABLE IF NOT EXISTS dialog_message (
+    conversation_id INT4 NOT NULL,
+    seq INT4 NOT NULL,
+    run_id INT4 NOT NULL,
+    element_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    token_count INT4 NULL,
+    date_inserted TIMESTAMPTZ NOT NULL DEFAULT now(),
+    CONSTRAINT dialog_message_pkey PRIMARY KEY (conversation_id, seq),
+    CONSTRAINT dialog_message_conversation_fkey FOREIGN KEY (conversation_id)
+        REFERENCES conversation(conversation_id) ON DELETE CASCADE,
+    CONSTRAINT dialog_message_run_fkey FOREIGN KEY (run_id) REFERENCES run(run_id) ON DELETE CASCADE
+);
+
+-- Dialogs of a run (reports, cascade deletes of runs)
+CREATE INDEX IF NOT EXISTS idx_dialog_message_run_element ON dialog_message(run_id, element_id);
+
+COMMENT ON TABLE dialog_message IS 'Append-only messages of dialog elements';
+
+-- ============================================================================
+-- Record migration
+-- ============================================================================
+
+INSERT INTO schema_migrations (version, description, applied_by)
+VALUES ('0016', 'Add dialog_message table', current_user)
+ON CONFLICT (version) DO NOTHING;
+
+COMMIT;
+
+-- ============================================================================
+-- Rollback
+-- ============================================================================
+-- See migrations/rollbacks/0016_rollback_dialog_message.sql
@@ -0,0 +1,87 @@
+-- ============================================================================
+-- Migration: 0017_jsonb_payloads
+-- ============================================================================
+-- Description: First step of moving conversation.json and course_element.json
+--              from text to jsonb. course_element (small, edited by the course
+--              editor) is converted in place; conversation gets a jsonb shadow
+--              column json_b kept in sync by a trigger and filled in batches by
+--              bin/utils/backfill_jsonb.py. Migration 0018 swaps the columns.
+-- Author: System
+-- Date: 2026-10-16
+-- Related: 0018_jsonb_conversation_swap, bin/utils/backfill_jsonb.py,
+--          CourseRepository (_json_value), bin/utils/bench_jsonb.py
+-- Breaking: No for the backend (reads both text and jsonb). The course editor
+--           must be deployed with the jsonb-aware db-utils.ts first: pg returns
+--           course_element.json as an object after this migration.
+-- ============================================================================
+--
+-- Order of the online conversion:
+--   1. deploy the backend and the course editor that read both text and jsonb
+--   2. apply this migration
+--   3. python bin/utils/backfill_jsonb.py   (batches, can be stopped and restarted)
+--   4. apply 0018_jsonb_conversation_swap
+--
+-- This migration performs:
+-- Phase 1: text_to_jsonb() helper
+-- Phase 2: Convert course_element.json to jsonb
+-- Phase 3: conversation.json_b shadow column and sync trigger
+-- ============================================================================
+
+BEGIN;
+
+-- ============================================================================
+-- PHASE 1: text_to_jsonb() helper
+-- ============================================================================
+
+-- Invalid JSON (written by hand or by old code) is kept as a jsonb string instead of failing the conversion
+CREATE OR REPLACE FUNCTION text_to_jsonb(value TEXT)
+RETURNS JSONB AS $$
+BEGIN
+    RETURN value::jsonb;
+EXCEPTION WHEN invalid_text_representation THEN
+    RETURN to_jsonb(value);
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+-- ============================================================================
+-- PHASE 2: Convert course_element.json to jsonb
+-- ============================================================================
+
+ALTER TABLE course_element ALTER COLUMN json TYPE JSONB USING text_to_jsonb(json);
+
+-- Containment queries on element payloads (json @> '{"element_data": {"type": "dialog"}}')
+CREATE INDEX IF NOT EXISTS idx_course_element_json ON course_element USING gin (json jsonb_path_ops);
+
+-- ============================================================================
+-- PHASE 3: conversation.json_b shadow column and sync trigger
+-- ============================================================================
+
+ALTER TABLE conversation ADD COLUMN IF NOT EXISTS json_b JSONB NULL;
+
+CREATE OR REPLACE FUNCTION conversation_sync_json_b()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.json_b := text_to_jsonb(NEW.json);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS conversation_sync_json_b ON conversation;
+CREATE TRIGGER conversation_sync_json_b
+    BEFORE INSERT OR UPDATE OF json ON conversation
+    FOR EACH ROW EXECUTE FUNCTION conversation_sync_json_b();
+
+-- ============================================================================
+-- Record migration
+-- ============================================================================
+
+INSERT INTO schema_migrations (version, description, applied_by)
+VALUES ('0017', 'Convert course_element.json to jsonb, add conversation.json_b shadow column', current_user)
+ON CONFLICT (version) DO NOTHING;
+
+COMMIT;
+
+-- ============================================================================
+-- Rollback
+-- ============================================================================
+-- See migrations/rollbacks/0017_rollback_jsonb_payloads.sql
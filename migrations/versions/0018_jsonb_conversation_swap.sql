@@ -0,0 +1,86 @@
+-- ============================================================================
+-- Migration: 0018_jsonb_conversation_swap
+-- ============================================================================
+-- Description: Second step of the jsonb conversion: conversation.json_b (filled
+--              by the trigger of 0017 and bin/utils/backfill_jsonb.py) replaces
+--              the text column json. run_state detects legacy revision chains by
+--              the jsonb key (json ? 'revision') instead of LIKE '%"revision"%'.
+-- Author: System
+-- Date: 2026-10-16
+-- Related: 0017_jsonb_payloads, bin/utils/backfill_jsonb.py, 0012_run_state
+-- Breaking: No for the backend (reads both text and jsonb); conversation.json
+--           is returned as an object by drivers that decode jsonb
+-- ============================================================================
+--
+-- Requires a finished backfill (the migration fails otherwise):
+--   python bin/utils/backfill_jsonb.py
+-- The swap holds an ACCESS EXCLUSIVE lock on conversation only for the catalog changes.
+-- The index of Phase 3 is built CONCURRENTLY after the COMMIT: don't run the file with psql -1.
+--
+-- This migration performs:
+-- Phase 1: Check the backfill
+-- Phase 2: Swap conversation.json_b -> conversation.json
+-- Phase 3: Index for legacy revision rows
+-- ============================================================================
+
+BEGIN;
+
+-- ============================================================================
+-- PHASE 1: Check the backfill
+-- ============================================================================
+
+LOCK TABLE conversation IN ACCESS EXCLUSIVE MODE;
+
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM conversation WHERE json IS NOT NULL AND json_b IS NULL) THEN
+        RAISE EXCEPTION 'conversation.json_b is not filled, run bin/utils/backfill_jsonb.py first';
+    END IF;
+END $$;
+
+-- ============================================================================
+-- PHASE 2: Swap conversation.json_b -> conversation.json
+-- ============================================================================
+
+DROP TRIGGER IF EXISTS conversation_sync_json_b ON conversation;
+DROP FUNCTION IF EXISTS conversation_sync_json_b();
+
+ALTER TABLE conversation DROP COLUMN json;
+ALTER TABLE conversation RENAME COLUMN json_b TO json;
+
+-- Same as in 0012, with the jsonb key check
+CREATE OR REPLACE FUNCTION run_state_on_conversation()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE run_state
+    SET conversation_id = NEW.conversation_id,
+        element_id = NEW.element_id,
+        element_type = NEW.element_type,
+        updated_at = NEW.date_inserted,
+        bot_conversation_id = CASE WHEN NEW.role = 'bot' THEN NEW.conversation_id ELSE bot_conversation_id END,
+        revision_conversation_id = CASE WHEN NEW.role = 'bot' AND jsonb_typeof(NEW.json) = 'object' AND NEW.json ? 'revision'
+                                        THEN NEW.conversation_id ELSE revision_conversation_id END
+    WHERE run_id = NEW.run_id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+INSERT INTO schema_migrations (version, description, applied_by)
+VALUES ('0018', 'Swap conversation.json to jsonb', current_user)
+ON CONFLICT (version) DO NOTHING;
+
+COMMIT;
+
+-- ============================================================================
+-- PHASE 3: Index for legacy revision rows
+-- ============================================================================
+
+-- Bot rows that still hold a revision chain in json (before revision_queue, 0014)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_conversation_revision_rows
+    ON conversation USING btree (run_id, date_inserted DESC)
+    WHERE role = 'bot' AND json ? 'revision';
+
+-- ============================================================================
+-- Rollback
+-- ============================================================================
+-- See migrations/rollbacks/0018_rollback_jsonb_conversation_swap.sql
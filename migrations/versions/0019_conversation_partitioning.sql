@@ -0,0 +1,201 @@
+-- ============================================================================
+-- Migration: 0019_conversation_partitioning
+-- ============================================================================
+-- Description: First step of partitioning conversation by month of date_inserted.
+--              Creates conversation_partitioned (same columns, monthly range
+--              partitions) kept in sync with conversation by a trigger and filled
+--              in batches by bin/utils/copy_conversation_partitioned.py, and the
+--              cold archive conversation_archive (compressed monthly partitions,
+--              minimal indexes) for rows of ended runs moved by
+--              bin/utils/archive_conversation.py. Migration 0020 swaps the tables.
+-- Author: System
+-- Date: 2026-10-16
+-- Related: 0020_conversation_partitioning_swap, bin/utils/copy_conversation_partitioned.py,
+--          bin/utils/archive_conversation.py, CourseRepository._run_conversation_filter
+-- Breaking: No (new tables; conversation writes also go to conversation_partitioned)
+-- ============================================================================
+--
+-- Requires PostgreSQL 14+ (lz4 column compression) and 0018 (conversation.json is jsonb).
+--
+-- Order of the online conversion:
+--   1. apply this migration
+--   2. python bin/utils/copy_conversation_partitioned.py   (batches, can be stopped and restarted)
+--   3. apply 0020_conversation_partitioning_swap
+--   4. schedule python bin/utils/archive_conversation.py (daily)
+--
+-- Partitions are named <prefix>_yYYYYmMM (conversation_y2026m10, conversation_archive_y2026m10).
+--
+-- This migration performs:
+-- Phase 1: conversation_create_partitions() helper
+-- Phase 2: Create conversation_partitioned
+-- Phase 3: Create conversation_archive
+-- Phase 4: run_state.archived_at
+-- Phase 5: Sync trigger on conversation
+-- ============================================================================
+
+BEGIN;
+
+-- ============================================================================
+-- PHASE 1: conversation_create_partitions() helper
+-- ============================================================================
+
+-- Creates missing monthly partitions of p_parent from the month of p_from to the month of p_until.
+-- p_cold: archive partition - values are compressed with lz4 from 128 bytes (toast_tuple_target)
+-- instead of the default ~2 kB, json and report are the bulk of a row
+CREATE OR REPLACE FUNCTION conversation_create_partitions(p_parent TEXT, p_prefix TEXT,
+                                                          p_from DATE, p_until DATE,
+                                                          p_cold BOOLEAN DEFAULT false)
+RETURNS INT4 AS $$
+DECLARE
+    month_start DATE := date_trunc('month', p_from)::date;
+    partition_name TEXT;
+    created INT4 := 0;
+BEGIN
+    WHILE month_start <= p_until LOOP
+        partition_name := format('%s_y%sm%s', p_prefix, to_char(month_start, 'YYYY'), to_char(month_start, 'MM'));
+        IF to_regclass(partition_name) IS NULL THEN
+            EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                           partition_name, p_parent, month_start, (month_start + interval '1 month')::date);
+            IF p_cold THEN
+                EXECUTE format('ALTER TABLE %I SET (toast_tuple_target = 128), '
+                               'ALTER COLUMN json SET COMPRESSION lz4, ALTER COLUMN report SET COMPRESSION lz4',
+                               partition_name);
+            END IF;
+            created := created + 1;
+        END IF;
+        month_start := (month_start + interval '1 month')::date;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================================================
+-- PHASE 2: Create conversation_partitioned
+-- ============================================================================
+
+-- Rows without date_inserted can't be routed to a partition (the column becomes part of the key)
+UPDATE conversation c
+SET date_inserted = COALESCE((SELECT r.date_inserted FROM run r WHERE r.run_id = c.run_id), '2000-01-01')
+WHERE c.date_inserted IS NULL;
+
+-- Same columns in the same order (INSERT ... SELECT * between the tables), defaults share the sequence
+CREATE TABLE IF NOT EXISTS conversation_partitioned (
+    LIKE conversation INCLUDING DEFAULTS INCLUDING STORAGE INCLUDING COMPRESSION
+) PARTITION BY RANGE (date_inserted);
+
+-- The primary key of a partitioned table must contain the partition key
+ALTER TABLE conversation_partitioned
+    ADD CONSTRAINT conversation_partitioned_pkey PRIMARY KEY (conversation_id, date_inserted);
+
+-- Foreign keys of conversation, only those that exist (0003 adds them conditionally)
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'conversation_run_id_fkey'
+               AND conrelid = 'conversation'::regclass) THEN
+        ALTER TABLE conversation_partitioned ADD CONSTRAINT conversation_partitioned_run_id_fkey
+            FOREIGN KEY (run_id) REFERENCES run(run_id) ON DELETE CASCADE;
+    END IF;
+    IF EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'conversation_account_id_fkey'
+               AND conrelid = 'conversation'::regclass) THEN
+        ALTER TABLE conversation_partitioned ADD CONSTRAINT conversation_partitioned_account_id_fkey
+            FOREIGN KEY (account_id) REFERENCES account(account_id) ON DELETE CASCADE;
+    END IF;
+END $$;
+
+-- Indexes used by the backend and the bot (0003, 0013, 0018); indexes that are a prefix of
+-- another one (run_id, (run_id, role), chat_id, (course_id, account_id)) are not repeated.
+-- 0020 renames them to the names of the conversation indexes.
+CREATE INDEX IF NOT EXISTS idx_conversation_partitioned_run_element_role_date
+    ON conversation_partitioned USING btree (run_id, element_id text_pattern_ops, role, date_inserted DESC);
+CREATE INDEX IF NOT EXISTS idx_conversation_partitioned_run_role_date
+    ON conversation_partitioned USING btree (run_id, role, date_inserted DESC);
+CREATE INDEX IF NOT EXISTS idx_conversation_partitioned_chat_element_date
+    ON conversation_partitioned USING btree (chat_id, element_id, date_inserted DESC);
+CREATE INDEX IF NOT EXISTS idx_conversation_partitioned_element
+    ON conversation_partitioned USING btree (course_id, account_id, element_id);
+CREATE INDEX IF NOT EXISTS idx_conversation_partitioned_account
+    ON conversation_partitioned USING btree (account_id);
+CREATE INDEX IF NOT EXISTS idx_conversation_partitioned_date
+    ON conversation_partitioned USING btree (date_inserted DESC);
+CREATE INDEX IF NOT EXISTS idx_conversation_partitioned_revision_rows
+    ON conversation_partitioned USING btree (run_id, date_inserted DESC)
+    WHERE role = 'bot' AND json ? 'revision';
+
+-- Partitions from the first month with data to two months ahead; rows outside (and the 2000-01-01
+-- placeholder dates set above) go to the default partition
+SELECT conversation_create_partitions(
+    'conversation_partitioned', 'conversation',
+    COALESCE((SELECT min(date_inserted)::date FROM conversation WHERE date_inserted > '2000-01-01'), current_date),
+    (current_date + interval '2 months')::date
+);
+CREATE TABLE IF NOT EXISTS conversation_default PARTITION OF conversation_partitioned DEFAULT;
+
+-- ============================================================================
+-- PHASE 3: Create conversation_archive
+-- ============================================================================
+
+-- Rows of ended runs moved out of conversation by bin/utils/archive_conversation.py.
+-- Only the indexes needed to read a run back and to delete runs (FK cascade).
+CREATE TABLE IF NOT EXISTS conversation_archive (
+    LIKE conversation_partitioned INCLUDING DEFAULTS INCLUDING STORAGE
+) PARTITION BY RANGE (date_inserted);
+
+ALTER TABLE conversation_archive
+    ADD CONSTRAINT conversation_archive_pkey PRIMARY KEY (conversation_id, date_inserted),
+    ADD CONSTRAINT conversation_archive_run_id_fkey FOREIGN KEY (run_id) REFERENCES run(run_id) ON DELETE CASCADE;
+
+CREATE INDEX IF NOT EXISTS idx_conversation_archive_run_date
+    ON conversation_archive USING btree (run_id, date_inserted);
+
+CREATE TABLE IF NOT EXISTS conversation_archive_default PARTITION OF conversation_archive DEFAULT;
+
+COMMENT ON TABLE conversation_archive IS 'Conversation rows of ended runs (cold, compressed partitions)';
+
+-- ============================================================================
+-- PHASE 4: run_state.archived_at
+-- ============================================================================
+
+-- Set by the archive job; a run with conversation rows after archived_at (updated_at > archived_at)
+-- is archived again
+ALTER TABLE run_state ADD COLUMN IF NOT EXISTS archived_at TIMESTAMPTZ NULL;
+
+-- ============================================================================
+-- PHASE 5: Sync trigger on conversation
+-- ============================================================================
+
+-- BEFORE trigger: the row is locked before the trigger runs (UPDATE/DELETE), so it can't interleave
+-- with a copy batch holding FOR SHARE locks; an update is copied as delete + insert
+CREATE OR REPLACE FUNCTION conversation_sync_partitioned()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP <> 'INSERT' THEN
+        DELETE FROM conversation_partitioned WHERE conversation_id = OLD.conversation_id;
+    END IF;
+    IF TG_OP = 'DELETE' THEN
+        RETURN OLD;
+    END IF;
+    NEW.date_inserted := COALESCE(NEW.date_inserted, now());
+    INSERT INTO conversation_partitioned SELECT (NEW).*;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS conversation_sync_partitioned ON conversation;
+CREATE TRIGGER conversation_sync_partitioned
+    BEFORE INSERT OR UPDATE OR DELETE ON conversation
+    FOR EACH ROW EXECUTE FUNCTION conversation_sync_partitioned();
+
+-- ============================================================================
+-- Record migration
+-- ============================================================================
+
+INSERT INTO schema_migrations (version, description, applied_by)
+VALUES ('0019', 'Add monthly partitioned conversation and conversation_archive', current_user)
+ON CONFLICT (version) DO NOTHING;
+
+COMMIT;
+
+-- ============================================================================
+-- Rollback
+-- ============================================================================
+-- See migrations/rollbacks/0019_rollback_conversation_partitioning.sql
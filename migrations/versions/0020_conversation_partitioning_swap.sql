@@ -0,0 +1,130 @@
+-- ============================================================================
+-- Migration: 0020_conversation_partitioning_swap
+-- ============================================================================
+-- Description: Second step of partitioning conversation: conversation_partitioned
+--              (filled by the trigger of 0019 and bin/utils/copy_conversation_partitioned.py)
+--              becomes conversation. The old table is kept as conversation_unpartitioned
+--              for the rollback; the run_state and run_score triggers move to the new
+--              table. Adds conversation_all (hot + archived rows) for reports.
+-- Author: System
+-- Date: 2026-10-16
+-- Related: 0019_conversation_partitioning, bin/utils/copy_conversation_partitioned.py,
+--          bin/utils/archive_conversation.py, 0012_run_state, 0015_run_score
+-- Breaking: dialog_message.conversation_id loses its foreign key (a partitioned table
+--           has no unique key on conversation_id alone); dialog rows are still deleted
+--           with their run (dialog_message_run_fkey)
+-- ============================================================================
+--
+-- Requires a finished copy (the migration fails otherwise):
+--   python bin/utils/copy_conversation_partitioned.py
+-- The row counts are compared before the lock (the sync trigger keeps both tables equal
+-- from then on); the swap holds ACCESS EXCLUSIVE locks only for the catalog changes.
+-- After checking the new table, drop the old one: DROP TABLE conversation_unpartitioned;
+--
+-- This migration performs:
+-- Phase 1: Check the copy
+-- Phase 2: Swap conversation_partitioned -> conversation
+-- Phase 3: Triggers and conversation_all view
+-- ============================================================================
+
+BEGIN;
+
+-- ============================================================================
+-- PHASE 1: Check the copy
+-- ============================================================================
+
+DO $$
+DECLARE
+    old_count BIGINT;
+    new_count BIGINT;
+BEGIN
+    -- One statement - one snapshot of both tables
+    SELECT (SELECT count(*) FROM conversation), (SELECT count(*) FROM conversation_partitioned)
+    INTO old_count, new_count;
+    IF old_count <> new_count THEN
+        RAISE EXCEPTION 'conversation_partitioned has % rows, conversation has %: run bin/utils/copy_conversation_partitioned.py first',
+            new_count, old_count;
+    END IF;
+END $$;
+
+-- ============================================================================
+-- PHASE 2: Swap conversation_partitioned -> conversation
+-- ============================================================================
+
+LOCK TABLE conversation, conversation_partitioned IN ACCESS EXCLUSIVE MODE;
+
+DROP TRIGGER IF EXISTS conversation_sync_partitioned ON conversation;
+DROP FUNCTION IF EXISTS conversation_sync_partitioned();
+DROP TRIGGER IF EXISTS run_state_conversation_insert ON conversation;
+DROP TRIGGER IF EXISTS run_score_conversation_insert ON conversation;
+
+ALTER TABLE dialog_message DROP CONSTRAINT IF EXISTS dialog_message_conversation_fkey;
+
+-- The sequence of conversation_id is shared (defaults copied by LIKE); it must not be
+-- dropped together with the old table
+DO $$
+BEGIN
+    EXECUTE format('ALTER SEQUENCE %s OWNED BY conversation_partitioned.conversation_id',
+                   pg_get_serial_sequence('conversation', 'conversation_id'));
+END $$;
+
+-- Old table and its indexes get the _unpartitioned suffix, the new indexes take their names
+DO $$
+DECLARE
+    index_name TEXT;
+BEGIN
+    FOR index_name IN
+        SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE i.indrelid = 'conversation'::regclass
+    LOOP
+        EXECUTE format('ALTER INDEX %I RENAME TO %I', index_name, index_name || '_unpartitioned');
+    END LOOP;
+END $$;
+
+ALTER TABLE conversation RENAME TO conversation_unpartitioned;
+ALTER TABLE conversation_partitioned RENAME TO conversation;
+
+ALTER INDEX conversation_partitioned_pkey RENAME TO conversation_pkey;
+ALTER INDEX idx_conversation_partitioned_run_element_role_date RENAME TO idx_conversation_run_element_role_date;
+ALTER INDEX idx_conversation_partitioned_run_role_date RENAME TO idx_conversation_run_role_date;
+ALTER INDEX idx_conversation_partitioned_chat_element_date RENAME TO idx_conversation_chat_element_date;
+ALTER INDEX idx_conversation_partitioned_element RENAME TO idx_conversation_element;
+ALTER INDEX idx_conversation_partitioned_account RENAME TO idx_conversation_account;
+ALTER INDEX idx_conversation_partitioned_date RENAME TO idx_conversation_date;
+ALTER INDEX idx_conversation_partitioned_revision_rows RENAME TO idx_conversation_revision_rows;
+
+-- ============================================================================
+-- PHASE 3: Triggers and conversation_all view
+-- ============================================================================
+
+-- Same as in 0012 and 0015 (functions are unchanged)
+CREATE TRIGGER run_state_conversation_insert
+    AFTER INSERT ON conversation
+    FOR EACH ROW EXECUTE FUNCTION run_state_on_conversation();
+
+CREATE TRIGGER run_score_conversation_insert
+    AFTER INSERT ON conversation
+    FOR EACH ROW
+    WHEN (NEW.run_id IS NOT NULL AND NEW.element_id IS NOT NULL
+          AND NEW.score IS NOT NULL AND NEW.maxscore IS NOT NULL
+          AND NEW.element_type IS DISTINCT FROM 'test')
+    EXECUTE FUNCTION run_score_on_conversation();
+
+-- Hot and archived rows, for reports over ended runs
+CREATE OR REPLACE VIEW conversation_all AS
+    SELECT * FROM conversation
+    UNION ALL
+    SELECT * FROM conversation_archive;
+
+COMMENT ON TABLE conversation IS 'Conversation log, monthly partitions by date_inserted (rows of ended runs move to conversation_archive)';
+
+INSERT INTO schema_migrations (version, description, applied_by)
+VALUES ('0020', 'Swap conversation to the monthly partitioned table', current_user)
+ON CONFLICT (version) DO NOTHING;
+
+COMMIT;
+
+-- ============================================================================
+-- Rollback
+-- ============================================================================
+-- See migrations/rollbacks/0020_rollback_conversation_partitioning_swap.sql
@@ -5,14 +5,18 @@
 import sys
 import os
 import json
-import yaml
 import re
 import logging
+import threading
+import weakref
+import functools
+import contextlib
 import httpx
 from fastapi import APIRouter, HTTPException, status, Cookie, Response, Request, Depends, Query
 from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from typing import Optional, List, Dict, Tuple
-from pydantic import BaseModel, Field
+from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
 # Настройка logging сначала
@@ -30,15 +34,19 @@ if not os.environ.get('BOT_NAME'):
     os.environ['BOT_NAME'] = "web_bot"
 
 # Импортируем репозиторий для работы с БД через SQLAlchemy
-from app.database import get_db
+from app.database import get_db, SessionLocal, get_async_db, get_async_sessionmaker
 from app.repositories.course_repository import CourseRepository
-from app.models.conversation import Conversation
-from sqlalchemy import and_, desc
+from app.repositories.async_course_repository import AsyncCourseRepository
 
 router = APIRouter()
 
 # Получаем project_root для работы с файлами
 project_root = os.environ.get('PROJECT_ROOT', os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../../..')))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+# Общий для бота и веб-версии кэш разобранных YAML файлов курсов
+from course_cache import course_cache
 
 
 # Dependency для получения репозитория курсов
@@ -46,6 +54,86 @@ def get_course_repository(db: Session = Depends(get_db)) -> CourseRepository:
     """Dependency для получения репозитория курсов"""
     return CourseRepository(db)
 
+
+async def get_async_course_repository(db=Depends(get_async_db)) -> AsyncCourseRepository:
+    """Dependency для async репозитория курсов (MVP_DB_MODE=async)"""
+    return AsyncCourseRepository(db)
+
+
+# MVP_DB_MODE=async: обработчики навигации, ответов и диалога - async def на AsyncCourseRepository (asyncpg),
+# без потоков threadpool; sync - обработчики def на CourseRepository в threadpool
+ASYNC_DB_MODE = settings.MVP_DB_MODE == "async"
+
+# Репозиторий по MVP_DB_MODE для обработчиков, которые есть только в async варианте (диалог)
+get_mode_course_repository = get_async_course_repository if ASYNC_DB_MODE else get_course_repository
+
+
+def sync_route(route):
+    """Регистрация sync варианта обработчика (MVP_DB_MODE=sync); в режиме async путь обслуживает async вариант"""
+    return (lambda handler: handler) if ASYNC_DB_MODE else route
+
+
+def async_route(route):
+    """Регистрация async варианта обработчика (MVP_DB_MODE=async)"""
+    return route if ASYNC_DB_MODE else (lambda handler: handler)
+
+
+def async_variant(sync_fn):
+    """Декоратор async варианта sync функции fn(..., repo): run_repo вызывает его для AsyncCourseRepository"""
+    def decorator(async_fn):
+        sync_fn.async_variant = async_fn
+        return async_fn
+    return decorator
+
+
+async def run_repo(repo, fn, *args, **kwargs):
+    """
+    Вызов функции fn(..., repo) из async обработчика без блокировки event loop: с AsyncCourseRepository -
+    ее async вариант (запросы через AsyncSession), с CourseRepository - sync fn в threadpool
+    """
+    if isinstance(repo, AsyncCourseRepository):
+        return await fn.async_variant(*args, **kwargs, repo=repo)
+    return await run_in_threadpool(fn, *args, **kwargs, repo=repo)
+
+
+@contextlib.asynccontextmanager
+async def open_course_repository():
+    """
+    Репозиторий по MVP_DB_MODE с собственной сессией БД - для тела StreamingResponse,
+    которое выполняется после закрытия зависимостей запроса (get_db/get_async_db)
+    """
+    if ASYNC_DB_MODE:
+        async with get_async_sessionmaker()() as db:
+            yield AsyncCourseRepository(db)
+        return
+    db = SessionLocal()
+    try:
+        yield CourseRepository(db)
+    finally:
+        await run_in_threadpool(db.close)
+
+
+def unit_of_work(handler):
+    """
+    Декоратор обработчика: все записи repo за запрос - одна транзакция (CourseRepository.unit_of_work),
+    commit до отправки ответа. Обработчик должен получать repo через Depends(get_course_repository)
+    (или вызываться через run_repo - тогда транзакция одна на вызов)
+    """
+    @functools.wraps(handler)
+    def wrapper(*args, **kwargs):
+        with kwargs["repo"].unit_of_work():
+            return handler(*args, **kwargs)
+    return wrapper
+
+
+def async_unit_of_work(handler):
+    """unit_of_work для async обработчика с AsyncCourseRepository"""
+    @functools.wraps(handler)
+    async def wrapper(*args, **kwargs):
+        async with kwargs["repo"].unit_of_work():
+            return await handler(*args, **kwargs)
+    return wrapper
+
 # Путь к файлу courses.yml
 COURSES_FILE = os.path.join(project_root, "scripts", "courses.yml")
 
@@ -165,61 +253,6 @@ async def proxy_media(url: str, request: Request):
         )
 
 
-class MessageElement(BaseModel):
-    element_id: str
-    text: str
-    button: Optional[str] = None
-    options: Optional[list] = None  # Для inline кнопок: [{"text": "...", "goto": "..."}]
-    parse_mode: Optional[str] = "MARKDOWN"
-    media: Optional[List[str]] = None  # Массив URL медиафайлов (изображения, видео)
-    link_preview: Optional[bool] = None  # Показывать ли превью ссылок
-
-
-class QuizAnswer(BaseModel):
-    text: str
-    correct: Optional[str] = None  # "yes" для правильного ответа
-    feedback: Optional[str] = None
-
-
-class QuizElement(BaseModel):
-    element_id: str
-    type: str = Field(default="quiz", exclude=False)  # Всегда включать в JSON
-    text: str
-    answers: List[QuizAnswer]
-    media: Optional[List[str]] = None
-
-
-class AudioElement(BaseModel):
-    element_id: str
-    type: str = Field(default="audio", exclude=False)  # Всегда включать в JSON
-    text: Optional[str] = None
-    media: List[str]  # Обязательный массив URL аудиофайлов
-    parse_mode: Optional[str] = "MARKDOWN"
-    link_preview: Optional[bool] = None
-
-
-class InputElement(BaseModel):
-    element_id: str
-    type: str = Field(default="input", exclude=False)  # Всегда включать в JSON
-    text: str
-    correct_answer: Optional[str] = None
-    feedback_correct: Optional[str] = None
-    feedback_incorrect: Optional[str] = None
-    input_type: Optional[str] = "text"  # "text" или "sequence"
-
-
-class QuestionAnswer(BaseModel):
-    text: str
-    feedback: Optional[str] = None
-
-
-class QuestionElement(BaseModel):
-    element_id: str
-    type: str = Field(default="question", exclude=False)  # Всегда включать в JSON
-    text: str
-    answers: List[QuestionAnswer]
-
-
 class QuizAnswerRequest(BaseModel):
     element_id: str
     selected_answer_index: int
@@ -252,23 +285,6 @@ class QuestionAnswerResponse(BaseModel):
     score: int = 0  # Всегда 0, так как question не оценивается
 
 
-class MultiChoiceAnswer(BaseModel):
-    text: str
-    correct: Optional[str] = None  # "yes" для правильного, "no" для неправильного
-    feedback: Optional[str] = None
-
-
-class MultiChoiceElement(BaseModel):
-    element_id: str
-    type: str = Field(default="multi_choice", exclude=False)  # Всегда включать в JSON
-    text: str
-    answers: List[MultiChoiceAnswer]
-    feedback_correct: str
-    feedback_partial: str
-    feedback_incorrect: str
-    mark: Optional[bool] = None
-
-
 class IndividualFeedback(BaseModel):
     answer_index: int
     answer_text: str
@@ -287,52 +303,6 @@ class MultiChoiceAnswerResponse(BaseModel):
     score: float  # 1.0, 0.5 или 0.0
 
 
-class TestElement(BaseModel):
-    element_id: str
-    type: str = Field(default="test", exclude=False)  # Всегда включать в JSON
-    text: str
-    prefix: str
-    score: Dict[int, str]  # Ключ - процент ошибок, значение - сообщение
-    button: Optional[str] = None
-
-
-class EndElement(BaseModel):
-    element_id: str
-    type: str = Field(default="end", exclude=False)
-    text: Optional[str] = None
-
-
-class RevisionElement(BaseModel):
-    element_id: str
-    type: str = Field(default="revision", exclude=False)
-    text: str
-    prefix: str
-    no_mistakes: str
-    button: Optional[str] = None
-
-
-class DialogElement(BaseModel):
-    element_id: str
-    type: str = Field(default="dialog", exclude=False)
-    text: str  # Начальное сообщение
-    prompt: str  # Системный промпт для AI
-    model: Optional[str] = None
-    temperature: Optional[float] = None
-    reasoning: Optional[str] = None
-    parse_mode: Optional[str] = "MARKDOWN"
-    link_preview: Optional[bool] = None
-    auto_start: Optional[bool] = False
-    voice_response: Optional[bool] = False
-    transcription_language: Optional[str] = None
-    tts_voice: Optional[str] = None
-    tts_model: Optional[str] = None
-    tts_speed: Optional[float] = 1.0
-    conversation: Optional[List[Dict[str, str]]] = []  # История диалога
-    
-    class Config:
-        extra = "allow"  # Для обратной совместимости
-
-
 class DialogMessageRequest(BaseModel):
     element_id: str
     message: str
@@ -380,339 +350,64 @@ def get_or_create_chat_id(chat_id_cookie: Optional[int] = None) -> int:
 
 
 def get_active_run(chat_id: int, course_id: str, repo: CourseRepository) -> Optional[int]:
-    """Получение активной сессии (run_id) для пользователя и курса"""
-    run_id = repo.get_run_id(chat_id, course_id)
-    if run_id:
-        # Проверяем, что сессия не завершена
-        if repo.is_course_ended(chat_id, course_id):
-            return None  # Сессия завершена
-        return run_id
-    return None
+    """Получение активной сессии (run_id) для пользователя и курса (None, если последняя сессия завершена)"""
+    return repo.get_active_run_id(chat_id, course_id)
 
 
-def get_current_element_from_conversation(chat_id: int, course_id: str, run_id: int, repo: CourseRepository) -> Optional[dict]:
-    """Получение текущего элемента из conversation"""
-    from app.models.conversation import Conversation
-    from sqlalchemy import func as sql_func
+# Типы элементов, которые могут быть текущими (последний элемент с role='bot' в conversation)
+CONVERSATION_ELEMENT_TYPES = {
+    "audio", "quiz", "input", "question", "multi_choice", "test", "end", "revision", "dialog", "message", "unimplemented"
+}
 
-    # Сначала проверяем наличие активной цепочки повторения
-    # Ищем последнюю запись с revision данными
-    try:
-        revision_conv = repo.db.query(Conversation).filter(
-            and_(
-                Conversation.chat_id == chat_id,
-                Conversation.course_id == course_id,
-                Conversation.run_id == run_id,
-                Conversation.role == 'bot',
-                Conversation.json.like('%"revision"%')
-            )
-        ).order_by(desc(Conversation.date_inserted)).first()
-    except Exception as e:
-        logger.error(f"get_current_element_from_conversation: revision query FAILED: {e}")
-        revision_conv = None
-
-    if revision_conv:
-        revision_result = (
-            revision_conv.element_id,
-            revision_conv.element_type,
-            revision_conv.json,
-            revision_conv.report
-        )
-        
-        if revision_result:
-            revision_element_id, revision_element_type, revision_json_data, revision_report = revision_result
-            revision_element_data = json.loads(revision_json_data)
-            
-            # Проверяем наличие активной цепочки повторения
-            if "revision" in revision_element_data:
-                revision_info = revision_element_data["revision"]
-                revision_chain = revision_info.get("data", [])
-                
-                if len(revision_chain) > 0:
-                    # Берем первый элемент из цепочки
-                    first_chain_item = revision_chain[0]
-                    first_element_id = list(first_chain_item.keys())[0]
-                    first_element_data = first_chain_item[first_element_id]["element_data"]
-                    
-                    element_type = first_element_data.get("type", "message")
-                    
-                    # Обрабатываем элемент в зависимости от типа
-                    if element_type == "quiz":
-                        answers = first_element_data.get("answers", [])
-                        normalized_answers = []
-                        for answer in answers:
-                            normalized_answer = answer.copy()
-                            if "text" in normalized_answer and not isinstance(normalized_answer["text"], str):
-                                normalized_answer["text"] = str(normalized_answer["text"])
-                            correct_value = answer.get("correct")
-                            if correct_value is True or correct_value == "yes":
-                                normalized_answer["correct"] = "yes"
-                            elif correct_value is False or correct_value == "no":
-                                normalized_answer.pop("correct", None)
-                            normalized_answers.append(normalized_answer)
-                        
-                        media = first_element_data.get("media")
-                        if media and isinstance(media, list):
-                            from urllib.parse import quote
-                            media = [
-                                f"/api/mvp/media/proxy?url={quote(get_direct_download_link(url), safe='')}"
-                                if extract_file_id_from_drive_url(url) else url
-                                for url in media
-                            ]
-                        
-                        result = {
-                            "element_id": first_element_id,
-                            "type": "quiz",
-                            "text": first_element_data.get("text", ""),
-                            "answers": normalized_answers,
-                            "media": media,
-                        }
-                        logger.info(f"get_current_element_from_conversation: revision chain quiz element_id={first_element_id}")
-                        return result
-                    
-                    elif element_type == "input":
-                        result = {
-                            "element_id": first_element_id,
-                            "type": "input",
-                            "text": first_element_data.get("text", ""),
-                            "correct_answer": first_element_data.get("correct_answer"),
-                            "feedback_correct": first_element_data.get("feedback_correct"),
-                            "feedback_incorrect": first_element_data.get("feedback_incorrect"),
-                            "input_type": first_element_data.get("input_type", "text"),
-                        }
-                        logger.info(f"get_current_element_from_conversation: revision chain input element_id={first_element_id}")
-                        return result
-                    
-                    elif element_type == "multi_choice":
-                        answers = first_element_data.get("answers", [])
-                        normalized_answers = []
-                        for answer in answers:
-                            normalized_answer = answer.copy()
-                            correct_value = answer.get("correct")
-                            if correct_value is True or correct_value == "yes":
-                                normalized_answer["correct"] = "yes"
-                            elif correct_value is False or correct_value == "no":
-                                normalized_answer["correct"] = "no"
-                            normalized_answers.append(normalized_answer)
-                        
-                        result = {
-                            "element_id": first_element_id,
-                            "type": "multi_choice",
-                            "text": first_element_data.get("text", ""),
-                            "answers": normalized_answers,
-                            "feedback_correct": first_element_data.get("feedback_correct", ""),
-                            "feedback_partial": first_element_data.get("feedback_partial", ""),
-                            "feedback_incorrect": first_element_data.get("feedback_incorrect", ""),
-                            "mark": first_element_data.get("mark"),
-                        }
-                        logger.info(f"get_current_element_from_conversation: revision chain multi_choice element_id={first_element_id}")
-                        return result
-        
-    # Если нет активной цепочки повторения, ищем последний элемент с role='bot'
-    conv = repo.db.query(Conversation).filter(
-        and_(
-            Conversation.chat_id == chat_id,
-            Conversation.course_id == course_id,
-            Conversation.run_id == run_id,
-            Conversation.role == 'bot'
-        )
-    ).order_by(desc(Conversation.date_inserted)).first()
-    if conv:
+
+def get_current_element_from_conversation(chat_id: int, course_id: str, run_id: int, repo: CourseRepository) -> Optional[dict]:
+    """
+    Получение текущего элемента из conversation
+    Позиция сессии берется из run_state (указатели на последние строки), без сканирования conversation
+    """
+    # Последний элемент с role='bot' (элементы цепочки повторения тоже сохраняются как bot-строки)
+    conv = repo.get_last_bot_conversation(run_id)
+    if conv and conv.element_type in CONVERSATION_ELEMENT_TYPES:
         element_id = conv.element_id
         element_type = conv.element_type
-        json_data = conv.json
-        report = conv.report
-        element_data = json.loads(json_data) if json_data else {}
-
-        # Обработка audio элементов
-        if element_type == "audio":
-            element_info = element_data.get("element_data", {})
-            result = {
-                "element_id": element_id,
-                "type": "audio",
-                "text": element_info.get("text"),
-                "media": element_info.get("media", []),
-                "parse_mode": element_info.get("parse_mode", "MARKDOWN"),
-                "link_preview": element_info.get("link_preview"),
-            }
-            logger.info(f"get_current_element_from_conversation: audio element_id={element_id}")
-            return result
-        
-        # Обработка quiz элементов
-        if element_type == "quiz":
-            element_info = element_data.get("element_data", {})
-            
-            # Нормализуем answers: преобразуем correct из boolean в строку "yes"
-            # и text в строку (на случай если это число из YAML)
-            answers = element_info.get("answers", [])
-            normalized_answers = []
-            for answer in answers:
-                normalized_answer = answer.copy()
-                # Преобразуем text в строку, если это не строка
-                if "text" in normalized_answer and not isinstance(normalized_answer["text"], str):
-                    normalized_answer["text"] = str(normalized_answer["text"])
-                correct_value = answer.get("correct")
-                if correct_value is True or correct_value == "yes":
-                    normalized_answer["correct"] = "yes"
-                elif correct_value is False or correct_value == "no":
-                    # Удаляем поле correct для неправильных ответов
-                    normalized_answer.pop("correct", None)
-                normalized_answers.append(normalized_answer)
-            
-            result = {
-                "element_id": element_id,
-                "type": "quiz",
-                "text": element_info.get("text", ""),
-                "answers": normalized_answers,
-                "media": element_info.get("media"),
-            }
-            logger.info(f"get_current_element_from_conversation: quiz element_id={element_id}")
-            return result
-        
-        # Обработка input элементов
-        if element_type == "input":
-            element_info = element_data.get("element_data", {})
-            result = {
-                "element_id": element_id,
-                "type": "input",
-                "text": element_info.get("text", ""),
-                "correct_answer": element_info.get("correct_answer"),
-                "feedback_correct": element_info.get("feedback_correct"),
-                "feedback_incorrect": element_info.get("feedback_incorrect"),
-                "input_type": element_info.get("input_type", "text"),
-            }
-            logger.info(f"get_current_element_from_conversation: input element_id={element_id}")
-            return result
-        
-        # Обработка question элементов
-        if element_type == "question":
-            element_info = element_data.get("element_data", {})
-            result = {
-                "element_id": element_id,
-                "type": "question",
-                "text": element_info.get("text", ""),
-                "answers": element_info.get("answers", []),
-            }
-            logger.info(f"get_current_element_from_conversation: question element_id={element_id}")
-            return result
-        
-        # Обработка multi_choice элементов
-        if element_type == "multi_choice":
-            element_info = element_data.get("element_data", {})
-            
-            # Нормализуем answers: преобразуем correct из boolean в строку "yes"/"no"
-            answers = element_info.get("answers", [])
-            normalized_answers = []
-            for answer in answers:
-                normalized_answer = answer.copy()
-                correct_value = answer.get("correct")
-                if correct_value is True or correct_value == "yes":
-                    normalized_answer["correct"] = "yes"
-                elif correct_value is False or correct_value == "no":
-                    normalized_answer["correct"] = "no"
-                normalized_answers.append(normalized_answer)
-            
-            result = {
-                "element_id": element_id,
-                "type": "multi_choice",
-                "text": element_info.get("text", ""),
-                "answers": normalized_answers,
-                "feedback_correct": element_info.get("feedback_correct", ""),
-                "feedback_partial": element_info.get("feedback_partial", ""),
-                "feedback_incorrect": element_info.get("feedback_incorrect", ""),
-                "mark": element_info.get("mark"),
-            }
-            logger.info(f"get_current_element_from_conversation: multi_choice element_id={element_id}")
-            return result
-        
-        # Обработка test элементов
-        if element_type == "test":
-            element_info = element_data.get("element_data", {})
-            result = {
-                "element_id": element_id,
-                "type": "test",
-                "text": element_info.get("text", ""),
-                "prefix": element_info.get("prefix", ""),
-                "score": element_info.get("score", {}),
-                "button": element_info.get("button"),
-            }
-            logger.info(f"get_current_element_from_conversation: test element_id={element_id}")
-            return result
-        
-        # Обработка end элементов
-        if element_type == "end":
-            element_info = element_data.get("element_data", {})
-            result = {
-                "element_id": element_id,
-                "type": "end",
-                "text": element_info.get("text"),
-            }
-            logger.info(f"get_current_element_from_conversation: end element_id={element_id}")
-            return result
+        element_data = repo.load_conversation_json(conv)
+        element_info = element_data.get("element_data", {})
         
-        # Обработка revision элементов
-        if element_type == "revision":
-            element_info = element_data.get("element_data", {})
-            result = {
-                "element_id": element_id,
-                "type": "revision",
-                "text": element_info.get("text", ""),
-                "prefix": element_info.get("prefix", ""),
-                "no_mistakes": element_info.get("no_mistakes", ""),
-                "button": element_info.get("button"),
-            }
-            logger.info(f"get_current_element_from_conversation: revision element_id={element_id}")
-            return result
+        # Готовый payload элемента из версии курса сессии; сохраненные данные - если элемента в курсе уже нет
+        result = get_element_payload(course_id, element_id, {**element_info, "type": element_type},
+                                     conv.course_version)
         
-        # Обработка dialog элементов
+        # Данные пользователя: история диалога
         if element_type == "dialog":
-            element_info = element_data.get("element_data", {})
-            text_value = element_info.get("text", "")
-            logger.info(f"get_current_element_from_conversation: dialog element_id={element_id}, text={text_value[:50] if text_value else 'EMPTY'}, element_info keys={list(element_info.keys())}")
-            result = {
-                "element_id": element_id,
-                "type": "dialog",
-                "text": text_value,
-                "prompt": element_info.get("prompt", ""),
-                "model": element_info.get("model"),
-                "temperature": element_info.get("temperature"),
-                "reasoning": element_info.get("reasoning"),
-                "parse_mode": element_info.get("parse_mode", "MARKDOWN"),
-                "link_preview": element_info.get("link_preview"),
-                "auto_start": element_info.get("auto_start", False),
-                "voice_response": element_info.get("voice_response", False),
-                "transcription_language": element_info.get("transcription_language"),
-                "tts_voice": element_info.get("tts_voice"),
-                "tts_model": element_info.get("tts_model"),
-                "tts_speed": element_info.get("tts_speed", 1.0),
-                "conversation": element_info.get("conversation", [])
-            }
-            logger.info(f"get_current_element_from_conversation: dialog result text={result['text'][:50] if result['text'] else 'EMPTY'}")
-            return result
+            result["conversation"], _ = repo.get_dialog_history(conv.conversation_id, element_info)
         
-        # Обработка message элементов
-        if element_type == "message":
-            element_info = element_data.get("element_data", {})
-            result = {
-                "element_id": element_id,
-                "text": element_info.get("text", ""),
-                "button": element_info.get("button"),
-                "options": element_info.get("options"),  # Поддержка inline кнопок
-                "parse_mode": element_info.get("parse_mode", "MARKDOWN"),
-                "media": element_info.get("media"),  # Поддержка медиа файлов
-                "link_preview": element_info.get("link_preview")  # Поддержка link_preview
-            }
-            logger.info(f"get_current_element_from_conversation: element_id={element_id}, options={result.get('options')}, media={result.get('media')}, json_data keys={list(element_info.keys())}")
-            return result
+        logger.info(f"get_current_element_from_conversation: {element_type} element_id={element_id}")
+        return result
+    
+    return None
+
+
+async def get_current_element_from_conversation_async(chat_id: int, course_id: str, run_id: int,
+                                                      repo: AsyncCourseRepository) -> Optional[dict]:
+    """get_current_element_from_conversation для AsyncCourseRepository"""
+    conv = await repo.get_last_bot_conversation(run_id)
+    if conv and conv.element_type in CONVERSATION_ELEMENT_TYPES:
+        element_info = (await repo.load_conversation_json(conv)).get("element_data", {})
+        result = get_element_payload(course_id, conv.element_id, {**element_info, "type": conv.element_type},
+                                     conv.course_version)
+        if conv.element_type == "dialog":
+            result["conversation"], _ = await repo.get_dialog_history(conv.conversation_id, element_info)
+        
+        logger.info(f"get_current_element_from_conversation_async: {conv.element_type} element_id={conv.element_id}")
+        return result
     
     return None
 
 
 def load_courses_yml() -> dict:
-    """Загрузка courses.yml"""
+    """Загрузка courses.yml (из кэша, перечитывается при изменении файла)"""
     try:
-        with open(COURSES_FILE, 'r', encoding='utf-8') as f:
-            return yaml.safe_load(f) or {}
+        return course_cache.get_courses_index(COURSES_FILE).courses
     except Exception as e:
         logger.error(f"Error loading courses.yml: {e}", exc_info=True)
         return {}
@@ -772,22 +467,14 @@ def find_revision_mistakes(chat_id: int, course_id: str, run_id: int, prefix: st
     - mistakes_list: список элементов с ошибками [{element_id: {element_data: {...}}}, ...]
     - correct_elements_list: список правильных элементов для разнообразия
     """
-    # Загружаем курс и находим элементы с префиксом
-    course_data = get_course_data(course_id)
-    if not course_data:
+    # Элементы с префиксом, которые могут иметь оценки (индекс строится один раз на версию курса)
+    compiled = get_compiled_course(course_id)
+    if not compiled:
         logger.warning(f"Revision mistakes: course {course_id} not found")
         return ([], [])
     
-    # Находим все элементы с префиксом (только те, которые могут иметь оценки)
-    scored_element_types = ["quiz", "input", "multi_choice"]
-    elements_with_prefix = []
-    
-    for element_id, element_data in course_data.items():
-        if element_id.startswith(prefix):
-            element_type = element_data.get("type", "message")
-            if element_type in scored_element_types:
-                elements_with_prefix.append((element_id, element_type, element_data))
-                logger.info(f"Revision mistakes: found element {element_id} ({element_type}) with prefix {prefix}")
+    scored = compiled.scored_elements(prefix)
+    elements_with_prefix = scored.entries
     
     if not elements_with_prefix:
         logger.warning(f"Revision mistakes: no elements found with prefix {prefix}")
@@ -809,16 +496,10 @@ def find_revision_mistakes(chat_id: int, course_id: str, run_id: int, prefix: st
         db_maxscore = response["maxscore"]
         
         # Находим соответствующий элемент из elements_with_prefix
-        element_data = None
-        element_type = None
-        for eid, etype, edata in elements_with_prefix:
-            if eid == element_id:
-                element_data = edata
-                element_type = etype
-                break
-        
-        if not element_data:
+        entry = scored.by_id.get(element_id)
+        if not entry:
             continue
+        _, element_type, element_data = entry
         
         score = None
         max_score = None
@@ -882,22 +563,13 @@ def calculate_test_score(chat_id: int, course_id: str, run_id: int, prefix: str,
     Возвращает:
     - (total_score, total_max_score)
     """
-    # Загружаем курс и находим элементы с префиксом
-    course_data = get_course_data(course_id)
-    if not course_data:
+    # Элементы с префиксом, которые могут иметь оценки (индекс строится один раз на версию курса)
+    compiled = get_compiled_course(course_id)
+    if not compiled:
         logger.warning(f"Test score: course {course_id} not found")
         return (0.0, 0.0)
     
-    # Находим все элементы с префиксом (только те, которые могут иметь оценки)
-    scored_element_types = ["quiz", "input", "multi_choice"]
-    elements_with_prefix = []
-    
-    for element_id, element_data in course_data.items():
-        if element_id.startswith(prefix):
-            element_type = element_data.get("type", "message")
-            if element_type in scored_element_types:
-                elements_with_prefix.append((element_id, element_type, element_data))
-                logger.info(f"Test score: found element {element_id} ({element_type}) with prefix {prefix}")
+    elements_with_prefix = compiled.scored_elements(prefix).entries
     
     if not elements_with_prefix:
         logger.warning(f"Test score: no elements found with prefix {prefix}")
@@ -991,301 +663,366 @@ def get_course_path(course_id: str) -> Optional[str]:
     return path
 
 
-def load_course_yaml(course_path: str) -> Optional[dict]:
-    """Загрузка YAML файла курса"""
+def get_compiled_course(course_id: str):
+    """
+    Получение скомпилированного курса из кэша: элементы + навигационный индекс.
+    Возвращает None, если курс не найден или пуст.
+    """
+    course_path = get_course_path(course_id)
+    if not course_path:
+        return None
+    
     try:
         if not os.path.exists(course_path):
             logger.error(f"Course file not found: {course_path}")
             return None
-        
-        with open(course_path, 'r', encoding='utf-8') as f:
-            return yaml.safe_load(f) or {}
+        compiled = course_cache.get_course(course_path)
     except Exception as e:
         logger.error(f"Error loading course YAML {course_path}: {e}", exc_info=True)
         return None
+    
+    if not compiled.elements:
+        return None
+    return compiled
+
+
+def pin_course_version(course_id: str, repo: CourseRepository) -> Optional[str]:
+    """
+    Версия курса для новой сессии: строки conversation сессии хранят только отличия от ее элементов.
+    Версия сохраняется в course_version один раз на процесс (отмечается после commit транзакции запроса:
+    при откате следующая сессия сохранит ее снова)
+    """
+    compiled = get_compiled_course(course_id)
+    if not compiled:
+        return None
+    version = course_cache.register_version(compiled)
+    if not compiled.stored:
+        repo.save_course_version(version, course_id, compiled.to_json())
+        
+        def mark_stored():
+            compiled.stored = True
+        repo.after_commit(mark_stored)
+    return version
+
+
+async def pin_course_version_async(course_id: str, repo: AsyncCourseRepository) -> Optional[str]:
+    """pin_course_version для AsyncCourseRepository"""
+    compiled = get_compiled_course(course_id)
+    if not compiled:
+        return None
+    version = course_cache.register_version(compiled)
+    if not compiled.stored:
+        await repo.save_course_version(version, course_id, compiled.to_json())
+        
+        def mark_stored():
+            compiled.stored = True
+        repo.after_commit(mark_stored)
+    return version
 
 
 def get_course_data(course_id: str) -> Optional[dict]:
     """Получение данных курса (все элементы, включая нереализованные)"""
-    course_path = get_course_path(course_id)
-    if not course_path:
+    compiled = get_compiled_course(course_id)
+    if not compiled:
         return None
     
-    course_data = load_course_yaml(course_path)
-    if not course_data:
+    # Возвращаем все элементы (включая нереализованные для обработки)
+    return compiled.elements
+
+
+# ========== Рендер элементов курса ==========
+# Payload элемента для клиента (нормализованные answers, прокси для media, флаги yes/no -> bool)
+# строится один раз на версию курса и хранится в кэше; обработчики запросов берут готовый
+# payload и добавляют только данные пользователя (например, conversation диалога).
+
+# Нереализованные в MVP типы элементов: показываются как заглушка с кнопкой "Продолжить"
+UNIMPLEMENTED_ELEMENT_TYPES = {
+    "miniapp": "Telegram Mini App",
+    "jump": "Навигация с опциями",
+    "delay": "Задержка перед следующим элементом"
+}
+
+
+def normalize_link_preview(link_preview):
+    """link_preview может быть "yes"/"no" или True/False"""
+    if isinstance(link_preview, str):
+        return link_preview.lower() == "yes"
+    if link_preview is None:
         return None
+    return bool(link_preview)
+
+
+def normalize_flag(value) -> bool:
+    """Флаги вроде auto_start/voice_response: "yes"/"no", True/False или строка"""
+    if isinstance(value, str):
+        return value.lower() in ("true", "yes", "1")
+    return bool(value)
+
+
+def proxy_media_urls(media):
+    """Преобразуем Google Drive ссылки в прокси URL через backend для обхода CORS"""
+    if media and isinstance(media, list):
+        from urllib.parse import quote
+        return [
+            f"/api/mvp/media/proxy?url={quote(get_direct_download_link(url), safe='')}"
+            if extract_file_id_from_drive_url(url) else url
+            for url in media
+        ]
+    return media
+
+
+def normalize_quiz_answers(answers: list) -> list:
+    """correct: True/"yes" -> "yes", у неправильных ответов поле correct удаляется; text -> строка (число из YAML)"""
+    normalized_answers = []
+    for answer in answers:
+        normalized_answer = answer.copy()
+        if "text" in normalized_answer and not isinstance(normalized_answer["text"], str):
+            normalized_answer["text"] = str(normalized_answer["text"])
+        correct_value = answer.get("correct")
+        if correct_value is True or correct_value == "yes":
+            normalized_answer["correct"] = "yes"
+        elif correct_value is False or correct_value == "no":
+            normalized_answer.pop("correct", None)
+        normalized_answers.append(normalized_answer)
+    return normalized_answers
+
+
+def normalize_multichoice_answers(answers: list) -> list:
+    """correct: True/False -> "yes"/"no" """
+    normalized_answers = []
+    for answer in answers:
+        normalized_answer = answer.copy()
+        correct_value = answer.get("correct")
+        if correct_value is True or correct_value == "yes":
+            normalized_answer["correct"] = "yes"
+        elif correct_value is False or correct_value == "no":
+            normalized_answer["correct"] = "no"
+        normalized_answers.append(normalized_answer)
+    return normalized_answers
+
+
+def render_element(element_id: str, element_data: dict) -> dict:
+    """Построение payload элемента для клиента из данных элемента (YAML)"""
+    element_type = element_data.get("type", "message")
+    
+    if element_type == "unimplemented":
+        # Заглушка, уже сохраненная в conversation
+        return {"element_id": element_id, **element_data}
     
-    # Возвращаем все элементы (включая нереализованные для обработки)
-    return course_data
+    if element_type == "audio":
+        return {
+            "element_id": element_id,
+            "type": "audio",
+            "text": element_data.get("text"),
+            "media": proxy_media_urls(element_data.get("media", [])),
+            "parse_mode": element_data.get("parse_mode", "MARKDOWN"),
+            "link_preview": normalize_link_preview(element_data.get("link_preview")),
+        }
+    
+    if element_type == "input":
+        return {
+            "element_id": element_id,
+            "type": "input",
+            "text": element_data.get("text", ""),
+            "correct_answer": element_data.get("correct_answer"),
+            "feedback_correct": element_data.get("feedback_correct"),
+            "feedback_incorrect": element_data.get("feedback_incorrect"),
+            "input_type": element_data.get("input_type", "text"),
+        }
+    
+    if element_type == "question":
+        return {
+            "element_id": element_id,
+            "type": "question",
+            "text": element_data.get("text", ""),
+            "answers": element_data.get("answers", []),
+        }
+    
+    if element_type == "multi_choice":
+        return {
+            "element_id": element_id,
+            "type": "multi_choice",
+            "text": element_data.get("text", ""),
+            "answers": normalize_multichoice_answers(element_data.get("answers", [])),
+            "feedback_correct": element_data.get("feedback_correct", ""),
+            "feedback_partial": element_data.get("feedback_partial", ""),
+            "feedback_incorrect": element_data.get("feedback_incorrect", ""),
+            "mark": element_data.get("mark"),
+        }
+    
+    if element_type == "quiz":
+        return {
+            "element_id": element_id,
+            "type": "quiz",
+            "text": element_data.get("text", ""),
+            "answers": normalize_quiz_answers(element_data.get("answers", [])),
+            "media": proxy_media_urls(element_data.get("media")),
+        }
+    
+    if element_type == "test":
+        return {
+            "element_id": element_id,
+            "type": "test",
+            "text": element_data.get("text", ""),
+            "prefix": element_data.get("prefix", ""),
+            "score": element_data.get("score", {}),
+            "button": element_data.get("button"),
+        }
+    
+    if element_type == "end":
+        return {
+            "element_id": element_id,
+            "type": "end",
+            "text": element_data.get("text"),
+        }
+    
+    if element_type == "revision":
+        return {
+            "element_id": element_id,
+            "type": "revision",
+            "text": element_data.get("text", ""),
+            "prefix": element_data.get("prefix", ""),
+            "no_mistakes": element_data.get("no_mistakes", ""),
+            "button": element_data.get("button"),
+        }
+    
+    if element_type == "dialog":
+        return {
+            "element_id": element_id,
+            "type": "dialog",
+            "text": element_data.get("text", ""),
+            "prompt": element_data.get("prompt", ""),
+            "model": element_data.get("model"),
+            "temperature": element_data.get("temperature"),
+            "reasoning": element_data.get("reasoning"),
+            "parse_mode": element_data.get("parse_mode", "MARKDOWN"),
+            "link_preview": element_data.get("link_preview"),
+            "auto_start": normalize_flag(element_data.get("auto_start", False)),
+            "voice_response": normalize_flag(element_data.get("voice_response", False)),
+            "transcription_language": element_data.get("transcription_language"),
+            "tts_voice": element_data.get("tts_voice"),
+            "tts_model": element_data.get("tts_model"),
+            "tts_speed": element_data.get("tts_speed", 1.0),
+            "conversation": element_data.get("conversation", [])
+        }
+    
+    if element_type in UNIMPLEMENTED_ELEMENT_TYPES:
+        element_text = element_data.get("text", "")
+        element_name = UNIMPLEMENTED_ELEMENT_TYPES[element_type]
+        return {
+            "element_id": element_id,
+            "type": "unimplemented",
+            "original_type": element_type,
+            "element_name": element_name,
+            "text": f"⚠️ Элемент '{element_name}' (тип: {element_type}) еще не реализован в MVP версии.\n\n"
+                   f"Оригинальный текст элемента:\n{element_text}\n\n"
+                   f"Этот элемент будет пропущен, и курс продолжит выполнение со следующего элемента.",
+            "button": "Продолжить"
+        }
+    
+    # message (и неизвестные типы)
+    return {
+        "element_id": element_id,
+        "text": element_data.get("text", ""),
+        "button": element_data.get("button"),
+        "options": element_data.get("options"),  # Поддержка inline кнопок
+        "parse_mode": element_data.get("parse_mode", "MARKDOWN"),
+        "media": proxy_media_urls(element_data.get("media")),  # Поддержка медиа файлов (с проксированием через backend)
+        "link_preview": normalize_link_preview(element_data.get("link_preview"))  # Поддержка link_preview
+    }
+
+
+# Готовые payload по версиям курса: CompiledCourse -> {element_id: payload}
+# (при изменении YAML появляется новый CompiledCourse, старые payload уходят вместе с ним)
+_rendered_courses = weakref.WeakKeyDictionary()
+_rendered_courses_lock = threading.Lock()
+
+
+def get_rendered_elements(compiled) -> Dict[str, dict]:
+    """Payload всех элементов курса (рендерятся один раз на версию курса). Только для чтения"""
+    with _rendered_courses_lock:
+        rendered = _rendered_courses.get(compiled)
+    if rendered is None:
+        rendered = {
+            element_id: render_element(element_id, element_data)
+            for element_id, element_data in compiled.elements.items()
+        }
+        with _rendered_courses_lock:
+            _rendered_courses[compiled] = rendered
+    return rendered
+
+
+def is_course_loaded(course_id: str) -> bool:
+    """courses.yml и YAML курса разобраны, payload элементов отрендерены (дальше - только чтение кэша)"""
+    if not course_cache.is_cached(COURSES_FILE):
+        return False
+    course_path = get_course_path(course_id)
+    if not course_path:
+        return True
+    if not course_cache.is_cached(course_path):
+        return False
+    compiled = course_cache.get_course(course_path)
+    with _rendered_courses_lock:
+        return not compiled.elements or compiled in _rendered_courses
+
+
+def load_course(course_id: str) -> None:
+    """Разбор YAML курса и рендер payload его элементов"""
+    compiled = get_compiled_course(course_id)
+    if compiled:
+        get_rendered_elements(compiled)
+
+
+async def ensure_course_loaded(course_id: str) -> None:
+    """
+    Для async обработчиков: разбор YAML (при первом обращении или после изменения файла) - в threadpool,
+    чтобы не блокировать event loop; функции курса после этого берут все из кэша
+    """
+    if not is_course_loaded(course_id):
+        await run_in_threadpool(load_course, course_id)
+
+
+def get_element_payload(course_id: str, element_id: str, element_data: Optional[dict] = None,
+                        course_version: Optional[str] = None) -> Optional[dict]:
+    """
+    Payload элемента курса для ответа клиенту (копия, можно дополнять полями пользователя).
+    course_version - версия курса, к которой привязана сессия (если она еще есть в памяти процесса),
+    иначе текущая версия.
+    Если элемента нет в версии курса (или у него другой тип), рендерится element_data,
+    например данные, сохраненные в conversation.
+    """
+    compiled = course_cache.get_version(course_version) if course_version else None
+    if compiled is None:
+        compiled = get_compiled_course(course_id)
+    if compiled:
+        payload = get_rendered_elements(compiled).get(element_id)
+        if payload and (element_data is None or
+                        payload.get("type", "message") == render_type(element_data)):
+            return dict(payload)
+    if element_data is not None:
+        return render_element(element_id, element_data)
+    return None
+
+
+def render_type(element_data: dict) -> str:
+    """Тип payload, который render_element построит для element_data"""
+    element_type = element_data.get("type", "message")
+    if element_type in UNIMPLEMENTED_ELEMENT_TYPES:
+        return "unimplemented"
+    return element_type
 
 
 def get_first_element_from_course(course_id: str) -> Optional[dict]:
     """Получение первого элемента курса из YAML"""
     try:
-        course_data = get_course_data(course_id)
-        if not course_data:
+        compiled = get_compiled_course(course_id)
+        if not compiled:
             return None
         
-        # Получаем первый элемент
-        for element_id, element_data in course_data.items():
-            element_type = element_data.get("type", "message")
-            
-            # Обработка audio элементов
-            if element_type == "audio":
-                # Обработка link_preview: может быть "yes"/"no" или True/False
-                link_preview = element_data.get("link_preview")
-                if isinstance(link_preview, str):
-                    link_preview = link_preview.lower() == "yes"
-                elif link_preview is None:
-                    link_preview = None
-                else:
-                    link_preview = bool(link_preview)
-                
-                # Преобразуем Google Drive ссылки в прокси URL для обхода CORS
-                media = element_data.get("media", [])
-                if media and isinstance(media, list):
-                    from urllib.parse import quote
-                    media = [
-                        f"/api/mvp/media/proxy?url={quote(get_direct_download_link(url), safe='')}"
-                        if extract_file_id_from_drive_url(url) else url
-                        for url in media
-                    ]
-                
-                result = {
-                    "element_id": element_id,
-                    "type": "audio",
-                    "text": element_data.get("text"),
-                    "media": media,
-                    "parse_mode": element_data.get("parse_mode", "MARKDOWN"),
-                    "link_preview": link_preview,
-                }
-                logger.info(f"get_first_element_from_course: audio element_id={element_id}")
-                return result
-            
-            # Обработка input элементов
-            if element_type == "input":
-                result = {
-                    "element_id": element_id,
-                    "type": "input",
-                    "text": element_data.get("text", ""),
-                    "correct_answer": element_data.get("correct_answer"),
-                    "feedback_correct": element_data.get("feedback_correct"),
-                    "feedback_incorrect": element_data.get("feedback_incorrect"),
-                    "input_type": element_data.get("input_type", "text"),
-                }
-                logger.info(f"get_first_element_from_course: input element_id={element_id}")
-                return result
-            
-            # Обработка question элементов
-            if element_type == "question":
-                result = {
-                    "element_id": element_id,
-                    "type": "question",
-                    "text": element_data.get("text", ""),
-                    "answers": element_data.get("answers", []),
-                }
-                logger.info(f"get_first_element_from_course: question element_id={element_id}")
-                return result
-            
-            # Обработка multi_choice элементов
-            if element_type == "multi_choice":
-                # Нормализуем answers: преобразуем correct из boolean в строку "yes"/"no"
-                answers = element_data.get("answers", [])
-                normalized_answers = []
-                for answer in answers:
-                    normalized_answer = answer.copy()
-                    correct_value = answer.get("correct")
-                    if correct_value is True or correct_value == "yes":
-                        normalized_answer["correct"] = "yes"
-                    elif correct_value is False or correct_value == "no":
-                        normalized_answer["correct"] = "no"
-                    normalized_answers.append(normalized_answer)
-                
-                result = {
-                    "element_id": element_id,
-                    "type": "multi_choice",
-                    "text": element_data.get("text", ""),
-                    "answers": normalized_answers,
-                    "feedback_correct": element_data.get("feedback_correct", ""),
-                    "feedback_partial": element_data.get("feedback_partial", ""),
-                    "feedback_incorrect": element_data.get("feedback_incorrect", ""),
-                }
-                logger.info(f"get_first_element_from_course: multi_choice element_id={element_id}")
-                return result
-            
-            # Обработка quiz элементов
-            if element_type == "quiz":
-                # Преобразуем Google Drive ссылки в прокси URL для обхода CORS
-                media = element_data.get("media")
-                if media and isinstance(media, list):
-                    from urllib.parse import quote
-                    media = [
-                        f"/api/mvp/media/proxy?url={quote(get_direct_download_link(url), safe='')}"
-                        if extract_file_id_from_drive_url(url) else url
-                        for url in media
-                    ]
-                
-                # Нормализуем answers: преобразуем correct из boolean в строку "yes"
-                # и text в строку (на случай если это число из YAML)
-                answers = element_data.get("answers", [])
-                normalized_answers = []
-                for answer in answers:
-                    normalized_answer = answer.copy()
-                    # Преобразуем text в строку, если это не строка
-                    if "text" in normalized_answer and not isinstance(normalized_answer["text"], str):
-                        normalized_answer["text"] = str(normalized_answer["text"])
-                    correct_value = answer.get("correct")
-                    if correct_value is True or correct_value == "yes":
-                        normalized_answer["correct"] = "yes"
-                    elif correct_value is False or correct_value == "no":
-                        # Удаляем поле correct для неправильных ответов
-                        normalized_answer.pop("correct", None)
-                    normalized_answers.append(normalized_answer)
-                
-                result = {
-                    "element_id": element_id,
-                    "type": "quiz",
-                    "text": element_data.get("text", ""),
-                    "answers": normalized_answers,
-                    "media": media,
-                }
-                logger.info(f"get_first_element_from_course: quiz element_id={element_id}")
-                return result
-            
-            # Обработка test элементов
-            if element_type == "test":
-                result = {
-                    "element_id": element_id,
-                    "type": "test",
-                    "text": element_data.get("text", ""),
-                    "prefix": element_data.get("prefix", ""),
-                    "score": element_data.get("score", {}),
-                    "button": element_data.get("button"),
-                }
-                logger.info(f"get_first_element_from_course: test element_id={element_id}")
-                return result
-            
-            # Обработка end элементов
-            if element_type == "end":
-                result = {
-                    "element_id": element_id,
-                    "type": "end",
-                    "text": element_data.get("text"),
-                }
-                logger.info(f"get_first_element_from_course: end element_id={element_id}")
-                return result
-            
-            # Обработка revision элементов
-            if element_type == "revision":
-                result = {
-                    "element_id": element_id,
-                    "type": "revision",
-                    "text": element_data.get("text", ""),
-                    "prefix": element_data.get("prefix", ""),
-                    "no_mistakes": element_data.get("no_mistakes", ""),
-                    "button": element_data.get("button"),
-                }
-                logger.info(f"get_first_element_from_course: revision element_id={element_id}")
-                return result
-            
-            # Обработка dialog элементов
-            if element_type == "dialog":
-                # Обработка auto_start: может быть "yes"/"no", True/False или строка
-                auto_start = element_data.get("auto_start", False)
-                if isinstance(auto_start, str):
-                    auto_start = auto_start.lower() in ("true", "yes", "1")
-                else:
-                    auto_start = bool(auto_start)
-                
-                # Обработка voice_response: может быть "yes"/"no", True/False или строка
-                voice_response = element_data.get("voice_response", False)
-                if isinstance(voice_response, str):
-                    voice_response = voice_response.lower() in ("true", "yes", "1")
-                else:
-                    voice_response = bool(voice_response)
-                
-                text_value = element_data.get("text", "")
-                logger.info(f"get_first_element_from_course: dialog element_id={element_id}, text length={len(text_value)}, text preview={text_value[:50] if text_value else 'EMPTY'}, element_data keys={list(element_data.keys())}")
-                
-                result = {
-                    "element_id": element_id,
-                    "type": "dialog",
-                    "text": text_value,
-                    "prompt": element_data.get("prompt", ""),
-                    "model": element_data.get("model"),
-                    "temperature": element_data.get("temperature"),
-                    "reasoning": element_data.get("reasoning"),
-                    "parse_mode": element_data.get("parse_mode", "MARKDOWN"),
-                    "link_preview": element_data.get("link_preview"),
-                    "auto_start": auto_start,
-                    "voice_response": voice_response,
-                    "transcription_language": element_data.get("transcription_language"),
-                    "tts_voice": element_data.get("tts_voice"),
-                    "tts_model": element_data.get("tts_model"),
-                    "tts_speed": element_data.get("tts_speed", 1.0),
-                    "conversation": element_data.get("conversation", [])
-                }
-                logger.info(f"get_first_element_from_course: dialog result text length={len(result['text'])}, text preview={result['text'][:50] if result['text'] else 'EMPTY'}")
-                return result
-            
-            # Обработка нереализованных элементов
-            unimplemented_types = {
-                "miniapp": "Telegram Mini App",
-                "jump": "Навигация с опциями",
-                "revision": "Повторение ошибок",
-                "delay": "Задержка перед следующим элементом",
-                "end": "Завершение курса"
-            }
-            
-            if element_type in unimplemented_types:
-                element_text = element_data.get("text", "")
-                element_name = unimplemented_types[element_type]
-                result = {
-                    "element_id": element_id,
-                    "type": "unimplemented",
-                    "original_type": element_type,
-                    "element_name": element_name,
-                    "text": f"⚠️ Элемент '{element_name}' (тип: {element_type}) еще не реализован в MVP версии.\n\n"
-                           f"Оригинальный текст элемента:\n{element_text}\n\n"
-                           f"Этот элемент будет пропущен, и курс продолжит выполнение со следующего элемента.",
-                    "button": "Продолжить"
-                }
-                logger.warning(f"get_first_element_from_course: unimplemented element type={element_type}, element_id={element_id}")
-                return result
-            
-            # Обработка message элементов
-            # Обработка link_preview: может быть "yes"/"no" или True/False
-            link_preview = element_data.get("link_preview")
-            if isinstance(link_preview, str):
-                link_preview = link_preview.lower() == "yes"
-            elif link_preview is None:
-                link_preview = None
-            else:
-                link_preview = bool(link_preview)
-            
-            # Преобразуем Google Drive ссылки в прокси URL для обхода CORS
-            media = element_data.get("media")
-            if media and isinstance(media, list):
-                # Преобразуем в прокси URL через backend
-                from urllib.parse import quote
-                media = [
-                    f"/api/mvp/media/proxy?url={quote(get_direct_download_link(url), safe='')}"
-                    if extract_file_id_from_drive_url(url) else url
-                    for url in media
-                ]
-                logger.info(f"Converted media URLs: {media}")
-            
-            result = {
-                "element_id": element_id,
-                "text": element_data.get("text", ""),
-                "button": element_data.get("button"),
-                "options": element_data.get("options"),  # Поддержка inline кнопок
-                "parse_mode": element_data.get("parse_mode", "MARKDOWN"),
-                "media": media,  # Поддержка медиа файлов (с проксированием через backend)
-                "link_preview": link_preview  # Поддержка link_preview
-            }
-            logger.info(f"get_first_element_from_course: element_id={element_id}, options={result.get('options')}, media={result.get('media')}")
-            return result
+        element_id = compiled.index.first_id()
+        result = get_element_payload(course_id, element_id)
+        logger.info(f"get_first_element_from_course: element_id={element_id}, type={result.get('type', 'message')}")
+        return result
     except Exception as e:
         logger.error(f"Error loading course {course_id}: {e}", exc_info=True)
     return None
@@ -1294,24 +1031,21 @@ def get_first_element_from_course(course_id: str) -> Optional[dict]:
 def get_element_from_course_by_id(course_id: str, target_element_id: str) -> Optional[dict]:
     """Получение элемента курса по его ID"""
     try:
-        course_data = get_course_data(course_id)
-        if not course_data:
+        compiled = get_compiled_course(course_id)
+        if not compiled:
             return None
 
-        if target_element_id not in course_data:
+        if target_element_id not in compiled.index:
             logger.warning(
                 f"get_element_from_course_by_id: element {target_element_id} "
                 f"not found in course {course_id}"
             )
             return None
 
-        keys = list(course_data.keys())
-        idx = keys.index(target_element_id)
-
-        if idx == 0:
+        prev_element_id = compiled.index.prev_id(target_element_id)
+        if prev_element_id is None:
             return get_first_element_from_course(course_id)
 
-        prev_element_id = keys[idx - 1]
         return get_next_element_from_course(course_id, prev_element_id)
     except Exception as e:
         logger.error(
@@ -1321,35 +1055,75 @@ def get_element_from_course_by_id(course_id: str, target_element_id: str) -> Opt
         return None
 
 
-def save_element_to_conversation(
+# report для строк conversation с показом элемента без текста
+ELEMENT_REPORTS = {
+    "audio": "Audio element",
+    "quiz": "Quiz element",
+    "input": "Input element",
+    "question": "Question element",
+    "multi_choice": "MultiChoice element",
+    "dialog": "Dialog element",
+    "end": "Курс завершен",
+}
+
+
+def element_report(element: dict) -> str:
+    """report строки conversation с показом элемента"""
+    element_type = element.get("type", "message")
+    if element_type == "test":
+        return f"Test элемент: {element.get('prefix', '')}"
+    if element_type == "revision":
+        return f"Revision элемент: {element.get('prefix', '')}"
+    if element_type == "unimplemented":
+        return f"Нереализованный элемент: {element.get('element_name', element.get('original_type', 'unknown'))}"
+    text = element.get("text") or ""
+    if element_type == "dialog":
+        text = text[:100]
+    return text or ELEMENT_REPORTS.get(element_type, "")
+
+
+def show_element(
     element: dict,
     course_id: str,
     chat_id: int,
     run_id: int,
     repo: "CourseRepository"
-) -> None:
-    """Сохранение элемента курса в conversation (используется для jump-to-element)"""
+) -> dict:
+    """
+    Показ элемента курса: payload сохраняется в conversation (role='bot'), элемент end завершает курс.
+    Возвращает тот же payload для ответа клиенту
+    """
+    row = element_row(element)
+    repo.insert_element(chat_id=chat_id, course_id=course_id, username=None, run_id=run_id, **row)
+    if row["element_type"] == "end":
+        repo.set_course_ended(chat_id, course_id)
+    logger.info(f"show_element: saved {row['element_type']} element_id={row['element_id']}")
+    return element
+
+
+async def show_element_async(element: dict, course_id: str, chat_id: int, run_id: int,
+                             repo: AsyncCourseRepository) -> dict:
+    """show_element для AsyncCourseRepository"""
+    row = element_row(element)
+    await repo.insert_element(chat_id=chat_id, course_id=course_id, username=None, run_id=run_id, **row)
+    if row["element_type"] == "end":
+        await repo.set_course_ended(chat_id, course_id)
+    logger.info(f"show_element_async: saved {row['element_type']} element_id={row['element_id']}")
+    return element
+
+
+def element_row(element: dict) -> dict:
+    """Поля строки conversation (role='bot') с показом элемента"""
     element_type = element.get("type", "message")
-    element_id = element["element_id"]
-
     element_data_for_db = {k: v for k, v in element.items() if k != "element_id"}
-    if "type" not in element_data_for_db:
-        element_data_for_db["type"] = element_type
-
-    repo.insert_element(
-        chat_id=chat_id,
-        course_id=course_id,
-        username=None,
-        element_id=element_id,
-        element_type=element_type,
-        run_id=run_id,
-        json_data={"element_data": element_data_for_db},
-        role="bot",
-        report=element.get("text") or f"{element_type} element"
-    )
-    logger.info(
-        f"save_element_to_conversation: saved {element_type} element_id={element_id}"
-    )
+    element_data_for_db["type"] = element_type
+    return {
+        "element_id": element["element_id"],
+        "element_type": element_type,
+        "json_data": {"element_data": element_data_for_db},
+        "role": "bot",
+        "report": element_report(element),
+    }
 
 
 def get_course_start_element_id(course_id: str) -> Optional[str]:
@@ -1362,292 +1136,19 @@ def get_course_start_element_id(course_id: str) -> Optional[str]:
 
 
 def get_next_element_from_course(course_id: str, current_element_id: str) -> Optional[dict]:
-    """Получение следующего элемента курса из YAML"""
+    """Получение следующего элемента курса из YAML (через навигационный индекс курса)"""
     try:
-        course_data = get_course_data(course_id)
-        if not course_data:
+        compiled = get_compiled_course(course_id)
+        if not compiled:
             return None
         
-        logger.info(f"get_next_element_from_course: searching for next element after {current_element_id}")
-        # Ищем следующий элемент после current_element_id
-        # Пропускаем нереализованные элементы автоматически
-        next_element = False
-        unimplemented_types = {
-            "miniapp": "Telegram Mini App",
-            "jump": "Навигация с опциями",
-            "delay": "Задержка перед следующим элементом"
-        }
+        element_id = compiled.index.next_id(current_element_id)
+        if element_id is None:
+            return None  # Курс завершен (или current_element_id нет в курсе)
         
-        for element_id, element_data in course_data.items():
-            if element_id == current_element_id:
-                logger.info(f"get_next_element_from_course: found current element {element_id}, next element will be returned")
-                next_element = True
-                continue
-            if next_element:
-                element_type = element_data.get("type", "message")
-                
-                # Обработка audio элементов
-                if element_type == "audio":
-                    # Обработка link_preview: может быть "yes"/"no" или True/False
-                    link_preview = element_data.get("link_preview")
-                    if isinstance(link_preview, str):
-                        link_preview = link_preview.lower() == "yes"
-                    elif link_preview is None:
-                        link_preview = None
-                    else:
-                        link_preview = bool(link_preview)
-                    
-                    # Преобразуем Google Drive ссылки в прокси URL для обхода CORS
-                    media = element_data.get("media", [])
-                    if media and isinstance(media, list):
-                        from urllib.parse import quote
-                        media = [
-                            f"/api/mvp/media/proxy?url={quote(get_direct_download_link(url), safe='')}"
-                            if extract_file_id_from_drive_url(url) else url
-                            for url in media
-                        ]
-                    
-                    result = {
-                        "element_id": element_id,
-                        "type": "audio",
-                        "text": element_data.get("text"),
-                        "media": media,
-                        "parse_mode": element_data.get("parse_mode", "MARKDOWN"),
-                        "link_preview": link_preview,
-                    }
-                    logger.info(f"get_next_element_from_course: audio element_id={element_id}")
-                    return result
-                
-                # Обработка input элементов
-                if element_type == "input":
-                    result = {
-                        "element_id": element_id,
-                        "type": "input",
-                        "text": element_data.get("text", ""),
-                        "correct_answer": element_data.get("correct_answer"),
-                        "feedback_correct": element_data.get("feedback_correct"),
-                        "feedback_incorrect": element_data.get("feedback_incorrect"),
-                        "input_type": element_data.get("input_type", "text"),
-                    }
-                    logger.info(f"get_next_element_from_course: input element_id={element_id}")
-                    return result
-                
-                # Обработка question элементов
-                if element_type == "question":
-                    result = {
-                        "element_id": element_id,
-                        "type": "question",
-                        "text": element_data.get("text", ""),
-                        "answers": element_data.get("answers", []),
-                    }
-                    logger.info(f"get_next_element_from_course: question element_id={element_id}")
-                    return result
-                
-                # Обработка multi_choice элементов
-                if element_type == "multi_choice":
-                    # Нормализуем answers: преобразуем correct из boolean в строку "yes"/"no"
-                    answers = element_data.get("answers", [])
-                    normalized_answers = []
-                    for answer in answers:
-                        normalized_answer = answer.copy()
-                        correct_value = answer.get("correct")
-                        if correct_value is True or correct_value == "yes":
-                            normalized_answer["correct"] = "yes"
-                        elif correct_value is False or correct_value == "no":
-                            normalized_answer["correct"] = "no"
-                        normalized_answers.append(normalized_answer)
-                    
-                    result = {
-                        "element_id": element_id,
-                        "type": "multi_choice",
-                        "text": element_data.get("text", ""),
-                        "answers": normalized_answers,
-                        "feedback_correct": element_data.get("feedback_correct", ""),
-                        "feedback_partial": element_data.get("feedback_partial", ""),
-                        "feedback_incorrect": element_data.get("feedback_incorrect", ""),
-                    }
-                    logger.info(f"get_next_element_from_course: multi_choice element_id={element_id}")
-                    return result
-                
-                # Обработка quiz элементов
-                if element_type == "quiz":
-                    # Преобразуем Google Drive ссылки в прокси URL для обхода CORS
-                    media = element_data.get("media")
-                    if media and isinstance(media, list):
-                        from urllib.parse import quote
-                        media = [
-                            f"/api/mvp/media/proxy?url={quote(get_direct_download_link(url), safe='')}"
-                            if extract_file_id_from_drive_url(url) else url
-                            for url in media
-                        ]
-                    
-                    # Нормализуем answers: преобразуем correct из boolean в строку "yes"
-                    # и text в строку (на случай если это число из YAML)
-                    answers = element_data.get("answers", [])
-                    normalized_answers = []
-                    for answer in answers:
-                        normalized_answer = answer.copy()
-                        # Преобразуем text в строку, если это не строка
-                        if "text" in normalized_answer and not isinstance(normalized_answer["text"], str):
-                            normalized_answer["text"] = str(normalized_answer["text"])
-                        correct_value = answer.get("correct")
-                        if correct_value is True or correct_value == "yes":
-                            normalized_answer["correct"] = "yes"
-                        elif correct_value is False or correct_value == "no":
-                            # Удаляем поле correct для неправильных ответов
-                            normalized_answer.pop("correct", None)
-                        normalized_answers.append(normalized_answer)
-                    
-                    result = {
-                        "element_id": element_id,
-                        "type": "quiz",
-                        "text": element_data.get("text", ""),
-                        "answers": normalized_answers,
-                        "media": media,
-                    }
-                    logger.info(f"get_next_element_from_course: quiz element_id={element_id}")
-                    return result
-                
-                # Обработка test элементов
-                if element_type == "test":
-                    result = {
-                        "element_id": element_id,
-                        "type": "test",
-                        "text": element_data.get("text", ""),
-                        "prefix": element_data.get("prefix", ""),
-                        "score": element_data.get("score", {}),
-                        "button": element_data.get("button"),
-                    }
-                    logger.info(f"get_next_element_from_course: test element_id={element_id}")
-                    return result
-                
-                # Обработка end элементов
-                if element_type == "end":
-                    result = {
-                        "element_id": element_id,
-                        "type": "end",
-                        "text": element_data.get("text"),
-                    }
-                    logger.info(f"get_next_element_from_course: end element_id={element_id}")
-                    return result
-                
-                # Обработка revision элементов
-                if element_type == "revision":
-                    result = {
-                        "element_id": element_id,
-                        "type": "revision",
-                        "text": element_data.get("text", ""),
-                        "prefix": element_data.get("prefix", ""),
-                        "no_mistakes": element_data.get("no_mistakes", ""),
-                        "button": element_data.get("button"),
-                    }
-                    logger.info(f"get_next_element_from_course: revision element_id={element_id}")
-                    return result
-                
-                # Обработка dialog элементов
-                if element_type == "dialog":
-                    # Обработка auto_start: может быть "yes"/"no", True/False или строка
-                    auto_start = element_data.get("auto_start", False)
-                    if isinstance(auto_start, str):
-                        auto_start = auto_start.lower() in ("true", "yes", "1")
-                    else:
-                        auto_start = bool(auto_start)
-                    
-                    # Обработка voice_response: может быть "yes"/"no", True/False или строка
-                    voice_response = element_data.get("voice_response", False)
-                    if isinstance(voice_response, str):
-                        voice_response = voice_response.lower() in ("true", "yes", "1")
-                    else:
-                        voice_response = bool(voice_response)
-                    
-                    result = {
-                        "element_id": element_id,
-                        "type": "dialog",
-                        "text": element_data.get("text", ""),
-                        "prompt": element_data.get("prompt", ""),
-                        "model": element_data.get("model"),
-                        "temperature": element_data.get("temperature"),
-                        "reasoning": element_data.get("reasoning"),
-                        "parse_mode": element_data.get("parse_mode", "MARKDOWN"),
-                        "link_preview": element_data.get("link_preview"),
-                        "auto_start": auto_start,
-                        "voice_response": voice_response,
-                        "transcription_language": element_data.get("transcription_language"),
-                        "tts_voice": element_data.get("tts_voice"),
-                        "tts_model": element_data.get("tts_model"),
-                        "tts_speed": element_data.get("tts_speed", 1.0),
-                        "conversation": element_data.get("conversation", [])
-                    }
-                    logger.info(f"get_next_element_from_course: dialog element_id={element_id}, auto_start={auto_start}")
-                    return result
-                
-                # Обработка нереализованных элементов
-                unimplemented_types = {
-                    "miniapp": "Telegram Mini App",
-                    "jump": "Навигация с опциями",
-                    "delay": "Задержка перед следующим элементом"
-                }
-                
-                if element_type in unimplemented_types:
-                    element_text = element_data.get("text", "")
-                    element_name = unimplemented_types[element_type]
-                    result = {
-                        "element_id": element_id,
-                        "type": "unimplemented",
-                        "original_type": element_type,
-                        "element_name": element_name,
-                        "text": f"⚠️ Элемент '{element_name}' (тип: {element_type}) еще не реализован в MVP версии.\n\n"
-                               f"Оригинальный текст элемента:\n{element_text}\n\n"
-                               f"Этот элемент будет пропущен, и курс продолжит выполнение со следующего элемента.",
-                        "button": "Продолжить"
-                    }
-                    logger.warning(f"get_next_element_from_course: unimplemented element type={element_type}, element_id={element_id}")
-                    return result
-                
-                # Обработка message элементов
-                # Обработка link_preview: может быть "yes"/"no" или True/False
-                link_preview = element_data.get("link_preview")
-                if isinstance(link_preview, str):
-                    link_preview = link_preview.lower() == "yes"
-                elif link_preview is None:
-                    link_preview = None
-                else:
-                    link_preview = bool(link_preview)
-                
-                # Преобразуем Google Drive ссылки в прокси URL для обхода CORS
-                media = element_data.get("media")
-                if media and isinstance(media, list):
-                    # Преобразуем в прокси URL через backend
-                    from urllib.parse import quote
-                    media = [
-                        f"/api/mvp/media/proxy?url={quote(get_direct_download_link(url), safe='')}"
-                        if extract_file_id_from_drive_url(url) else url
-                        for url in media
-                    ]
-                
-                result = {
-                    "element_id": element_id,
-                    "text": element_data.get("text", ""),
-                    "button": element_data.get("button"),
-                    "options": element_data.get("options"),  # Поддержка inline кнопок
-                    "parse_mode": element_data.get("parse_mode", "MARKDOWN"),
-                    "media": media,  # Поддержка медиа файлов (с проксированием через backend)
-                    "link_preview": link_preview  # Поддержка link_preview
-                }
-                logger.info(f"get_next_element_from_course: element_id={element_id}, options={result.get('options')}, media={result.get('media')}")
-                return result
-            
-            # Пропускаем нереализованные элементы автоматически
-            if element_id == current_element_id:
-                next_element = True
-            elif next_element:
-                # Если следующий элемент нереализованный, пропускаем его и продолжаем поиск
-                element_type = element_data.get("type", "message")
-                if element_type in unimplemented_types:
-                    logger.info(f"get_next_element_from_course: skipping unimplemented element type={element_type}, element_id={element_id}")
-                    continue  # Пропускаем нереализованный элемент и продолжаем поиск
-        
-        return None  # Курс завершен
+        result = get_element_payload(course_id, element_id)
+        logger.info(f"get_next_element_from_course: next element after {current_element_id} is {element_id}, type={result.get('type', 'message')}")
+        return result
     except Exception as e:
         logger.error(f"Error getting next element for {course_id}: {e}", exc_info=True)
     return None
@@ -1655,11 +1156,14 @@ def get_next_element_from_course(course_id: str, current_element_id: str) -> Opt
 
 @router.get("/courses/token/{token}", response_model=dict)
 def resolve_course_token(token: str):
-    """Резолв секретного токена в course_id"""
-    courses = load_courses_yml()
-    for course_id, course_info in courses.items():
-        if isinstance(course_info, dict) and course_info.get("token") == token:
-            return {"course_id": course_id, "token": token}
+    """Резолв секретного токена в course_id (по индексу токенов, перестраивается при изменении courses.yml)"""
+    try:
+        course_id = course_cache.get_courses_index(COURSES_FILE).resolve_token(token)
+    except Exception as e:
+        logger.error(f"Error loading courses.yml: {e}", exc_info=True)
+        course_id = None
+    if course_id is not None:
+        return {"course_id": course_id, "token": token}
     raise HTTPException(
         status_code=status.HTTP_404_NOT_FOUND,
         detail="Неверная ссылка на курс"
@@ -1695,7 +1199,32 @@ def check_course_exists(course_id: str):
         )
 
 
-@router.get("/courses/{course_id}/current", response_model=None)
+# report строки conversation с действием пользователя в /next
+NEXT_REPORTS = {
+    "message": "Нажата кнопка 'Далее'",
+    "quiz": "Ответ на quiz",
+    "audio": "Прослушан audio элемент",
+    "input": "Ответ на input",
+    "question": "Ответ на question",
+    "multi_choice": "Ответ на multi_choice",
+    "test": "Просмотрен результат Test",
+    "revision": "Просмотрен результат Revision",
+    "dialog": "Сообщение в dialog",
+    "end": "Курс завершен",
+    "unimplemented": "Продолжение после нереализованного элемента"
+}
+
+
+def course_completed_response():
+    """Ответ /next после завершения курса"""
+    from fastapi.responses import JSONResponse
+    return JSONResponse(
+        status_code=200,
+        content={"completed": True, "message": "Курс завершен"}
+    )
+
+
+@sync_route(router.get("/courses/{course_id}/current", response_model=None))
 def get_current_element(
     course_id: str,
     chat_id: Optional[int] = Cookie(None),
@@ -1724,67 +1253,7 @@ def get_current_element(
         # Получаем текущий элемент из conversation
         element = get_current_element_from_conversation(current_chat_id, course_id, run_id, repo)
         if element:
-            element_type = element.get("type", "message")
-            if element_type == "audio":
-                logger.info(f"get_current_element from DB: audio element_id={element.get('element_id')}")
-                audio_element = AudioElement(**element)
-                result_dict = audio_element.dict()
-                result_dict['type'] = 'audio'
-                return result_dict
-            elif element_type == "quiz":
-                logger.info(f"get_current_element from DB: quiz element_id={element.get('element_id')}")
-                quiz_element = QuizElement(**element)
-                result_dict = quiz_element.dict()
-                result_dict['type'] = 'quiz'
-                return result_dict
-            elif element_type == "input":
-                logger.info(f"get_current_element from DB: input element_id={element.get('element_id')}")
-                input_element = InputElement(**element)
-                result_dict = input_element.dict()
-                result_dict['type'] = 'input'
-                return result_dict
-            elif element_type == "question":
-                logger.info(f"get_current_element from DB: question element_id={element.get('element_id')}")
-                question_element = QuestionElement(**element)
-                result_dict = question_element.dict()
-                result_dict['type'] = 'question'
-                return result_dict
-            elif element_type == "multi_choice":
-                logger.info(f"get_current_element from DB: multi_choice element_id={element.get('element_id')}")
-                multichoice_element = MultiChoiceElement(**element)
-                result_dict = multichoice_element.dict()
-                result_dict['type'] = 'multi_choice'
-                return result_dict
-            elif element_type == "test":
-                logger.info(f"get_current_element from DB: test element_id={element.get('element_id')}")
-                test_element = TestElement(**element)
-                result_dict = test_element.dict()
-                result_dict['type'] = 'test'
-                return result_dict
-            elif element_type == "end":
-                logger.info(f"get_current_element from DB: end element_id={element.get('element_id')}")
-                end_element = EndElement(**element)
-                result_dict = end_element.dict()
-                result_dict['type'] = 'end'
-                return result_dict
-            elif element_type == "revision":
-                logger.info(f"get_current_element from DB: revision element_id={element.get('element_id')}")
-                revision_element = RevisionElement(**element)
-                result_dict = revision_element.dict()
-                result_dict['type'] = 'revision'
-                return result_dict
-            elif element_type == "dialog":
-                logger.info(f"get_current_element from DB: dialog element_id={element.get('element_id')}")
-                dialog_element = DialogElement(**element)
-                result_dict = dialog_element.dict()
-                result_dict['type'] = 'dialog'
-                return result_dict
-            elif element_type == "unimplemented":
-                logger.info(f"get_current_element from DB: unimplemented element_id={element.get('element_id')}")
-                return element  # Возвращаем как есть для нереализованных элементов
-            else:
-                logger.info(f"get_current_element from DB: options={element.get('options')}")
-                return MessageElement(**element).dict()
+            return element
     
     # Если нет активной сессии или текущего элемента, получаем первый элемент курса
     element = get_first_element_from_course(course_id)
@@ -1793,71 +1262,11 @@ def get_current_element(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Курс не содержит элементов"
         )
-    
-    element_type = element.get("type", "message")
-    if element_type == "audio":
-        logger.info(f"get_current_element from YAML: audio element_id={element.get('element_id')}")
-        audio_element = AudioElement(**element)
-        result_dict = audio_element.dict()
-        result_dict['type'] = 'audio'
-        return result_dict
-    elif element_type == "quiz":
-        logger.info(f"get_current_element from YAML: quiz element_id={element.get('element_id')}")
-        quiz_element = QuizElement(**element)
-        result_dict = quiz_element.dict()
-        result_dict['type'] = 'quiz'
-        return result_dict
-    elif element_type == "input":
-        logger.info(f"get_current_element from YAML: input element_id={element.get('element_id')}")
-        input_element = InputElement(**element)
-        result_dict = input_element.dict()
-        result_dict['type'] = 'input'
-        return result_dict
-    elif element_type == "question":
-        logger.info(f"get_current_element from YAML: question element_id={element.get('element_id')}")
-        question_element = QuestionElement(**element)
-        result_dict = question_element.dict()
-        result_dict['type'] = 'question'
-        return result_dict
-    elif element_type == "multi_choice":
-        logger.info(f"get_current_element from YAML: multi_choice element_id={element.get('element_id')}")
-        multichoice_element = MultiChoiceElement(**element)
-        result_dict = multichoice_element.dict()
-        result_dict['type'] = 'multi_choice'
-        return result_dict
-    elif element_type == "test":
-        logger.info(f"get_current_element from YAML: test element_id={element.get('element_id')}")
-        test_element = TestElement(**element)
-        result_dict = test_element.dict()
-        result_dict['type'] = 'test'
-        return result_dict
-    elif element_type == "end":
-        logger.info(f"get_current_element from YAML: end element_id={element.get('element_id')}")
-        end_element = EndElement(**element)
-        result_dict = end_element.dict()
-        result_dict['type'] = 'end'
-        return result_dict
-    elif element_type == "revision":
-        logger.info(f"get_current_element from YAML: revision element_id={element.get('element_id')}")
-        revision_element = RevisionElement(**element)
-        result_dict = revision_element.dict()
-        result_dict['type'] = 'revision'
-        return result_dict
-    elif element_type == "dialog":
-        logger.info(f"get_current_element from YAML: dialog element_id={element.get('element_id')}")
-        dialog_element = DialogElement(**element)
-        result_dict = dialog_element.dict()
-        result_dict['type'] = 'dialog'
-        return result_dict
-    elif element_type == "unimplemented":
-        logger.info(f"get_current_element from YAML: unimplemented element_id={element.get('element_id')}")
-        return element  # Возвращаем как есть для нереализованных элементов
-    else:
-        logger.info(f"get_current_element from YAML: options={element.get('options')}")
-        return MessageElement(**element).dict()
+    return element
 
 
-@router.post("/courses/{course_id}/start")
+@sync_route(router.post("/courses/{course_id}/start"))
+@unit_of_work
 def start_course(
     course_id: str,
     element_id: Optional[str] = Query(None, description="ID элемента для перехода"),
@@ -1889,11 +1298,10 @@ def start_course(
             )
         existing_run_id = get_active_run(current_chat_id, course_id, repo)
         run_id = existing_run_id or repo.create_run(
-            course_id, None, current_chat_id, None, None
-        )
-        save_element_to_conversation(
-            target_element, course_id, current_chat_id, run_id, repo
+            course_id, None, current_chat_id, None, None,
+            course_version=pin_course_version(course_id, repo)
         )
+        show_element(target_element, course_id, current_chat_id, run_id, repo)
         logger.info(
             f"start_course: jump to element_id={element_id}, run_id={run_id}"
         )
@@ -1905,7 +1313,8 @@ def start_course(
         return {"run_id": existing_run_id, "message": "Сессия уже существует"}
 
     # Создаем новую сессию
-    run_id = repo.create_run(course_id, None, current_chat_id, None, None)
+    run_id = repo.create_run(course_id, None, current_chat_id, None, None,
+                             course_version=pin_course_version(course_id, repo))
 
     # Определяем стартовый элемент: из courses.yml или первый
     yml_start_element_id = get_course_start_element_id(course_id)
@@ -1920,288 +1329,13 @@ def start_course(
     else:
         element = get_first_element_from_course(course_id)
     if element:
-        element_type = element.get("type", "message")
-        logger.info(f"start_course: saving element type={element_type}, element_id={element.get('element_id')}")
-        
-        if element_type == "audio":
-            element_data = {
-                "element_data": {
-                    "type": "audio",
-                    "text": element.get("text"),
-                    "media": element.get("media", []),
-                    "parse_mode": element.get("parse_mode", "MARKDOWN"),
-                    "link_preview": element.get("link_preview"),
-                }
-            }
-            repo.insert_element(
-                chat_id=current_chat_id,
-                course_id=course_id,
-                username=None,
-                element_id=element["element_id"],
-                element_type="audio",
-                run_id=run_id,
-                json_data=element_data,
-                role="bot",
-                report=element.get("text", "Audio element")
-            )
-        elif element_type == "quiz":
-            # Нормализуем answers перед сохранением: преобразуем correct из boolean в строку "yes"
-            # и text в строку (на случай если это число из YAML)
-            answers = element.get("answers", [])
-            normalized_answers = []
-            for answer in answers:
-                normalized_answer = answer.copy()
-                # Преобразуем text в строку, если это не строка
-                if "text" in normalized_answer and not isinstance(normalized_answer["text"], str):
-                    normalized_answer["text"] = str(normalized_answer["text"])
-                correct_value = answer.get("correct")
-                if correct_value is True or correct_value == "yes":
-                    normalized_answer["correct"] = "yes"
-                elif correct_value is False or correct_value == "no":
-                    # Удаляем поле correct для неправильных ответов
-                    normalized_answer.pop("correct", None)
-                normalized_answers.append(normalized_answer)
-            
-            element_data = {
-                "element_data": {
-                    "type": "quiz",
-                    "text": element["text"],
-                    "answers": normalized_answers,
-                    "media": element.get("media"),
-                }
-            }
-            repo.insert_element(
-                chat_id=current_chat_id,
-                course_id=course_id,
-                username=None,
-                element_id=element["element_id"],
-                element_type="quiz",
-                run_id=run_id,
-                json_data=element_data,
-                role="bot",
-                report=element["text"]
-            )
-        elif element_type == "input":
-            element_data = {
-                "element_data": {
-                    "type": "input",
-                    "text": element.get("text", ""),
-                    "correct_answer": element.get("correct_answer"),
-                    "feedback_correct": element.get("feedback_correct"),
-                    "feedback_incorrect": element.get("feedback_incorrect"),
-                    "input_type": element.get("input_type", "text"),
-                }
-            }
-            repo.insert_element(
-                chat_id=current_chat_id,
-                course_id=course_id,
-                username=None,
-                element_id=element["element_id"],
-                element_type="input",
-                run_id=run_id,
-                json_data=element_data,
-                role="bot",
-                report=element.get("text", "Input element")
-            )
-        elif element_type == "question":
-            element_data = {
-                "element_data": {
-                    "type": "question",
-                    "text": element.get("text", ""),
-                    "answers": element.get("answers", []),
-                }
-            }
-            repo.insert_element(
-                chat_id=current_chat_id,
-                course_id=course_id,
-                username=None,
-                element_id=element["element_id"],
-                element_type="question",
-                run_id=run_id,
-                json_data=element_data,
-                role="bot",
-                report=element.get("text", "Question element")
-            )
-        elif element_type == "multi_choice":
-            # Нормализуем answers перед сохранением: преобразуем correct из boolean в строку "yes"/"no"
-            answers = element.get("answers", [])
-            normalized_answers = []
-            for answer in answers:
-                normalized_answer = answer.copy()
-                correct_value = answer.get("correct")
-                if correct_value is True or correct_value == "yes":
-                    normalized_answer["correct"] = "yes"
-                elif correct_value is False or correct_value == "no":
-                    normalized_answer["correct"] = "no"
-                normalized_answers.append(normalized_answer)
-            
-            element_data = {
-                "element_data": {
-                    "type": "multi_choice",
-                    "text": element.get("text", ""),
-                    "answers": normalized_answers,
-                    "feedback_correct": element.get("feedback_correct", ""),
-                    "feedback_partial": element.get("feedback_partial", ""),
-                    "feedback_incorrect": element.get("feedback_incorrect", ""),
-                }
-            }
-            repo.insert_element(
-                chat_id=current_chat_id,
-                course_id=course_id,
-                username=None,
-                element_id=element["element_id"],
-                element_type="multi_choice",
-                run_id=run_id,
-                json_data=element_data,
-                role="bot",
-                report=element.get("text", "MultiChoice element")
-            )
-        elif element_type == "test":
-            element_data = {
-                "element_data": {
-                    "type": "test",
-                    "text": element.get("text", ""),
-                    "prefix": element.get("prefix", ""),
-                    "score": element.get("score", {}),
-                    "button": element.get("button"),
-                }
-            }
-            repo.insert_element(
-                chat_id=current_chat_id,
-                course_id=course_id,
-                username=None,
-                element_id=element["element_id"],
-                element_type="test",
-                run_id=run_id,
-                json_data=element_data,
-                role="bot",
-                report=f"Test элемент: {element.get('prefix', '')}"
-            )
-        elif element_type == "end":
-            element_data = {
-                "element_data": {
-                    "type": "end",
-                    "text": element.get("text"),
-                }
-            }
-            repo.insert_element(
-                chat_id=current_chat_id,
-                course_id=course_id,
-                username=None,
-                element_id=element["element_id"],
-                element_type="end",
-                run_id=run_id,
-                json_data=element_data,
-                role="bot",
-                report=element.get("text", "Курс завершен")
-            )
-            # Помечаем курс как завершенный
-            repo.set_course_ended(current_chat_id, course_id)
-        elif element_type == "revision":
-            element_data = {
-                "element_data": {
-                    "type": "revision",
-                    "text": element.get("text", ""),
-                    "prefix": element.get("prefix", ""),
-                    "no_mistakes": element.get("no_mistakes", ""),
-                    "button": element.get("button"),
-                }
-            }
-            repo.insert_element(
-                chat_id=current_chat_id,
-                course_id=course_id,
-                username=None,
-                element_id=element["element_id"],
-                element_type="revision",
-                run_id=run_id,
-                json_data=element_data,
-                role="bot",
-                report=f"Revision элемент: {element.get('prefix', '')}"
-            )
-        elif element_type == "dialog":
-            text_value = element.get("text", "")
-            logger.info(f"start_course: Saving dialog element_id={element['element_id']}, text length={len(text_value)}, text preview={text_value[:50] if text_value else 'EMPTY'}")
-            element_data = {
-                "element_data": {
-                    "type": "dialog",
-                    "text": text_value,
-                    "prompt": element.get("prompt", ""),
-                    "model": element.get("model"),
-                    "temperature": element.get("temperature"),
-                    "reasoning": element.get("reasoning"),
-                    "parse_mode": element.get("parse_mode", "MARKDOWN"),
-                    "link_preview": element.get("link_preview"),
-                    "auto_start": element.get("auto_start", False),
-                    "voice_response": element.get("voice_response", False),
-                    "transcription_language": element.get("transcription_language"),
-                    "tts_voice": element.get("tts_voice"),
-                    "tts_model": element.get("tts_model"),
-                    "tts_speed": element.get("tts_speed", 1.0),
-                    "conversation": element.get("conversation", [])
-                }
-            }
-            logger.info(f"start_course: element_data text={element_data['element_data']['text'][:50] if element_data['element_data']['text'] else 'EMPTY'}")
-            repo.insert_element(
-                chat_id=current_chat_id,
-                course_id=course_id,
-                username=None,
-                element_id=element["element_id"],
-                element_type="dialog",
-                run_id=run_id,
-                json_data=element_data,
-                role="bot",
-                report=text_value[:100] if text_value else "Dialog element"
-            )
-        elif element_type == "unimplemented":
-            # Сохраняем нереализованные элементы как обычные сообщения для отображения
-            element_data = {
-                "element_data": {
-                    "type": "unimplemented",
-                    "original_type": element.get("original_type"),
-                    "element_name": element.get("element_name"),
-                    "text": element.get("text", ""),
-                    "button": element.get("button"),
-                }
-            }
-            repo.insert_element(
-                chat_id=current_chat_id,
-                course_id=course_id,
-                username=None,
-                element_id=element["element_id"],
-                element_type="unimplemented",
-                run_id=run_id,
-                json_data=element_data,
-                role="bot",
-                report=f"Нереализованный элемент: {element.get('element_name', element.get('original_type', 'unknown'))}"
-            )
-        else:
-            element_data = {
-                "element_data": {
-                    "type": "message",
-                    "text": element["text"],
-                    "button": element.get("button"),
-                    "options": element.get("options"),  # Сохраняем options
-                    "parse_mode": element.get("parse_mode", "MARKDOWN"),
-                    "media": element.get("media"),  # Сохраняем media
-                    "link_preview": element.get("link_preview")  # Сохраняем link_preview
-                }
-            }
-            repo.insert_element(
-                chat_id=current_chat_id,
-                course_id=course_id,
-                username=None,
-                element_id=element["element_id"],
-                element_type="message",
-                run_id=run_id,
-                json_data=element_data,
-                role="bot",
-                report=element["text"]
-            )
+        show_element(element, course_id, current_chat_id, run_id, repo)
     
     return {"run_id": run_id, "message": "Курс начат"}
 
 
-@router.post("/courses/{course_id}/next", response_model=None)
+@sync_route(router.post("/courses/{course_id}/next", response_model=None))
+@unit_of_work
 def next_element(
     course_id: str,
     chat_id: Optional[int] = Cookie(None),
@@ -2218,7 +1352,8 @@ def next_element(
     run_id = get_active_run(current_chat_id, course_id, repo)
     if not run_id:
         # Создаем новую сессию
-        run_id = repo.create_run(course_id, None, current_chat_id, None, None)
+        run_id = repo.create_run(course_id, None, current_chat_id, None, None,
+                                 course_version=pin_course_version(course_id, repo))
 
     # Получаем текущий элемент из conversation
     current_element = get_current_element_from_conversation(current_chat_id, course_id, run_id, repo)
@@ -2233,19 +1368,6 @@ def next_element(
     
     # Сохраняем действие пользователя
     current_element_type = current_element.get("type", "message")
-    report_messages = {
-        "message": "Нажата кнопка 'Далее'",
-        "quiz": "Ответ на quiz",
-        "audio": "Прослушан audio элемент",
-        "input": "Ответ на input",
-        "question": "Ответ на question",
-        "multi_choice": "Ответ на multi_choice",
-        "test": "Просмотрен результат Test",
-        "revision": "Просмотрен результат Revision",
-        "dialog": "Сообщение в dialog",
-        "end": "Курс завершен",
-        "unimplemented": "Продолжение после нереализованного элемента"
-    }
     repo.insert_element(
         chat_id=current_chat_id,
         course_id=course_id,
@@ -2255,208 +1377,28 @@ def next_element(
         run_id=run_id,
         json_data={},
         role="user",
-        report=report_messages.get(current_element_type, "Переход к следующему элементу")
+        report=NEXT_REPORTS.get(current_element_type, "Переход к следующему элементу")
     )
     
     # Если текущий элемент - end, курс уже завершен
     if current_element_type == "end":
         repo.set_course_ended(current_chat_id, course_id)
-        from fastapi.responses import JSONResponse
-        return JSONResponse(
-            status_code=200,
-            content={"completed": True, "message": "Курс завершен"}
-        )
+        return course_completed_response()
     
-    # Проверяем наличие активной цепочки повторения
+    # Активная цепочка повторения (revision_queue): следующий непоказанный элемент
+    next_element_data = None
     try:
-        revision_result = repo.get_revision_conversation(current_chat_id, course_id, run_id)
-        next_element_data = None
+        next_element_id, revision_element_id = repo.next_revision_element(run_id, current_element["element_id"])
+        course_data = (get_course_data(course_id) or {}) if next_element_id else {}
+        while next_element_id and next_element_id not in course_data:
+            # Элемента уже нет в курсе - пропускаем
+            next_element_id, revision_element_id = repo.next_revision_element(run_id, next_element_id)
         
-        if revision_result:
-            revision_element_id, revision_element_type, revision_json_data, revision_report, revision_conversation_id = revision_result
-            revision_element_data = json.loads(revision_json_data)
-            
-            # Проверяем наличие активной цепочки повторения
-            if "revision" in revision_element_data:
-                revision_info = revision_element_data["revision"]
-                revision_chain = revision_info.get("data", [])
-                
-                if len(revision_chain) > 0:
-                    # Удаляем первый элемент из цепочки (он уже был пройден)
-                    revision_chain.pop(0)
-                    
-                    # Обновляем цепочку в БД
-                    updated_revision_data = {
-                        "revision": {
-                            "revision_element": revision_info.get("revision_element"),
-                            "data": revision_chain
-                        }
-                    }
-                    
-                    # Обновляем запись в БД по conversation_id
-                    repo.update_conversation_json(revision_conversation_id, updated_revision_data)
-                    
-                    # Если цепочка не пуста, берем следующий элемент из цепочки
-                    if len(revision_chain) > 0:
-                            next_chain_item = revision_chain[0]
-                            next_element_id = list(next_chain_item.keys())[0]
-                            next_element_data_dict = next_chain_item[next_element_id]["element_data"]
-                            
-                            element_type = next_element_data_dict.get("type", "message")
-                            
-                            # Обрабатываем элемент в зависимости от типа
-                            if element_type == "quiz":
-                                answers = next_element_data_dict.get("answers", [])
-                                normalized_answers = []
-                                for answer in answers:
-                                    normalized_answer = answer.copy()
-                                    if "text" in normalized_answer and not isinstance(normalized_answer["text"], str):
-                                        normalized_answer["text"] = str(normalized_answer["text"])
-                                    correct_value = answer.get("correct")
-                                    if correct_value is True or correct_value == "yes":
-                                        normalized_answer["correct"] = "yes"
-                                    elif correct_value is False or correct_value == "no":
-                                        normalized_answer.pop("correct", None)
-                                    normalized_answers.append(normalized_answer)
-                                
-                                media = next_element_data_dict.get("media")
-                                if media and isinstance(media, list):
-                                    from urllib.parse import quote
-                                    media = [
-                                        f"/api/mvp/media/proxy?url={quote(get_direct_download_link(url), safe='')}"
-                                        if extract_file_id_from_drive_url(url) else url
-                                        for url in media
-                                    ]
-                                
-                                element_data = {
-                                    "element_data": {
-                                        "type": "quiz",
-                                        "text": next_element_data_dict.get("text", ""),
-                                        "answers": normalized_answers,
-                                        "media": media,
-                                    }
-                                }
-                                repo.insert_element(
-                                    chat_id=current_chat_id,
-                                    course_id=course_id,
-                                    username=None,
-                                    element_id=next_element_id,
-                                    element_type="quiz",
-                                    run_id=run_id,
-                                    json_data=element_data,
-                                    role="bot",
-                                    report=next_element_data_dict.get("text", "Quiz element")
-                                )
-                                quiz_element = QuizElement(
-                                    element_id=next_element_id,
-                                    type="quiz",
-                                    text=next_element_data_dict.get("text", ""),
-                                    answers=normalized_answers,
-                                    media=media
-                                )
-                                result_dict = quiz_element.dict()
-                                result_dict['type'] = 'quiz'
-                                return result_dict
-                            
-                            elif element_type == "input":
-                                element_data = {
-                                    "element_data": {
-                                        "type": "input",
-                                        "text": next_element_data_dict.get("text", ""),
-                                        "correct_answer": next_element_data_dict.get("correct_answer"),
-                                        "feedback_correct": next_element_data_dict.get("feedback_correct"),
-                                        "feedback_incorrect": next_element_data_dict.get("feedback_incorrect"),
-                                        "input_type": next_element_data_dict.get("input_type", "text"),
-                                    }
-                                }
-                                repo.insert_element(
-                                    chat_id=current_chat_id,
-                                    course_id=course_id,
-                                    username=None,
-                                    element_id=next_element_id,
-                                    element_type="input",
-                                    run_id=run_id,
-                                    json_data=element_data,
-                                    role="bot",
-                                    report=next_element_data_dict.get("text", "Input element")
-                                )
-                                input_element = InputElement(
-                                    element_id=next_element_id,
-                                    type="input",
-                                    text=next_element_data_dict.get("text", ""),
-                                    correct_answer=next_element_data_dict.get("correct_answer"),
-                                    feedback_correct=next_element_data_dict.get("feedback_correct"),
-                                    feedback_incorrect=next_element_data_dict.get("feedback_incorrect"),
-                                    input_type=next_element_data_dict.get("input_type", "text")
-                                )
-                                result_dict = input_element.dict()
-                                result_dict['type'] = 'input'
-                                return result_dict
-                            
-                            elif element_type == "multi_choice":
-                                answers = next_element_data_dict.get("answers", [])
-                                normalized_answers = []
-                                for answer in answers:
-                                    normalized_answer = answer.copy()
-                                    correct_value = answer.get("correct")
-                                    if correct_value is True or correct_value == "yes":
-                                        normalized_answer["correct"] = "yes"
-                                    elif correct_value is False or correct_value == "no":
-                                        normalized_answer["correct"] = "no"
-                                    normalized_answers.append(normalized_answer)
-                                
-                                element_data = {
-                                    "element_data": {
-                                        "type": "multi_choice",
-                                        "text": next_element_data_dict.get("text", ""),
-                                        "answers": normalized_answers,
-                                        "feedback_correct": next_element_data_dict.get("feedback_correct", ""),
-                                        "feedback_partial": next_element_data_dict.get("feedback_partial", ""),
-                                        "feedback_incorrect": next_element_data_dict.get("feedback_incorrect", ""),
-                                    }
-                                }
-                                repo.insert_element(
-                                    chat_id=current_chat_id,
-                                    course_id=course_id,
-                                    username=None,
-                                    element_id=next_element_id,
-                                    element_type="multi_choice",
-                                    run_id=run_id,
-                                    json_data=element_data,
-                                    role="bot",
-                                    report=next_element_data_dict.get("text", "MultiChoice element")
-                                )
-                                multichoice_element = MultiChoiceElement(
-                                    element_id=next_element_id,
-                                    type="multi_choice",
-                                    text=next_element_data_dict.get("text", ""),
-                                    answers=normalized_answers,
-                                    feedback_correct=next_element_data_dict.get("feedback_correct", ""),
-                                    feedback_partial=next_element_data_dict.get("feedback_partial", ""),
-                                    feedback_incorrect=next_element_data_dict.get("feedback_incorrect", "")
-                                )
-                                result_dict = multichoice_element.dict()
-                                result_dict['type'] = 'multi_choice'
-                                return result_dict
-                            
-                            # Если цепочка пуста, возвращаемся к следующему элементу после Revision
-                            else:
-                                # Удаляем запись о цепочке повторения
-                                repo.db.query(Conversation).filter(
-                                    Conversation.conversation_id == revision_conversation_id
-                                ).delete()
-                                repo.db.commit()
-                                # Продолжаем обычную логику - получаем следующий элемент после Revision
-                                next_element_data = get_next_element_from_course(course_id, revision_element_id)
-                    else:
-                        # Цепочка пуста, продолжаем обычную логику
-                        next_element_data = get_next_element_from_course(course_id, current_element["element_id"])
-                else:
-                    # Нет активной цепочки, продолжаем обычную логику
-                    next_element_data = get_next_element_from_course(course_id, current_element["element_id"])
-            else:
-                # Нет активной цепочки, продолжаем обычную логику
-                next_element_data = get_next_element_from_course(course_id, current_element["element_id"])
+        if next_element_id:
+            next_element_data = get_element_payload(course_id, next_element_id)
+        elif revision_element_id:
+            # Цепочка закончилась - продолжаем после элемента Revision
+            next_element_data = get_next_element_from_course(course_id, revision_element_id)
     except Exception as e:
         logger.error(f"Error checking revision chain: {e}", exc_info=True)
         # В случае ошибки продолжаем обычную логику
@@ -2468,384 +1410,222 @@ def next_element(
     if not next_element_data:
         # Курс завершен
         repo.set_course_ended(current_chat_id, course_id)
-        from fastapi.responses import JSONResponse
-        return JSONResponse(
-            status_code=200,
-            content={"completed": True, "message": "Курс завершен"}
-        )
+        return course_completed_response()
     
     # Сохраняем следующий элемент в conversation
-    element_type = next_element_data.get("type", "message")
-    logger.info(f"next_element: saving element type={element_type}, element_id={next_element_data.get('element_id')}")
-    
-    # Если следующий элемент - end, помечаем курс как завершенный после сохранения
-    if element_type == "end":
-        # Курс будет помечен как завершенный в обработке элемента end
-        pass
+    return show_element(next_element_data, course_id, current_chat_id, run_id, repo)
+
+
+@async_route(router.get("/courses/{course_id}/current", response_model=None))
+async def get_current_element_async(
+    course_id: str,
+    chat_id: Optional[int] = Cookie(None),
+    response: Response = None,
+    repo: AsyncCourseRepository = Depends(get_async_course_repository)
+):
+    """Получение текущего элемента курса (MVP_DB_MODE=async)"""
+    current_chat_id = get_or_create_chat_id(chat_id)
+    if not chat_id:
+        response.set_cookie(key="chat_id", value=str(current_chat_id), max_age=31536000)
     
-    if element_type == "audio":
-        element_data = {
-            "element_data": {
-                "type": "audio",
-                "text": next_element_data.get("text"),
-                "media": next_element_data.get("media", []),
-                "parse_mode": next_element_data.get("parse_mode", "MARKDOWN"),
-                "link_preview": next_element_data.get("link_preview"),
-            }
-        }
-        repo.insert_element(
-            chat_id=current_chat_id,
-            course_id=course_id,
-            username=None,
-            element_id=next_element_data["element_id"],
-            element_type="audio",
-            run_id=run_id,
-            json_data=element_data,
-            role="bot",
-            report=next_element_data.get("text", "Audio element")
-        )
-        audio_element = AudioElement(**next_element_data)
-        result_dict = audio_element.dict()
-        result_dict['type'] = 'audio'
-        return result_dict
-    elif element_type == "quiz":
-        # Нормализуем answers перед сохранением: преобразуем correct из boolean в строку "yes"
-        answers = next_element_data.get("answers", [])
-        normalized_answers = []
-        for answer in answers:
-            normalized_answer = answer.copy()
-            correct_value = answer.get("correct")
-            if correct_value is True or correct_value == "yes":
-                normalized_answer["correct"] = "yes"
-            elif correct_value is False or correct_value == "no":
-                # Удаляем поле correct для неправильных ответов
-                normalized_answer.pop("correct", None)
-            normalized_answers.append(normalized_answer)
-        
-        element_data = {
-            "element_data": {
-                "type": "quiz",
-                "text": next_element_data["text"],
-                "answers": normalized_answers,
-                "media": next_element_data.get("media"),
-            }
-        }
-        repo.insert_element(
-            chat_id=current_chat_id,
-            course_id=course_id,
-            username=None,
-            element_id=next_element_data["element_id"],
-            element_type="quiz",
-            run_id=run_id,
-            json_data=element_data,
-            role="bot",
-            report=next_element_data["text"]
-        )
-        quiz_element = QuizElement(**next_element_data)
-        # Убеждаемся, что type всегда присутствует в ответе
-        result_dict = quiz_element.dict()
-        result_dict['type'] = 'quiz'
-        return result_dict
-    elif element_type == "input":
-        element_data = {
-            "element_data": {
-                "type": "input",
-                "text": next_element_data.get("text", ""),
-                "correct_answer": next_element_data.get("correct_answer"),
-                "feedback_correct": next_element_data.get("feedback_correct"),
-                "feedback_incorrect": next_element_data.get("feedback_incorrect"),
-                "input_type": next_element_data.get("input_type", "text"),
-            }
-        }
-        repo.insert_element(
-            chat_id=current_chat_id,
-            course_id=course_id,
-            username=None,
-            element_id=next_element_data["element_id"],
-            element_type="input",
-            run_id=run_id,
-            json_data=element_data,
-            role="bot",
-            report=next_element_data.get("text", "Input element")
-        )
-        input_element = InputElement(**next_element_data)
-        result_dict = input_element.dict()
-        result_dict['type'] = 'input'
-        return result_dict
-    elif element_type == "question":
-        element_data = {
-            "element_data": {
-                "type": "question",
-                "text": next_element_data.get("text", ""),
-                "answers": next_element_data.get("answers", []),
-            }
-        }
-        repo.insert_element(
-            chat_id=current_chat_id,
-            course_id=course_id,
-            username=None,
-            element_id=next_element_data["element_id"],
-            element_type="question",
-            run_id=run_id,
-            json_data=element_data,
-            role="bot",
-            report=next_element_data.get("text", "Question element")
-        )
-        question_element = QuestionElement(**next_element_data)
-        result_dict = question_element.dict()
-        result_dict['type'] = 'question'
-        return result_dict
-    elif element_type == "multi_choice":
-        # Нормализуем answers перед сохранением: преобразуем correct из boolean в строку "yes"/"no"
-        answers = next_element_data.get("answers", [])
-        normalized_answers = []
-        for answer in answers:
-            normalized_answer = answer.copy()
-            correct_value = answer.get("correct")
-            if correct_value is True or correct_value == "yes":
-                normalized_answer["correct"] = "yes"
-            elif correct_value is False or correct_value == "no":
-                normalized_answer["correct"] = "no"
-            normalized_answers.append(normalized_answer)
-        
-        element_data = {
-            "element_data": {
-                "type": "multi_choice",
-                "text": next_element_data.get("text", ""),
-                "answers": normalized_answers,
-                "feedback_correct": next_element_data.get("feedback_correct", ""),
-                "feedback_partial": next_element_data.get("feedback_partial", ""),
-                "feedback_incorrect": next_element_data.get("feedback_incorrect", ""),
-            }
-        }
-        repo.insert_element(
-            chat_id=current_chat_id,
-            course_id=course_id,
-            username=None,
-            element_id=next_element_data["element_id"],
-            element_type="multi_choice",
-            run_id=run_id,
-            json_data=element_data,
-            role="bot",
-            report=next_element_data.get("text", "MultiChoice element")
-        )
-        multichoice_element = MultiChoiceElement(**next_element_data)
-        result_dict = multichoice_element.dict()
-        result_dict['type'] = 'multi_choice'
-        return result_dict
-    elif element_type == "test":
-        element_data = {
-            "element_data": {
-                "type": "test",
-                "text": next_element_data.get("text", ""),
-                "prefix": next_element_data.get("prefix", ""),
-                "score": next_element_data.get("score", {}),
-                "button": next_element_data.get("button"),
-            }
-        }
-        repo.insert_element(
-            chat_id=current_chat_id,
-            course_id=course_id,
-            username=None,
-            element_id=next_element_data["element_id"],
-            element_type="test",
-            run_id=run_id,
-            json_data=element_data,
-            role="bot",
-            report=f"Test элемент: {next_element_data.get('prefix', '')}"
-        )
-        test_element = TestElement(**next_element_data)
-        result_dict = test_element.dict()
-        result_dict['type'] = 'test'
-        return result_dict
-    elif element_type == "end":
-        element_data = {
-            "element_data": {
-                "type": "end",
-                "text": next_element_data.get("text"),
-            }
-        }
-        repo.insert_element(
-            chat_id=current_chat_id,
-            course_id=course_id,
-            username=None,
-            element_id=next_element_data["element_id"],
-            element_type="end",
-            run_id=run_id,
-            json_data=element_data,
-            role="bot",
-            report=next_element_data.get("text", "Курс завершен")
-        )
-        # Помечаем курс как завершенный
-        repo.set_course_ended(current_chat_id, course_id)
-        end_element = EndElement(**next_element_data)
-        result_dict = end_element.dict()
-        result_dict['type'] = 'end'
-        return result_dict
-    elif element_type == "revision":
-        element_data = {
-            "element_data": {
-                "type": "revision",
-                "text": next_element_data.get("text", ""),
-                "prefix": next_element_data.get("prefix", ""),
-                "no_mistakes": next_element_data.get("no_mistakes", ""),
-                "button": next_element_data.get("button"),
-            }
-        }
-        repo.insert_element(
-            chat_id=current_chat_id,
-            course_id=course_id,
-            username=None,
-            element_id=next_element_data["element_id"],
-            element_type="revision",
-            run_id=run_id,
-            json_data=element_data,
-            role="bot",
-            report=f"Revision элемент: {next_element_data.get('prefix', '')}"
+    await ensure_course_loaded(course_id)
+    if not get_course_path(course_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Курс не найден"
         )
-        revision_element = RevisionElement(**next_element_data)
-        result_dict = revision_element.dict()
-        result_dict['type'] = 'revision'
-        return result_dict
-    elif element_type == "dialog":
-        element_data = {
-            "element_data": {
-                "type": "dialog",
-                "text": next_element_data.get("text", ""),
-                "prompt": next_element_data.get("prompt", ""),
-                "model": next_element_data.get("model"),
-                "temperature": next_element_data.get("temperature"),
-                "reasoning": next_element_data.get("reasoning"),
-                "parse_mode": next_element_data.get("parse_mode", "MARKDOWN"),
-                "link_preview": next_element_data.get("link_preview"),
-                "auto_start": next_element_data.get("auto_start", False),
-                "voice_response": next_element_data.get("voice_response", False),
-                "transcription_language": next_element_data.get("transcription_language"),
-                "tts_voice": next_element_data.get("tts_voice"),
-                "tts_model": next_element_data.get("tts_model"),
-                "tts_speed": next_element_data.get("tts_speed", 1.0),
-                "conversation": next_element_data.get("conversation", [])
-            }
-        }
-        repo.insert_element(
-            chat_id=current_chat_id,
-            course_id=course_id,
-            username=None,
-            element_id=next_element_data["element_id"],
-            element_type="dialog",
-            run_id=run_id,
-            json_data=element_data,
-            role="bot",
-            report=next_element_data.get("text", "Dialog element")
+    
+    run_id = await repo.get_active_run_id(current_chat_id, course_id)
+    if run_id:
+        element = await get_current_element_from_conversation_async(current_chat_id, course_id, run_id, repo)
+        if element:
+            return element
+    
+    element = get_first_element_from_course(course_id)
+    if not element:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Курс не содержит элементов"
         )
-        dialog_element = DialogElement(**next_element_data)
-        result_dict = dialog_element.dict()
-        result_dict['type'] = 'dialog'
-        return result_dict
-    elif element_type == "unimplemented":
-        # Сохраняем нереализованные элементы как обычные сообщения для отображения
-        element_data = {
-            "element_data": {
-                "type": "unimplemented",
-                "original_type": next_element_data.get("original_type"),
-                "element_name": next_element_data.get("element_name"),
-                "text": next_element_data.get("text", ""),
-                "button": next_element_data.get("button"),
-            }
-        }
-        repo.insert_element(
-            chat_id=current_chat_id,
-            course_id=course_id,
-            username=None,
-            element_id=next_element_data["element_id"],
-            element_type="unimplemented",
-            run_id=run_id,
-            json_data=element_data,
-            role="bot",
-            report=f"Нереализованный элемент: {next_element_data.get('element_name', next_element_data.get('original_type', 'unknown'))}"
+    return element
+
+
+@async_route(router.post("/courses/{course_id}/start"))
+@async_unit_of_work
+async def start_course_async(
+    course_id: str,
+    element_id: Optional[str] = Query(None, description="ID элемента для перехода"),
+    chat_id: Optional[int] = Cookie(None),
+    response: Response = None,
+    repo: AsyncCourseRepository = Depends(get_async_course_repository)
+):
+    """Начало курса (MVP_DB_MODE=async)"""
+    current_chat_id = get_or_create_chat_id(chat_id)
+    if not chat_id:
+        response.set_cookie(key="chat_id", value=str(current_chat_id), max_age=31536000)
+
+    await ensure_course_loaded(course_id)
+    if not get_course_path(course_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Курс не найден"
         )
-        return next_element_data  # Возвращаем как есть
-    else:
-        element_data = {
-            "element_data": {
-                "type": "message",
-                "text": next_element_data["text"],
-                "button": next_element_data.get("button"),
-                "options": next_element_data.get("options"),  # Сохраняем options
-                "parse_mode": next_element_data.get("parse_mode", "MARKDOWN"),
-                "media": next_element_data.get("media"),  # Сохраняем media
-                "link_preview": next_element_data.get("link_preview")  # Сохраняем link_preview
-            }
-        }
-        repo.insert_element(
-            chat_id=current_chat_id,
-            course_id=course_id,
-            username=None,
-            element_id=next_element_data["element_id"],
-            element_type="message",
-            run_id=run_id,
-            json_data=element_data,
-            role="bot",
-            report=next_element_data["text"]
+
+    # Если задан element_id — прыжок к конкретному элементу
+    if element_id:
+        target_element = get_element_from_course_by_id(course_id, element_id)
+        if not target_element:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Элемент {element_id} не найден в курсе"
+            )
+        run_id = await repo.get_active_run_id(current_chat_id, course_id) or await repo.create_run(
+            course_id, None, current_chat_id, None, None,
+            course_version=await pin_course_version_async(course_id, repo)
         )
-        return MessageElement(**next_element_data).dict()
+        await show_element_async(target_element, course_id, current_chat_id, run_id, repo)
+        logger.info(f"start_course_async: jump to element_id={element_id}, run_id={run_id}")
+        return {"run_id": run_id, "message": "Переход к элементу"}
+
+    existing_run_id = await repo.get_active_run_id(current_chat_id, course_id)
+    if existing_run_id:
+        return {"run_id": existing_run_id, "message": "Сессия уже существует"}
 
+    run_id = await repo.create_run(course_id, None, current_chat_id, None, None,
+                                   course_version=await pin_course_version_async(course_id, repo))
 
-@router.post("/courses/{course_id}/quiz/answer", response_model=QuizAnswerResponse)
-def submit_quiz_answer(
+    # Стартовый элемент: из courses.yml или первый
+    yml_start_element_id = get_course_start_element_id(course_id)
+    element = get_element_from_course_by_id(course_id, yml_start_element_id) if yml_start_element_id else None
+    if not element:
+        if yml_start_element_id:
+            logger.warning(
+                f"start_course_async: courses.yml element={yml_start_element_id} "
+                f"not found in course {course_id}, falling back to first element"
+            )
+        element = get_first_element_from_course(course_id)
+    if element:
+        await show_element_async(element, course_id, current_chat_id, run_id, repo)
+    
+    return {"run_id": run_id, "message": "Курс начат"}
+
+
+@async_route(router.post("/courses/{course_id}/next", response_model=None))
+@async_unit_of_work
+async def next_element_async(
     course_id: str,
-    answer_data: QuizAnswerRequest,
     chat_id: Optional[int] = Cookie(None),
     response: Response = None,
-    repo: CourseRepository = Depends(get_course_repository)
+    repo: AsyncCourseRepository = Depends(get_async_course_repository)
 ):
-    """Обработка ответа пользователя на quiz элемент"""
-    # Получаем или создаем chat_id
+    """Переход к следующему элементу (MVP_DB_MODE=async)"""
     current_chat_id = get_or_create_chat_id(chat_id)
     if not chat_id:
         response.set_cookie(key="chat_id", value=str(current_chat_id), max_age=31536000)
     
-    # Получаем активную сессию
-    run_id = get_active_run(current_chat_id, course_id, repo)
+    await ensure_course_loaded(course_id)
+    run_id = await repo.get_active_run_id(current_chat_id, course_id)
+    if not run_id:
+        run_id = await repo.create_run(course_id, None, current_chat_id, None, None,
+                                       course_version=await pin_course_version_async(course_id, repo))
+
+    current_element = await get_current_element_from_conversation_async(current_chat_id, course_id, run_id, repo)
+    if not current_element:
+        current_element = get_first_element_from_course(course_id)
+        if not current_element:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Курс не содержит элементов"
+            )
+    
+    current_element_type = current_element.get("type", "message")
+    await repo.insert_element(
+        chat_id=current_chat_id,
+        course_id=course_id,
+        username=None,
+        element_id=current_element["element_id"],
+        element_type=current_element_type,
+        run_id=run_id,
+        json_data={},
+        role="user",
+        report=NEXT_REPORTS.get(current_element_type, "Переход к следующему элементу")
+    )
+    
+    if current_element_type == "end":
+        await repo.set_course_ended(current_chat_id, course_id)
+        return course_completed_response()
+    
+    # Активная цепочка повторения (revision_queue): следующий непоказанный элемент
+    next_element_data = None
+    try:
+        next_element_id, revision_element_id = await repo.next_revision_element(run_id, current_element["element_id"])
+        course_data = (get_course_data(course_id) or {}) if next_element_id else {}
+        while next_element_id and next_element_id not in course_data:
+            # Элемента уже нет в курсе - пропускаем
+            next_element_id, revision_element_id = await repo.next_revision_element(run_id, next_element_id)
+        
+        if next_element_id:
+            next_element_data = get_element_payload(course_id, next_element_id)
+        elif revision_element_id:
+            next_element_data = get_next_element_from_course(course_id, revision_element_id)
+    except Exception as e:
+        logger.error(f"Error checking revision chain: {e}", exc_info=True)
+    
+    if not next_element_data:
+        next_element_data = get_next_element_from_course(course_id, current_element["element_id"])
+    if not next_element_data:
+        await repo.set_course_ended(current_chat_id, course_id)
+        return course_completed_response()
+    
+    return await show_element_async(next_element_data, course_id, current_chat_id, run_id, repo)
+
+
+def answer_element(run_id: Optional[int], current_element: Optional[dict], element_type: str, element_id: str) -> dict:
+    """Текущий элемент сессии, на который пришел ответ: проверка сессии, типа элемента и element_id"""
     if not run_id:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Активная сессия не найдена. Начните курс сначала."
         )
-    
-    # Получаем текущий элемент из conversation
-    current_element = get_current_element_from_conversation(current_chat_id, course_id, run_id, repo)
     if not current_element:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Текущий элемент не найден"
         )
-    
-    # Проверяем, что элемент является quiz
-    if current_element.get("type") != "quiz":
+    if current_element.get("type") != element_type:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Текущий элемент не является quiz"
+            detail=f"Текущий элемент не является {element_type}"
         )
-    
-    # Проверяем, что element_id совпадает
-    if current_element.get("element_id") != answer_data.element_id:
+    if current_element.get("element_id") != element_id:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Неверный element_id"
         )
-    
-    # Получаем ответы
+    return current_element
+
+
+def selected_answer_for(current_element: dict, selected_index: int) -> dict:
+    """Выбранный вариант ответа quiz/question"""
     answers = current_element.get("answers", [])
-    if answer_data.selected_answer_index < 0 or answer_data.selected_answer_index >= len(answers):
+    if selected_index < 0 or selected_index >= len(answers):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Неверный индекс ответа"
         )
+    return answers[selected_index]
+
+
+def grade_quiz_answer(current_element: dict, answer_data: QuizAnswerRequest) -> Tuple[dict, QuizAnswerResponse]:
+    """
+    Проверка ответа на quiz. Оценщики ответов возвращают (record, ответ клиенту), record - поля строки
+    conversation с ответом пользователя и report для bot строки элемента (summary)
+    """
+    selected_answer = selected_answer_for(current_element, answer_data.selected_answer_index)
     
     # Находим правильный ответ
     correct_answer_index = None
-    for i, answer in enumerate(answers):
+    for i, answer in enumerate(current_element.get("answers", [])):
         if answer.get("correct") == "yes":
             correct_answer_index = i
             break
@@ -2856,144 +1636,56 @@ def submit_quiz_answer(
             detail="В quiz не найден правильный ответ"
         )
     
-    # Проверяем правильность ответа
     is_correct = answer_data.selected_answer_index == correct_answer_index
-    selected_answer = answers[answer_data.selected_answer_index]
-    feedback = selected_answer.get("feedback", "Ответ принят")
     score = 1 if is_correct else 0
-    
-    # Сохраняем ответ пользователя в conversation
-    json_data_to_save = {
-        "user_answer": {
-            "selected_index": answer_data.selected_answer_index,
-            "selected_text": selected_answer.get("text", ""),
-            "is_correct": is_correct,
-            "score": score,
-            "max_score": 1
-        }
+    record = {
+        "json_data": {
+            "user_answer": {
+                "selected_index": answer_data.selected_answer_index,
+                "selected_text": selected_answer.get("text", ""),
+                "is_correct": is_correct,
+                "score": score,
+                "max_score": 1
+            }
+        },
+        "report": f"Ответ: {selected_answer.get('text', '')}",
+        "score": score,
+        "maxscore": 1,
+        "summary": f"{current_element.get('text', '')} | Score: {score}/1",
     }
-    logger.info(f"Quiz answer: saving with chat_id={current_chat_id}, course_id={course_id}, run_id={run_id}, element_id={answer_data.element_id}, score={score}, maxscore=1")
-    logger.info(f"Quiz answer: JSON data to save: {json.dumps(json_data_to_save)}")
-    conversation_id = repo.insert_element(
-        chat_id=current_chat_id,
-        course_id=course_id,
-        username=None,
-        element_id=answer_data.element_id,
-        element_type="quiz",
-        run_id=run_id,
-        json_data=json_data_to_save,
-        role="user",
-        report=f"Ответ: {selected_answer.get('text', '')}",
-        score=score,
-        maxscore=1
-    )
-    logger.info(f"Quiz answer: saved with conversation_id={conversation_id}")
-    
-    # Проверяем, что данные сохранились правильно
-    check_result = repo.get_conversation_by_id(conversation_id)
-    if check_result:
-        logger.info(f"Quiz answer: verification - conversation_id={check_result['conversation_id']}, role={check_result['role']}, score={check_result['score']}, maxscore={check_result['maxscore']}, json_preview={str(check_result['json'])[:200] if check_result['json'] else 'None'}")
-    
-    # Сохраняем результат в report (для статистики)
-    repo.update_conversation_report(
-        current_chat_id,
-        course_id,
-        run_id,
-        answer_data.element_id,
-        f"{current_element.get('text', '')} | Score: {score}/1"
-    )
-    
-    logger.info(f"Quiz answer submitted: element_id={answer_data.element_id}, is_correct={is_correct}, score={score}")
-    
-    return QuizAnswerResponse(
+    return record, QuizAnswerResponse(
         is_correct=is_correct,
-        feedback=feedback,
+        feedback=selected_answer.get("feedback", "Ответ принят"),
         score=score
     )
 
 
-@router.post("/courses/{course_id}/input/answer", response_model=InputAnswerResponse)
-def submit_input_answer(
-    course_id: str,
-    answer_data: InputAnswerRequest,
-    chat_id: Optional[int] = Cookie(None),
-    response: Response = None,
-    repo: CourseRepository = Depends(get_course_repository)
-):
-    """Обработка ответа пользователя на input элемент"""
-    # Получаем или создаем chat_id
-    current_chat_id = get_or_create_chat_id(chat_id)
-    if not chat_id:
-        response.set_cookie(key="chat_id", value=str(current_chat_id), max_age=31536000)
-    
-    # Получаем активную сессию
-    run_id = get_active_run(current_chat_id, course_id, repo)
-    if not run_id:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Активная сессия не найдена. Начните курс сначала."
-        )
-    
-    # Получаем текущий элемент из conversation
-    current_element = get_current_element_from_conversation(current_chat_id, course_id, run_id, repo)
-    if not current_element:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Текущий элемент не найден"
-        )
-    
-    # Проверяем, что элемент является input
-    if current_element.get("type") != "input":
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Текущий элемент не является input"
-        )
-    
-    # Проверяем, что element_id совпадает
-    if current_element.get("element_id") != answer_data.element_id:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Неверный element_id"
-        )
-    
-    # Проверяем наличие ответа пользователя
+def grade_input_answer(current_element: dict, answer_data: InputAnswerRequest) -> Tuple[dict, InputAnswerResponse]:
+    """Проверка ответа на input"""
     if not answer_data.user_answer or not answer_data.user_answer.strip():
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Ответ не может быть пустым"
         )
     
-    # Получаем параметры input элемента
     correct_answer = current_element.get("correct_answer")
     input_type = current_element.get("input_type", "text")
-    feedback_correct = current_element.get("feedback_correct", "Правильно!")
-    feedback_incorrect = current_element.get("feedback_incorrect", "Неправильно.")
     
     # Проверяем правильность ответа (если указан correct_answer)
     is_correct = False
     feedback = ""
     score = 0
-    
     if correct_answer:
         is_correct = compare_answers(answer_data.user_answer, correct_answer, input_type)
-        feedback = feedback_correct if is_correct else feedback_incorrect
+        # В payload input элемента без feedback_* ключи есть со значением None
+        feedback = (current_element.get("feedback_correct") or "Правильно!" if is_correct
+                    else current_element.get("feedback_incorrect") or "Неправильно.")
         score = 1 if is_correct else 0
-    else:
-        # Если correct_answer не указан, просто принимаем ответ без проверки
-        # Возвращаем пустой feedback, чтобы фронтенд ничего не показывал
-        feedback = ""
-        score = 0
+    # Без correct_answer ответ принимается без проверки, с пустым feedback (фронтенд ничего не показывает)
     
-    # Сохраняем ответ пользователя в conversation
     max_score_value = 1 if correct_answer else 0
-    repo.insert_element(
-        chat_id=current_chat_id,
-        course_id=course_id,
-        username=None,
-        element_id=answer_data.element_id,
-        element_type="input",
-        run_id=run_id,
-        json_data={
+    record = {
+        "json_data": {
             "user_answer": {
                 "text": answer_data.user_answer,
                 "is_correct": is_correct,
@@ -3002,94 +1694,23 @@ def submit_input_answer(
                 "input_type": input_type
             }
         },
-        role="user",
-        report=f"Ответ: {answer_data.user_answer}",
-        score=score,
-        maxscore=max_score_value
-    )
-    
-    # Сохраняем результат в report (для статистики)
-    repo.update_conversation_report(
-        current_chat_id,
-        course_id,
-        run_id,
-        answer_data.element_id,
-        f"{current_element.get('text', '')} | Score: {score}/1"
-    )
-    
-    logger.info(f"Input answer submitted: element_id={answer_data.element_id}, is_correct={is_correct}, score={score}")
-    
-    return InputAnswerResponse(
+        "report": f"Ответ: {answer_data.user_answer}",
+        "score": score,
+        "maxscore": max_score_value,
+        "summary": f"{current_element.get('text', '')} | Score: {score}/1",
+    }
+    return record, InputAnswerResponse(
         is_correct=is_correct,
         feedback=feedback,
         score=score
     )
 
 
-@router.post("/courses/{course_id}/question/answer", response_model=QuestionAnswerResponse)
-def submit_question_answer(
-    course_id: str,
-    answer_data: QuestionAnswerRequest,
-    chat_id: Optional[int] = Cookie(None),
-    response: Response = None
-):
-    """Обработка ответа пользователя на question элемент"""
-    # Получаем или создаем chat_id
-    current_chat_id = get_or_create_chat_id(chat_id)
-    if not chat_id:
-        response.set_cookie(key="chat_id", value=str(current_chat_id), max_age=31536000)
-    
-    # Получаем активную сессию
-    run_id = get_active_run(current_chat_id, course_id, repo)
-    if not run_id:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Активная сессия не найдена. Начните курс сначала."
-        )
-    
-    # Получаем текущий элемент из conversation
-    current_element = get_current_element_from_conversation(current_chat_id, course_id, run_id, repo)
-    if not current_element:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Текущий элемент не найден"
-        )
-    
-    # Проверяем, что элемент является question
-    if current_element.get("type") != "question":
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Текущий элемент не является question"
-        )
-    
-    # Проверяем, что element_id совпадает
-    if current_element.get("element_id") != answer_data.element_id:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Неверный element_id"
-        )
-    
-    # Получаем ответы
-    answers = current_element.get("answers", [])
-    if answer_data.selected_answer_index < 0 or answer_data.selected_answer_index >= len(answers):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Неверный индекс ответа"
-        )
-    
-    # Получаем feedback для выбранного варианта (если указан)
-    selected_answer = answers[answer_data.selected_answer_index]
-    feedback = selected_answer.get("feedback", "Ответ принят")
-    
-    # Сохраняем ответ пользователя в conversation
-    repo.insert_element(
-        chat_id=current_chat_id,
-        course_id=course_id,
-        username=None,
-        element_id=answer_data.element_id,
-        element_type="question",
-        run_id=run_id,
-        json_data={
+def grade_question_answer(current_element: dict, answer_data: QuestionAnswerRequest) -> Tuple[dict, QuestionAnswerResponse]:
+    """Ответ на question (без оценки)"""
+    selected_answer = selected_answer_for(current_element, answer_data.selected_answer_index)
+    record = {
+        "json_data": {
             "user_answer": {
                 "selected_index": answer_data.selected_answer_index,
                 "selected_text": selected_answer.get("text", ""),
@@ -3097,82 +1718,27 @@ def submit_question_answer(
                 "max_score": 0
             }
         },
-        role="user",
-        report=f"Ответ: {selected_answer.get('text', '')}"
-    )
-    
-    # Сохраняем результат в report (для статистики)
-    repo.update_conversation_report(
-        current_chat_id,
-        course_id,
-        run_id,
-        answer_data.element_id,
-        f"{current_element.get('text', '')} | Ответ: {selected_answer.get('text', '')}"
-    )
-    
-    logger.info(f"Question answer submitted: element_id={answer_data.element_id}, selected_index={answer_data.selected_answer_index}")
-    
-    return QuestionAnswerResponse(
-        feedback=feedback,
+        "report": f"Ответ: {selected_answer.get('text', '')}",
+        "score": None,
+        "maxscore": None,
+        "summary": f"{current_element.get('text', '')} | Ответ: {selected_answer.get('text', '')}",
+    }
+    return record, QuestionAnswerResponse(
+        feedback=selected_answer.get("feedback", "Ответ принят"),
         score=0
     )
 
 
-@router.post("/courses/{course_id}/multichoice/answer", response_model=MultiChoiceAnswerResponse)
-def submit_multichoice_answer(
-    course_id: str,
-    answer_data: MultiChoiceAnswerRequest,
-    chat_id: Optional[int] = Cookie(None),
-    response: Response = None,
-    repo: CourseRepository = Depends(get_course_repository)
-):
-    """Обработка ответа пользователя на multi_choice элемент"""
-    # Получаем или создаем chat_id
-    current_chat_id = get_or_create_chat_id(chat_id)
-    if not chat_id:
-        response.set_cookie(key="chat_id", value=str(current_chat_id), max_age=31536000)
-    
-    # Получаем активную сессию
-    run_id = get_active_run(current_chat_id, course_id, repo)
-    if not run_id:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Активная сессия не найдена. Начните курс сначала."
-        )
-    
-    # Получаем текущий элемент из conversation
-    current_element = get_current_element_from_conversation(current_chat_id, course_id, run_id, repo)
-    if not current_element:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Текущий элемент не найден"
-        )
-    
-    # Проверяем, что элемент является multi_choice
-    if current_element.get("type") != "multi_choice":
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Текущий элемент не является multi_choice"
-        )
-    
-    # Проверяем, что element_id совпадает
-    if current_element.get("element_id") != answer_data.element_id:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Неверный element_id"
-        )
-    
-    # Проверяем наличие выбранных ответов
-    if not answer_data.selected_answer_indices or len(answer_data.selected_answer_indices) == 0:
+def grade_multichoice_answer(current_element: dict,
+                             answer_data: MultiChoiceAnswerRequest) -> Tuple[dict, MultiChoiceAnswerResponse]:
+    """Проверка ответа на multi_choice"""
+    if not answer_data.selected_answer_indices:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Необходимо выбрать хотя бы один вариант ответа"
         )
     
-    # Получаем ответы
     answers = current_element.get("answers", [])
-    
-    # Проверяем валидность индексов
     for index in answer_data.selected_answer_indices:
         if index < 0 or index >= len(answers):
             raise HTTPException(
@@ -3180,10 +1746,9 @@ def submit_multichoice_answer(
                 detail=f"Неверный индекс ответа: {index}"
             )
     
-    # Вычисляем результат
     is_correct, result_type, score = calculate_multichoice_result(answer_data.selected_answer_indices, answers)
     
-    # Получаем итоговое сообщение в зависимости от результата
+    # Итоговое сообщение в зависимости от результата
     if result_type == "correct":
         feedback = current_element.get("feedback_correct", "Правильно!")
     elif result_type == "partial":
@@ -3191,26 +1756,19 @@ def submit_multichoice_answer(
     else:
         feedback = current_element.get("feedback_incorrect", "Неправильно.")
     
-    # Формируем детальный feedback для каждого выбранного варианта
-    individual_feedbacks = []
-    for index in answer_data.selected_answer_indices:
-        selected_answer = answers[index]
-        individual_feedbacks.append(IndividualFeedback(
+    # Детальный feedback для каждого выбранного варианта
+    individual_feedbacks = [
+        IndividualFeedback(
             answer_index=index,
-            answer_text=selected_answer.get("text", ""),
-            feedback=selected_answer.get("feedback")
-        ))
+            answer_text=answers[index].get("text", ""),
+            feedback=answers[index].get("feedback")
+        )
+        for index in answer_data.selected_answer_indices
+    ]
     
-    # Сохраняем ответ пользователя в conversation
     selected_texts = [answers[i].get("text", "") for i in answer_data.selected_answer_indices]
-    repo.insert_element(
-        chat_id=current_chat_id,
-        course_id=course_id,
-        username=None,
-        element_id=answer_data.element_id,
-        element_type="multi_choice",
-        run_id=run_id,
-        json_data={
+    record = {
+        "json_data": {
             "user_answer": {
                 "selected_indices": answer_data.selected_answer_indices,
                 "selected_texts": selected_texts,
@@ -3220,29 +1778,209 @@ def submit_multichoice_answer(
                 "max_score": 1.0
             }
         },
-        role="user",
-        report=f"Ответы: {', '.join(selected_texts)}",
-        score=score,
-        maxscore=1.0
+        "report": f"Ответы: {', '.join(selected_texts)}",
+        "score": score,
+        "maxscore": 1.0,
+        "summary": f"{current_element.get('text', '')} | Score: {score}/1.0",
+    }
+    return record, MultiChoiceAnswerResponse(
+        is_correct=is_correct,
+        feedback=feedback,
+        individual_feedbacks=individual_feedbacks,
+        score=score
     )
+
+
+def submit_answer(course_id: str, element_type: str, answer_data, chat_id: Optional[int], response: Response,
+                  grade, repo: CourseRepository):
+    """
+    Ответ пользователя на элемент element_type: проверка grade(current_element, answer_data),
+    строка conversation с ответом и итог в report bot строки элемента (для статистики)
+    """
+    current_chat_id = get_or_create_chat_id(chat_id)
+    if not chat_id:
+        response.set_cookie(key="chat_id", value=str(current_chat_id), max_age=31536000)
     
-    # Сохраняем результат в report (для статистики)
-    repo.update_conversation_report(
-        current_chat_id,
-        course_id,
-        run_id,
-        answer_data.element_id,
-        f"{current_element.get('text', '')} | Score: {score}/1.0"
+    run_id = get_active_run(current_chat_id, course_id, repo)
+    current_element = get_current_element_from_conversation(current_chat_id, course_id, run_id, repo) if run_id else None
+    record, result = grade(answer_element(run_id, current_element, element_type, answer_data.element_id), answer_data)
+    
+    repo.insert_element(
+        chat_id=current_chat_id,
+        course_id=course_id,
+        username=None,
+        element_id=answer_data.element_id,
+        element_type=element_type,
+        run_id=run_id,
+        json_data=record["json_data"],
+        role="user",
+        report=record["report"],
+        score=record["score"],
+        maxscore=record["maxscore"]
     )
+    repo.update_conversation_report(current_chat_id, course_id, run_id, answer_data.element_id, record["summary"])
+    
+    logger.info(f"{element_type} answer submitted: element_id={answer_data.element_id}, run_id={run_id}, score={record['score']}")
+    return result
+
+
+async def submit_answer_async(course_id: str, element_type: str, answer_data, chat_id: Optional[int],
+                              response: Response, grade, repo: AsyncCourseRepository):
+    """submit_answer для AsyncCourseRepository"""
+    current_chat_id = get_or_create_chat_id(chat_id)
+    if not chat_id:
+        response.set_cookie(key="chat_id", value=str(current_chat_id), max_age=31536000)
     
-    logger.info(f"MultiChoice answer submitted: element_id={answer_data.element_id}, selected_indices={answer_data.selected_answer_indices}, is_correct={is_correct}, score={score}")
+    await ensure_course_loaded(course_id)
+    run_id = await repo.get_active_run_id(current_chat_id, course_id)
+    current_element = (await get_current_element_from_conversation_async(current_chat_id, course_id, run_id, repo)
+                       if run_id else None)
+    record, result = grade(answer_element(run_id, current_element, element_type, answer_data.element_id), answer_data)
     
-    return MultiChoiceAnswerResponse(
-        is_correct=is_correct,
-        feedback=feedback,
-        individual_feedbacks=individual_feedbacks,
-        score=score
+    await repo.insert_element(
+        chat_id=current_chat_id,
+        course_id=course_id,
+        username=None,
+        element_id=answer_data.element_id,
+        element_type=element_type,
+        run_id=run_id,
+        json_data=record["json_data"],
+        role="user",
+        report=record["report"],
+        score=record["score"],
+        maxscore=record["maxscore"]
     )
+    await repo.update_conversation_report(current_chat_id, course_id, run_id, answer_data.element_id, record["summary"])
+    
+    logger.info(f"{element_type} answer submitted: element_id={answer_data.element_id}, run_id={run_id}, score={record['score']}")
+    return result
+
+
+@sync_route(router.post("/courses/{course_id}/quiz/answer", response_model=QuizAnswerResponse))
+@unit_of_work
+def submit_quiz_answer(
+    course_id: str,
+    answer_data: QuizAnswerRequest,
+    chat_id: Optional[int] = Cookie(None),
+    response: Response = None,
+    repo: CourseRepository = Depends(get_course_repository)
+):
+    """Обработка ответа пользователя на quiz элемент"""
+    return submit_answer(course_id, "quiz", answer_data, chat_id, response, grade_quiz_answer, repo)
+
+
+@async_route(router.post("/courses/{course_id}/quiz/answer", response_model=QuizAnswerResponse))
+@async_unit_of_work
+async def submit_quiz_answer_async(
+    course_id: str,
+    answer_data: QuizAnswerRequest,
+    chat_id: Optional[int] = Cookie(None),
+    response: Response = None,
+    repo: AsyncCourseRepository = Depends(get_async_course_repository)
+):
+    """Обработка ответа пользователя на quiz элемент (MVP_DB_MODE=async)"""
+    return await submit_answer_async(course_id, "quiz", answer_data, chat_id, response, grade_quiz_answer, repo)
+
+
+@sync_route(router.post("/courses/{course_id}/input/answer", response_model=InputAnswerResponse))
+@unit_of_work
+def submit_input_answer(
+    course_id: str,
+    answer_data: InputAnswerRequest,
+    chat_id: Optional[int] = Cookie(None),
+    response: Response = None,
+    repo: CourseRepository = Depends(get_course_repository)
+):
+    """Обработка ответа пользователя на input элемент"""
+    return submit_answer(course_id, "input", answer_data, chat_id, response, grade_input_answer, repo)
+
+
+@async_route(router.post("/courses/{course_id}/input/answer", response_model=InputAnswerResponse))
+@async_unit_of_work
+async def submit_input_answer_async(
+    course_id: str,
+    answer_data: InputAnswerRequest,
+    chat_id: Optional[int] = Cookie(None),
+    response: Response = None,
+    repo: AsyncCourseRepository = Depends(get_async_course_repository)
+):
+    """Обработка ответа пользователя на input элемент (MVP_DB_MODE=async)"""
+    return await submit_answer_async(course_id, "input", answer_data, chat_id, response, grade_input_answer, repo)
+
+
+@sync_route(router.post("/courses/{course_id}/question/answer", response_model=QuestionAnswerResponse))
+@unit_of_work
+def submit_question_answer(
+    course_id: str,
+    answer_data: QuestionAnswerRequest,
+    chat_id: Optional[int] = Cookie(None),
+    response: Response = None,
+    repo: CourseRepository = Depends(get_course_repository)
+):
+    """Обработка ответа пользователя на question элемент"""
+    return submit_answer(course_id, "question", answer_data, chat_id, response, grade_question_answer, repo)
+
+
+@async_route(router.post("/courses/{course_id}/question/answer", response_model=QuestionAnswerResponse))
+@async_unit_of_work
+async def submit_question_answer_async(
+    course_id: str,
+    answer_data: QuestionAnswerRequest,
+    chat_id: Optional[int] = Cookie(None),
+    response: Response = None,
+    repo: AsyncCourseRepository = Depends(get_async_course_repository)
+):
+    """Обработка ответа пользователя на question элемент (MVP_DB_MODE=async)"""
+    return await submit_answer_async(course_id, "question", answer_data, chat_id, response, grade_question_answer, repo)
+
+
+@sync_route(router.post("/courses/{course_id}/multichoice/answer", response_model=MultiChoiceAnswerResponse))
+@unit_of_work
+def submit_multichoice_answer(
+    course_id: str,
+    answer_data: MultiChoiceAnswerRequest,
+    chat_id: Optional[int] = Cookie(None),
+    response: Response = None,
+    repo: CourseRepository = Depends(get_course_repository)
+):
+    """Обработка ответа пользователя на multi_choice элемент"""
+    return submit_answer(course_id, "multi_choice", answer_data, chat_id, response, grade_multichoice_answer, repo)
+
+
+@async_route(router.post("/courses/{course_id}/multichoice/answer", response_model=MultiChoiceAnswerResponse))
+@async_unit_of_work
+async def submit_multichoice_answer_async(
+    course_id: str,
+    answer_data: MultiChoiceAnswerRequest,
+    chat_id: Optional[int] = Cookie(None),
+    response: Response = None,
+    repo: AsyncCourseRepository = Depends(get_async_course_repository)
+):
+    """Обработка ответа пользователя на multi_choice элемент (MVP_DB_MODE=async)"""
+    return await submit_answer_async(course_id, "multi_choice", answer_data, chat_id, response,
+                                     grade_multichoice_answer, repo)
+
+
+def format_var_conversation(element_info: dict, conversation: List[dict], limit: int = 0) -> str:
+    """
+    Текст элемента и его разговора для подстановки в переменную промпта
+    (limit: 0 = все сообщения, >0 = первые N, <0 = последние M)
+    """
+    text = element_info.get("text", "")
+    if conversation:
+        text = "### assistant:\n" + text + "\n"
+        i = 1
+        n = len(conversation) + limit if limit < 0 else len(conversation)
+        
+        for message in conversation:
+            if message.get("role") != "system":
+                if limit < 0 and i == n:
+                    text = ""
+                text = text + "### " + message.get("role", "user") + ":\n" + message.get("content", "") + "\n\n"
+                i += 1
+                if limit > 0 and i >= limit:
+                    break
+    return text
 
 
 def get_conversation_text_for_var(chat_id: int, course_id: str, run_id: int, element_id: str, limit: int = 0, repo: Optional[CourseRepository] = None) -> str:
@@ -3262,40 +2000,13 @@ def get_conversation_text_for_var(chat_id: int, course_id: str, run_id: int, ele
     """
     # Используем репозиторий если доступен, иначе используем прямой SQL (для обратной совместимости)
     if repo:
-        conv = repo.db.query(Conversation).filter(
-            and_(
-                Conversation.chat_id == chat_id,
-                Conversation.course_id == course_id,
-                Conversation.run_id == run_id,
-                Conversation.element_id == element_id,
-                Conversation.role == 'bot'
-            )
-        ).order_by(desc(Conversation.date_inserted)).first()
-        
-        if not conv:
+        dialog_data = repo.get_dialog_conversation(chat_id, course_id, run_id, element_id)
+        if not dialog_data:
             return "NOT_FOUND"
         
-        element_data = json.loads(conv.json) if conv.json else {}
-        element_info = element_data.get("element_data", {})
-        text = element_info.get("text", "")
-        
-        # Если есть conversation, добавляем его
-        conversation = element_info.get("conversation", [])
-        if conversation:
-            text = "### assistant:\n" + text + "\n"
-            i = 1
-            n = len(conversation) + limit if limit < 0 else len(conversation)
-            
-            for message in conversation:
-                if message.get("role") != "system":
-                    if limit < 0 and i == n:
-                        text = ""
-                    text = text + "### " + message.get("role", "user") + ":\n" + message.get("content", "") + "\n\n"
-                    i += 1
-                    if limit > 0 and i >= limit:
-                        break
-        
-        return text
+        element_info = dialog_data["element_data"]
+        conversation, _ = repo.get_dialog_history(dialog_data["conversation_id"], element_info)
+        return format_var_conversation(element_info, conversation, limit)
     else:
         # Fallback на старый способ для обратной совместимости
         import db
@@ -3315,61 +2026,43 @@ def get_conversation_text_for_var(chat_id: int, course_id: str, run_id: int, ele
             if not result:
                 return "NOT_FOUND"
             
-            element_data = json.loads(result[0])
+            # jsonb (миграция 0018) psycopg2 отдает уже декодированным
+            element_data = json.loads(result[0]) if isinstance(result[0], str) else result[0]
             element_info = element_data.get("element_data", {})
-            text = element_info.get("text", "")
-            
-            # Если есть conversation, добавляем его
-            conversation = element_info.get("conversation", [])
-            if conversation:
-                text = "### assistant:\n" + text + "\n"
-                i = 1
-                n = len(conversation) + limit if limit < 0 else len(conversation)
-                
-                for message in conversation:
-                    if message.get("role") != "system":
-                        if limit < 0 and i == n:
-                            text = ""
-                        text = text + "### " + message.get("role", "user") + ":\n" + message.get("content", "") + "\n\n"
-                        i += 1
-                        if limit > 0 and i >= limit:
-                            break
-            
-            return text
+            return format_var_conversation(element_info, element_info.get("conversation", []), limit)
         finally:
             conn.close()
 
 
-def replace_vars_in_prompt(prompt: str, chat_id: int, course_id: str, run_id: int, repo: Optional[CourseRepository] = None) -> str:
+async def get_conversation_text_for_var_async(chat_id: int, course_id: str, run_id: int, element_id: str,
+                                              limit: int, repo: AsyncCourseRepository) -> str:
+    """get_conversation_text_for_var для AsyncCourseRepository"""
+    dialog_data = await repo.get_dialog_conversation(chat_id, course_id, run_id, element_id)
+    if not dialog_data:
+        return "NOT_FOUND"
+    
+    element_info = dialog_data["element_data"]
+    conversation, _ = await repo.get_dialog_history(dialog_data["conversation_id"], element_info)
+    return format_var_conversation(element_info, conversation, limit)
+
+
+PROMPT_VAR_PATTERN = re.compile(r"\{\{(.*?)\}\}")
+
+
+def parse_prompt_vars(prompt: str) -> Tuple[str, List[Tuple[str, str, int]]]:
     """
-    Заменяет переменные в промпте на текст из предыдущих элементов.
+    Промпт без HTML комментариев и его переменные: (имя в промпте, element_id, limit)
     
     Поддерживает форматы:
     - {{element_id}} - все сообщения из элемента
     - {{N]element_id}} - первые N сообщений
     - {{element_id[M}} - последние M сообщений
-    
-    Args:
-        prompt: Промпт с переменными
-        chat_id: ID чата
-        course_id: ID курса
-        run_id: ID сессии
-    
-    Returns:
-        Промпт с замененными переменными
     """
-    import re
-    
     # Удаляем HTML комментарии
     prompt = re.sub(r'<!--.*?-->', '', prompt, flags=re.DOTALL)
     
-    # Находим все переменные
-    pattern = re.compile(r"\{\{(.*?)\}\}")
-    var_names = pattern.findall(prompt)
-    
-    # Создаем карту значений переменных
-    vars_map = {}
-    for original_var_name in var_names:
+    prompt_vars = []
+    for original_var_name in PROMPT_VAR_PATTERN.findall(prompt):
         limit = 0
         var_name = original_var_name
         try:
@@ -3385,12 +2078,12 @@ def replace_vars_in_prompt(prompt: str, chat_id: int, course_id: str, run_id: in
                     var_name = var_name[0:i]
         except ValueError:
             pass
-        
-        var_value = get_conversation_text_for_var(chat_id, course_id, run_id, var_name, limit, repo)
-        # Используем оригинальное имя переменной как ключ для правильной замены
-        vars_map[original_var_name] = var_value
-    
-    # Заменяем переменные в промпте
+        prompt_vars.append((original_var_name, var_name, limit))
+    return prompt, prompt_vars
+
+
+def substitute_prompt_vars(prompt: str, vars_map: Dict[str, str]) -> str:
+    """Замена переменных промпта значениями vars_map (по имени в промпте)"""
     def replacer(match):
         original_var = match.group(1)
         var_value = vars_map.get(original_var, "NOT_FOUND")
@@ -3398,181 +2091,261 @@ def replace_vars_in_prompt(prompt: str, chat_id: int, course_id: str, run_id: in
             logger.warning(f"Variable {original_var} is not found among previous element keys")
         return var_value
     
-    prompt = pattern.sub(replacer, prompt)
-    
-    return prompt
+    return PROMPT_VAR_PATTERN.sub(replacer, prompt)
 
 
-def update_element_conversation(chat_id: int, course_id: str, run_id: int, element_id: str, conversation: List[Dict[str, str]], repo: CourseRepository):
+def replace_vars_in_prompt(prompt: str, chat_id: int, course_id: str, run_id: int, repo: Optional[CourseRepository] = None) -> str:
     """
-    Обновляет conversation в указанном dialog элементе в базе данных.
+    Заменяет переменные в промпте на текст из предыдущих элементов (форматы - см. parse_prompt_vars).
     
     Args:
+        prompt: Промпт с переменными
         chat_id: ID чата
         course_id: ID курса
         run_id: ID сессии
-        element_id: ID dialog элемента для обновления
-        conversation: Обновленная история диалога
-        repo: Репозиторий для работы с БД
+    
+    Returns:
+        Промпт с замененными переменными
     """
-    dialog_data = repo.get_dialog_conversation(chat_id, course_id, run_id, element_id)
-    if dialog_data:
-        conversation_id = dialog_data["conversation_id"]
-        element_data = json.loads(dialog_data["json"]) if dialog_data["json"] else {}
-        
-        logger.info(f"update_element_conversation: Found element, json_data keys={list(element_data.keys())}")
-        
-        # Проверяем структуру данных
-        if "element_data" not in element_data:
-            logger.warning(f"update_element_conversation: element_data not found in json_data, keys={list(element_data.keys())}")
-            # Пытаемся создать правильную структуру
-            element_data = {"element_data": element_data}
-        
-        if "element_data" in element_data:
-            element_data["element_data"]["conversation"] = conversation
-            repo.update_dialog_conversation(conversation_id, conversation)
-            logger.info(f"Updated conversation for element_id={element_id}, chat_id={chat_id}, course_id={course_id}, run_id={run_id}, conversation_length={len(conversation)}")
-        else:
-            logger.error(f"update_element_conversation: Could not find element_data structure, json_data keys={list(element_data.keys())}")
+    prompt, prompt_vars = parse_prompt_vars(prompt)
+    vars_map = {
+        original_var_name: get_conversation_text_for_var(chat_id, course_id, run_id, var_name, limit, repo)
+        for original_var_name, var_name, limit in prompt_vars
+    }
+    return substitute_prompt_vars(prompt, vars_map)
+
+
+async def replace_vars_in_prompt_async(prompt: str, chat_id: int, course_id: str, run_id: int,
+                                       repo: AsyncCourseRepository) -> str:
+    """replace_vars_in_prompt для AsyncCourseRepository"""
+    prompt, prompt_vars = parse_prompt_vars(prompt)
+    vars_map = {}
+    for original_var_name, var_name, limit in prompt_vars:
+        vars_map[original_var_name] = await get_conversation_text_for_var_async(
+            chat_id, course_id, run_id, var_name, limit, repo
+        )
+    return substitute_prompt_vars(prompt, vars_map)
+
+
+def needs_system_prompt(conversation: List[dict], stored_count: int) -> bool:
+    """
+    Нужно ли добавить system prompt в начало истории диалога: история пуста или
+    (диалог из conversation.json, еще не в dialog_message) в ней нет system сообщения
+    """
+    if not conversation:
+        return True
+    return stored_count == 0 and not any(msg.get("role") == "system" for msg in conversation)
+
+
+def dialog_turn(run_id: int, dialog_data: dict, conversation: List[dict], stored_count: int) -> dict:
+    """Ход диалога (результат start_dialog_turn): история с сообщением пользователя и параметры модели"""
+    element_info = dialog_data["element_data"]
+    return {
+        "run_id": run_id,
+        "conversation_id": dialog_data["conversation_id"],
+        "conversation": conversation,
+        "stored_count": stored_count,
+        # Сообщения этого хода (с сообщения пользователя) - на случай, если параллельный ход уже дописал историю
+        "turn_start": len(conversation) - 1,
+        # Параметры модели с дефолтными значениями
+        "model": element_info.get("model") or "gpt-4",
+        "temperature": element_info.get("temperature"),
+        "reasoning": element_info.get("reasoning"),
+        # Кэш ответов LLM для одинаковых ходов (cache: true в YAML элемента)
+        "cache": element_info.get("cache", False),
+        "cache_ttl": element_info.get("cache_ttl"),
+        # Бюджет токенов истории, отправляемой модели (старые ходы - сводкой), см. context_window.py
+        "max_context_tokens": element_info.get("max_context_tokens"),
+    }
+
+
+@unit_of_work
+def start_dialog_turn(chat_id: int, course_id: str, message_data: DialogMessageRequest,
+                      repo: CourseRepository) -> dict:
+    """
+    Первая транзакция хода диалога (до запроса к LLM): история диалога, system prompt,
+    сохранение сообщения пользователя. После commit соединение с БД возвращается в пул
+    """
+    run_id = get_active_run(chat_id, course_id, repo)
+    if not run_id:
+        raise HTTPException(status_code=404, detail="Активная сессия не найдена")
+    
+    # Получаем текущий dialog элемент напрямую из БД по element_id
+    # Это гарантирует, что мы получаем правильный элемент с актуальной conversation
+    dialog_data = repo.get_dialog_conversation(chat_id, course_id, run_id, message_data.element_id)
+    if not dialog_data:
+        raise HTTPException(status_code=404, detail=f"Dialog элемент {message_data.element_id} не найден")
+    
+    element_info = dialog_data["element_data"]
+    # История из dialog_message; stored_count сообщений уже сохранено, остальные будут добавлены
+    conversation, stored_count = repo.get_dialog_history(dialog_data["conversation_id"], element_info)
+    
+    logger.info(f"send_dialog_message: Loaded dialog element_id={message_data.element_id}, conversation_length={len(conversation)}, stored={stored_count}")
+    
+    if needs_system_prompt(conversation, stored_count):
+        prompt = replace_vars_in_prompt(element_info.get("prompt", ""), chat_id, course_id, run_id, repo)
+        conversation = [{"role": "system", "content": prompt}] + conversation
+        logger.info(f"send_dialog_message: Added system prompt to conversation, new length={len(conversation)}")
+    
+    # Добавляем сообщение пользователя
+    conversation.append({"role": "user", "content": message_data.message})
+    
+    # Сохраняем сообщение пользователя в БД
+    repo.insert_element(
+        chat_id=chat_id,
+        course_id=course_id,
+        username=None,
+        element_id=message_data.element_id,
+        element_type="dialog",
+        run_id=run_id,
+        json_data={"user_message": message_data.message},
+        role="user",
+        report=message_data.message
+    )
+    
+    return dialog_turn(run_id, dialog_data, conversation, stored_count)
+
+
+@async_variant(start_dialog_turn)
+@async_unit_of_work
+async def start_dialog_turn_async(chat_id: int, course_id: str, message_data: DialogMessageRequest,
+                                  repo: AsyncCourseRepository) -> dict:
+    """start_dialog_turn для AsyncCourseRepository"""
+    run_id = await repo.get_active_run_id(chat_id, course_id)
+    if not run_id:
+        raise HTTPException(status_code=404, detail="Активная сессия не найдена")
+    
+    dialog_data = await repo.get_dialog_conversation(chat_id, course_id, run_id, message_data.element_id)
+    if not dialog_data:
+        raise HTTPException(status_code=404, detail=f"Dialog элемент {message_data.element_id} не найден")
+    
+    element_info = dialog_data["element_data"]
+    conversation, stored_count = await repo.get_dialog_history(dialog_data["conversation_id"], element_info)
+    
+    logger.info(f"start_dialog_turn_async: Loaded dialog element_id={message_data.element_id}, conversation_length={len(conversation)}, stored={stored_count}")
+    
+    if needs_system_prompt(conversation, stored_count):
+        prompt = await replace_vars_in_prompt_async(element_info.get("prompt", ""), chat_id, course_id, run_id, repo)
+        conversation = [{"role": "system", "content": prompt}] + conversation
+    
+    conversation.append({"role": "user", "content": message_data.message})
+    
+    await repo.insert_element(
+        chat_id=chat_id,
+        course_id=course_id,
+        username=None,
+        element_id=message_data.element_id,
+        element_type="dialog",
+        run_id=run_id,
+        json_data={"user_message": message_data.message},
+        role="user",
+        report=message_data.message
+    )
+    
+    return dialog_turn(run_id, dialog_data, conversation, stored_count)
+
+
+@unit_of_work
+def finish_dialog_turn(turn: dict, element_id: str, repo: CourseRepository) -> None:
+    """Вторая транзакция хода диалога (после ответа LLM): новые сообщения в dialog_message"""
+    # История в conversation.json не перезаписывается
+    stored_count = turn["stored_count"]
+    repo.append_dialog_messages(turn["conversation_id"], turn["run_id"], element_id,
+                                turn["conversation"][stored_count:], stored_count,
+                                turn_start=turn["turn_start"] - stored_count)
+
+
+@async_variant(finish_dialog_turn)
+@async_unit_of_work
+async def finish_dialog_turn_async(turn: dict, element_id: str, repo: AsyncCourseRepository) -> None:
+    """finish_dialog_turn для AsyncCourseRepository"""
+    stored_count = turn["stored_count"]
+    await repo.append_dialog_messages(turn["conversation_id"], turn["run_id"], element_id,
+                                      turn["conversation"][stored_count:], stored_count,
+                                      turn_start=turn["turn_start"] - stored_count)
+
+
+def add_dialog_reply(conversation: list, reply: str) -> Tuple[str, bool]:
+    """
+    Обработка ответа LLM: удаление маркера {STOP} и добавление непустого ответа в conversation
+    Возвращает (reply без маркера, stop)
+    """
+    # Проверяем {STOP} маркер
+    stop_detected = False
+    original_reply = reply
+
+    if "{STOP}" in reply:
+        reply = reply.replace("{STOP}", "").strip()
+        stop_detected = True
+        logger.info(f"dialog: Detected {{STOP}} marker, original_reply={original_reply[:200]}")
+
+    logger.info(f"dialog: reply_length={len(reply)}, stop_detected={stop_detected}, reply_preview={reply[:100] if reply else 'EMPTY'}")
+    
+    # Проверяем, пустой ли ответ после удаления маркера (как в Telegram версии)
+    # Если ответ пустой и диалог завершен, не добавляем пустое сообщение
+    if reply.strip() != "":
+        # Добавляем ответ ассистента (без маркера) - это важно для сохранения в БД
+        conversation.append({"role": "assistant", "content": reply})
+        logger.info(f"dialog: Added assistant reply, conversation length={len(conversation)}")
     else:
-        logger.warning(f"update_element_conversation: No dialog element found for element_id={element_id}, chat_id={chat_id}, course_id={course_id}, run_id={run_id}")
+        # Если ответ пустой после удаления маркера, не добавляем его в conversation
+        logger.info(f"dialog: Reply is empty after marker removal, skipping empty message (stop_detected={stop_detected})")
+        # Если диалог завершен, reply будет пустым в ответе
+        reply = ""  # Убеждаемся, что reply пустой
+    
+    return reply, stop_detected
+
+
+def sse_event(event: str, data: dict) -> str:
+    """Событие Server-Sent Events с JSON в data"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
 
 @router.post("/courses/{course_id}/dialog/message", response_model=DialogMessageResponse)
-def send_dialog_message(
+async def send_dialog_message(
     course_id: str,
     message_data: DialogMessageRequest,
     chat_id: Optional[int] = Cookie(None),
     response: Response = None,
-    repo: CourseRepository = Depends(get_course_repository)
+    repo=Depends(get_mode_course_repository)
 ):
-    """Отправка сообщения в dialog элемент"""
+    """
+    Отправка сообщения в dialog элемент
+    Ответ LLM ожидается в event loop: на время генерации обработчик не занимает ни поток threadpool,
+    ни соединение с БД (работа с БД - две короткие транзакции до и после запроса к LLM, в режиме
+    MVP_DB_MODE=async - на AsyncCourseRepository, иначе в threadpool)
+    """
     try:
         current_chat_id = get_or_create_chat_id(chat_id)
         if not chat_id:
             response.set_cookie(key="chat_id", value=str(current_chat_id), max_age=31536000)
         
-        run_id = get_active_run(current_chat_id, course_id, repo)
-        if not run_id:
-            raise HTTPException(status_code=404, detail="Активная сессия не найдена")
-        
-        # Получаем текущий dialog элемент напрямую из БД по element_id
-        # Это гарантирует, что мы получаем правильный элемент с актуальной conversation
-        dialog_data = repo.get_dialog_conversation(current_chat_id, course_id, run_id, message_data.element_id)
-        if not dialog_data:
-            raise HTTPException(status_code=404, detail=f"Dialog элемент {message_data.element_id} не найден")
-        
-        element_data = json.loads(dialog_data["json"]) if dialog_data["json"] else {}
-        element_info = element_data.get("element_data", {})
-        
-        # Формируем current_element из данных БД
-        current_element = {
-            "element_id": message_data.element_id,
-            "type": "dialog",
-            "text": element_info.get("text", ""),
-            "prompt": element_info.get("prompt", ""),
-            "model": element_info.get("model"),
-            "temperature": element_info.get("temperature"),
-            "reasoning": element_info.get("reasoning"),
-            "conversation": element_info.get("conversation", [])
-        }
-        
-        logger.info(f"send_dialog_message: Loaded dialog element_id={message_data.element_id}, conversation_length={len(current_element.get('conversation', []))}")
-        
-        # Получаем conversation из элемента
-        conversation = current_element.get("conversation", [])
-        
-        logger.info(f"send_dialog_message: Current conversation length={len(conversation)}, conversation={conversation}")
-        
-        # Инициализируем промпт если conversation пуст
-        if not conversation:
-            prompt = replace_vars_in_prompt(
-                current_element.get("prompt", ""), 
-                current_chat_id, 
-                course_id, 
-                run_id,
-                repo
-            )
-            conversation = [{"role": "system", "content": prompt}]
-            logger.info(f"send_dialog_message: Initialized conversation with system prompt, length={len(conversation)}")
-        else:
-            # Проверяем, есть ли system message в conversation
-            has_system = any(msg.get("role") == "system" for msg in conversation)
-            if not has_system:
-                # Если нет system message, добавляем его в начало
-                prompt = replace_vars_in_prompt(
-                    current_element.get("prompt", ""), 
-                    current_chat_id, 
-                    course_id, 
-                    run_id
-                )
-                conversation = [{"role": "system", "content": prompt}] + conversation
-                logger.info(f"send_dialog_message: Added system prompt to existing conversation, new length={len(conversation)}")
-        
-        # Добавляем сообщение пользователя
-        conversation.append({"role": "user", "content": message_data.message})
-        logger.info(f"send_dialog_message: Added user message, conversation length={len(conversation)}")
-        
-        # Сохраняем сообщение пользователя в БД
-        repo.insert_element(
-            chat_id=current_chat_id,
-            course_id=course_id,
-            username=None,
-            element_id=message_data.element_id,
-            element_type="dialog",
-            run_id=run_id,
-            json_data={"user_message": message_data.message},
-            role="user",
-            report=message_data.message
-        )
+        turn = await run_repo(repo, start_dialog_turn, current_chat_id, course_id, message_data)
+        conversation = turn["conversation"]
         
         # Генерируем ответ через llm_service
-        from app.services.llm_service import generate_chat_response
+        from app.services.llm_service import generate_chat_response_async
         
-        # Получаем параметры модели с дефолтными значениями
-        model = current_element.get("model") or "gpt-4"
-        temperature = current_element.get("temperature")
-        reasoning = current_element.get("reasoning")
-        
-        logger.info(f"send_dialog_message: Generating response with model={model}, temperature={temperature}, reasoning={reasoning}")
+        logger.info(f"send_dialog_message: Generating response with model={turn['model']}, temperature={turn['temperature']}, reasoning={turn['reasoning']}")
         
         try:
-            reply = generate_chat_response(
+            reply = await generate_chat_response_async(
                 messages=conversation,
-                model=model,
-                temperature=temperature,
-                reasoning=reasoning
+                model=turn["model"],
+                temperature=turn["temperature"],
+                reasoning=turn["reasoning"],
+                cache=turn["cache"],
+                cache_ttl=turn["cache_ttl"],
+                max_context_tokens=turn["max_context_tokens"]
             )
         except Exception as e:
             logger.error(f"Error generating dialog response: {e}", exc_info=True)
             # Используем HTTPException, который обрабатывается CORS middleware
             raise HTTPException(status_code=500, detail=f"Ошибка генерации ответа: {str(e)}")
         
-        # Проверяем {STOP} маркер
-        stop_detected = False
-        original_reply = reply
-
-        if "{STOP}" in reply:
-            reply = reply.replace("{STOP}", "").strip()
-            stop_detected = True
-            logger.info(f"send_dialog_message: Detected {{STOP}} marker, original_reply={original_reply[:200]}")
-
-        logger.info(f"send_dialog_message: reply_length={len(reply)}, stop_detected={stop_detected}, reply_preview={reply[:100] if reply else 'EMPTY'}")
-        
-        # Проверяем, пустой ли ответ после удаления маркера (как в Telegram версии)
-        # Если ответ пустой и диалог завершен, не добавляем пустое сообщение
-        if reply.strip() != "":
-            # Добавляем ответ ассистента (без маркера) - это важно для сохранения в БД
-            conversation.append({"role": "assistant", "content": reply})
-            logger.info(f"send_dialog_message: Added assistant reply, conversation length={len(conversation)}")
-        else:
-            # Если ответ пустой после удаления маркера, не добавляем его в conversation
-            logger.info(f"send_dialog_message: Reply is empty after marker removal, skipping empty message (stop_detected={stop_detected})")
-            # Если диалог завершен, reply будет пустым в ответе
-            reply = ""  # Убеждаемся, что reply пустой
+        reply, stop_detected = add_dialog_reply(conversation, reply)
         
-        # Сохраняем обновленную conversation в элемент (обновляем существующий dialog элемент)
-        update_element_conversation(current_chat_id, course_id, run_id, message_data.element_id, conversation, repo)
+        await run_repo(repo, finish_dialog_turn, turn, message_data.element_id)
         
         # Не вставляем следующий элемент здесь — фронтенд сам вызовет /next
         # при получении stop=true
@@ -3591,6 +2364,67 @@ def send_dialog_message(
         raise HTTPException(status_code=500, detail=f"Внутренняя ошибка сервера: {str(e)}")
 
 
+@router.post("/courses/{course_id}/dialog/stream")
+async def stream_dialog_message(
+    course_id: str,
+    message_data: DialogMessageRequest,
+    chat_id: Optional[int] = Cookie(None),
+    response: Response = None,
+    repo=Depends(get_mode_course_repository)
+):
+    """
+    Отправка сообщения в dialog элемент с потоковой передачей ответа (Server-Sent Events)
+    События: token - {"text"}: очередной фрагмент ответа (без маркера {STOP});
+    done - {"reply", "stop", "conversation"} как ответ /dialog/message, после сохранения ответа в БД;
+    error - {"detail"}. Ответ сохраняется только после завершения потока
+    """
+    current_chat_id = get_or_create_chat_id(chat_id)
+    if not chat_id:
+        response.set_cookie(key="chat_id", value=str(current_chat_id), max_age=31536000)
+    
+    # До начала потока: ошибки (нет сессии, нет элемента) возвращаются обычным HTTP статусом
+    turn = await run_repo(repo, start_dialog_turn, current_chat_id, course_id, message_data)
+    conversation = turn["conversation"]
+    
+    from app.services.llm_service import stream_chat_response
+    from chat import StopMarkerFilter  # chat уже импортирован llm_service (с CONFIG_FILE)
+    
+    async def events():
+        stop_filter = StopMarkerFilter()
+        parts = []
+        try:
+            async for delta in stream_chat_response(
+                messages=conversation,
+                model=turn["model"],
+                temperature=turn["temperature"],
+                reasoning=turn["reasoning"],
+                cache=turn["cache"],
+                cache_ttl=turn["cache_ttl"],
+                max_context_tokens=turn["max_context_tokens"]
+            ):
+                parts.append(delta)
+                text = stop_filter.feed(delta)
+                if text:
+                    yield sse_event("token", {"text": text})
+            text = stop_filter.flush()
+            if text:
+                yield sse_event("token", {"text": text})
+            
+            reply, stop_detected = add_dialog_reply(conversation, "".join(parts))
+            # Зависимости запроса (repo) к этому моменту закрыты - своя сессия БД
+            async with open_course_repository() as stream_repo:
+                await run_repo(stream_repo, finish_dialog_turn, turn, message_data.element_id)
+        except Exception as e:
+            logger.error(f"Error streaming dialog response: {e}", exc_info=True)
+            yield sse_event("error", {"detail": f"Ошибка генерации ответа: {str(e)}"})
+            return
+        
+        yield sse_event("done", {"reply": reply, "stop": stop_detected, "conversation": conversation})
+    
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 @router.get("/courses/{course_id}/test/result/{element_id}", response_model=TestResultResponse)
 def get_test_result(
     course_id: str,
@@ -3750,6 +2584,7 @@ def get_revision_result(
 
 
 @router.post("/courses/{course_id}/revision/start/{element_id}", response_model=None)
+@unit_of_work
 def start_revision(
     course_id: str,
     element_id: str,
@@ -3824,19 +2659,6 @@ def start_revision(
     
     logger.info(f"Revision start: has_mistakes={has_mistakes}, mistakes_count={mistakes_count}, chain_length={len(revision_chain)}")
     
-    # Сохраняем информацию о цепочке повторения в БД
-    # Используем специальный формат, аналогичный Telegram-версии
-    revision_data = {
-        "revision": {
-            "revision_element": {
-                "type": "revision",
-                "element_id": element_id,
-                "prefix": revision_element_data.get("prefix", ""),
-            },
-            "data": revision_chain  # Список элементов для повторения
-        }
-    }
-    
     # Сохраняем маркер начала повторения в conversation
     repo.insert_element(
         chat_id=current_chat_id,
@@ -3845,165 +2667,30 @@ def start_revision(
         element_id=element_id,
         element_type="revision",
         run_id=run_id,
-        json_data=revision_data,
+        json_data={"element_data": revision_element_data},
         role="bot",
         report="Начато повторение ошибок"
     )
     
-    # Берем первый элемент из цепочки
-    if len(revision_chain) == 0:
+    # Цепочка хранится в revision_queue (только id элементов), данные элементов берутся из курса
+    repo.start_revision_queue(run_id, element_id, [list(item.keys())[0] for item in revision_chain])
+    first_element_id, _ = repo.next_revision_element(run_id, element_id)
+    while first_element_id and first_element_id not in course_data:
+        # Элемента уже нет в курсе - пропускаем
+        first_element_id, _ = repo.next_revision_element(run_id, first_element_id)
+    
+    if not first_element_id:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Цепочка повторения пуста"
         )
     
-    first_chain_item = revision_chain[0]
-    first_element_id = list(first_chain_item.keys())[0]
-    first_element_data = first_chain_item[first_element_id]["element_data"]
-    
-    # Обрабатываем первый элемент из цепочки
-    element_type = first_element_data.get("type", "message")
-    
-    # Нормализуем и возвращаем элемент в зависимости от типа
-    if element_type == "quiz":
-        # Нормализуем answers
-        answers = first_element_data.get("answers", [])
-        normalized_answers = []
-        for answer in answers:
-            normalized_answer = answer.copy()
-            if "text" in normalized_answer and not isinstance(normalized_answer["text"], str):
-                normalized_answer["text"] = str(normalized_answer["text"])
-            correct_value = answer.get("correct")
-            if correct_value is True or correct_value == "yes":
-                normalized_answer["correct"] = "yes"
-            elif correct_value is False or correct_value == "no":
-                normalized_answer.pop("correct", None)
-            normalized_answers.append(normalized_answer)
-        
-        # Преобразуем Google Drive ссылки в прокси URL
-        media = first_element_data.get("media")
-        if media and isinstance(media, list):
-            from urllib.parse import quote
-            media = [
-                f"/api/mvp/media/proxy?url={quote(get_direct_download_link(url), safe='')}"
-                if extract_file_id_from_drive_url(url) else url
-                for url in media
-            ]
-        
-        element_data = {
-            "element_data": {
-                "type": "quiz",
-                "text": first_element_data.get("text", ""),
-                "answers": normalized_answers,
-                "media": media,
-            }
-        }
-        repo.insert_element(
-            chat_id=current_chat_id,
-            course_id=course_id,
-            username=None,
-            element_id=first_element_id,
-            element_type="quiz",
-            run_id=run_id,
-            json_data=element_data,
-            role="bot",
-            report=first_element_data.get("text", "Quiz element")
-        )
-        quiz_element = QuizElement(
-            element_id=first_element_id,
-            type="quiz",
-            text=first_element_data.get("text", ""),
-            answers=normalized_answers,
-            media=media
-        )
-        result_dict = quiz_element.dict()
-        result_dict['type'] = 'quiz'
-        return result_dict
-    
-    elif element_type == "input":
-        element_data = {
-            "element_data": {
-                "type": "input",
-                "text": first_element_data.get("text", ""),
-                "correct_answer": first_element_data.get("correct_answer"),
-                "feedback_correct": first_element_data.get("feedback_correct"),
-                "feedback_incorrect": first_element_data.get("feedback_incorrect"),
-                "input_type": first_element_data.get("input_type", "text"),
-            }
-        }
-        repo.insert_element(
-            chat_id=current_chat_id,
-            course_id=course_id,
-            username=None,
-            element_id=first_element_id,
-            element_type="input",
-            run_id=run_id,
-            json_data=element_data,
-            role="bot",
-            report=first_element_data.get("text", "Input element")
-        )
-        input_element = InputElement(
-            element_id=first_element_id,
-            type="input",
-            text=first_element_data.get("text", ""),
-            correct_answer=first_element_data.get("correct_answer"),
-            feedback_correct=first_element_data.get("feedback_correct"),
-            feedback_incorrect=first_element_data.get("feedback_incorrect"),
-            input_type=first_element_data.get("input_type", "text")
-        )
-        result_dict = input_element.dict()
-        result_dict['type'] = 'input'
-        return result_dict
-    
-    elif element_type == "multi_choice":
-        # Нормализуем answers
-        answers = first_element_data.get("answers", [])
-        normalized_answers = []
-        for answer in answers:
-            normalized_answer = answer.copy()
-            correct_value = answer.get("correct")
-            if correct_value is True or correct_value == "yes":
-                normalized_answer["correct"] = "yes"
-            elif correct_value is False or correct_value == "no":
-                normalized_answer["correct"] = "no"
-            normalized_answers.append(normalized_answer)
-        
-        element_data = {
-            "element_data": {
-                "type": "multi_choice",
-                "text": first_element_data.get("text", ""),
-                "answers": normalized_answers,
-                "feedback_correct": first_element_data.get("feedback_correct", ""),
-                "feedback_partial": first_element_data.get("feedback_partial", ""),
-                "feedback_incorrect": first_element_data.get("feedback_incorrect", ""),
-            }
-        }
-        repo.insert_element(
-            chat_id=current_chat_id,
-            course_id=course_id,
-            username=None,
-            element_id=first_element_id,
-            element_type="multi_choice",
-            run_id=run_id,
-            json_data=element_data,
-            role="bot",
-            report=first_element_data.get("text", "MultiChoice element")
-        )
-        multichoice_element = MultiChoiceElement(
-            element_id=first_element_id,
-            type="multi_choice",
-            text=first_element_data.get("text", ""),
-            answers=normalized_answers,
-            feedback_correct=first_element_data.get("feedback_correct", ""),
-            feedback_partial=first_element_data.get("feedback_partial", ""),
-            feedback_incorrect=first_element_data.get("feedback_incorrect", "")
-        )
-        result_dict = multichoice_element.dict()
-        result_dict['type'] = 'multi_choice'
-        return result_dict
-    
-    else:
+    # В цепочке повторения только оцениваемые элементы
+    element_type = course_data[first_element_id].get("type", "message")
+    if element_type not in ("quiz", "input", "multi_choice"):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Неподдерживаемый тип элемента в цепочке повторения: {element_type}"
         )
+    return show_element(get_element_payload(course_id, first_element_id), course_id,
+                        current_chat_id, run_id, repo)
@@ -8,6 +8,7 @@ class Settings(BaseSettings):
     FRONTEND_URL: str = "http://localhost:3002"
     ENVIRONMENT: str = "development"
     TELEGRAM_AUTH_BOT_TOKEN: str = ""  # Token for Telegram authentication bot (enraidrobot)
+    MVP_DB_MODE: str = "sync"  # sync - обработчики MVP в threadpool (psycopg2), async - async def на AsyncSession (asyncpg)
     
     class Config:
         env_file = ".env"
@@ -1,4 +1,5 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.config import settings
@@ -15,3 +16,38 @@ def get_db():
     finally:
         db.close()
 
+
+# Async engine (MVP_DB_MODE=async): создается при первом обращении, asyncpg нужен только в этом режиме
+_async_engine = None
+_async_sessionmaker = None
+
+
+def get_async_database_url(database_url: str):
+    """DATABASE_URL с драйвером asyncpg (sslmode libpq у asyncpg называется ssl)"""
+    url = make_url(database_url).set(drivername="postgresql+asyncpg")
+    if "sslmode" in url.query:
+        query = dict(url.query)
+        query["ssl"] = query.pop("sslmode")
+        url = url.set(query=query)
+    return url
+
+
+def get_async_sessionmaker():
+    global _async_engine, _async_sessionmaker
+    if _async_sessionmaker is None:
+        from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+        _async_engine = create_async_engine(get_async_database_url(settings.DATABASE_URL))
+        # expire_on_commit=False: атрибуты объектов после commit читаются без ленивой загрузки (в async ее нет)
+        _async_sessionmaker = async_sessionmaker(bind=_async_engine, autoflush=False, expire_on_commit=False)
+    return _async_sessionmaker
+
+
+async def dispose_async_engine():
+    """Закрытие пула соединений asyncpg (соединения привязаны к event loop сервера)"""
+    if _async_engine is not None:
+        await _async_engine.dispose()
+
+
+async def get_async_db():
+    async with get_async_sessionmaker()() as db:
+        yield db
@@ -1,3 +1,4 @@
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.v1 import courses, lessons, steps, chat, quiz, mvp
@@ -36,6 +37,37 @@ app.include_router(steps.router, prefix="/api/v1/steps", tags=["steps"])
 app.include_router(chat.router, prefix="/api/v1", tags=["chat"])
 app.include_router(quiz.router, prefix="/api/v1/steps", tags=["quiz"])
 
+@app.on_event("startup")
+def start_course_watch():
+    # Сброс кэша курсов при изменении scripts/, см. course_watch.py. Бэкенд кэширует только курсы из файлов,
+    # поэтому без LISTEN course_changed (лишнее соединение и поток на каждый worker)
+    # course_watch лежит в корне проекта: путь добавлен в sys.path при импорте mvp
+    import course_watch
+    course_watch.start()
+
+
+@app.on_event("shutdown")
+def stop_course_watch():
+    import course_watch
+    course_watch.stop()
+
+
+@app.on_event("shutdown")
+async def close_llm_client():
+    # Пулы HTTP соединений к LLM (chat.py): event loop сервера (/dialog/message, /dialog/stream)
+    # и event loop потока LLM (синхронные вызовы), который останавливается вместе со своим пулом
+    from app.services import llm_service
+    await llm_service.aclose()
+    await asyncio.to_thread(llm_service.shutdown)
+
+
+@app.on_event("shutdown")
+async def close_async_db():
+    # Пул asyncpg (MVP_DB_MODE=async), создается при первом запросе
+    from app.database import dispose_async_engine
+    await dispose_async_engine()
+
+
 @app.get("/")
 def root():
     return {"message": "ProfoChatBot Web API"}
@@ -10,6 +10,10 @@ from app.models.quiz_attempt import QuizAttempt
 
 # Модели для старой схемы БД (из db.py)
 from app.models.run import Run
+from app.models.run_state import RunState
+from app.models.revision_queue import RevisionQueue
+from app.models.run_score import RunScore
+from app.models.dialog_message import DialogMessage
 from app.models.conversation import Conversation
 from app.models.waiting_element import WaitingElement
 from app.models.course_db import CourseDB
@@ -17,6 +21,8 @@ from app.models.course_element_db import CourseElementDB
 from app.models.banned_participant import BannedParticipant
 from app.models.course_participant import CourseParticipant
 from app.models.course_deployment_db import CourseDeploymentDB
+from app.models.course_module_db import CourseModuleDB
+from app.models.course_version_db import CourseVersionDB
 
 # Модели для Telegram авторизации и мультитенантности
 # UserTelegram - алиас для User (обратная совместимость)
@@ -35,10 +41,16 @@ __all__ = [
     'QuizAttempt',
     # Старая схема БД
     'Run',
+    'RunState',
+    'RevisionQueue',
+    'RunScore',
+    'DialogMessage',
     'Conversation',
     'WaitingElement',
     'CourseDB',
     'CourseElementDB',
+    'CourseModuleDB',
+    'CourseVersionDB',
     'BannedParticipant',
     'CourseParticipant',
     # Telegram auth и мультитенантность
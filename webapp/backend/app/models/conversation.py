@@ -2,6 +2,7 @@
 SQLAlchemy модель для таблицы conversation (история взаимодействий)
 """
 from sqlalchemy import Column, Integer, BigInteger, String, Float, DateTime, Text, ForeignKey
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from app.database import Base
@@ -18,7 +19,8 @@ class Conversation(Base):
     element_id = Column(Text, index=True)
     element_type = Column(Text)
     run_id = Column(Integer, index=True)
-    json = Column(Text)  # JSON строка с данными элемента
+    json = Column(JSONB)  # Данные элемента (jsonb после миграции 0018, до нее text - см. CourseRepository._json_value)
+    course_version = Column(Text, nullable=True)  # Если задана, json хранит только отличия от элемента этой версии курса
     role = Column(Text)  # "user" или "bot"
     report = Column(Text)  # Текст отчета/ответа
     score = Column(Float)
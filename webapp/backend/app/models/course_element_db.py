@@ -3,6 +3,7 @@ SQLAlchemy модель для таблицы course_element (элементы 
 После миграции 0004: course_id теперь INT (FK на course.course_id)
 """
 from sqlalchemy import Column, Integer, String, Text, ForeignKey, BigInteger
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from app.database import Base
 
@@ -16,7 +17,7 @@ class CourseElementDB(Base):
     course_code = Column(String, nullable=True, index=True)  # Старое значение для обратной совместимости
     account_id = Column(Integer, nullable=False, default=1, index=True)
     element_id = Column(String, nullable=True, index=True)  # Может быть NULL согласно setup.sql
-    json = Column(Text)  # JSON данные элемента
+    json = Column(JSONB)  # JSON данные элемента (jsonb после миграции 0017)
     element_type = Column(String, nullable=True)  # Может быть NULL согласно setup.sql
     bot_name = Column(String, nullable=True, index=True)  # Оставляем для обратной совместимости
     
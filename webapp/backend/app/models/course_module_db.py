@@ -0,0 +1,21 @@
+"""
+SQLAlchemy модель для таблицы course_module (границы модулей курсов из БД)
+Таблица заполняется триггерами на course_element (миграция 0009)
+"""
+from sqlalchemy import Column, Integer, String, ForeignKey
+from app.database import Base
+
+
+class CourseModuleDB(Base):
+    """Модель границ модуля курса: куда переходить по "следующий/предыдущий модуль" """
+    __tablename__ = "course_module"
+    
+    course_id = Column(Integer, ForeignKey("course.course_id"), primary_key=True)
+    account_id = Column(Integer, primary_key=True, default=1)
+    module = Column(String, primary_key=True)  # Часть element_id до первого "_" (Ex8_2 -> Ex8)
+    module_order = Column(Integer, nullable=False)
+    first_element_id = Column(String, nullable=False)
+    last_element_id = Column(String, nullable=False)
+    next_element_id = Column(String, nullable=True)  # Первый элемент после первого блока модуля
+    prev_element_id = Column(String, nullable=True)  # Первый элемент предыдущего модуля
+    restart_element_id = Column(String, nullable=True)  # Первый элемент последнего блока модуля
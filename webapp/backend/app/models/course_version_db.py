@@ -0,0 +1,17 @@
+"""
+SQLAlchemy модель для таблицы course_version (версии курсов по хешу содержимого)
+Строки conversation ссылаются на версию и хранят только состояние пользователя (миграция 0011)
+"""
+from sqlalchemy import Column, String, Text, DateTime
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class CourseVersionDB(Base):
+    """Модель версии курса: элементы курса, сохраненные один раз на версию"""
+    __tablename__ = "course_version"
+    
+    course_version = Column(String, primary_key=True)  # sha256 содержимого курса (CompiledCourse.version)
+    course_code = Column(String, nullable=False, index=True)
+    elements = Column(Text, nullable=False)  # JSON: element_id -> element_data
+    date_created = Column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,21 @@
+"""
+SQLAlchemy модель для таблицы dialog_message (сообщения dialog элементов)
+Миграция 0016
+"""
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class DialogMessage(Base):
+    """Модель сообщения диалога: строки только добавляются, история читается по (conversation_id, seq)"""
+    __tablename__ = "dialog_message"
+    
+    conversation_id = Column(Integer, ForeignKey("conversation.conversation_id"), primary_key=True)  # bot строка диалога
+    seq = Column(Integer, primary_key=True)  # Позиция в истории с 0 (system prompt - первое сообщение)
+    run_id = Column(Integer, ForeignKey("run.run_id"), nullable=False)
+    element_id = Column(String, nullable=False)
+    role = Column(String, nullable=False)  # "system", "user" или "assistant"
+    content = Column(Text, nullable=False)
+    token_count = Column(Integer, nullable=True)  # Оценка размера content в токенах
+    date_inserted = Column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,19 @@
+"""
+SQLAlchemy модель для таблицы revision_queue (элементы цепочки повторения ошибок)
+Миграция 0014
+"""
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class RevisionQueue(Base):
+    """Модель элемента цепочки повторения: pending (не показан) -> shown (показан) -> done"""
+    __tablename__ = "revision_queue"
+    
+    run_id = Column(Integer, ForeignKey("run.run_id"), primary_key=True)
+    position = Column(Integer, primary_key=True)  # Растет в пределах сессии
+    element_id = Column(String, nullable=False)
+    revision_element_id = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="pending")
+    date_inserted = Column(DateTime(timezone=True), server_default=func.now())
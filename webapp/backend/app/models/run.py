@@ -19,3 +19,4 @@ class Run(Base):
     utm_source = Column(Text)
     utm_campaign = Column(Text)
     is_ended = Column(Boolean, default=False)
+    course_version = Column(Text, nullable=True)  # Версия курса на момент старта (course_version)
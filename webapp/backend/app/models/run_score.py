@@ -0,0 +1,19 @@
+"""
+SQLAlchemy модель для таблицы run_score (баллы сессии по элементам)
+Таблица поддерживается триггером на conversation (миграция 0015)
+"""
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey
+from app.database import Base
+
+
+class RunScore(Base):
+    """Модель баллов сессии по оцениваемому элементу: последний и лучший ответ, количество попыток"""
+    __tablename__ = "run_score"
+    
+    run_id = Column(Integer, ForeignKey("run.run_id"), primary_key=True)
+    element_id = Column(String, primary_key=True)
+    last_score = Column(Float, nullable=False)
+    last_maxscore = Column(Float, nullable=False)
+    best_score = Column(Float, nullable=False)
+    attempts = Column(Integer, nullable=False, default=1)
+    updated_at = Column(DateTime(timezone=True), nullable=False)
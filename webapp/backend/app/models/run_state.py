@@ -0,0 +1,24 @@
+"""
+SQLAlchemy модель для таблицы run_state (текущая позиция сессии)
+Таблица поддерживается триггерами на run и conversation (миграция 0012)
+"""
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, DateTime, Text, ForeignKey
+from app.database import Base
+
+
+class RunState(Base):
+    """Модель текущего состояния сессии: последние строки conversation и флаг завершения"""
+    __tablename__ = "run_state"
+    
+    run_id = Column(Integer, ForeignKey("run.run_id"), primary_key=True)
+    chat_id = Column(BigInteger, nullable=False)
+    course_id = Column(String, nullable=False)  # course_code, как в run
+    botname = Column(String, nullable=False)
+    course_version = Column(Text, nullable=True)
+    is_ended = Column(Boolean, nullable=False, default=False)
+    conversation_id = Column(Integer, nullable=True)  # Последняя строка conversation (любая роль)
+    element_id = Column(Text, nullable=True)
+    element_type = Column(Text, nullable=True)
+    bot_conversation_id = Column(Integer, nullable=True)  # Последняя строка с role='bot'
+    revision_conversation_id = Column(Integer, nullable=True)  # Последняя bot строка с цепочкой повторения
+    updated_at = Column(DateTime(timezone=True), nullable=True)
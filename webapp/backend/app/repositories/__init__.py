@@ -2,5 +2,6 @@
 Репозитории для работы с базой данных
 """
 from app.repositories.course_repository import CourseRepository
+from app.repositories.async_course_repository import AsyncCourseRepository
 
-__all__ = ['CourseRepository']
+__all__ = ['CourseRepository', 'AsyncCourseRepository']
@@ -0,0 +1,389 @@
+"""
+Async вариант CourseRepository на AsyncSession (SQLAlchemy asyncio, драйвер asyncpg) для MVP_DB_MODE=async
+Запросы те же, что в CourseRepository, но выполняются через await AsyncSession.execute: соединение
+ожидается в event loop, поток из threadpool не нужен. Методы - те, что используют async обработчики MVP
+(навигация по курсу, ответы на элементы, ходы диалога); кэши процесса общие с CourseRepository
+"""
+from contextlib import asynccontextmanager
+from typing import Optional, List, Dict, Tuple, Any
+import logging
+
+from sqlalchemy import func, desc, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.run import Run
+from app.models.run_state import RunState
+from app.models.revision_queue import RevisionQueue
+from app.models.dialog_message import DialogMessage
+from app.models.conversation import Conversation
+from app.models.course_version_db import CourseVersionDB
+from app.repositories.course_repository import (
+    BOT_NAME, RUN_STARTED_AT_MARGIN, MAX_CACHED_RUN_VERSIONS, DIALOG_APPEND_ATTEMPTS,
+    _saved_course_versions, _run_course_versions, _run_started_at, unit_of_work_stats,
+    _json_value, estimate_tokens
+)
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncCourseRepository:
+    """Репозиторий курсов для async обработчиков: await repo.get_active_run_id(...) и т.д."""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+        self.bot_name = BOT_NAME
+        self._unit_depth = 0
+        self.write_count = 0  # Операции записи (без unit of work - commit на каждую)
+        self.commit_count = 0
+        self._after_commit = []  # Действия после успешного commit unit of work
+
+    # ========== Unit of work (одна транзакция на запрос) ==========
+
+    @asynccontextmanager
+    async def unit_of_work(self):
+        """Записи репозитория внутри блока - одна транзакция с одним commit в конце (см. CourseRepository.unit_of_work)"""
+        if self._unit_depth:
+            # Вложенный блок - часть внешней транзакции
+            self._unit_depth += 1
+            try:
+                yield self
+            finally:
+                self._unit_depth -= 1
+            return
+
+        self._unit_depth = 1
+        autoflush = self.db.sync_session.autoflush
+        self.db.sync_session.autoflush = True
+        writes_before = self.write_count
+        try:
+            yield self
+            writes = self.write_count - writes_before
+            if writes:
+                await self.db.commit()
+                self.commit_count += 1
+                unit_of_work_stats["commits"] += 1
+        except BaseException:
+            await self.db.rollback()
+            raise
+        finally:
+            self._unit_depth = 0
+            self.db.sync_session.autoflush = autoflush
+            callbacks, self._after_commit = self._after_commit, []
+        for callback in callbacks:
+            callback()
+        unit_of_work_stats["units"] += 1
+        unit_of_work_stats["writes"] += writes
+        logger.debug(f"unit_of_work: {writes} writes, {1 if writes else 0} commits")
+
+    def after_commit(self, callback) -> None:
+        """callback() после commit записей (внутри unit_of_work - после успешного конца блока)"""
+        if self._unit_depth:
+            self._after_commit.append(callback)
+        else:
+            callback()
+
+    async def _commit(self) -> None:
+        """commit записи; внутри unit_of_work изменения остаются в транзакции до конца блока"""
+        self.write_count += 1
+        if self._unit_depth:
+            return
+        await self.db.commit()
+        self.commit_count += 1
+
+    async def _commit_and_refresh(self, obj) -> None:
+        """commit записи obj с получением первичного ключа (внутри unit_of_work - flush без commit)"""
+        await self._commit()
+        if self._unit_depth:
+            await self.db.flush()
+        else:
+            await self.db.refresh(obj)
+
+    # ========== Run (сессии прохождения курсов) ==========
+
+    async def create_run(self, course_code: str, username: Optional[str], chat_id: int,
+                         utm_source: Optional[str] = None, utm_campaign: Optional[str] = None,
+                         course_version: Optional[str] = None) -> int:
+        """Создание новой сессии прохождения курса по course_code (с версией курса course_version)"""
+        run = Run(
+            course_id=course_code,  # В таблице run course_id остается TEXT (course_code)
+            username=username,
+            chat_id=chat_id,
+            botname=self.bot_name,
+            utm_source=utm_source,
+            utm_campaign=utm_campaign,
+            course_version=course_version
+        )
+        self.db.add(run)
+        await self._commit_and_refresh(run)
+        self._cache_run_course_version(run.run_id, course_version)
+        return run.run_id
+
+    def _cache_run_course_version(self, run_id: int, course_version: Optional[str]) -> None:
+        if len(_run_course_versions) >= MAX_CACHED_RUN_VERSIONS:
+            _run_course_versions.clear()
+        _run_course_versions[run_id] = course_version
+
+    async def get_run_course_version(self, run_id: Optional[int]) -> Optional[str]:
+        """Версия курса сессии (None для сессий без версии)"""
+        if run_id is None:
+            return None
+        if run_id not in _run_course_versions:
+            row = (await self.db.execute(select(Run.course_version).where(Run.run_id == run_id))).first()
+            self._cache_run_course_version(run_id, row.course_version if row else None)
+        return _run_course_versions[run_id]
+
+    async def _run_conversation_filter(self, run_id: int) -> List[Any]:
+        """Условия выборки строк conversation сессии: run_id и нижняя граница date_inserted (начало сессии)"""
+        if run_id not in _run_started_at:
+            row = (await self.db.execute(select(Run.date_inserted).where(Run.run_id == run_id))).first()
+            if not row:
+                return [Conversation.run_id == run_id]
+            if len(_run_started_at) >= MAX_CACHED_RUN_VERSIONS:
+                _run_started_at.clear()
+            _run_started_at[run_id] = row.date_inserted
+        started_at = _run_started_at[run_id]
+        if started_at is None:
+            return [Conversation.run_id == run_id]
+        return [Conversation.run_id == run_id, Conversation.date_inserted >= started_at - RUN_STARTED_AT_MARGIN]
+
+    async def _get_run_conversation(self, run_id: int, conversation_id: int) -> Optional[Conversation]:
+        """Строка conversation сессии по id (указатели run_state) - только в секциях периода сессии"""
+        return (await self.db.execute(select(Conversation).where(
+            Conversation.conversation_id == conversation_id,
+            *await self._run_conversation_filter(run_id)
+        ).limit(1))).scalars().first()
+
+    async def set_course_ended(self, chat_id: int, course_code: Optional[str] = None) -> None:
+        """Отметка курса как завершенного по course_code"""
+        statement = update(Run).where(Run.chat_id == chat_id, Run.botname == self.bot_name)
+        if course_code:
+            statement = statement.where(Run.course_id == course_code)  # В run course_id это course_code
+        await self.db.execute(statement.values(is_ended=True))
+        await self._commit()
+
+    async def get_active_run_id(self, chat_id: int, course_code: str) -> Optional[int]:
+        """ID последней сессии пользователя в курсе, если она не завершена (одно чтение по индексу run_state)"""
+        state = (await self.db.execute(select(RunState.run_id, RunState.is_ended).where(
+            RunState.chat_id == chat_id,
+            RunState.course_id == course_code,
+            RunState.botname == self.bot_name
+        ).order_by(desc(RunState.run_id)).limit(1))).first()
+        if not state or state.is_ended:
+            return None
+        return state.run_id
+
+    async def get_run_state(self, run_id: int) -> Optional[RunState]:
+        """Текущая позиция сессии (run_state поддерживается триггерами, миграция 0012)"""
+        return await self.db.get(RunState, run_id)
+
+    # ========== Course version (версии курсов по хешу содержимого) ==========
+
+    async def save_course_version(self, course_version: str, course_code: str, elements_json: str) -> None:
+        """Сохранение версии курса (один раз на версию, см. CourseRepository.save_course_version)"""
+        if course_version in _saved_course_versions:
+            return
+        exists = (await self.db.execute(select(CourseVersionDB.course_version).where(
+            CourseVersionDB.course_version == course_version
+        ))).first()
+        if not exists:
+            try:
+                # В savepoint: конфликт не откатывает остальные записи транзакции (unit of work)
+                async with self.db.begin_nested():
+                    self.db.add(CourseVersionDB(
+                        course_version=course_version,
+                        course_code=course_code,
+                        elements=elements_json
+                    ))
+                await self._commit()
+            except IntegrityError:
+                # Ту же версию одновременно сохранил другой процесс
+                pass
+        self.after_commit(lambda: _saved_course_versions.add(course_version))
+
+    async def get_course_version_elements(self, course_version: str) -> Optional[str]:
+        """JSON элементов версии курса"""
+        row = (await self.db.execute(select(CourseVersionDB.elements).where(
+            CourseVersionDB.course_version == course_version
+        ))).first()
+        return row.elements if row else None
+
+    async def _get_version_element(self, course_version: str, element_id: str) -> Optional[Dict[str, Any]]:
+        """Определение элемента в версии курса (из кэша процесса, иначе из course_version)"""
+        from course_cache import course_cache
+        compiled = course_cache.get_version(course_version)
+        if compiled is None:
+            elements_json = await self.get_course_version_elements(course_version)
+            if elements_json is None:
+                return None
+            compiled = course_cache.get_version(course_version, loader=lambda _version: elements_json)
+        definition = compiled.json_elements.get(element_id)
+        return definition if isinstance(definition, dict) else None
+
+    async def _pack_conversation_json(self, course_version: Optional[str], element_id: str,
+                                      json_data: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[str]]:
+        """Данные для conversation.json и версия курса, относительно которой они сохранены"""
+        if course_version and isinstance(json_data, dict) and isinstance(json_data.get("element_data"), dict):
+            definition = await self._get_version_element(course_version, element_id)
+            if definition is not None:
+                from course_cache import pack_element_json
+                return pack_element_json(definition, json_data), course_version
+        return json_data, None
+
+    async def load_conversation_json(self, conv: Conversation) -> Dict[str, Any]:
+        """Полные данные элемента из conversation.json (с определением элемента из версии курса)"""
+        json_data = _json_value(conv.json) if conv.json else {}
+        if conv.course_version:
+            definition = await self._get_version_element(conv.course_version, conv.element_id)
+            if definition is None:
+                # Версия курса недоступна: отдаем сохраненное состояние пользователя
+                return json_data
+            from course_cache import unpack_element_json
+            json_data = unpack_element_json(definition, json_data)
+        return json_data
+
+    # ========== Conversation (история взаимодействий) ==========
+
+    async def insert_element(self, chat_id: int, course_id: str, username: Optional[str],
+                             element_id: str, element_type: str, run_id: int,
+                             json_data: Dict[str, Any], role: str, report: Optional[str],
+                             score: Optional[float] = None, maxscore: Optional[float] = None,
+                             need_id: bool = False) -> Optional[int]:
+        """Сохранение элемента в историю (см. CourseRepository.insert_element)"""
+        json_value, course_version = await self._pack_conversation_json(
+            await self.get_run_course_version(run_id), element_id, json_data
+        )
+
+        conversation = Conversation(
+            chat_id=chat_id,
+            course_id=course_id,
+            username=username or "--empty--",
+            element_id=element_id,
+            element_type=element_type,
+            run_id=run_id,
+            json=json_value,
+            course_version=course_version,
+            role=role,
+            report=report,
+            score=score,
+            maxscore=maxscore
+        )
+        self.db.add(conversation)
+        if self._unit_depth and not need_id:
+            await self._commit()
+            return None
+        await self._commit_and_refresh(conversation)
+        return conversation.conversation_id
+
+    async def get_last_bot_conversation(self, run_id: int) -> Optional[Conversation]:
+        """Последняя строка сессии с role='bot' (по указателю из run_state)"""
+        state = await self.get_run_state(run_id)
+        if not state or not state.bot_conversation_id:
+            return None
+        return await self._get_run_conversation(run_id, state.bot_conversation_id)
+
+    async def _get_last_bot_row(self, chat_id: int, course_id: str, run_id: int, element_id: str) -> Optional[Conversation]:
+        """Последняя bot строка элемента в сессии"""
+        return (await self.db.execute(select(Conversation).where(
+            Conversation.chat_id == chat_id,
+            Conversation.course_id == course_id,
+            *await self._run_conversation_filter(run_id),
+            Conversation.element_id == element_id,
+            Conversation.role == 'bot'
+        ).order_by(desc(Conversation.date_inserted), desc(Conversation.conversation_id)).limit(1))).scalars().first()
+
+    async def update_conversation_report(self, chat_id: int, course_id: str, run_id: int,
+                                         element_id: str, report: str) -> None:
+        """Обновление report в последнем bot элементе"""
+        conv = await self._get_last_bot_row(chat_id, course_id, run_id, element_id)
+        if conv:
+            conv.report = report
+            await self._commit()
+
+    # ========== Revision queue (цепочки повторения) ==========
+
+    async def next_revision_element(self, run_id: int, current_element_id: str) -> Tuple[Optional[str], Optional[str]]:
+        """Следующий элемент активной цепочки повторения сессии (см. CourseRepository.next_revision_element)"""
+        items = (await self.db.execute(select(RevisionQueue).where(
+            RevisionQueue.run_id == run_id,
+            RevisionQueue.status.in_(('pending', 'shown'))
+        ).order_by(RevisionQueue.position))).scalars().all()
+        if not items:
+            return None, None
+
+        revision_element_id = items[-1].revision_element_id
+        shown = [item for item in items if item.status == 'shown']
+        pending = [item for item in items if item.status == 'pending']
+        if current_element_id != revision_element_id and not (shown and shown[-1].element_id == current_element_id):
+            for item in items:
+                item.status = 'done'
+            await self._commit()
+            return None, None
+
+        if pending:
+            pending[0].status = 'shown'
+            await self._commit()
+            return pending[0].element_id, revision_element_id
+
+        for item in shown:
+            item.status = 'done'
+        await self._commit()
+        return None, revision_element_id
+
+    # ========== Dialog (история диалогов) ==========
+
+    async def get_dialog_conversation(self, chat_id: int, course_id: str, run_id: int, element_id: str) -> Optional[Dict[str, Any]]:
+        """Получение dialog элемента из conversation"""
+        conv = await self._get_last_bot_row(chat_id, course_id, run_id, element_id)
+        if not conv:
+            return None
+
+        element_data = await self.load_conversation_json(conv)
+        return {
+            "conversation_id": conv.conversation_id,
+            "element_data": element_data.get("element_data", {})
+        }
+
+    async def get_dialog_messages(self, conversation_id: int) -> List[Dict[str, str]]:
+        """История диалога из dialog_message (одно чтение по первичному ключу conversation_id, seq)"""
+        rows = (await self.db.execute(select(DialogMessage.role, DialogMessage.content).where(
+            DialogMessage.conversation_id == conversation_id
+        ).order_by(DialogMessage.seq))).all()
+        return [{"role": row.role, "content": row.content} for row in rows]
+
+    async def get_dialog_history(self, conversation_id: int, element_data: Dict[str, Any]) -> Tuple[List[Dict[str, str]], int]:
+        """История диалога и количество ее сообщений, уже сохраненных в dialog_message"""
+        messages = await self.get_dialog_messages(conversation_id)
+        if messages:
+            return messages, len(messages)
+        return list(element_data.get("conversation") or []), 0
+
+    async def append_dialog_messages(self, conversation_id: int, run_id: int, element_id: str,
+                                     messages: List[Dict[str, str]], start_seq: int, turn_start: int = 0) -> None:
+        """Добавление сообщений в конец истории диалога (см. CourseRepository.append_dialog_messages)"""
+        for _ in range(DIALOG_APPEND_ATTEMPTS):
+            last_seq = (await self.db.execute(select(func.max(DialogMessage.seq)).where(
+                DialogMessage.conversation_id == conversation_id
+            ))).scalar()
+            next_seq = 0 if last_seq is None else last_seq + 1
+            pending = messages if next_seq <= start_seq else messages[turn_start:]
+            try:
+                # В savepoint: конфликт seq с параллельным ходом не откатывает остальные записи транзакции
+                async with self.db.begin_nested():
+                    for seq, message in enumerate(pending, start=next_seq):
+                        content = message.get("content", "")
+                        self.db.add(DialogMessage(
+                            conversation_id=conversation_id,
+                            seq=seq,
+                            run_id=run_id,
+                            element_id=element_id,
+                            role=message.get("role", "user"),
+                            content=content,
+                            token_count=estimate_tokens(content)
+                        ))
+            except IntegrityError:
+                logger.info(f"append_dialog_messages: seq conflict for conversation_id={conversation_id}, retrying")
+                continue
+            await self._commit()
+            return
+        raise RuntimeError(f"append_dialog_messages: conversation_id={conversation_id} is being appended concurrently")
@@ -3,26 +3,68 @@
 Заменяет функции из db.py
 """
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, func, desc
+from sqlalchemy.orm.attributes import flag_modified
+from sqlalchemy import and_, or_, func, desc, cast, Text
 from sqlalchemy.sql import case
 from typing import Optional, List, Dict, Tuple, Any
+from contextlib import contextmanager
 import json
 import os
-from datetime import datetime
+import logging
+from datetime import datetime, timedelta
 
 from app.models.run import Run
+from app.models.run_state import RunState
+from app.models.revision_queue import RevisionQueue
+from app.models.run_score import RunScore
+from app.models.dialog_message import DialogMessage
 from app.models.conversation import Conversation
 from app.models.waiting_element import WaitingElement
 from app.models.course_db import CourseDB
 from app.models.course_element_db import CourseElementDB
 from app.models.course_deployment_db import CourseDeploymentDB
+from app.models.course_module_db import CourseModuleDB
+from app.models.course_version_db import CourseVersionDB
 from app.models.banned_participant import BannedParticipant
 from app.models.course_participant import CourseParticipant
 
 from sqlalchemy import desc
+from sqlalchemy.exc import IntegrityError
 
 BOT_NAME = os.environ.get('BOT_NAME', 'web_bot')
 
+logger = logging.getLogger(__name__)
+
+# Версии курсов, уже сохраненные в course_version этим процессом
+_saved_course_versions = set()
+# run_id -> course_version: версия сессии задается при создании и не меняется
+_run_course_versions = {}
+MAX_CACHED_RUN_VERSIONS = 10000
+# run_id -> начало сессии (run.date_inserted): строки conversation сессии не старше него
+_run_started_at = {}
+# Запас нижней границы date_inserted (timestamp/timestamptz в разных схемах); секции помесячные
+RUN_STARTED_AT_MARGIN = timedelta(days=1)
+# Попыток дописать историю диалога при конфликте seq с параллельным ходом
+DIALOG_APPEND_ATTEMPTS = 5
+
+# Счетчики unit of work процесса: блоки, операции записи в них и фактические commit
+unit_of_work_stats = {"units": 0, "writes": 0, "commits": 0}
+
+
+def _json_value(value: Any) -> Any:
+    """
+    Значение json колонки (conversation.json, course_element.json): jsonb драйвер отдает уже
+    декодированным, text (до миграций 0017/0018) - строкой, которую нужно разобрать
+    """
+    if isinstance(value, (str, bytes)):
+        return json.loads(value)
+    return value
+
+
+def estimate_tokens(text: str) -> int:
+    """Оценка количества токенов в тексте (~4 символа на токен, без токенизатора модели)"""
+    return (len(text or "") + 3) // 4
+
 
 class CourseRepository:
     """Репозиторий для работы с курсами и элементами"""
@@ -30,26 +72,140 @@ class CourseRepository:
     def __init__(self, db: Session):
         self.db = db
         self.bot_name = BOT_NAME
+        self._unit_depth = 0
+        self.write_count = 0  # Операции записи (без unit of work - commit на каждую)
+        self.commit_count = 0
+        self._after_commit = []  # Действия после успешного commit unit of work
+    
+    # ========== Unit of work (одна транзакция на запрос) ==========
+    
+    @contextmanager
+    def unit_of_work(self):
+        """
+        Записи репозитория внутри блока выполняются в одной транзакции с одним commit в конце.
+        Вставки копятся в сессии и отправляются одним flush - перед чтением, которому они нужны
+        (autoflush), или при commit. При исключении все записи блока откатываются.
+        """
+        if self._unit_depth:
+            # Вложенный блок - часть внешней транзакции
+            self._unit_depth += 1
+            try:
+                yield self
+            finally:
+                self._unit_depth -= 1
+            return
+        
+        self._unit_depth = 1
+        autoflush = self.db.autoflush
+        self.db.autoflush = True
+        writes_before = self.write_count
+        try:
+            yield self
+            writes = self.write_count - writes_before
+            if writes:
+                self.db.commit()
+                self.commit_count += 1
+                unit_of_work_stats["commits"] += 1
+        except BaseException:
+            self.db.rollback()
+            raise
+        finally:
+            self._unit_depth = 0
+            self.db.autoflush = autoflush
+            callbacks, self._after_commit = self._after_commit, []
+        for callback in callbacks:
+            callback()
+        unit_of_work_stats["units"] += 1
+        unit_of_work_stats["writes"] += writes
+        logger.debug(f"unit_of_work: {writes} writes, {1 if writes else 0} commits")
+    
+    def after_commit(self, callback) -> None:
+        """
+        callback() после commit записей: внутри unit_of_work - после успешного конца блока
+        (при откате не вызывается), без него - сразу
+        """
+        if self._unit_depth:
+            self._after_commit.append(callback)
+        else:
+            callback()
+    
+    def _commit(self) -> None:
+        """commit записи; внутри unit_of_work изменения остаются в транзакции до конца блока"""
+        self.write_count += 1
+        if self._unit_depth:
+            return
+        self.db.commit()
+        self.commit_count += 1
+    
+    def _commit_and_refresh(self, obj) -> None:
+        """commit записи obj с получением первичного ключа (внутри unit_of_work - flush без commit)"""
+        self._commit()
+        if self._unit_depth:
+            self.db.flush()
+        else:
+            self.db.refresh(obj)
     
     # ========== Run (сессии прохождения курсов) ==========
     
     def create_run(self, course_code: str, username: Optional[str], chat_id: int,
                    utm_source: Optional[str] = None, utm_campaign: Optional[str] = None,
-                   account_id: int = 1) -> int:
-        """Создание новой сессии прохождения курса по course_code"""
+                   account_id: int = 1, course_version: Optional[str] = None) -> int:
+        """
+        Создание новой сессии прохождения курса по course_code
+        course_version - версия курса, к которой привязана сессия (см. save_course_version)
+        """
         run = Run(
             course_id=course_code,  # В таблице run course_id остается TEXT (course_code)
             username=username,
             chat_id=chat_id,
             botname=self.bot_name,
             utm_source=utm_source,
-            utm_campaign=utm_campaign
+            utm_campaign=utm_campaign,
+            course_version=course_version
         )
         self.db.add(run)
-        self.db.commit()
-        self.db.refresh(run)
+        self._commit_and_refresh(run)
+        self._cache_run_course_version(run.run_id, course_version)
         return run.run_id
     
+    def _cache_run_course_version(self, run_id: int, course_version: Optional[str]) -> None:
+        if len(_run_course_versions) >= MAX_CACHED_RUN_VERSIONS:
+            _run_course_versions.clear()
+        _run_course_versions[run_id] = course_version
+    
+    def get_run_course_version(self, run_id: Optional[int]) -> Optional[str]:
+        """Версия курса сессии (None для сессий без версии и курсов из БД)"""
+        if run_id is None:
+            return None
+        if run_id not in _run_course_versions:
+            row = self.db.query(Run.course_version).filter(Run.run_id == run_id).first()
+            self._cache_run_course_version(run_id, row.course_version if row else None)
+        return _run_course_versions[run_id]
+    
+    def _run_conversation_filter(self, run_id: int) -> List[Any]:
+        """
+        Условия выборки строк conversation сессии: run_id и нижняя граница date_inserted (начало сессии).
+        По границе PostgreSQL не читает помесячные секции conversation старше сессии (миграция 0019)
+        """
+        if run_id not in _run_started_at:
+            row = self.db.query(Run.date_inserted).filter(Run.run_id == run_id).first()
+            if not row:
+                return [Conversation.run_id == run_id]
+            if len(_run_started_at) >= MAX_CACHED_RUN_VERSIONS:
+                _run_started_at.clear()
+            _run_started_at[run_id] = row.date_inserted
+        started_at = _run_started_at[run_id]
+        if started_at is None:
+            return [Conversation.run_id == run_id]
+        return [Conversation.run_id == run_id, Conversation.date_inserted >= started_at - RUN_STARTED_AT_MARGIN]
+    
+    def _get_run_conversation(self, run_id: int, conversation_id: int) -> Optional[Conversation]:
+        """Строка conversation сессии по id (указатели run_state) - только в секциях периода сессии"""
+        return self.db.query(Conversation).filter(
+            Conversation.conversation_id == conversation_id,
+            *self._run_conversation_filter(run_id)
+        ).first()
+    
     def get_run_id(self, chat_id: int, course_code: str, account_id: int = 1) -> Optional[int]:
         """Получение ID сессии по chat_id и course_code"""
         run = self.db.query(Run).filter(
@@ -73,21 +229,50 @@ class CourseRepository:
             query = query.filter(Run.course_id == course_code)  # В run course_id это course_code
         
         query.update({Run.is_ended: True})
-        self.db.commit()
+        self._commit()
     
     def is_course_ended(self, chat_id: int, course_code: Optional[str] = None) -> bool:
-        """Проверка завершения курса по course_code"""
-        query = self.db.query(Run).filter(
+        """Проверка завершения курса по course_code (последняя сессия пользователя)"""
+        query = self.db.query(RunState.is_ended).filter(
             and_(
-                Run.chat_id == chat_id,
-                Run.botname == self.bot_name
+                RunState.chat_id == chat_id,
+                RunState.botname == self.bot_name
             )
         )
         if course_code:
-            query = query.filter(Run.course_id == course_code)  # В run course_id это course_code
+            query = query.filter(RunState.course_id == course_code)
         
-        run = query.order_by(desc(Run.date_inserted)).first()
-        return run.is_ended if run and run.is_ended else False
+        state = query.order_by(desc(RunState.run_id)).first()
+        return bool(state and state.is_ended)
+    
+    def get_active_run_id(self, chat_id: int, course_code: str) -> Optional[int]:
+        """ID последней сессии пользователя в курсе, если она не завершена (одно чтение по индексу run_state)"""
+        state = self.db.query(RunState.run_id, RunState.is_ended).filter(
+            and_(
+                RunState.chat_id == chat_id,
+                RunState.course_id == course_code,
+                RunState.botname == self.bot_name
+            )
+        ).order_by(desc(RunState.run_id)).first()
+        if not state or state.is_ended:
+            return None
+        return state.run_id
+    
+    def get_run_state(self, run_id: int) -> Optional[RunState]:
+        """Текущая позиция сессии (run_state поддерживается триггерами, миграция 0012)"""
+        return self.db.get(RunState, run_id)
+    
+    def _get_latest_run_state(self, chat_id: int, bot_name: Optional[str] = None) -> Optional[RunState]:
+        """Сессия пользователя с самой свежей строкой conversation"""
+        query = self.db.query(RunState).filter(
+            and_(
+                RunState.chat_id == chat_id,
+                RunState.conversation_id.isnot(None)
+            )
+        )
+        if bot_name:
+            query = query.filter(RunState.botname == bot_name)
+        return query.order_by(desc(RunState.updated_at)).first()
     
     def get_username_by_chat_id(self, chat_id: int) -> Optional[str]:
         """Получение username по chat_id"""
@@ -99,14 +284,99 @@ class CourseRepository:
         ).order_by(desc(Run.date_inserted)).first()
         return run.username if run else None
     
+    # ========== Course version (версии курсов по хешу содержимого) ==========
+    
+    def save_course_version(self, course_version: str, course_code: str, elements_json: str) -> None:
+        """
+        Сохранение версии курса (один раз на версию, elements_json - CompiledCourse.to_json()).
+        Внутри unit_of_work версия считается сохраненной только после commit блока
+        """
+        if course_version in _saved_course_versions:
+            return
+        exists = self.db.query(CourseVersionDB.course_version).filter(
+            CourseVersionDB.course_version == course_version
+        ).first()
+        if not exists:
+            try:
+                # В savepoint: конфликт не откатывает остальные записи транзакции (unit of work)
+                with self.db.begin_nested():
+                    self.db.add(CourseVersionDB(
+                        course_version=course_version,
+                        course_code=course_code,
+                        elements=elements_json
+                    ))
+                self._commit()
+            except IntegrityError:
+                # Ту же версию одновременно сохранил другой процесс
+                pass
+        self.after_commit(lambda: _saved_course_versions.add(course_version))
+    
+    def get_course_version_elements(self, course_version: str) -> Optional[str]:
+        """JSON элементов версии курса"""
+        row = self.db.query(CourseVersionDB.elements).filter(
+            CourseVersionDB.course_version == course_version
+        ).first()
+        return row.elements if row else None
+    
+    def _get_version_element(self, course_version: str, element_id: str) -> Optional[Dict[str, Any]]:
+        """Определение элемента в версии курса (из кэша процесса, иначе из course_version)"""
+        # course_cache лежит в корне проекта (общий с ботом)
+        from course_cache import course_cache
+        compiled = course_cache.get_version(course_version, loader=self.get_course_version_elements)
+        if compiled is None:
+            return None
+        definition = compiled.json_elements.get(element_id)
+        return definition if isinstance(definition, dict) else None
+    
+    def _pack_conversation_json(self, course_version: Optional[str], element_id: str,
+                                json_data: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[str]]:
+        """
+        Данные для conversation.json и версия курса, относительно которой они сохранены.
+        Если элемент есть в версии курса, сохраняются только отличия от него (состояние пользователя),
+        иначе - полный JSON и версия None
+        """
+        if course_version and isinstance(json_data, dict) and isinstance(json_data.get("element_data"), dict):
+            definition = self._get_version_element(course_version, element_id)
+            if definition is not None:
+                from course_cache import pack_element_json
+                return pack_element_json(definition, json_data), course_version
+        return json_data, None
+    
+    def load_conversation_json(self, conv: Conversation) -> Dict[str, Any]:
+        """Полные данные элемента из conversation.json (с определением элемента из версии курса)"""
+        json_data = _json_value(conv.json) if conv.json else {}
+        if conv.course_version:
+            definition = self._get_version_element(conv.course_version, conv.element_id)
+            if definition is None:
+                # Версия курса недоступна: отдаем сохраненное состояние пользователя
+                return json_data
+            from course_cache import unpack_element_json
+            json_data = unpack_element_json(definition, json_data)
+        return json_data
+    
+    def conversation_json(self, conv: Conversation) -> Optional[str]:
+        """conversation.json в полном виде (как до появления course_version)"""
+        if not conv.course_version:
+            if conv.json is None or isinstance(conv.json, str):
+                return conv.json
+            return json.dumps(conv.json, ensure_ascii=False)
+        return json.dumps(self.load_conversation_json(conv), ensure_ascii=False)
+    
     # ========== Conversation (история взаимодействий) ==========
     
     def insert_element(self, chat_id: int, course_id: str, username: Optional[str],
                       element_id: str, element_type: str, run_id: int,
                       json_data: Dict[str, Any], role: str, report: Optional[str],
-                      score: Optional[float] = None, maxscore: Optional[float] = None) -> int:
-        """Сохранение элемента в историю"""
-        json_string = json.dumps(json_data, ensure_ascii=False)
+                      score: Optional[float] = None, maxscore: Optional[float] = None,
+                      need_id: bool = False) -> Optional[int]:
+        """
+        Сохранение элемента в историю (относительно версии курса сессии, если она есть)
+        Внутри unit_of_work строка отправляется вместе с остальными записями и id возвращается
+        только при need_id=True (для этого нужен отдельный flush)
+        """
+        json_value, course_version = self._pack_conversation_json(
+            self.get_run_course_version(run_id), element_id, json_data
+        )
         
         conversation = Conversation(
             chat_id=chat_id,
@@ -115,31 +385,30 @@ class CourseRepository:
             element_id=element_id,
             element_type=element_type,
             run_id=run_id,
-            json=json_string,
+            json=json_value,
+            course_version=course_version,
             role=role,
             report=report,
             score=score,
             maxscore=maxscore
         )
         self.db.add(conversation)
-        self.db.commit()
-        self.db.refresh(conversation)
+        if self._unit_depth and not need_id:
+            self._commit()
+            return None
+        self._commit_and_refresh(conversation)
         return conversation.conversation_id
     
     def get_current_element(self, chat_id: int) -> Optional[Tuple[int, str, str, str, int, Dict[str, Any]]]:
         """Получение текущего элемента пользователя"""
-        # botname берется из связанной таблицы run
-        conv = self.db.query(Conversation).join(Run).filter(
-            and_(
-                Conversation.chat_id == chat_id,
-                Run.botname == self.bot_name
-            )
-        ).order_by(desc(Conversation.date_inserted)).first()
+        # botname берется из run_state (копия run.botname)
+        state = self._get_latest_run_state(chat_id, self.bot_name)
+        conv = self._get_run_conversation(state.run_id, state.conversation_id) if state and state.conversation_id else None
         
         if not conv:
             return None
         
-        element_data = json.loads(conv.json) if conv.json else {}
+        element_data = self.load_conversation_json(conv)
         return (
             conv.conversation_id,
             conv.element_id,
@@ -151,21 +420,17 @@ class CourseRepository:
     
     def get_current_element_id(self, chat_id: int) -> Optional[str]:
         """Получение ID текущего элемента"""
-        conv = self.db.query(Conversation).filter(
-            Conversation.chat_id == chat_id
-        ).order_by(desc(Conversation.date_inserted)).first()
-        return conv.element_id if conv else None
+        state = self._get_latest_run_state(chat_id)
+        return state.element_id if state else None
     
     def get_current_element_ids(self, chat_id: int) -> Optional[Tuple[str, str, int]]:
         """Получение ID текущего элемента, курса и сессии"""
-        conv = self.db.query(Conversation).filter(
-            Conversation.chat_id == chat_id
-        ).order_by(desc(Conversation.date_inserted)).first()
+        state = self._get_latest_run_state(chat_id)
         
-        if not conv:
+        if not state:
             return None
         
-        return (conv.element_id, conv.course_id, conv.run_id)
+        return (state.element_id, state.course_id, state.run_id)
     
     def get_last_element_of(self, chat_id: int, element_id: str) -> Optional[Tuple[int, str, str, str, int, Dict[str, Any]]]:
         """Получение последнего вхождения конкретного элемента (возвращает кортеж как в db.py)"""
@@ -174,12 +439,12 @@ class CourseRepository:
                 Conversation.chat_id == chat_id,
                 Conversation.element_id == element_id
             )
-        ).order_by(desc(Conversation.date_inserted)).first()
+        ).order_by(desc(Conversation.date_inserted), desc(Conversation.conversation_id)).first()
         
         if not conv:
             return None
         
-        element_data = json.loads(conv.json) if conv.json else {}
+        element_data = self.load_conversation_json(conv)
         return (
             conv.conversation_id,
             conv.element_id,
@@ -194,7 +459,7 @@ class CourseRepository:
         count = self.db.query(func.count(Conversation.conversation_id)).filter(
             and_(
                 Conversation.element_type == element_type,
-                Conversation.run_id == run_id
+                *self._run_conversation_filter(run_id)
             )
         ).scalar()
         return count or 0
@@ -203,7 +468,7 @@ class CourseRepository:
         """Получение ошибок для повторения"""
         convs = self.db.query(Conversation).filter(
             and_(
-                Conversation.run_id == run_id,
+                *self._run_conversation_filter(run_id),
                 Conversation.element_id.like(f"{prefix}%"),
                 Conversation.score != 1.0
             )
@@ -211,44 +476,38 @@ class CourseRepository:
         
         result = []
         for conv in convs:
-            element_data = json.loads(conv.json) if conv.json else {}
+            element_data = self.load_conversation_json(conv)
             result.append({conv.element_id: element_data})
         
         return result
     
     def get_revision_elements(self, run_id: int, prefix: str, limit: int = 2) -> List[Dict[str, Any]]:
         """Получение элементов для повторения (правильные ответы, случайный порядок)"""
-        # В оригинале используется ORDER BY RANDOM(), но SQLAlchemy не поддерживает это напрямую
-        # Используем Python random для перемешивания
-        import random
+        # Случайная выборка в БД: читаются только limit строк
         convs = self.db.query(Conversation).filter(
             and_(
-                Conversation.run_id == run_id,
+                *self._run_conversation_filter(run_id),
                 Conversation.element_id.like(f"{prefix}%"),
                 Conversation.score == 1.0  # Правильные ответы
             )
-        ).all()
-        
-        # Перемешиваем и берем limit элементов
-        random.shuffle(convs)
-        convs = convs[:limit]
+        ).order_by(func.random()).limit(limit).all()
         
         result = []
         for conv in convs:
-            element_data = json.loads(conv.json) if conv.json else {}
+            element_data = self.load_conversation_json(conv)
             result.append({conv.element_id: element_data})
         
         return result
     
     def get_total_score(self, run_id: int, prefix: str) -> Tuple[float, float]:
-        """Подсчет общего балла"""
+        """Подсчет общего балла: последние ответы на элементы с префиксом (из run_score)"""
         result = self.db.query(
-            func.sum(Conversation.score).label('total_score'),
-            func.sum(Conversation.maxscore).label('max_score')
+            func.sum(RunScore.last_score).label('total_score'),
+            func.sum(RunScore.last_maxscore).label('max_score')
         ).filter(
             and_(
-                Conversation.run_id == run_id,
-                Conversation.element_id.like(f"{prefix}%")
+                RunScore.run_id == run_id,
+                RunScore.element_id.like(f"{prefix}%")
             )
         ).first()
         
@@ -256,6 +515,98 @@ class CourseRepository:
         max_score = float(result.max_score) if result.max_score else 0.0
         return (total_score, max_score)
     
+    def get_run_score_totals(self, course_id: str, prefix: str = "",
+                             bot_name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Баллы всех сессий курса по элементам с префиксом (для статистики по группе)"""
+        rows = self.db.query(
+            Run.run_id,
+            Run.chat_id,
+            Run.username,
+            func.sum(RunScore.last_score).label('total_score'),
+            func.sum(RunScore.last_maxscore).label('max_score'),
+            func.sum(RunScore.best_score).label('best_score'),
+            func.count(RunScore.element_id).label('answered')
+        ).join(
+            RunScore, RunScore.run_id == Run.run_id
+        ).filter(
+            and_(
+                Run.course_id == course_id,
+                Run.botname == (bot_name or self.bot_name),
+                RunScore.element_id.like(f"{prefix}%")
+            )
+        ).group_by(Run.run_id, Run.chat_id, Run.username).order_by(Run.run_id).all()
+        
+        return [
+            {
+                "run_id": row.run_id,
+                "chat_id": row.chat_id,
+                "username": row.username,
+                "score": float(row.total_score or 0.0),
+                "maxscore": float(row.max_score or 0.0),
+                "best_score": float(row.best_score or 0.0),
+                "answered": row.answered
+            }
+            for row in rows
+        ]
+    
+    # ========== Revision queue (цепочка повторения) ==========
+    
+    def start_revision_queue(self, run_id: int, revision_element_id: str, element_ids: List[str]) -> None:
+        """Новая цепочка повторения: незавершенная предыдущая закрывается"""
+        self.db.query(RevisionQueue).filter(
+            and_(
+                RevisionQueue.run_id == run_id,
+                RevisionQueue.status != 'done'
+            )
+        ).update({RevisionQueue.status: 'done'}, synchronize_session=False)
+        last_position = self.db.query(func.max(RevisionQueue.position)).filter(
+            RevisionQueue.run_id == run_id
+        ).scalar() or 0
+        for i, element_id in enumerate(element_ids, start=last_position + 1):
+            self.db.add(RevisionQueue(
+                run_id=run_id,
+                position=i,
+                element_id=element_id,
+                revision_element_id=revision_element_id,
+                status='pending'
+            ))
+        self._commit()
+    
+    def next_revision_element(self, run_id: int, current_element_id: str) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Следующий элемент активной цепочки повторения сессии: (element_id, revision_element_id)
+        Цепочка активна, пока пользователь на revision элементе или на последнем показанном элементе цепочки.
+        (None, revision_element_id) - цепочка только что закончилась, курс продолжается после revision элемента;
+        (None, None) - активной цепочки нет (если пользователь ушел из цепочки, она закрывается)
+        """
+        items = self.db.query(RevisionQueue).filter(
+            and_(
+                RevisionQueue.run_id == run_id,
+                RevisionQueue.status.in_(('pending', 'shown'))
+            )
+        ).order_by(RevisionQueue.position).all()
+        if not items:
+            return None, None
+        
+        revision_element_id = items[-1].revision_element_id
+        shown = [item for item in items if item.status == 'shown']
+        pending = [item for item in items if item.status == 'pending']
+        if current_element_id != revision_element_id and not (shown and shown[-1].element_id == current_element_id):
+            for item in items:
+                item.status = 'done'
+            self._commit()
+            return None, None
+        
+        if pending:
+            pending[0].status = 'shown'
+            self._commit()
+            return pending[0].element_id, revision_element_id
+        
+        for item in shown:
+            item.status = 'done'
+        self._commit()
+        return None, revision_element_id
+    
     # ========== Waiting Element (отложенные элементы) ==========
     
     def add_waiting_element(self, chat_id: int, waiting_till_date: Optional[datetime] = None,
@@ -271,8 +622,7 @@ class CourseRepository:
             botname=self.bot_name
         )
         self.db.add(waiting)
-        self.db.commit()
-        self.db.refresh(waiting)
+        self._commit_and_refresh(waiting)
         return waiting.waiting_element_id
     
     def get_active_waiting_elements(self) -> List[Tuple[int, int, Optional[str], Optional[str]]]:
@@ -296,7 +646,7 @@ class CourseRepository:
         
         if waiting:
             waiting.is_waiting = False
-            self.db.commit()
+            self._commit()
     
     # ========== Course DB (метаданные курсов) ==========
     
@@ -376,7 +726,7 @@ class CourseRepository:
         for elem in elements:
             if not elem.element_id:  # Пропускаем элементы без element_id
                 continue
-            json_data = json.loads(elem.json) if elem.json else {}
+            json_data = _json_value(elem.json) if elem.json else {}
             element_data = json_data.get("element_data", {})
             result[elem.element_id] = element_data
         
@@ -437,26 +787,18 @@ class CourseRepository:
         for element_id, element_data in course_data.items():
             element_type = element_data.get("type", "message")
             
-            # Формируем JSON строку
-            if course_script is None:
-                # Из Google Sheets - стандартная сериализация
-                json_string = json.dumps({"element_data": element_data})
-            else:
-                # Из generator/editor - с ensure_ascii=False для кириллицы
-                json_string = json.dumps({"element_data": element_data}, ensure_ascii=False)
-            
             course_element = CourseElementDB(
                 course_id=course_id_int,  # Используем INT course_id
                 course_code=course_code,  # Сохраняем course_code для обратной совместимости
                 account_id=account_id,
                 bot_name=bot_name,
                 element_id=element_id,
-                json=json_string,
+                json={"element_data": element_data},
                 element_type=element_type
             )
             self.db.add(course_element)
         
-        self.db.commit()
+        self._commit()
     
     def insert_course_element(self, course_code: str, element_id: str, json_data: Dict[str, Any],
                               element_type: str, bot_name: Optional[str] = None, account_id: int = 1) -> Optional[int]:
@@ -474,20 +816,17 @@ class CourseRepository:
         if not course:
             return None
         
-        json_string = json.dumps(json_data, ensure_ascii=False)
-        
         course_element = CourseElementDB(
             course_id=course.course_id,  # Используем INT course_id
             course_code=course_code,
             account_id=account_id,
             bot_name=bot_name,
             element_id=element_id,
-            json=json_string,
+            json=json_data,
             element_type=element_type
         )
         self.db.add(course_element)
-        self.db.commit()
-        self.db.refresh(course_element)
+        self._commit_and_refresh(course_element)
         return course_element.course_element_id
     
     def get_element_from_course_by_id(self, course_code: str, element_id: str, account_id: int = 1) -> Optional[Tuple[str, Dict[str, Any]]]:
@@ -514,7 +853,7 @@ class CourseRepository:
         if not element or not element.element_id:
             return None
         
-        element_data = json.loads(element.json) if element.json else {}
+        element_data = _json_value(element.json) if element.json else {}
         return (element.element_id, element_data)
     
     def get_first_element_from_course(self, course_code: str, account_id: int = 1) -> Optional[Tuple[str, Dict[str, Any]]]:
@@ -540,7 +879,7 @@ class CourseRepository:
         if not element or not element.element_id:
             return None
         
-        element_data = json.loads(element.json) if element.json else {}
+        element_data = _json_value(element.json) if element.json else {}
         return (element.element_id, element_data)
     
     def get_next_course_element_by_id(self, course_code: str, element_id: str, account_id: int = 1) -> Optional[Tuple[str, Dict[str, Any]]]:
@@ -580,44 +919,45 @@ class CourseRepository:
         if not next_element or not next_element.element_id:
             return None
         
-        element_data = json.loads(next_element.json) if next_element.json else {}
+        element_data = _json_value(next_element.json) if next_element.json else {}
         return (next_element.element_id, element_data)
     
-    def get_other_module_course_element_id(self, course_id: str, element_id: str,
-                                          module: str, shift: int) -> Optional[str]:
-        """Получение ID элемента из другого модуля (для навигации вперед/назад)"""
-        # TODO: поддержка shift == -1 (назад) пока не реализована
-        if shift != 1:
-            return None
-        
-        # Находим максимальный course_element_id для текущего модуля
-        from sqlalchemy import func as sql_func, case
-        
-        # Получаем все элементы текущего модуля
-        module_elements = self.db.query(CourseElementDB).filter(
+    def get_other_module_course_element_id(self, course_code: str, element_id: str,
+                                          module: str, shift: int, account_id: int = 1) -> Optional[str]:
+        """
+        Получение ID элемента из другого модуля (shift=1 - следующий модуль, shift=-1 - предыдущий)
+        Границы модулей берутся из таблицы course_module (поддерживается триггерами на course_element)
+        """
+        course = self.db.query(CourseDB).filter(
             and_(
-                CourseElementDB.course_id == course_id,
-                CourseElementDB.bot_name == self.bot_name,
-                CourseElementDB.element_id.like(f"{module}_%")
+                CourseDB.course_code == course_code,
+                CourseDB.account_id == account_id
             )
-        ).all()
+        ).first()
         
-        if not module_elements:
+        if not course:
             return None
         
-        # Находим максимальный ID среди элементов модуля
-        max_id = max(elem.id for elem in module_elements)
-        
-        # Находим следующий элемент после максимального ID текущего модуля
-        next_element = self.db.query(CourseElementDB).filter(
+        entry = self.db.query(CourseModuleDB).filter(
             and_(
-                CourseElementDB.course_id == course_id,
-                CourseElementDB.bot_name == self.bot_name,
-                CourseElementDB.id > max_id
+                CourseModuleDB.course_id == course.course_id,
+                CourseModuleDB.account_id == account_id,
+                CourseModuleDB.module == module
             )
-        ).order_by(CourseElementDB.id).first()
+        ).first()
         
-        return next_element.element_id if next_element else None
+        if not entry:
+            return None
+        
+        if shift == 1:
+            # Для последнего модуля - последний элемент курса
+            return entry.next_element_id or entry.last_element_id
+        if shift == -1:
+            # На последнем элементе курса "предыдущий модуль" - начало текущего
+            if entry.next_element_id is None and element_id == entry.last_element_id:
+                return entry.restart_element_id
+            return entry.prev_element_id
+        return None
     
     # ========== Banned Participants ==========
     
@@ -659,7 +999,7 @@ class CourseRepository:
             self.db.merge(banned)  # Используем merge для избежания дубликатов
             ban_count += 1
         
-        self.db.commit()
+        self._commit()
         return ban_count
     
     def check_user_banned(self, chat_id: int) -> bool:
@@ -713,7 +1053,7 @@ class CourseRepository:
             ).delete()
             count += deleted
         
-        self.db.commit()
+        self._commit()
         return count
     
     def get_creators(self) -> List[int]:
@@ -727,27 +1067,33 @@ class CourseRepository:
     
     def get_revision_conversation(self, chat_id: int, course_id: str, run_id: int) -> Optional[Tuple[str, str, str, str, int]]:
         """Получение последней записи с revision данными"""
-        conv = self.db.query(Conversation).filter(
-            and_(
-                Conversation.chat_id == chat_id,
-                Conversation.course_id == course_id,
-                Conversation.run_id == run_id,
-                Conversation.role == 'bot',
-                Conversation.json.like('%"revision"%')
-            )
-        ).order_by(desc(Conversation.date_inserted)).first()
+        conv = self.get_revision_conversation_row(run_id)
         
-        if not conv:
+        if not conv or conv.chat_id != chat_id:
             return None
         
         return (
             conv.element_id,
             conv.element_type,
-            conv.json,
+            self.conversation_json(conv),
             conv.report,
             conv.conversation_id
         )
     
+    def get_revision_conversation_row(self, run_id: int) -> Optional[Conversation]:
+        """Последняя bot строка сессии с цепочкой повторения (по указателю из run_state)"""
+        state = self.get_run_state(run_id)
+        if not state or not state.revision_conversation_id:
+            return None
+        return self._get_run_conversation(run_id, state.revision_conversation_id)
+    
+    def get_last_bot_conversation(self, run_id: int) -> Optional[Conversation]:
+        """Последняя строка сессии с role='bot' (по указателю из run_state)"""
+        state = self.get_run_state(run_id)
+        if not state or not state.bot_conversation_id:
+            return None
+        return self._get_run_conversation(run_id, state.bot_conversation_id)
+    
     def update_conversation_json(self, conversation_id: int, json_data: Dict[str, Any]) -> None:
         """Обновление JSON данных в conversation"""
         conv = self.db.query(Conversation).filter(
@@ -755,8 +1101,9 @@ class CourseRepository:
         ).first()
         
         if conv:
-            conv.json = json.dumps(json_data, ensure_ascii=False)
-            self.db.commit()
+            conv.json, conv.course_version = self._pack_conversation_json(conv.course_version, conv.element_id, json_data)
+            flag_modified(conv, "json")  # данные могли измениться на месте (тот же объект)
+            self._commit()
     
     def get_conversation_by_id(self, conversation_id: int) -> Optional[Dict[str, Any]]:
         """Получение conversation по ID для проверки"""
@@ -769,7 +1116,7 @@ class CourseRepository:
         
         return {
             "conversation_id": conv.conversation_id,
-            "json": conv.json,
+            "json": self.conversation_json(conv),
             "score": conv.score,
             "maxscore": conv.maxscore,
             "role": conv.role
@@ -782,51 +1129,62 @@ class CourseRepository:
             and_(
                 Conversation.chat_id == chat_id,
                 Conversation.course_id == course_id,
-                Conversation.run_id == run_id,
+                *self._run_conversation_filter(run_id),
                 Conversation.element_id == element_id,
                 Conversation.role == 'bot'
             )
-        ).order_by(desc(Conversation.date_inserted)).first()
+        ).order_by(desc(Conversation.date_inserted), desc(Conversation.conversation_id)).first()
         
         if conv:
             conv.report = report
-            self.db.commit()
+            self._commit()
+    
+    def _get_last_user_responses(self, chat_id: int, course_id: str, run_id: int,
+                                 element_ids: List[str]) -> Dict[str, Conversation]:
+        """
+        Последний ответ пользователя для каждого элемента одним запросом (DISTINCT ON element_id)
+        Приоритет: записи с score и maxscore не NULL, затем записи с непустым JSON
+        """
+        if not element_ids:
+            return {}
+        rows = self.db.query(Conversation).filter(
+            and_(
+                Conversation.chat_id == chat_id,
+                Conversation.course_id == course_id,
+                *self._run_conversation_filter(run_id),
+                Conversation.element_id.in_(element_ids),
+                Conversation.role == 'user',
+                or_(
+                    and_(Conversation.score.isnot(None), Conversation.maxscore.isnot(None)),
+                    and_(Conversation.json.isnot(None), cast(Conversation.json, Text).notin_(('{}', 'null')))
+                )
+            )
+        ).distinct(Conversation.element_id).order_by(
+            Conversation.element_id,
+            desc(Conversation.score.isnot(None)),
+            desc(Conversation.date_inserted),
+            desc(Conversation.conversation_id)
+        ).all()
+        return {conv.element_id: conv for conv in rows}
     
     def get_user_responses_for_elements(self, chat_id: int, course_id: str, run_id: int,
                                        elements_with_prefix: List[Tuple[str, str, Dict[str, Any]]]) -> List[Dict[str, Any]]:
-        """Получение ответов пользователя для элементов (для test элементов)"""
+        """Получение ответов пользователя для элементов (для test элементов), в порядке элементов"""
+        responses = self._get_last_user_responses(
+            chat_id, course_id, run_id, [element_id for element_id, _, _ in elements_with_prefix]
+        )
         results = []
         
         for element_id, element_type, element_data in elements_with_prefix:
-            # Ищем последний ответ пользователя для этого элемента
-            conv = self.db.query(Conversation).filter(
-                and_(
-                    Conversation.chat_id == chat_id,
-                    Conversation.course_id == course_id,
-                    Conversation.run_id == run_id,
-                    Conversation.element_id == element_id,
-                    Conversation.role == 'user',
-                    or_(
-                        and_(Conversation.score.isnot(None), Conversation.maxscore.isnot(None)),
-                        and_(Conversation.json.isnot(None), Conversation.json != '{}', Conversation.json != 'null')
-                    )
-                )
-            ).order_by(
-                # Приоритет: записи с score и maxscore не NULL, затем записи с непустым JSON
-                desc(Conversation.score.isnot(None)),
-                desc(Conversation.date_inserted)
-            ).first()
-            
+            conv = responses.get(element_id)
             if conv:
-                json_str = conv.json if conv.json else None
-                db_score = conv.score
-                db_maxscore = conv.maxscore
+                json_str = self.conversation_json(conv) if conv.json else None
                 
                 results.append({
                     "element_id": element_id,
                     "json": json_str,
-                    "score": db_score,
-                    "maxscore": db_maxscore,
+                    "score": conv.score,
+                    "maxscore": conv.maxscore,
                     "conversation_id": conv.conversation_id
                 })
         
@@ -834,43 +1192,46 @@ class CourseRepository:
     
     def get_test_scores(self, chat_id: int, course_id: str, run_id: int,
                        elements_with_prefix: List[Tuple[str, str, Dict[str, Any]]]) -> Tuple[float, float]:
-        """Подсчет баллов для test элементов"""
+        """
+        Подсчет баллов для test элементов
+        Баллы берутся из run_score (последний ответ с score/maxscore); ответы, где балл есть только в JSON, -
+        из conversation, только для элементов без строки в run_score
+        """
+        element_ids = [element_id for element_id, _, _ in elements_with_prefix]
         total_score = 0.0
         total_max_score = 0.0
+        if not element_ids:
+            return (total_score, total_max_score)
         
-        for element_id, element_type, element_data in elements_with_prefix:
-            conv = self.db.query(Conversation).filter(
-                and_(
-                    Conversation.chat_id == chat_id,
-                    Conversation.course_id == course_id,
-                    Conversation.run_id == run_id,
-                    Conversation.element_id == element_id,
-                    Conversation.role == 'user',
-                    or_(
-                        and_(Conversation.score.isnot(None), Conversation.maxscore.isnot(None)),
-                        and_(Conversation.json.isnot(None), Conversation.json != '{}', Conversation.json != 'null')
-                    )
-                )
-            ).order_by(
-                desc(Conversation.score.isnot(None)),
-                desc(Conversation.date_inserted)
-            ).first()
-            
-            if conv:
-                if conv.score is not None and conv.maxscore is not None:
-                    total_score += float(conv.score)
-                    total_max_score += float(conv.maxscore)
-                elif conv.json:
-                    try:
-                        json_data = json.loads(conv.json)
-                        if isinstance(json_data, dict):
-                            score = json_data.get("score")
-                            maxscore = json_data.get("maxscore")
-                            if score is not None and maxscore is not None:
-                                total_score += float(score)
-                                total_max_score += float(maxscore)
-                    except (json.JSONDecodeError, ValueError):
-                        pass
+        scores = self.db.query(RunScore).filter(
+            and_(
+                RunScore.run_id == run_id,
+                RunScore.element_id.in_(element_ids)
+            )
+        ).all()
+        for run_score in scores:
+            total_score += float(run_score.last_score)
+            total_max_score += float(run_score.last_maxscore)
+        
+        scored_ids = {run_score.element_id for run_score in scores}
+        missing_ids = [element_id for element_id in element_ids if element_id not in scored_ids]
+        responses = self._get_last_user_responses(chat_id, course_id, run_id, missing_ids)
+        
+        for conv in responses.values():
+            if conv.score is not None and conv.maxscore is not None:
+                total_score += float(conv.score)
+                total_max_score += float(conv.maxscore)
+            elif conv.json:
+                try:
+                    json_data = self.load_conversation_json(conv)
+                    if isinstance(json_data, dict):
+                        score = json_data.get("score")
+                        maxscore = json_data.get("maxscore")
+                        if score is not None and maxscore is not None:
+                            total_score += float(score)
+                            total_max_score += float(maxscore)
+                except (json.JSONDecodeError, ValueError):
+                    pass
         
         return (total_score, total_max_score)
     
@@ -880,20 +1241,19 @@ class CourseRepository:
             and_(
                 Conversation.chat_id == chat_id,
                 Conversation.course_id == course_id,
-                Conversation.run_id == run_id,
+                *self._run_conversation_filter(run_id),
                 Conversation.element_id == element_id,
                 Conversation.role == 'bot'
             )
-        ).order_by(desc(Conversation.date_inserted)).first()
+        ).order_by(desc(Conversation.date_inserted), desc(Conversation.conversation_id)).first()
         
         if not conv:
             return None
         
-        element_data = json.loads(conv.json) if conv.json else {}
+        element_data = self.load_conversation_json(conv)
         return {
             "conversation_id": conv.conversation_id,
-            "element_data": element_data.get("element_data", {}),
-            "json": conv.json
+            "element_data": element_data.get("element_data", {})
         }
     
     def update_dialog_conversation(self, conversation_id: int, conversation_history: List[Dict[str, str]]) -> None:
@@ -903,7 +1263,61 @@ class CourseRepository:
         ).first()
         
         if conv:
-            element_data = json.loads(conv.json) if conv.json else {}
+            element_data = self.load_conversation_json(conv)
             element_data["element_data"]["conversation"] = conversation_history
-            conv.json = json.dumps(element_data, ensure_ascii=False)
-            self.db.commit()
+            conv.json, conv.course_version = self._pack_conversation_json(conv.course_version, conv.element_id, element_data)
+            flag_modified(conv, "json")  # данные могли измениться на месте (тот же объект)
+            self._commit()
+    
+    # ========== Dialog messages (история диалогов) ==========
+    
+    def get_dialog_messages(self, conversation_id: int) -> List[Dict[str, str]]:
+        """История диалога из dialog_message (одно чтение по первичному ключу conversation_id, seq)"""
+        rows = self.db.query(DialogMessage.role, DialogMessage.content).filter(
+            DialogMessage.conversation_id == conversation_id
+        ).order_by(DialogMessage.seq).all()
+        return [{"role": row.role, "content": row.content} for row in rows]
+    
+    def get_dialog_history(self, conversation_id: int, element_data: Dict[str, Any]) -> Tuple[List[Dict[str, str]], int]:
+        """
+        История диалога и количество ее сообщений, уже сохраненных в dialog_message
+        Диалоги, начатые до миграции 0016, читаются из element_data.conversation (сохранено 0 сообщений)
+        """
+        messages = self.get_dialog_messages(conversation_id)
+        if messages:
+            return messages, len(messages)
+        return list(element_data.get("conversation") or []), 0
+    
+    def append_dialog_messages(self, conversation_id: int, run_id: int, element_id: str,
+                               messages: List[Dict[str, str]], start_seq: int, turn_start: int = 0) -> None:
+        """
+        Добавление сообщений в конец истории диалога; существующие строки не меняются
+        messages - продолжение истории с seq start_seq. Если параллельный ход уже дописал историю,
+        после его сообщений добавляются только messages[turn_start:] (сообщения этого хода)
+        """
+        for _ in range(DIALOG_APPEND_ATTEMPTS):
+            last_seq = self.db.query(func.max(DialogMessage.seq)).filter(
+                DialogMessage.conversation_id == conversation_id
+            ).scalar()
+            next_seq = 0 if last_seq is None else last_seq + 1
+            pending = messages if next_seq <= start_seq else messages[turn_start:]
+            try:
+                # В savepoint: конфликт seq с параллельным ходом не откатывает остальные записи транзакции
+                with self.db.begin_nested():
+                    for seq, message in enumerate(pending, start=next_seq):
+                        content = message.get("content", "")
+                        self.db.add(DialogMessage(
+                            conversation_id=conversation_id,
+                            seq=seq,
+                            run_id=run_id,
+                            element_id=element_id,
+                            role=message.get("role", "user"),
+                            content=content,
+                            token_count=estimate_tokens(content)
+                        ))
+            except IntegrityError:
+                logger.info(f"append_dialog_messages: seq conflict for conversation_id={conversation_id}, retrying")
+                continue
+            self._commit()
+            return
+        raise RuntimeError(f"append_dialog_messages: conversation_id={conversation_id} is being appended concurrently")
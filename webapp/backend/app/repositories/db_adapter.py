@@ -52,15 +52,25 @@ def _get_repo_or_db():
 # Функции, совместимые с db.py API
 
 def create_run(course_id: str, username: Optional[str], chat_id: int, 
-               utm_source: Optional[str] = None, utm_campaign: Optional[str] = None) -> int:
-    """Создание новой сессии прохождения курса"""
+               utm_source: Optional[str] = None, utm_campaign: Optional[str] = None,
+               course_version: Optional[str] = None) -> int:
+    """Создание новой сессии прохождения курса (course_version - версия курса, к которой привязана сессия)"""
     repo_or_db = _get_repo_or_db()
-    if hasattr(repo_or_db, 'create_run'):
-        return repo_or_db.create_run(course_id, username, chat_id, utm_source, utm_campaign)
+    if repo_or_db is _current_repo:
+        return repo_or_db.create_run(course_id, username, chat_id, utm_source, utm_campaign,
+                                     course_version=course_version)
     else:
+        # В db_old версий курса нет
         return _original_db.create_run(course_id, username, chat_id, utm_source, utm_campaign)
 
 
+def save_course_version(course_version: str, course_code: str, elements_json: str) -> None:
+    """Сохранение версии курса (в db_old версий нет - ничего не делает)"""
+    repo_or_db = _get_repo_or_db()
+    if hasattr(repo_or_db, 'save_course_version'):
+        repo_or_db.save_course_version(course_version, course_code, elements_json)
+
+
 def get_run_id(chat_id: int, course_id: str) -> Optional[int]:
     """Получение ID сессии по chat_id и course_id"""
     repo_or_db = _get_repo_or_db()
@@ -174,6 +184,21 @@ def get_revision_elements(run_id: int, prefix: str, limit: int = 2) -> List[Dict
         return _original_db.get_revision_elements(run_id, prefix, limit)
 
 
+def start_revision_queue(run_id: int, revision_element_id: str, element_ids: List[str]) -> None:
+    """Новая цепочка повторения (revision_queue; в db_old таблицы нет - ничего не делает)"""
+    repo_or_db = _get_repo_or_db()
+    if hasattr(repo_or_db, 'start_revision_queue'):
+        repo_or_db.start_revision_queue(run_id, revision_element_id, element_ids)
+
+
+def next_revision_element(run_id: int, current_element_id: str) -> Tuple[Optional[str], Optional[str]]:
+    """Следующий элемент активной цепочки повторения: (element_id, revision_element_id), в db_old цепочек нет"""
+    repo_or_db = _get_repo_or_db()
+    if hasattr(repo_or_db, 'next_revision_element'):
+        return repo_or_db.next_revision_element(run_id, current_element_id)
+    return None, None
+
+
 def get_total_score(run_id: int, prefix: str) -> Tuple[float, float]:
     """Подсчет общего балла"""
     repo_or_db = _get_repo_or_db()
@@ -3,8 +3,9 @@ import sys
 import os
 import asyncio
 import logging
+import threading
 from pathlib import Path
-from typing import Optional
+from typing import AsyncIterator, Optional
 
 logger = logging.getLogger(__name__)
 
@@ -75,7 +76,10 @@ def _prepare_conversation_and_prompt(messages: list[dict]) -> tuple[list[dict],
 def _prepare_params(
     model: Optional[str], 
     temperature: Optional[float] = None, 
-    reasoning: Optional[str] = None
+    reasoning: Optional[str] = None,
+    cache: bool = False,
+    cache_ttl: Optional[int] = None,
+    max_context_tokens: Optional[int] = None
 ) -> dict:
     """
     Подготовка параметров для chat.get_reply.
@@ -84,6 +88,9 @@ def _prepare_params(
         model: Идентификатор модели
         temperature: Температура для стандартных моделей
         reasoning: Reasoning effort для reasoning моделей
+        cache: Кэш ответов chat.py для элемента
+        cache_ttl: Время жизни ответа в кэше в секундах
+        max_context_tokens: Бюджет токенов истории, отправляемой модели
     
     Returns:
         dict: Параметры для chat.get_reply
@@ -113,38 +120,84 @@ def _prepare_params(
         # Стандартные модели используют temperature
         params["temperature"] = temperature if temperature is not None else 0.0
     
+    if cache:
+        params["cache"] = True
+        params["cache_ttl"] = cache_ttl
+    if max_context_tokens:
+        params["max_context_tokens"] = max_context_tokens
+    
     return params
 
-def _call_async_chat(conversation: list[dict], new_prompt: str, params: dict) -> tuple[str, list[dict]]:
-    """
-    Обертка для вызова async chat.get_reply из sync контекста.
-    
-    Args:
-        conversation: История разговора
-        new_prompt: Новое сообщение пользователя
-        params: Параметры модели
-    
-    Returns:
-        tuple: (reply, updated_conversation)
-    """
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
+# Event loop в отдельном потоке для вызовов chat.py из sync обработчиков: один на процесс,
+# чтобы пул соединений chat.py (привязан к event loop) переиспользовался между запросами
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    """Event loop потока LLM, запускается при первом вызове"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="llm-event-loop", daemon=True).start()
+            _loop = loop
+        return _loop
+
+
+def shutdown() -> None:
+    """Закрытие пула соединений chat.py и остановка event loop потока LLM (при остановке приложения)"""
+    global _loop
+    with _loop_lock:
+        loop, _loop = _loop, None
+    if loop is None:
+        return
     try:
-        reply, updated_conversation = loop.run_until_complete(
-            chat.get_reply(conversation, new_prompt, params)
-        )
-        return reply, updated_conversation
+        if CHAT_MODULE_AVAILABLE:
+            asyncio.run_coroutine_threadsafe(chat.aclose(), loop).result(timeout=10)
+    except Exception as e:
+        logger.warning(f"Failed to close chat HTTP client: {e}")
     finally:
-        loop.close()
+        loop.call_soon_threadsafe(loop.stop)
 
-def generate_chat_response(
+
+async def aclose() -> None:
+    """Закрытие пула соединений chat.py event loop сервера (им пользуются async эндпоинты диалога)"""
+    if CHAT_MODULE_AVAILABLE:
+        await chat.aclose()
+
+
+def _map_model(model: Optional[str]) -> str:
+    """Модель по умолчанию и маппинг нестандартных названий моделей"""
+    # Если модель не указана, используем дефолтную
+    if not model:
+        model = "gpt-4-turbo"
+    
+    # Маппинг нестандартных названий моделей
+    model_mapping = {
+        "gpt-4.1": "gpt-4-turbo",
+        "gpt-4": "gpt-4-turbo",
+    }
+    return model_mapping.get(model, model)
+
+def _run_on_llm_loop(coro):
+    """
+    Выполнение корутины из sync контекста в общем event loop потока LLM, вызывающий поток ждет результат.
+    """
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop()).result()
+
+async def generate_chat_response_async(
     messages: list[dict],
     model: Optional[str] = None,
     temperature: Optional[float] = None,
-    reasoning: Optional[str] = None
+    reasoning: Optional[str] = None,
+    cache: bool = False,
+    cache_ttl: Optional[int] = None,
+    max_context_tokens: Optional[int] = None
 ) -> str:
     """
     Генерация ответа от LLM через общий chat.py модуль.
+    Ожидает ответ в текущем event loop (пул соединений chat.py этого loop), поток не блокируется.
     
     Эта функция использует общий модуль chat.py из Telegram версии,
     обеспечивая единообразие работы с AI во всех версиях приложения.
@@ -154,6 +207,9 @@ def generate_chat_response(
         model: Идентификатор модели (например, "gpt-4", "gpt-5", "o1")
         temperature: Температура для стандартных моделей (0.0-1.0)
         reasoning: Reasoning effort для reasoning моделей ("low", "medium", "high")
+        cache: Использовать кэш ответов chat.py (одинаковые запросы - без обращения к модели)
+        cache_ttl: Время жизни ответа в кэше в секундах (по умолчанию cache_ttl из config.yaml)
+        max_context_tokens: Бюджет токенов истории для модели (по умолчанию max_context_tokens из config.yaml)
     
     Returns:
         str: Ответ от AI модели
@@ -166,20 +222,11 @@ def generate_chat_response(
         ...     {"role": "system", "content": "You are a helpful assistant."},
         ...     {"role": "user", "content": "Hello!"}
         ... ]
-        >>> response = generate_chat_response(messages, model="gpt-4", temperature=0.7)
+        >>> response = await generate_chat_response_async(messages, model="gpt-4", temperature=0.7)
         >>> print(response)
         "Hello! How can I help you today?"
     """
-    # Если модель не указана, используем дефолтную
-    if not model:
-        model = "gpt-4-turbo"
-    
-    # Маппинг нестандартных названий моделей
-    model_mapping = {
-        "gpt-4.1": "gpt-4-turbo",
-        "gpt-4": "gpt-4-turbo",
-    }
-    model = model_mapping.get(model, model)
+    model = _map_model(model)
     
     # Если chat модуль недоступен, используем fallback
     if not CHAT_MODULE_AVAILABLE:
@@ -193,7 +240,9 @@ def generate_chat_response(
                 logger.warning(f"Reasoning parameter not supported in fallback mode for model {model}")
             
             logger.info(f"generate_chat_response (fallback): Sending to OpenAI with model={model}, messages_count={len(messages)}, messages={[{'role': m.get('role'), 'content_length': len(m.get('content', ''))} for m in messages]}")
-            response = fallback_client.chat.completions.create(
+            # Sync клиент fallback - в отдельном потоке, чтобы не блокировать event loop
+            response = await asyncio.to_thread(
+                fallback_client.chat.completions.create,
                 model=model,
                 messages=messages,
                 temperature=temperature if temperature is not None else 0.7
@@ -211,12 +260,11 @@ def generate_chat_response(
         logger.info(f"generate_chat_response: Prepared conversation length={len(conversation)}, new_prompt length={len(new_prompt)}, conversation={[{'role': m.get('role'), 'content_length': len(m.get('content', ''))} for m in conversation]}")
         
         # Подготовка параметров
-        params = _prepare_params(model, temperature, reasoning)
+        params = _prepare_params(model, temperature, reasoning, cache, cache_ttl, max_context_tokens)
         
         logger.info(f"generate_chat_response: Calling chat.get_reply with model={params.get('model')}, params={params}")
         
-        # Вызов async функции через обертку
-        reply, updated_conversation = _call_async_chat(conversation, new_prompt, params)
+        reply, updated_conversation = await chat.get_reply(conversation, new_prompt, params)
         
         logger.info(f"generate_chat_response: Received reply, length={len(reply)}, updated_conversation length={len(updated_conversation)}")
         
@@ -225,3 +273,46 @@ def generate_chat_response(
         logger.error(f"Error in chat.get_reply: {e}", exc_info=True)
         raise Exception(f"Ошибка генерации ответа: {str(e)}")
 
+
+async def stream_chat_response(
+    messages: list[dict],
+    model: Optional[str] = None,
+    temperature: Optional[float] = None,
+    reasoning: Optional[str] = None,
+    cache: bool = False,
+    cache_ttl: Optional[int] = None,
+    max_context_tokens: Optional[int] = None
+) -> AsyncIterator[str]:
+    """
+    Потоковая генерация ответа через chat.get_reply_stream: фрагменты ответа по мере получения
+    от модели (маркер {STOP} не удаляется). Параметры те же, что у generate_chat_response_async.
+    Без chat модуля ответ fallback клиента отдается одним фрагментом.
+    """
+    if not CHAT_MODULE_AVAILABLE:
+        yield await generate_chat_response_async(messages, model, temperature, reasoning)
+        return
+    
+    conversation, new_prompt = _prepare_conversation_and_prompt(messages)
+    params = _prepare_params(_map_model(model), temperature, reasoning, cache, cache_ttl, max_context_tokens)
+    
+    logger.info(f"stream_chat_response: Calling chat.get_reply_stream with model={params.get('model')}, params={params}, conversation length={len(conversation)}")
+    
+    try:
+        async for delta in chat.get_reply_stream(conversation, new_prompt, params):
+            yield delta
+    except Exception as e:
+        logger.error(f"Error in chat.get_reply_stream: {e}", exc_info=True)
+        raise Exception(f"Ошибка генерации ответа: {str(e)}")
+
+
+def generate_chat_response(
+    messages: list[dict],
+    model: Optional[str] = None,
+    temperature: Optional[float] = None,
+    reasoning: Optional[str] = None
+) -> str:
+    """
+    Sync вариант generate_chat_response_async для sync кода (chat_service): корутина выполняется
+    в event loop потока LLM, вызывающий поток ждет ответ. Параметры те же.
+    """
+    return _run_on_llm_loop(generate_chat_response_async(messages, model, temperature, reasoning))
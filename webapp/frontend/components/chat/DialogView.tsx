@@ -30,6 +30,7 @@ export default function DialogView({ element, courseId, onNext }: DialogViewProp
   const [inputValue, setInputValue] = useState('')
   const [loading, setLoading] = useState(false)
   const [typing, setTyping] = useState(false)
+  const [streamingReply, setStreamingReply] = useState('') // Ответ, пока он передается потоком
   const [dialogCompleted, setDialogCompleted] = useState(false)
   const messagesEndRef = useRef<HTMLDivElement>(null)
   const inputRef = useRef<HTMLTextAreaElement>(null)
@@ -116,7 +117,7 @@ export default function DialogView({ element, courseId, onNext }: DialogViewProp
     
     try {
       console.log('DialogView: Auto-start triggered', { elementId: element.element_id })
-      const response = await dialogApi.sendMessage(courseId, element.element_id, "")
+      const response = await dialogApi.streamMessage(courseId, element.element_id, "", setStreamingReply)
       console.log('DialogView: Auto-start response', { reply: response.reply, stop: response.stop })
       
       // Если ответ пустой, не добавляем его в сообщения
@@ -146,6 +147,7 @@ export default function DialogView({ element, courseId, onNext }: DialogViewProp
     } finally {
       setLoading(false)
       setTyping(false)
+      setStreamingReply('')
     }
   }
   
@@ -180,7 +182,7 @@ export default function DialogView({ element, courseId, onNext }: DialogViewProp
     setTyping(true)
     
     try {
-      const response = await dialogApi.sendMessage(courseId, element.element_id, messageToSend)
+      const response = await dialogApi.streamMessage(courseId, element.element_id, messageToSend, setStreamingReply)
       console.log('DialogView: Received response', { 
         reply: response.reply, 
         stop: response.stop,
@@ -255,6 +257,7 @@ export default function DialogView({ element, courseId, onNext }: DialogViewProp
     } finally {
       setLoading(false)
       setTyping(false)
+      setStreamingReply('')
     }
   }
   
@@ -358,8 +361,12 @@ export default function DialogView({ element, courseId, onNext }: DialogViewProp
         )}
         {typing && (
           <div className="flex justify-start">
-            <div className="bg-gray-100 p-3 rounded-lg rounded-bl-sm">
-              <span className="animate-pulse text-gray-600">Генерирую...</span>
+            <div className="max-w-[70%] bg-gray-100 p-3 rounded-lg rounded-bl-sm">
+              {streamingReply ? (
+                <p className="text-sm whitespace-pre-wrap text-gray-800 break-words" style={{ wordWrap: 'break-word', overflowWrap: 'break-word', wordBreak: 'break-word' }}>{streamingReply}</p>
+              ) : (
+                <span className="animate-pulse text-gray-600">Генерирую...</span>
+              )}
             </div>
           </div>
         )}
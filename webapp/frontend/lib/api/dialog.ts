@@ -44,5 +44,65 @@ export const dialogApi = {
     const data = await response.json();
     console.log('dialogApi.sendMessage: Response data', data);
     return data;
+  },
+
+  // Потоковый вариант sendMessage (Server-Sent Events): onText получает ответ, накопленный на данный момент,
+  // результат - как у sendMessage (событие done после сохранения ответа)
+  streamMessage: async (
+    courseId: string,
+    elementId: string,
+    message: string,
+    onText: (text: string) => void
+  ): Promise<DialogMessageResponse> => {
+    const apiUrl = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000';
+    const url = `${apiUrl}/api/mvp/courses/${courseId}/dialog/stream`;
+    const response = await fetch(url, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        'Accept': 'text/event-stream',
+      },
+      credentials: 'include',
+      body: JSON.stringify({ element_id: elementId, message: message })
+    });
+
+    if (!response.ok || !response.body) {
+      const errorText = await response.text();
+      console.error('dialogApi.streamMessage: Error', { status: response.status, errorText });
+      throw new Error(`Ошибка отправки сообщения: ${response.status} - ${errorText}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let text = '';
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      // События разделяются пустой строкой: "event: ...\ndata: {...}\n\n"
+      let boundary;
+      while ((boundary = buffer.indexOf('\n\n')) >= 0) {
+        const block = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        let event = 'message';
+        let data = '';
+        for (const line of block.split('\n')) {
+          if (line.startsWith('event:')) event = line.slice(6).trim();
+          else if (line.startsWith('data:')) data += line.slice(5).trim();
+        }
+        if (!data) continue;
+        const payload = JSON.parse(data);
+        if (event === 'token') {
+          text += payload.text;
+          onText(text);
+        } else if (event === 'done') {
+          return payload as DialogMessageResponse;
+        } else if (event === 'error') {
+          throw new Error(payload.detail);
+        }
+      }
+    }
+    throw new Error('Ошибка отправки сообщения: поток ответа прерван');
   }
 };
@@ -22,7 +22,8 @@ export interface CourseMetadata {
 
 export interface CourseElement {
   element_id: string;
-  json: string;
+  // jsonb (миграция 0017) pg возвращает уже разобранным объектом
+  json: string | Record<string, any>;
   element_type: string;
 }
 
@@ -83,7 +84,7 @@ export function elementsToYaml(elements: CourseElement[]): Record<string, any> {
 
   for (const elem of elements) {
     try {
-      const jsonData = JSON.parse(elem.json);
+      const jsonData = typeof elem.json === 'string' ? JSON.parse(elem.json) : elem.json;
       yamlContent[elem.element_id] = jsonData.element_data || jsonData;
     } catch (error) {
       console.error(`Error parsing JSON for element ${elem.element_id}:`, error);